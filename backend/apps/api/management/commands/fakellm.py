@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.rag.fake_llm import LATENCY_DISTRIBUTIONS, FakeLLMConfig, FakeLLMServer, LatencyModel
+
+
+class Command(BaseCommand):
+    help = "啟動本地假 LLM 伺服器（Gemini REST 相容），以 GOOGLE_API_ENDPOINT 指向它做壓測或離線測試。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8089)
+        parser.add_argument("--latency-ms", type=float, default=800.0, help="生成延遲平均值（毫秒）")
+        parser.add_argument("--latency-dist", choices=LATENCY_DISTRIBUTIONS, default="lognormal")
+        parser.add_argument("--latency-spread", type=float, default=0.5, help="uniform 相對寬度 / normal 變異係數 / lognormal sigma")
+        parser.add_argument("--embed-latency-ms", type=float, default=30.0, help="嵌入延遲平均值（毫秒）")
+        parser.add_argument("--embed-latency-dist", choices=LATENCY_DISTRIBUTIONS, default="fixed")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="回應 500 的比例")
+        parser.add_argument("--throttle-rate", type=float, default=0.0, help="回應 429 的比例")
+        parser.add_argument("--empty-rate", type=float, default=0.0, help="回傳空白回答的比例")
+        parser.add_argument("--stream-chunks", type=int, default=8)
+        parser.add_argument("--seed", type=int, default=None)
+
+    def handle(self, *args, **options):
+        try:
+            config = FakeLLMConfig(
+                latency=LatencyModel(options["latency_dist"], options["latency_ms"], options["latency_spread"]),
+                embed_latency=LatencyModel(options["embed_latency_dist"], options["embed_latency_ms"], options["latency_spread"]),
+                error_rate=options["error_rate"],
+                throttle_rate=options["throttle_rate"],
+                empty_rate=options["empty_rate"],
+                stream_chunks=options["stream_chunks"],
+                seed=options["seed"],
+            )
+            server = FakeLLMServer((options["host"], options["port"]), config)
+        except (ValueError, OSError) as e:
+            raise CommandError(str(e))
+        self.stdout.write(f"fake LLM listening on {server.url}")
+        self.stdout.write(f"  GOOGLE_API_ENDPOINT={server.url} GOOGLE_API_KEY=<any non-empty value>")
+        self.stdout.flush()
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
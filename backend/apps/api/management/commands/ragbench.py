@@ -0,0 +1,76 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.rag.microbench import (
+    CASES,
+    DEFAULT_THRESHOLD,
+    BenchResult,
+    compare,
+    format_size,
+    load_results,
+    parse_size,
+    run_suite,
+    write_results,
+)
+
+
+class Command(BaseCommand):
+    help = "離線執行 RAG 熱路徑微基準（EchoLLM + 本地嵌入），輸出 JSON 並可與基準比較。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="1k,10k,100k", help="合成語料大小，逗號分隔（預設 1k,10k,100k）")
+        parser.add_argument("--cases", default="", help="只執行指定案例或前綴，逗號分隔（例如 service.,vectorstore.query）")
+        parser.add_argument("--min-time", type=float, default=1.0, help="每個案例至少量測的秒數")
+        parser.add_argument("--output", default="", help="結果 JSON 路徑")
+        parser.add_argument("--baseline", default="", help="基準 JSON 路徑；ops/sec 下降超過門檻時以非零狀態結束")
+        parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="允許的 ops/sec 下降比例（預設 0.2）")
+        parser.add_argument("--update-baseline", action="store_true", help="將本次結果寫入 --baseline")
+        parser.add_argument("--list", action="store_true", help="列出可用案例")
+
+    def handle(self, *args, **options):
+        if options["list"]:
+            for case in CASES.values():
+                self.stdout.write(f"{case.name}{' (corpus)' if case.needs_corpus else ''}")
+            return
+        try:
+            sizes = [parse_size(s) for s in options["sizes"].split(",") if s.strip()]
+        except ValueError as e:
+            raise CommandError(str(e))
+        cases = [c.strip() for c in options["cases"].split(",") if c.strip()] or None
+        baseline_path = Path(options["baseline"]) if options["baseline"] else None
+        if options["update_baseline"] and baseline_path is None:
+            raise CommandError("--update-baseline requires --baseline")
+
+        self.stdout.write(f"sizes={','.join(format_size(s) for s in sizes)} min_time={options['min_time']}s")
+        try:
+            suite = run_suite(sizes, cases, min_time=options["min_time"], on_result=lambda r: self.stdout.write(self._format(r)))
+        except KeyError as e:
+            raise CommandError(str(e.args[0]))
+        if options["output"]:
+            write_results(suite, Path(options["output"]))
+            self.stdout.write(f"results written to {options['output']}")
+        if baseline_path is None:
+            return
+        if options["update_baseline"]:
+            write_results(suite, baseline_path)
+            self.stdout.write(self.style.SUCCESS(f"baseline updated: {baseline_path}"))
+            return
+        if not baseline_path.exists():
+            raise CommandError(f"baseline not found: {baseline_path}")
+
+        comparisons = compare(suite, load_results(baseline_path), options["threshold"])
+        for c in comparisons:
+            line = f"{c.key:<44} {c.baseline_ops:>12.1f} -> {c.current_ops:>12.1f} ops/s ({c.change:+.1%})"
+            self.stdout.write(self.style.ERROR(line) if c.regressed else line)
+        regressed = [c.key for c in comparisons if c.regressed]
+        if regressed:
+            raise CommandError(f"{len(regressed)} benchmark(s) regressed more than {options['threshold']:.0%}: {', '.join(regressed)}")
+        self.stdout.write(self.style.SUCCESS(f"no regression beyond {options['threshold']:.0%} ({len(comparisons)} compared)"))
+
+    @staticmethod
+    def _format(r: BenchResult) -> str:
+        return (
+            f"{r.key:<44} {r.ops_per_sec:>12.1f} ops/s  "
+            f"p50 {r.p50_us:>10.1f}us  p95 {r.p95_us:>10.1f}us  p99 {r.p99_us:>10.1f}us  (n={r.ops})"
+        )
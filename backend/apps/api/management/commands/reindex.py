@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.rag.reindex import ReindexInProgress, ReindexProgress, read_reindex_status, reindex
+from apps.rag.vectorstore import ChromaVectorStore
+
+
+class Command(BaseCommand):
+    help = "以目前設定的嵌入器重建向量索引（blue/green），完成後切換並清除舊世代 collection。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--status", action="store_true", help="只顯示目前的重新索引進度")
+        parser.add_argument("--batch-size", type=int, default=None, help="每批處理的 chunk 數（預設 REINDEX_BATCH_SIZE 或 256）")
+        parser.add_argument("--keep-old", action="store_true", help="切換後保留舊 collection")
+        parser.add_argument("--grace-seconds", type=float, default=None, help="切換後刪除舊 collection 前的等待秒數")
+
+    def handle(self, *args, **options):
+        store = ChromaVectorStore()
+        if options["status"]:
+            status = read_reindex_status(store.config.persist_dir)
+            self.stdout.write(f"active={store.active_collection_name()} needs_reindex={store.needs_reindex()}")
+            self.stdout.write(self._format(status))
+            return
+
+        last_line = [""]
+
+        def on_progress(progress: ReindexProgress) -> None:
+            line = self._format(progress)
+            if line != last_line[0]:
+                self.stdout.write(line)
+                last_line[0] = line
+
+        try:
+            result = reindex(
+                store,
+                batch_size=options["batch_size"],
+                gc=not options["keep_old"],
+                grace_seconds=options["grace_seconds"],
+                on_progress=on_progress,
+            )
+        except ReindexInProgress as e:
+            raise CommandError(str(e))
+        elapsed = (result.finished_at or 0) - (result.started_at or 0)
+        self.stdout.write(self.style.SUCCESS(
+            f"active collection: {store.active_collection_name()} ({result.total} chunks in {elapsed:.1f}s); dropped: {', '.join(result.dropped) or '-'}"
+        ))
+
+    @staticmethod
+    def _format(p: ReindexProgress) -> str:
+        eta = f"{p.eta_seconds:.0f}s" if p.eta_seconds is not None else "-"
+        return (
+            f"[{p.state}{'/' + p.phase if p.phase else ''}] {p.source} -> {p.target}: "
+            f"{p.done}/{p.total} chunks, {p.rate_per_sec:.1f}/s, eta {eta}"
+        )
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.rag.article_summaries import get_article_summary_store, warm_article_summaries
+from apps.rag.llm_providers import EchoLLM, get_default_llm
+from apps.rag.templates_registry import REGISTRY
+
+
+class Command(BaseCommand):
+    help = "為模板條文預先產生摘要並寫入摘要儲存（第N條查詢直接回傳），已有有效摘要的條文會略過。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("template_ids", nargs="*", help="模板 ID（預設全部已登記模板）")
+        parser.add_argument("--articles", nargs="+", default=None, help="只處理指定條號")
+        parser.add_argument("--concurrency", type=int, default=None, help="同時進行的 LLM 呼叫數（預設 ARTICLE_SUMMARY_WARMUP_CONCURRENCY 或 4）")
+
+    def handle(self, *args, **options):
+        if get_article_summary_store() is None:
+            raise CommandError("Article summary store is disabled (ARTICLE_SUMMARIES=0)")
+        llm = get_default_llm()
+        if isinstance(llm, EchoLLM):
+            raise CommandError("No LLM provider configured; set GOOGLE_API_KEY or OPENAI_API_KEY")
+        template_ids = options["template_ids"] or list(REGISTRY)
+        unknown = [tid for tid in template_ids if tid not in REGISTRY]
+        if unknown:
+            raise CommandError(f"Unknown template_id: {', '.join(unknown)}")
+        for tid in template_ids:
+            stats = warm_article_summaries(tid, llm, concurrency=options["concurrency"], articles=options["articles"])
+            line = (
+                f"{tid}: {stats.articles} articles, {stats.cached} cached, {stats.generated} generated, "
+                f"{stats.failed} failed, {stats.purged} stale removed ({stats.seconds:.1f}s)"
+            )
+            self.stdout.write(self.style.SUCCESS(line) if not stats.failed else self.style.WARNING(line))
@@ -1,20 +1,23 @@
 from __future__ import annotations
 
-from typing import List, Optional, Literal, Union
-from pydantic import BaseModel, Field, field_validator
+from typing import Dict, List, Optional, Literal, Union
+from pydantic import BaseModel, Field, field_validator, model_validator
 from apps.common.limits import MESSAGE_MAX_CHARS, HISTORY_ITEM_MAX_CHARS, HISTORY_MAX_TURNS
 
 
 class HealthResponse(BaseModel):
     status: str = Field(default="ok")
+    llm: Optional[Dict[str, Union[str, bool, float, None]]] = Field(default=None, description="LLM client 預熱與 readiness 狀態")
 
 
 class ChatRequest(BaseModel):
     message: str = Field(..., description="使用者問題或訊息")
     doc_ids: Optional[List[Union[int, str]]] = Field(default=None, description="限制檢索的文件 ID 列表（字串或整數）")
     top_k: int = Field(default=5, ge=1, le=50, description="檢索返回片段數量")
-    history: Optional[List["ChatTurn"]] = Field(default=None, description="最近的對話回合，僅保留 N 回合")
+    history: Optional[List["ChatTurn"]] = Field(default=None, description="最近的對話回合，僅保留 N 回合；帶 conversation_id 時不可提供")
+    conversation_id: Optional[str] = Field(default=None, max_length=64, pattern=r"^[A-Za-z0-9_-]+$", description="伺服器端對話 ID；提供時歷史由伺服器保存，只需送出新訊息")
     inline_citations: Optional[bool] = Field(default=None, description="是否在回答中加入 [n] 內文引用；預設取環境變數")
+    include_timings: bool = Field(default=False, description="是否在回應附上各階段耗時（毫秒）")
 
     @field_validator("message")
     @classmethod
@@ -32,6 +35,12 @@ class ChatRequest(BaseModel):
             raise ValueError(f"history too long (>{HISTORY_MAX_TURNS} turns)")
         return v
 
+    @model_validator(mode="after")
+    def validate_conversation(self) -> "ChatRequest":
+        if self.conversation_id is not None and self.history:
+            raise ValueError("history must be omitted when conversation_id is provided")
+        return self
+
 
 class ChatSource(BaseModel):
     id: Optional[str] = None
@@ -45,6 +54,8 @@ class ChatResponse(BaseModel):
     answer: str
     sources: List[ChatSource] = Field(default_factory=list)
     retrieval: Optional[str] = None
+    timings: Optional[Dict[str, float]] = Field(default=None, description="各階段耗時（毫秒），僅在 include_timings 時提供")
+    conversation_id: Optional[str] = Field(default=None, description="伺服器端對話 ID，下一輪請求帶上即可省略 history")
 
 
 class ChatTurn(BaseModel):
@@ -74,13 +85,44 @@ class IngestResult(BaseModel):
     ok: bool = True
     chunks: int = 0
     upserts: int = 0
+    added: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    deleted: int = 0
     error: Optional[str] = None
 
 
-class IngestResponse(BaseModel):
+class IngestStreamResponse(BaseModel):
+    documents: int = 0
+    chunks: int = 0
+    elapsed_ms: float = 0.0
+    docs_per_sec: float = 0.0
     results: List[IngestResult] = Field(default_factory=list)
 
 
+class IngestJobDocument(BaseModel):
+    doc_id: str
+    state: str = Field(..., description="queued / running / done / failed")
+    chunks: int = 0
+    upserts: int = 0
+    added: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    deleted: int = 0
+    error: Optional[str] = None
+
+
+class IngestJob(BaseModel):
+    job_id: str
+    state: str = Field(..., description="queued / running / completed / failed")
+    created_at: float
+    updated_at: float
+    total: int = 0
+    completed: int = 0
+    failed: int = 0
+    documents: List[IngestJobDocument] = Field(default_factory=list)
+
+
 class TemplateMetaOut(BaseModel):
     template_id: str
     title: str
@@ -3,12 +3,14 @@ from django.core.cache import cache
 import json
 
 from apps.common.limits import MAX_PAYLOAD_BYTES
+from apps.common.rate_limit import get_rate_limit_store
 
 
 class ApiTests(TestCase):
     def setUp(self):
         self.client = Client()
         cache.clear()
+        get_rate_limit_store().reset()
 
     def test_health_ok(self):
         resp = self.client.get("/api/v1/health")
@@ -68,6 +70,26 @@ class ApiTests(TestCase):
             last_status = resp.status_code
         self.assertEqual(last_status, 429)
 
+    def test_rate_limit_rejects_before_body_validation(self):
+        # 額度在驗證前即扣除：無效 body 也計數，超額後直接 429 而非 422
+        statuses = [
+            self.client.post("/api/v1/chat/stream", data="{not json", content_type="application/json").status_code
+            for _ in range(21)
+        ]
+        self.assertNotIn(429, statuses[:20])
+        self.assertEqual(statuses[20], 429)
+        resp = self.client.post("/api/v1/chat", data=json.dumps({"message": "hi"}), content_type="application/json")
+        self.assertEqual(resp.status_code, 429)
+        self.assertEqual(resp.json()["error"]["code"], "rate_limit")
+        self.assertGreaterEqual(int(resp["Retry-After"]), 1)
+        # 其他來源 IP 有自己的額度
+        other = self.client.post(
+            "/api/v1/chat", data=json.dumps({"message": "hi"}), content_type="application/json",
+            HTTP_X_FORWARDED_FOR="203.0.113.9",
+        )
+        self.assertEqual(other.status_code, 200)
+        self.assertEqual(other["X-RateLimit-Remaining"], "19")
+
     def test_chat_without_inline_citations(self):
         body = {"message": "hi"}
         resp = self.client.post(
@@ -82,3 +104,141 @@ class ApiTests(TestCase):
         import re
         self.assertIsNone(re.search(r"\[(\s*\d+(\s*,\s*\d+)*)\]", text))
 
+
+    def test_chat_stream_sse_events(self):
+        body = {"message": "特休怎麼算", "inline_citations": False}
+        resp = self.client.post(
+            "/api/v1/chat/stream",
+            data=json.dumps(body),
+            content_type="application/json",
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp["Content-Type"].startswith("text/event-stream"))
+        raw = b"".join(resp.streaming_content).decode("utf-8")
+        events = []
+        for block in raw.strip().split("\n\n"):
+            lines = dict(line.split(": ", 1) for line in block.split("\n"))
+            events.append((lines["event"], json.loads(lines["data"])))
+        names = [e for e, _ in events]
+        self.assertEqual(names[0], "sources")
+        self.assertEqual(names[-1], "done")
+        self.assertGreater(names.count("delta"), 1)
+        answer = "".join(d["text"] for e, d in events if e == "delta")
+        self.assertIn("特休怎麼算", answer)
+        self.assertIn("first_token_ms", events[-1][1]["timings"])
+
+    def test_chat_conversation_session(self):
+        from unittest import mock
+
+        from apps.rag import service
+
+        def post(body):
+            return self.client.post("/api/v1/chat", data=json.dumps(body), content_type="application/json")
+
+        with mock.patch.object(service, "build_budgeted_prompt", wraps=service.build_budgeted_prompt) as build:
+            first = post({"message": "加班費怎麼算", "history": [{"role": "user", "content": "你好"}, {"role": "assistant", "content": "您好"}]})
+            cid = first.json()["data"]["conversation_id"]
+            self.assertTrue(cid)
+            second = post({"message": "那假日呢", "conversation_id": cid})
+        self.assertEqual(second.json()["data"]["conversation_id"], cid)
+        history = build.call_args_list[-1].args[1]
+        self.assertEqual([t.content for t in history][:3], ["你好", "您好", "加班費怎麼算"])
+        self.assertEqual(len(history), 4)
+
+        missing = post({"message": "hi", "conversation_id": "expired"})
+        self.assertEqual(missing.status_code, 404)
+        self.assertEqual(missing.json()["error"]["code"], "conversation_not_found")
+        both = post({"message": "hi", "conversation_id": cid, "history": [{"role": "user", "content": "a"}]})
+        self.assertEqual(both.status_code, 422)
+
+    def test_chat_stream_conversation_session(self):
+        from apps.rag.conversations import get_conversation_store
+
+        resp = self.client.post("/api/v1/chat/stream", data=json.dumps({"message": "特休怎麼算"}), content_type="application/json")
+        raw = b"".join(resp.streaming_content).decode("utf-8")
+        done = json.loads(raw.strip().split("\n\n")[-1].split("data: ", 1)[1])
+        turns = get_conversation_store().get(done["conversation_id"])
+        self.assertEqual(turns[0], ("user", "特休怎麼算"))
+        self.assertEqual(turns[1][0], "assistant")
+        self.assertIn("特休怎麼算", turns[1][1])
+
+    def test_reindex_status(self):
+        resp = self.client.get("/api/v1/reindex")
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json().get("data", {})
+        self.assertIn("state", data)
+        self.assertIn("active_collection", data)
+        self.assertFalse(data.get("needs_reindex"))
+
+    def test_ingest_returns_job_and_status(self):
+        body = {"documents": [{"doc_id": "job_doc", "text": "第1條 測試內容。"}]}
+        resp = self.client.post("/api/v1/ingest", data=json.dumps(body), content_type="application/json")
+        self.assertEqual(resp.status_code, 202)
+        job = resp.json()["data"]
+        self.assertEqual(job["total"], 1)
+        self.assertEqual(resp["Location"], f"/api/v1/ingest/jobs/{job['job_id']}")
+
+        status = self.client.get(f"/api/v1/ingest/jobs/{job['job_id']}")
+        self.assertEqual(status.status_code, 200)
+        self.assertEqual(status.json()["data"]["documents"][0]["doc_id"], "job_doc")
+        self.assertEqual(self.client.get("/api/v1/ingest/jobs/missing").status_code, 404)
+
+    def test_ingest_stream_ndjson_beyond_payload_limit(self):
+        lines = [
+            json.dumps({"doc_id": "stream_a", "text": "第1條 勞工每日正常工作時間不得超過八小時。"}, ensure_ascii=False),
+            # 連續相同 doc_id 的行為同一文件的後續片段
+            json.dumps({"doc_id": "stream_a", "text": "第2條 雇主延長工作時間者，應依規定加給工資。"}, ensure_ascii=False),
+            json.dumps({"doc_id": "stream_b", "text": "第3條 特別休假。"}, ensure_ascii=False),
+        ]
+        # 以空白行墊高到超過 MAX_PAYLOAD_BYTES，確認串流端點不受請求大小限制
+        body = ("\n".join(lines) + "\n" * (MAX_PAYLOAD_BYTES + 1)).encode("utf-8")
+        resp = self.client.post("/api/v1/ingest/stream", data=body, content_type="application/x-ndjson")
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()["data"]
+        self.assertEqual(data["documents"], 2)
+        self.assertEqual([r["doc_id"] for r in data["results"]], ["stream_a", "stream_b"])
+        self.assertTrue(all(r["ok"] for r in data["results"]))
+
+    def test_ingest_stream_multipart_and_errors(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        upload = SimpleUploadedFile("policy.txt", "第1條 請假規則。\n第2條 加班規則。".encode("utf-8"))
+        resp = self.client.post("/api/v1/ingest/stream", data={"files": [upload]})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()["data"]["results"][0]["doc_id"], "policy")
+
+        bad = self.client.post("/api/v1/ingest/stream", data=b'{"doc_id": 1}\n', content_type="application/x-ndjson")
+        self.assertEqual(bad.status_code, 400)
+        self.assertEqual(bad.json()["error"]["code"], "invalid_payload")
+
+        wrong = self.client.post("/api/v1/ingest/stream", data="{}", content_type="application/json")
+        self.assertEqual(wrong.status_code, 415)
+
+    def test_metrics_exposition(self):
+        self.client.get("/api/v1/health")
+        resp = self.client.get("/api/v1/metrics")
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp["Content-Type"].startswith("text/plain; version=0.0.4"))
+        body = resp.content.decode()
+        self.assertIn('http_requests_total{method="GET",endpoint="/api/v1/health",status="200"}', body)
+        self.assertIn("# TYPE rag_stage_duration_seconds histogram", body)
+        self.assertIn("# TYPE rag_vector_collection_chunks gauge", body)
+
+    def test_chat_stage_timings_and_slow_request_log(self):
+        import os
+        from unittest import mock
+
+        body = {"message": "特別休假有幾天", "include_timings": True}
+        with mock.patch.dict(os.environ, {"SLOW_REQUEST_MS": "0"}):
+            with self.assertLogs("apps.common.timing", level="WARNING") as logs:
+                resp = self.client.post("/api/v1/chat", data=json.dumps(body), content_type="application/json")
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("total;dur=", resp["Server-Timing"])
+        timings = resp.json()["data"]["timings"]
+        self.assertIn("total", timings)
+        self.assertIn("normalize", timings)
+        self.assertEqual(logs.records[0].trace_id, resp["X-Trace-Id"])
+        self.assertIn("prompt_chars", logs.output[0])
+
+        plain = self.client.post("/api/v1/chat", data=json.dumps({"message": "你好"}), content_type="application/json")
+        self.assertIsNone(plain.json()["data"]["timings"])
@@ -5,24 +5,40 @@ from .schemas import (
     ChatRequest,
     ChatResponse,
     IngestRequest,
-    IngestResponse,
+    IngestJob,
     IngestResult,
+    IngestStreamResponse,
     TemplateMetaOut,
     IngestTemplateRequest,
 )
-from apps.common.schemas import success_response
+from apps.common.schemas import error_response, success_response
 from apps.common.exceptions import ApiError, api_error_handler, generic_error_handler
 from apps.common.limits import MAX_PAYLOAD_BYTES
-from apps.common.rate_limit import rate_limit
-from apps.rag.service import answer_with_rag
+from apps.common.metrics import REGISTRY
+from apps.common.timing import current_timings
+from apps.rag.conversations import Conversation, ConversationNotFound, open_conversation, record_exchange
+from apps.rag.executors import run_blocking
+from apps.rag.service import aanswer_with_rag, stream_answer_with_rag
 from ninja.errors import ValidationError
+import codecs
+import contextvars
+import json
 import logging
-from django.http import JsonResponse
+import os
+import time
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 
 logger = logging.getLogger(__name__)
-from apps.rag.ingest import ingest_text
+from apps.rag.ingest import NdjsonFormatError, ingest_stream, ingest_text, iter_ndjson_documents
+from apps.rag.jobs import QueueFull, get_ingest_queue
+from apps.rag.article_summaries import start_summary_warmup
+from apps.rag.llm_providers import get_llm_registry
 from apps.rag.templates_registry import list_templates, load_template_text
 from apps.rag.diagnostics import diagnose_rag_system
+from apps.rag.reindex import ReindexInProgress, read_reindex_status, start_background_reindex
+from apps.rag.service import get_vector_store
+from apps.rag.vectorstore import collection_name_for
+from dataclasses import asdict
 
 api = NinjaAPI(
     title="FutureNest RAG API",
@@ -64,12 +80,10 @@ def _handle_validation_error(request, exc: ValidationError):
 
 @api.get("/health")
 def health(request):
-    return success_response(HealthResponse().model_dump())
+    return success_response(HealthResponse(llm=get_llm_registry().status()).model_dump())
 
 
-@api.post("/chat")
-@rate_limit(key="chat:{ip}", limit=20, window_seconds=60)
-def chat(request, payload: ChatRequest):
+def _check_payload_size(request) -> None:
     # 載荷大小基本檢查（非嚴格，Django 已解析完畢；仍可作為保護）
     try:
         meta_len = int(request.META.get("CONTENT_LENGTH") or 0)
@@ -88,38 +102,203 @@ def chat(request, payload: ChatRequest):
             status_code=413,
         )
 
-    # 呼叫服務層，傳遞可選 doc_ids 與 inline_citations
+
+def _open_conversation(payload: ChatRequest) -> Conversation:
     try:
-        result = answer_with_rag(
+        return open_conversation(payload.conversation_id, payload.history)
+    except ConversationNotFound:
+        raise ApiError(
+            code="conversation_not_found",
+            message="conversation_id is unknown or expired; resend without it (with history) to start a new conversation",
+            status_code=404,
+        )
+
+
+@api.post("/chat")
+async def chat(request, payload: ChatRequest):
+    _check_payload_size(request)
+    conversation = await run_blocking(_open_conversation, payload)
+
+    # 呼叫服務層，傳遞可選 doc_ids 與 inline_citations；async 路徑下等待 LLM 不佔用執行緒
+    try:
+        result = await aanswer_with_rag(
             payload.message,
-            payload.history,
+            conversation.history,
             top_k=payload.top_k,
             doc_ids=[str(i) for i in (payload.doc_ids or [])] or None,
             inline_citations=payload.inline_citations,
         )
+        await run_blocking(record_exchange, conversation, payload.message, result.answer)
+        # 回答快取命中時 result 為共用物件，複製後再附上對話 ID 與本次耗時
+        update = {"conversation_id": conversation.conversation_id}
+        timings = current_timings()
+        if payload.include_timings and timings is not None:
+            update["timings"] = timings.summary()
+        result = result.model_copy(update=update)
         return success_response(result.model_dump())
     except Exception:
         logger.exception("answer_with_rag_failed", extra={"trace_id": getattr(request, "trace_id", "")})
         from apps.api.schemas import ChatResponse, ChatSource
+        # 本輪未寫入對話；既有對話仍可繼續使用
         fallback_response = ChatResponse(
             answer="抱歉，處理您的問題時發生了錯誤。請稍後再試，或簡化您的問題。",
-            sources=[]
+            sources=[],
+            conversation_id=payload.conversation_id,
         )
         return success_response(fallback_response.model_dump())
 
 
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@api.post("/chat/stream")
+def chat_stream(request, payload: ChatRequest):
+    """SSE 串流回答：sources（檢索完成）→ delta（逐段文字）→ done（耗時資訊與 conversation_id）。"""
+    _check_payload_size(request)
+    # 串流在 middleware 返回後才被消費，需自行保留 trace_id；每一步在請求的 context 中執行，
+    # 讓分段計時與 log 的 trace_id 仍綁定到這個請求
+    trace_id = getattr(request, "trace_id", "")
+    conversation = _open_conversation(payload)
+    ctx = contextvars.copy_context()
+    timings = current_timings()
+
+    def _events():
+        answer_parts = []
+        events = stream_answer_with_rag(
+            payload.message,
+            conversation.history,
+            top_k=payload.top_k,
+            doc_ids=[str(i) for i in (payload.doc_ids or [])] or None,
+            inline_citations=payload.inline_citations,
+        )
+        try:
+            while True:
+                try:
+                    event, data = ctx.run(next, events)
+                except StopIteration:
+                    break
+                if event == "delta":
+                    answer_parts.append(data["text"])
+                elif event == "done":
+                    ctx.run(record_exchange, conversation, payload.message, "".join(answer_parts))
+                    data = {**data, "trace_id": trace_id, "conversation_id": conversation.conversation_id}
+                    if payload.include_timings and timings is not None:
+                        data["timings"] = {**data["timings"], "stages": timings.summary()}
+                yield _sse_event(event, data)
+        except Exception:
+            logger.exception("stream_answer_with_rag_failed", extra={"trace_id": trace_id})
+            yield _sse_event(
+                "error",
+                {"code": "internal_error", "message": "抱歉，處理您的問題時發生了錯誤。請稍後再試，或簡化您的問題。", "trace_id": trace_id},
+            )
+        finally:
+            if timings is not None:
+                timings.finish()
+
+    response = StreamingHttpResponse(_events(), content_type="text/event-stream; charset=utf-8")
+    response["Cache-Control"] = "no-cache"
+    # 關閉反向代理（nginx）緩衝，確保 delta 即時送達
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
 @api.post("/ingest")
-@rate_limit(key="ingest:{ip}", limit=10, window_seconds=60)
 def ingest(request, payload: IngestRequest):
+    """登記 ingest job 後立即回傳 job id；切片、嵌入與寫入由背景 worker 執行。"""
+    queue = get_ingest_queue()
+    try:
+        job_id = queue.submit([(doc.doc_id, doc.text) for doc in payload.documents])
+    except QueueFull as e:
+        resp = JsonResponse(error_response("queue_full", str(e), {"max_depth": queue.max_depth}), status=429)
+        # 佇列以 job 為單位消化，數秒後通常已有空位
+        resp["Retry-After"] = "5"
+        return resp
+    job = IngestJob(**queue.get(job_id)).model_dump()
+    resp = JsonResponse(success_response(job), status=202)
+    resp["Location"] = f"/api/v1/ingest/jobs/{job_id}"
+    return resp
+
+
+_NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/jsonl", "application/json-lines")
+
+
+def _multipart_documents(request):
+    """multipart 上傳：.ndjson/.jsonl 檔依 NDJSON 解析，其餘檔案各為一份文件（doc_id 取檔名）。
+
+    Django 會把超過 FILE_UPLOAD_MAX_MEMORY_SIZE 的檔案寫入暫存檔，這裡再分段讀取解碼。
+    """
+    for uploaded in request.FILES.values():
+        name = uploaded.name or "document"
+        stem, ext = os.path.splitext(os.path.basename(name))
+        if ext.lower() in (".ndjson", ".jsonl"):
+            yield from iter_ndjson_documents(uploaded)
+        else:
+            yield stem or name, codecs.iterdecode(uploaded.chunks(), "utf-8")
+
+
+@api.post("/ingest/stream")
+def ingest_stream_view(request):
+    """串流 ingest：逐行讀取 NDJSON 或 multipart 檔案，邊讀邊切分並分批寫入，不受 1MB 請求大小限制。"""
+    if request.content_type in _NDJSON_CONTENT_TYPES:
+        # 直接迭代 request 逐行讀取 body，不經過 request.body（會整包載入並受 DATA_UPLOAD_MAX_MEMORY_SIZE 限制）
+        documents = iter_ndjson_documents(request)
+    elif request.content_type == "multipart/form-data":
+        documents = _multipart_documents(request)
+    else:
+        raise ApiError(
+            code="unsupported_media_type",
+            message="Use application/x-ndjson or multipart/form-data",
+            status_code=415,
+        )
+
+    started = time.perf_counter()
     results: list[IngestResult] = []
-    for doc in payload.documents:
-        try:
-            chunks, upserts = ingest_text(doc.doc_id, doc.text)
-            results.append(IngestResult(doc_id=doc.doc_id, chunks=chunks, upserts=upserts))
-        except Exception as e:  
-            logger.exception("ingest_failed", extra={"doc_id": doc.doc_id, "trace_id": getattr(request, "trace_id", "")})
-            results.append(IngestResult(doc_id=doc.doc_id, ok=False, error=str(e)))
-    return success_response(IngestResponse(results=results).model_dump())
+    try:
+        for doc_id, pieces in documents:
+            try:
+                stats = ingest_stream(doc_id, pieces)
+            except (NdjsonFormatError, UnicodeDecodeError):
+                raise
+            except Exception as e:
+                logger.exception("ingest_failed", extra={"doc_id": doc_id, "trace_id": getattr(request, "trace_id", "")})
+                # 丟棄這份文件剩餘的片段，繼續處理下一份
+                for _ in pieces:
+                    pass
+                results.append(IngestResult(doc_id=doc_id, ok=False, error=str(e)))
+                continue
+            results.append(
+                IngestResult(
+                    doc_id=doc_id,
+                    chunks=stats.chunks,
+                    upserts=stats.upserts,
+                    added=stats.added,
+                    updated=stats.updated,
+                    unchanged=stats.unchanged,
+                    deleted=stats.deleted,
+                )
+            )
+    except (NdjsonFormatError, UnicodeDecodeError) as e:
+        raise ApiError(code="invalid_payload", message=str(e), status_code=400, details={"ingested": len(results)})
+
+    elapsed = time.perf_counter() - started
+    return success_response(
+        IngestStreamResponse(
+            documents=len(results),
+            chunks=sum(r.chunks for r in results),
+            elapsed_ms=round(elapsed * 1000, 1),
+            docs_per_sec=round(len(results) / elapsed, 2) if elapsed > 0 else 0.0,
+            results=results,
+        ).model_dump()
+    )
+
+
+@api.get("/ingest/jobs/{job_id}")
+def ingest_job(request, job_id: str):
+    job = get_ingest_queue().get(job_id)
+    if job is None:
+        raise ApiError(code="not_found", message=f"Ingest job {job_id} not found", status_code=404)
+    return success_response(IngestJob(**job).model_dump())
 
 
 @api.get("/templates")
@@ -133,17 +312,61 @@ def templates(request):
 
 
 @api.post("/ingest-template")
-@rate_limit(key="ingest:{ip}", limit=10, window_seconds=60)
 def ingest_template(request, payload: IngestTemplateRequest):
     try:
         text = load_template_text(payload.template_id)
-        chunks, upserts = ingest_text(payload.template_id, text)
-        return success_response({"doc_id": payload.template_id, "chunks": chunks, "upserts": upserts})
+        stats = ingest_text(payload.template_id, text)
+        # 模板內容改變時清除過期的條文摘要；ARTICLE_SUMMARY_WARMUP=1 時於背景預先產生
+        start_summary_warmup(payload.template_id)
+        return success_response(
+            {
+                "doc_id": payload.template_id,
+                "chunks": stats.chunks,
+                "upserts": stats.upserts,
+                "added": stats.added,
+                "updated": stats.updated,
+                "unchanged": stats.unchanged,
+                "deleted": stats.deleted,
+            }
+        )
     except Exception as e:  # pragma: no cover
         logger.exception("ingest_template_failed", extra={"template_id": payload.template_id, "trace_id": getattr(request, "trace_id", "")})
         raise ApiError(code="ingest_failed", message=str(e), status_code=400)
 
 
+def _reindex_payload(store) -> dict:
+    status = asdict(read_reindex_status(store.config.persist_dir))
+    status.update(
+        active_collection=store.active_collection_name(),
+        configured_collection=collection_name_for(store.target_embedder.embedder_id),
+        needs_reindex=store.needs_reindex(),
+    )
+    return status
+
+
+@api.get("/reindex")
+def reindex_status(request):
+    """重新索引進度：已處理數、速率、ETA 與目前服務中的 collection。"""
+    return success_response(_reindex_payload(get_vector_store()))
+
+
+@api.post("/reindex")
+def reindex_start(request):
+    """以目前設定的嵌入器在背景重建索引；完成後原子切換，查詢期間不中斷。"""
+    store = get_vector_store()
+    try:
+        start_background_reindex(store)
+    except ReindexInProgress as e:
+        raise ApiError(code="reindex_running", message=str(e), status_code=409)
+    return success_response(_reindex_payload(store))
+
+
+@api.get("/metrics")
+def metrics(request):
+    """Prometheus 文字格式（text exposition format 0.0.4）。"""
+    return HttpResponse(REGISTRY.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @api.get("/diagnostics")
 def rag_diagnostics(request):
     """RAG 系統診斷端點"""
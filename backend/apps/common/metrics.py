@@ -0,0 +1,263 @@
+"""行程內的 Prometheus 風格指標（counter / histogram / gauge），由 /api/v1/metrics 以文字格式輸出。
+
+記錄時不取鎖：每個執行緒寫入自己的分片（asyncio 任務在同一執行緒內同步記錄，不會交錯），
+只有輸出時才合併各分片；已結束執行緒的分片在輸出時併入保留值，避免每請求一執行緒的伺服器無限累積。
+"""
+from __future__ import annotations
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .timing import current_timings
+
+LabelValues = Tuple[str, ...]
+
+# 秒；涵蓋本地嵌入的毫秒級到 LLM 的數十秒
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards: List[Tuple[threading.Thread, Dict[LabelValues, list]]] = []
+        self._retired: Dict[LabelValues, list] = {}
+        self._lock = threading.Lock()
+
+    def _shard(self) -> Dict[LabelValues, list]:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard: Dict[LabelValues, list] = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+            self._local.shard = shard
+            return shard
+
+    def _check_labels(self, labels: LabelValues) -> LabelValues:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {labels}")
+        return labels
+
+    def _new_row(self) -> list:
+        raise NotImplementedError
+
+    @staticmethod
+    def _merge_row(into: list, row: list) -> None:
+        for i, v in enumerate(row):
+            into[i] += v
+
+    def _snapshot(self) -> Dict[LabelValues, list]:
+        with self._lock:
+            alive = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    alive.append((thread, shard))
+                    continue
+                # 擁有者已結束，不會再寫入：併入保留值
+                for labels, row in shard.items():
+                    self._merge_row(self._retired.setdefault(labels, self._new_row()), row)
+            self._shards = alive
+            merged = {labels: list(row) for labels, row in self._retired.items()}
+            shards = [shard for _, shard in alive]
+        for shard in shards:
+            for labels, row in list(shard.items()):
+                self._merge_row(merged.setdefault(labels, self._new_row()), list(row))
+        return merged
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_row(self) -> list:
+        return [0.0]
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        shard = self._shard()
+        row = shard.get(labels)
+        if row is None:
+            row = shard[self._check_labels(labels)] = [0.0]
+        row[0] += amount
+
+    def value(self, *labels: str) -> float:
+        row = self._snapshot().get(labels)
+        return row[0] if row else 0.0
+
+    def samples(self) -> Iterator[str]:
+        for labels, row in sorted(self._snapshot().items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(row[0])}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_row(self) -> list:
+        # 各 bucket 的非累積次數 + 超出最大 bucket 的次數，最後兩格為 sum、count
+        return [0.0] * (len(self.buckets) + 3)
+
+    def observe(self, value: float, *labels: str) -> None:
+        shard = self._shard()
+        row = shard.get(labels)
+        if row is None:
+            self._check_labels(labels)
+            row = shard[labels] = self._new_row()
+        row[bisect.bisect_left(self.buckets, value)] += 1
+        row[-2] += value
+        row[-1] += 1
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def count(self, *labels: str) -> float:
+        row = self._snapshot().get(labels)
+        return row[-1] if row else 0.0
+
+    def samples(self) -> Iterator[str]:
+        for labels, row in sorted(self._snapshot().items()):
+            cumulative = 0.0
+            for bound, n in zip(self.buckets + (float("inf"),), row):
+                cumulative += n
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {_format_value(cumulative)}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(row[-2])}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {_format_value(row[-1])}"
+
+
+class Gauge(_Metric):
+    """目前值；可用 set() 記錄，或以 set_function() 在輸出時才計算（例如 collection 大小）。"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._function: Optional[Callable[[], Iterable[Tuple[LabelValues, float]]]] = None
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[self._check_labels(labels)] = float(value)
+
+    def set_function(self, fn: Callable[[], Iterable[Tuple[LabelValues, float]]]) -> None:
+        self._function = fn
+
+    def samples(self) -> Iterator[str]:
+        values = dict(self._values)
+        if self._function is not None:
+            try:
+                values.update({tuple(labels): float(v) for labels, v in self._function()})
+            except Exception:
+                # 取值失敗時略過，不影響其他指標輸出
+                pass
+        for labels, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"Metric {metric.name} already registered with a different type or labels")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))  # type: ignore[return-value]
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))  # type: ignore[return-value]
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))  # type: ignore[return-value]
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(m.render() for m in metrics) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUESTS = REGISTRY.counter("http_requests_total", "HTTP requests by endpoint and status.", ("method", "endpoint", "status"))
+HTTP_REQUEST_DURATION = REGISTRY.histogram("http_request_duration_seconds", "HTTP request latency until the response is returned.", ("method", "endpoint"))
+RAG_STAGE_DURATION = REGISTRY.histogram("rag_stage_duration_seconds", "Latency of RAG pipeline stages.", ("stage",))
+LLM_REQUESTS = REGISTRY.counter("rag_llm_requests_total", "LLM generate calls by provider.", ("provider",))
+LLM_ERRORS = REGISTRY.counter("rag_llm_errors_total", "LLM provider errors.", ("provider",))
+LLM_FALLBACKS = REGISTRY.counter("rag_llm_fallbacks_total", "Answers served by EchoLLM in place of the configured provider.", ("provider", "reason"))
+LLM_HEDGES = REGISTRY.counter("rag_llm_hedges_total", "Hedged duplicate requests sent to a runner-up provider.", ("provider",))
+LLM_FAILOVERS = REGISTRY.counter("rag_llm_failovers_total", "Requests retried on the next provider after a failure.", ("provider",))
+LLM_ROUTED = REGISTRY.counter("rag_llm_routed_total", "Router answers by the provider that won.", ("provider",))
+PROMPT_TOKENS = REGISTRY.histogram("rag_prompt_tokens", "Estimated tokens of assembled prompts.", ("path",), buckets=(250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000, 16000))
+PROMPT_HISTORY_SUMMARIES = REGISTRY.counter("rag_prompt_history_summaries_total", "Rolling history summary lookups (hit, extended from a cached prefix, miss).", ("result",))
+ARTICLE_SUMMARY_LOOKUPS = REGISTRY.counter("rag_article_summary_lookups_total", "Article fast-path summary store lookups.", ("result",))
+CONVERSATION_LOOKUPS = REGISTRY.counter("rag_conversation_lookups_total", "Server-side conversation lookups by conversation_id.", ("result",))
+RATE_LIMIT_REJECTIONS = REGISTRY.counter("rate_limit_rejections_total", "Requests rejected with 429 by the rate limiter.", ("scope",))
+INGEST_DOCUMENTS = REGISTRY.counter("rag_ingest_documents_total", "Documents ingested.")
+INGEST_CHUNKS = REGISTRY.counter("rag_ingest_chunks_total", "Chunks produced by ingest (rate() gives chunks/sec).")
+INGEST_UPSERTS = REGISTRY.counter("rag_ingest_upserts_total", "Chunks embedded and written by ingest.")
+INGEST_CHUNKS_PER_SECOND = REGISTRY.gauge("rag_ingest_chunks_per_second", "Chunk throughput of the most recent ingest.")
+VECTOR_COLLECTION_CHUNKS = REGISTRY.gauge("rag_vector_collection_chunks", "Chunks stored in the active vector collection.", ("collection",))
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    """記錄 RAG 階段耗時到直方圖，並計入目前請求的分段（Server-Timing / 慢請求 log）。"""
+    RAG_STAGE_DURATION.observe(seconds, stage)
+    timings = current_timings()
+    if timings is not None:
+        timings.record(stage, seconds)
+
+
+@contextmanager
+def time_stage(stage: str) -> Iterator[None]:
+    """`with time_stage("embed"): ...`"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
@@ -1,9 +1,15 @@
 from __future__ import annotations
 
+import time
 import uuid
 from typing import Callable
 from contextvars import ContextVar
 
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .metrics import HTTP_REQUEST_DURATION, HTTP_REQUESTS
+from .timing import reset_request_timings, start_request_timings
+
 
 _current_trace_id: ContextVar[str] = ContextVar("trace_id", default="")
 
@@ -16,18 +22,89 @@ def get_current_trace_id() -> str:
 
 
 class TraceIdMiddleware:
+    # 同時支援 sync/async：若只支援 sync，ASGI 下 Django 會把整條鏈切回單一同步執行緒，
+    # async view 的併發效益會完全消失
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response: Callable):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
         trace_id = uuid.uuid4().hex
         request.trace_id = trace_id
         token = _current_trace_id.set(trace_id)
+        timings, timings_token = start_request_timings(trace_id, request.method, request.path)
         try:
             response = self.get_response(request)
         finally:
+            reset_request_timings(timings_token)
+            _current_trace_id.reset(token)
+        response["X-Trace-Id"] = trace_id
+        _finish_timings(response, timings)
+        return response
+
+    async def __acall__(self, request):
+        trace_id = uuid.uuid4().hex
+        request.trace_id = trace_id
+        token = _current_trace_id.set(trace_id)
+        timings, timings_token = start_request_timings(trace_id, request.method, request.path)
+        try:
+            response = await self.get_response(request)
+        finally:
+            reset_request_timings(timings_token)
             _current_trace_id.reset(token)
         response["X-Trace-Id"] = trace_id
+        _finish_timings(response, timings)
+        return response
+
+
+def _finish_timings(response, timings) -> None:
+    response["Server-Timing"] = timings.server_timing()
+    # 串流回應的本體在此之後才產生，由 view 在串流結束時呼叫 finish()
+    if not getattr(response, "streaming", False):
+        timings.finish()
+
+
+def _endpoint_label(request) -> str:
+    # 以路由樣式（如 api/v1/ingest/jobs/<job_id>）為標籤，避免路徑參數造成標籤爆量
+    match = getattr(request, "resolver_match", None)
+    route = getattr(match, "route", None) if match is not None else None
+    return f"/{route}" if route is not None else "unmatched"
+
+
+class MetricsMiddleware:
+    """記錄每個端點的請求數與延遲（串流回應只計到回應開始為止）。"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response: Callable):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self._record(request, response, started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self._record(request, response, started)
         return response
 
+    @staticmethod
+    def _record(request, response, started: float) -> None:
+        endpoint = _endpoint_label(request)
+        HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, request.method, endpoint)
+        HTTP_REQUESTS.inc(request.method, endpoint, str(response.status_code))
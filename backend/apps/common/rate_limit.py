@@ -1,48 +1,300 @@
+"""以來源 IP 計數的滑動視窗限流，由 RateLimitMiddleware 在 view（與 body 解析）之前執行。
+
+每個請求對共用 store 做一次原子操作（清除視窗外紀錄、計數、未超額則記錄），多個 worker 行程共享同一份額度：
+- sqlite：本機多行程共用一個檔案，以 BEGIN IMMEDIATE 的檔案寫鎖保證原子性（預設）
+- redis：單一 Lua script（EVAL），時間取自 Redis 伺服器，多台主機共用
+- memory：行程內，僅供測試或單一行程
+額度於 settings.RATE_LIMITS 宣告。
+"""
 from __future__ import annotations
 
+import logging
+import math
+import os
+import sqlite3
+import threading
 import time
-from functools import wraps
-from typing import Callable
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
 
-from django.core.cache import cache
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from django.http import JsonResponse
 
+from .metrics import RATE_LIMIT_REJECTIONS
 from .schemas import error_response
 
+logger = logging.getLogger(__name__)
 
 
+@dataclass(frozen=True)
+class RateLimitDecision:
+    allowed: bool
+    remaining: int
+    # 被拒絕時，最早一筆紀錄離開視窗所需的秒數
+    retry_after: float = 0.0
 
-def rate_limit(key: str, limit: int, window_seconds: int = 60) -> Callable:
-    """
-    簡易限流：以 cache 計數。
-    key 可用格式字串，例如: "chat:{ip}"。
-    """
 
-    def decorator(view_func: Callable) -> Callable:
-        @wraps(view_func)
-        def _wrapped(request, *args, **kwargs):
-            xff = request.META.get('HTTP_X_FORWARDED_FOR')
-            client_ip = (xff.split(',')[0].strip() if xff else request.META.get('REMOTE_ADDR', 'unknown'))
-            resolved_key = key.format(ip=client_ip)
-            now = int(time.time())
-            window = now // window_seconds
-            cache_key = f"rl:{resolved_key}:{window}"
-            count = cache.get(cache_key, 0)
-            if count >= limit:
-                resp = JsonResponse(
-                    error_response("rate_limit", f"Too many requests, limit={limit}/{window_seconds}s"),
-                    status=429,
+class RateLimitStore:
+    def hit(self, key: str, limit: int, window_seconds: float, now: Optional[float] = None) -> RateLimitDecision:
+        """原子地記錄一次請求；視窗內已有 limit 筆時拒絕且不記錄。"""
+        raise NotImplementedError
+
+    def reset(self) -> None:
+        raise NotImplementedError
+
+
+class MemoryRateLimitStore(RateLimitStore):
+    def __init__(self) -> None:
+        self._hits: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, limit: int, window_seconds: float, now: Optional[float] = None) -> RateLimitDecision:
+        now = time.time() if now is None else now
+        with self._lock:
+            hits = self._hits.setdefault(key, deque())
+            while hits and hits[0] <= now - window_seconds:
+                hits.popleft()
+            if len(hits) >= limit:
+                return RateLimitDecision(False, 0, hits[0] + window_seconds - now)
+            hits.append(now)
+            return RateLimitDecision(True, limit - len(hits))
+
+    def reset(self) -> None:
+        with self._lock:
+            self._hits.clear()
+
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_limit_hits (
+    key TEXT NOT NULL,
+    ts REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rate_limit_hits_key_ts ON rate_limit_hits (key, ts);
+"""
+
+
+class SQLiteRateLimitStore(RateLimitStore):
+    """多個行程開啟同一檔案即共用額度；每次 hit 為一個 BEGIN IMMEDIATE 交易。"""
+
+    # 每隔多少次 hit 清除所有 key 的過期紀錄（各 key 自己的過期紀錄在 hit 時即清除）
+    PURGE_EVERY = 1000
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # 限流紀錄遺失可接受，不需每次交易 fsync
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.executescript(_SQLITE_SCHEMA)
+        self._hits_since_purge = 0
+        self._max_window = 0.0
+
+    def hit(self, key: str, limit: int, window_seconds: float, now: Optional[float] = None) -> RateLimitDecision:
+        now = time.time() if now is None else now
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM rate_limit_hits WHERE key = ? AND ts <= ?", (key, now - window_seconds))
+                count, oldest = self._conn.execute(
+                    "SELECT COUNT(*), MIN(ts) FROM rate_limit_hits WHERE key = ?", (key,)
+                ).fetchone()
+                if count >= limit:
+                    decision = RateLimitDecision(False, 0, oldest + window_seconds - now)
+                else:
+                    self._conn.execute("INSERT INTO rate_limit_hits (key, ts) VALUES (?, ?)", (key, now))
+                    decision = RateLimitDecision(True, limit - count - 1)
+                self._maybe_purge_locked(now, window_seconds)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return decision
+
+    def _maybe_purge_locked(self, now: float, window_seconds: float) -> None:
+        self._max_window = max(self._max_window, window_seconds)
+        self._hits_since_purge += 1
+        if self._hits_since_purge >= self.PURGE_EVERY:
+            self._hits_since_purge = 0
+            self._conn.execute("DELETE FROM rate_limit_hits WHERE ts <= ?", (now - self._max_window,))
+
+    def reset(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM rate_limit_hits")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# KEYS[1]=key；ARGV: window 秒、limit、唯一成員。回傳 {allowed, remaining, retry_after}
+_REDIS_SLIDING_WINDOW = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local window = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+local count = redis.call('ZCARD', KEYS[1])
+if count < limit then
+    redis.call('ZADD', KEYS[1], now, ARGV[3])
+    redis.call('PEXPIRE', KEYS[1], math.ceil(window * 1000))
+    return {1, limit - count - 1, '0'}
+end
+local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+return {0, 0, tostring(tonumber(oldest[2]) + window - now)}
+"""
+
+
+class RedisRateLimitStore(RateLimitStore):
+    """任何支援 EVAL 的 Redis 相容伺服器；client 需提供 redis-py 的 eval / scan_iter / delete 介面。"""
+
+    def __init__(self, client: Any, prefix: str = "rl:") -> None:
+        self._client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, prefix: str = "rl:") -> "RedisRateLimitStore":
+        try:
+            import redis
+        except ImportError as exc:
+            raise RuntimeError("RATE_LIMIT_STORE=redis requires the redis package: pip install redis") from exc
+        return cls(redis.Redis.from_url(url), prefix)
+
+    def hit(self, key: str, limit: int, window_seconds: float, now: Optional[float] = None) -> RateLimitDecision:
+        # now 僅供其他 store 測試用；Redis 以伺服器時間為準，避免多台主機時鐘不一致
+        allowed, remaining, retry_after = self._client.eval(
+            _REDIS_SLIDING_WINDOW, 1, self.prefix + key, window_seconds, limit, uuid.uuid4().hex
+        )
+        return RateLimitDecision(bool(int(allowed)), int(remaining), float(retry_after))
+
+    def reset(self) -> None:
+        keys = list(self._client.scan_iter(match=self.prefix + "*"))
+        if keys:
+            self._client.delete(*keys)
+
+
+@dataclass(frozen=True)
+class Quota:
+    scope: str
+    limit: int
+    window_seconds: float
+
+
+def load_quotas(config: Dict[str, Dict[str, Any]]) -> Dict[Tuple[str, str], Quota]:
+    """settings.RATE_LIMITS -> {(method, path): Quota}。"""
+    routes: Dict[Tuple[str, str], Quota] = {}
+    for scope, spec in config.items():
+        quota = Quota(scope, int(spec["limit"]), float(spec.get("window", 60)))
+        for method in spec.get("methods") or ["POST"]:
+            for path in spec["paths"]:
+                routes[(method.upper(), path.rstrip("/") or "/")] = quota
+    return routes
+
+
+def client_ip(request) -> str:
+    xff = request.META.get("HTTP_X_FORWARDED_FOR")
+    return xff.split(",")[0].strip() if xff else request.META.get("REMOTE_ADDR", "unknown")
+
+
+def retry_after_header(decision: RateLimitDecision) -> str:
+    return str(max(1, math.ceil(decision.retry_after)))
+
+
+_STORE: Optional[RateLimitStore] = None
+_STORE_LOCK = threading.Lock()
+
+
+def create_rate_limit_store(kind: str, *, sqlite_path: str = "", redis_url: str = "") -> RateLimitStore:
+    kind = (kind or "sqlite").strip().lower()
+    if kind == "memory":
+        return MemoryRateLimitStore()
+    if kind == "redis":
+        return RedisRateLimitStore.from_url(redis_url)
+    if kind == "sqlite":
+        return SQLiteRateLimitStore(sqlite_path)
+    raise ValueError(f"Unknown RATE_LIMIT_STORE {kind!r}; expected sqlite, redis or memory")
+
+
+def get_rate_limit_store() -> RateLimitStore:
+    global _STORE
+    if _STORE is None:
+        with _STORE_LOCK:
+            if _STORE is None:
+                from django.conf import settings
+
+                _STORE = create_rate_limit_store(
+                    settings.RATE_LIMIT_STORE,
+                    sqlite_path=settings.RATE_LIMIT_SQLITE_PATH,
+                    redis_url=settings.RATE_LIMIT_REDIS_URL,
                 )
-                # Provide Retry-After based on remaining window seconds
-                remain = window_seconds - (now % window_seconds)
-                resp["Retry-After"] = str(remain)
-                return resp
-            cache.add(cache_key, 0, timeout=window_seconds)
-            cache.incr(cache_key)
-            return view_func(request, *args, **kwargs)
+    return _STORE
+
+
+class RateLimitMiddleware:
+    """依 settings.RATE_LIMITS 對 (method, path) 限流；於 view 之前執行，超額請求不會讀取或驗證 body。
+
+    store 無法使用時放行（fail open）並記錄錯誤，避免限流後端故障導致整站 429/500。
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response: Callable):
+        from django.conf import settings
+
+        self.get_response = get_response
+        self.routes = load_quotas(getattr(settings, "RATE_LIMITS", {}))
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _quota(self, request) -> Optional[Quota]:
+        return self.routes.get((request.method, request.path_info.rstrip("/") or "/"))
+
+    @staticmethod
+    def _check(quota: Quota, key: str) -> Optional[RateLimitDecision]:
+        try:
+            return get_rate_limit_store().hit(key, quota.limit, quota.window_seconds)
+        except Exception:
+            logger.exception("rate_limit_store_failed", extra={"scope": quota.scope})
+            return None
 
-        return _wrapped
+    @staticmethod
+    def _rejected(quota: Quota, decision: RateLimitDecision) -> JsonResponse:
+        RATE_LIMIT_REJECTIONS.inc(quota.scope)
+        resp = JsonResponse(
+            error_response("rate_limit", f"Too many requests, limit={quota.limit}/{quota.window_seconds:g}s"),
+            status=429,
+        )
+        resp["Retry-After"] = retry_after_header(decision)
+        return resp
 
-    return decorator
+    @staticmethod
+    def _annotate(response, quota: Quota, decision: Optional[RateLimitDecision]):
+        if decision is not None:
+            response["X-RateLimit-Limit"] = str(quota.limit)
+            response["X-RateLimit-Remaining"] = str(decision.remaining)
+        return response
 
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        quota = self._quota(request)
+        if quota is None:
+            return self.get_response(request)
+        decision = self._check(quota, f"{quota.scope}:{client_ip(request)}")
+        if decision is not None and not decision.allowed:
+            return self._rejected(quota, decision)
+        return self._annotate(self.get_response(request), quota, decision)
 
+    async def __acall__(self, request):
+        quota = self._quota(request)
+        if quota is None:
+            return await self.get_response(request)
+        # store 操作可能等待檔案鎖或網路，移出事件迴圈
+        decision = await sync_to_async(self._check, thread_sensitive=False)(quota, f"{quota.scope}:{client_ip(request)}")
+        if decision is not None and not decision.allowed:
+            return self._rejected(quota, decision)
+        return self._annotate(await self.get_response(request), quota, decision)
@@ -0,0 +1,104 @@
+"""單一請求的分段計時：綁定在 TraceIdMiddleware 的 trace_id 上，輸出成 Server-Timing 與慢請求 log。
+
+各階段以 apps.common.metrics.time_stage 記錄（同時寫入 Prometheus 直方圖）；run_blocking 會複製
+contextvars，因此在執行緒池中的階段也會記到同一個請求。
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+_current_timings: ContextVar[Optional["RequestTimings"]] = ContextVar("request_timings", default=None)
+
+
+def slow_request_threshold_ms() -> float:
+    return float(os.getenv("SLOW_REQUEST_MS", "3000"))
+
+
+@dataclass
+class RequestTimings:
+    trace_id: str
+    method: str = ""
+    path: str = ""
+    started: float = field(default_factory=time.perf_counter)
+    # 階段 -> 累計毫秒（同一階段可能執行多次）
+    stages: Dict[str, float] = field(default_factory=dict)
+    # 候選數、提示長度等診斷資訊
+    details: Dict[str, Any] = field(default_factory=dict)
+    # 非耗時的數值（例如 prompt_tokens），放在 summary() 但不放進 Server-Timing
+    values: Dict[str, float] = field(default_factory=dict)
+    finished: bool = False
+
+    def record(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds * 1000
+
+    def annotate(self, **details: Any) -> None:
+        self.details.update(details)
+
+    def set_value(self, name: str, value: float) -> None:
+        self.values[name] = value
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def durations(self) -> Dict[str, float]:
+        out = {stage: round(ms, 1) for stage, ms in self.stages.items()}
+        out["total"] = round(self.total_ms(), 1)
+        return out
+
+    def summary(self) -> Dict[str, float]:
+        return {**self.durations(), **self.values}
+
+    def server_timing(self) -> str:
+        return ", ".join(f"{stage};dur={ms}" for stage, ms in self.durations().items())
+
+    def finish(self) -> None:
+        """請求結束時呼叫一次；超過 SLOW_REQUEST_MS 時記錄完整的分段。"""
+        if self.finished:
+            return
+        self.finished = True
+        total = self.total_ms()
+        if total < slow_request_threshold_ms():
+            return
+        logger.warning(
+            "slow_request %s %s %.1fms stages=%s details=%s",
+            self.method,
+            self.path,
+            total,
+            json.dumps(self.summary(), ensure_ascii=False),
+            json.dumps(self.details, ensure_ascii=False, default=str),
+            extra={"trace_id": self.trace_id},
+        )
+
+
+def start_request_timings(trace_id: str, method: str = "", path: str = ""):
+    """建立並綁定目前請求的計時；回傳 (timings, token)，結束時以 token 解除綁定。"""
+    timings = RequestTimings(trace_id=trace_id, method=method, path=path)
+    return timings, _current_timings.set(timings)
+
+
+def reset_request_timings(token) -> None:
+    _current_timings.reset(token)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    return _current_timings.get()
+
+
+def annotate_request(**details: Any) -> None:
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.annotate(**details)
+
+
+def record_value(name: str, value: float) -> None:
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.set_value(name, value)
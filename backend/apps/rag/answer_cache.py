@@ -0,0 +1,203 @@
+"""回答快取（兩層）：
+
+- exact：以正規化訊息 + 檢索範圍（doc_ids、top_k、inline_citations、模型）為鍵。
+- semantic：同一檢索範圍內，查詢向量與已快取查詢的 cosine 相似度 ≥ 門檻即重用回答。
+  查詢中的數字（條號、年資、天數）也納入範圍，避免「第38條」命中「第39條」的回答。
+
+兩層都帶 TTL 與容量上限（LRU），並綁定語料版本：任何改變語料的 ingest 之後，
+第一次存取就會整批清空。只快取無對話歷史的請求。
+"""
+from __future__ import annotations
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from apps.api.schemas import ChatResponse
+from .corpus import get_corpus_generation
+
+
+_WHITESPACE = re.compile(r"\s+")
+_NUMBERS = re.compile(r"\d+")
+
+# (doc_ids, top_k, inline_citations, model, 查詢中的數字)
+Scope = Tuple[Tuple[str, ...], int, Optional[bool], str, Tuple[str, ...]]
+
+
+@dataclass(frozen=True)
+class AnswerCacheKey:
+    normalized: str
+    scope: Scope
+
+
+def make_cache_key(normalized_message: str, *, doc_ids: Optional[List[str]], top_k: int, inline_citations: Optional[bool], model: str) -> AnswerCacheKey:
+    text = _WHITESPACE.sub(" ", normalized_message).strip().lower()
+    numbers = tuple(_NUMBERS.findall(text))
+    return AnswerCacheKey(normalized=text, scope=(tuple(sorted(doc_ids or [])), top_k, inline_citations, model, numbers))
+
+
+@dataclass
+class _Entry:
+    response: ChatResponse
+    expires_at: float
+    scope: Scope
+    vector: Optional[np.ndarray]
+
+
+class AnswerCache:
+    def __init__(self, max_entries: int = 512, ttl_seconds: float = 600.0, semantic_threshold: Optional[float] = 0.92) -> None:
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        # None 代表停用語意層
+        self.semantic_threshold = semantic_threshold
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._generation: Optional[str] = None
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def semantic_enabled(self) -> bool:
+        return self.semantic_threshold is not None
+
+    @staticmethod
+    def _exact_key(key: AnswerCacheKey) -> str:
+        return repr((key.normalized, key.scope))
+
+    def _sync_generation_locked(self, generation: str) -> None:
+        if generation != self._generation:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._generation = generation
+
+    def get(
+        self,
+        key: AnswerCacheKey,
+        query_vector_fn: Optional[Callable[[], Optional[np.ndarray]]] = None,
+        *,
+        generation: Optional[str] = None,
+    ) -> Tuple[Optional[ChatResponse], Optional[np.ndarray]]:
+        """查詢快取，回傳 (命中的回答, 查詢向量)。
+
+        查詢向量只在 exact 層未命中且啟用語意層時才計算（於鎖外呼叫 query_vector_fn），
+        並回傳給呼叫端重用於檢索，避免重複嵌入。
+        """
+        generation = get_corpus_generation() if generation is None else generation
+        with self._lock:
+            self._sync_generation_locked(generation)
+            ek = self._exact_key(key)
+            entry = self._entries.get(ek)
+            if entry is not None:
+                if entry.expires_at > time.monotonic():
+                    self._entries.move_to_end(ek)
+                    self.exact_hits += 1
+                    return entry.response.model_copy(deep=True), None
+                del self._entries[ek]
+
+        vector: Optional[np.ndarray] = None
+        if self.semantic_enabled and query_vector_fn is not None:
+            vector = query_vector_fn()
+            if vector is not None:
+                with self._lock:
+                    hit = self._semantic_lookup_locked(key.scope, vector, time.monotonic())
+                    if hit is not None:
+                        self.semantic_hits += 1
+                        return hit.response.model_copy(deep=True), vector
+
+        with self._lock:
+            self.misses += 1
+        return None, vector
+
+    def _semantic_lookup_locked(self, scope: Scope, query_vector: np.ndarray, now: float) -> Optional[_Entry]:
+        candidates = [(k, e) for k, e in self._entries.items() if e.scope == scope and e.vector is not None and e.expires_at > now]
+        if not candidates:
+            return None
+        q = np.asarray(query_vector, dtype=np.float32).ravel()
+        q_norm = float(np.linalg.norm(q))
+        if q_norm == 0.0:
+            return None
+        matrix = np.stack([e.vector for _, e in candidates])
+        if matrix.shape[1] != q.shape[0]:
+            return None
+        # 快取時已將向量正規化，這裡只需對查詢向量正規化
+        sims = matrix @ (q / q_norm)
+        best = int(np.argmax(sims))
+        if float(sims[best]) < float(self.semantic_threshold or 1.0):
+            return None
+        k, entry = candidates[best]
+        self._entries.move_to_end(k)
+        return entry
+
+    def put(self, key: AnswerCacheKey, response: ChatResponse, query_vector: Optional[np.ndarray] = None, *, generation: Optional[str] = None) -> None:
+        current = get_corpus_generation()
+        if generation is not None and generation != current:
+            # 計算回答期間語料已變更，這份回答可能已過時
+            return
+        generation = current
+        vector: Optional[np.ndarray] = None
+        if self.semantic_enabled and query_vector is not None:
+            v = np.asarray(query_vector, dtype=np.float32).ravel()
+            n = float(np.linalg.norm(v))
+            vector = v / n if n > 0 else None
+        with self._lock:
+            self._sync_generation_locked(generation)
+            ek = self._exact_key(key)
+            self._entries[ek] = _Entry(
+                response=response.model_copy(deep=True),
+                expires_at=time.monotonic() + self.ttl_seconds,
+                scope=key.scope,
+                vector=vector,
+            )
+            self._entries.move_to_end(ek)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "semantic_threshold": self.semantic_threshold,
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.exact_hits + self.semantic_hits) / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
+
+
+_ANSWER_CACHE: Optional[AnswerCache] = None
+_ANSWER_CACHE_LOCK = threading.Lock()
+
+
+def get_answer_cache() -> Optional[AnswerCache]:
+    """ANSWER_CACHE=0 時停用；ANSWER_CACHE_SEMANTIC_THRESHOLD 設為空值或 0 時只用 exact 層。"""
+    global _ANSWER_CACHE
+    if (os.getenv("ANSWER_CACHE") or "1").strip() == "0":
+        return None
+    if _ANSWER_CACHE is None:
+        with _ANSWER_CACHE_LOCK:
+            if _ANSWER_CACHE is None:
+                raw_threshold = (os.getenv("ANSWER_CACHE_SEMANTIC_THRESHOLD") or "0.92").strip()
+                threshold = float(raw_threshold) if raw_threshold not in ("", "0") else None
+                _ANSWER_CACHE = AnswerCache(
+                    max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "512")),
+                    ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "600")),
+                    semantic_threshold=threshold,
+                )
+    return _ANSWER_CACHE
@@ -0,0 +1,294 @@
+"""條文摘要的持久化儲存（SQLite）：「第N條」快速路徑直接回傳已產生的摘要，不必每次呼叫 LLM。
+
+- 鍵：(template_id, 條號, 模型, prompt 版本)；prompt 版本取摘要指示的雜湊，修改指示即自動失效。
+  模型為實際產生摘要的供應商：設定 LLMRouter 時依勝出者（含對沖）保存，查詢時依路由排序逐一查各供應商，
+  增減路由中的供應商不會讓既有摘要失效。
+- 每筆記錄產生時的模板內容雜湊；模板內容改變後舊摘要不再命中，並於重新 ingest 模板或預熱時刪除。
+- 填入：查詢未命中時於 LLM 回答後寫入（lazy）；或 ingest 模板後背景預熱（ARTICLE_SUMMARY_WARMUP=1）、
+  `manage.py summarize_articles` 批次產生。
+- 只儲存供應商成功產生的摘要；EchoLLM 或回退的回答不寫入。
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set
+
+from apps.common.metrics import ARTICLE_SUMMARY_LOOKUPS
+
+from .llm_providers import BaseLLM, EchoLLM, LLMCallError, get_default_llm
+from .llm_router import LLMRouter
+from .templates_registry import extract_article_text, normalize_article_no, template_articles, template_content_hash
+
+logger = logging.getLogger(__name__)
+
+
+ARTICLE_SUMMARY_INSTRUCTIONS = (
+    "請嚴格依據下列條文，用繁體中文回答：\n"
+    "1) 先給一句話結論。\n"
+    "2) 接著條列重點 3-6 點（精簡、準確）。\n"
+    "3) 不要貼出全文，不要使用數字型內文引用。\n"
+    "4) 若條文有列舉項目，請歸納而非照抄。\n"
+)
+PROMPT_VERSION = hashlib.sha256(ARTICLE_SUMMARY_INSTRUCTIONS.encode("utf-8")).hexdigest()[:12]
+
+
+def build_article_prompt(article_text: str) -> str:
+    return f"{ARTICLE_SUMMARY_INSTRUCTIONS}\n--- 條文開始 ---\n{article_text}\n--- 條文結束 ---\n"
+
+
+def model_label(llm: BaseLLM) -> str:
+    return f"{llm.provider}:{getattr(llm, 'model', '')}"
+
+
+def answering_providers(llm: BaseLLM) -> List[BaseLLM]:
+    """可能產生回答的供應商；路由器依目前排序展開。"""
+    if isinstance(llm, LLMRouter):
+        return [llm.providers[i] for i in llm.rank()]
+    return [llm]
+
+
+@dataclass(frozen=True)
+class SummaryKey:
+    template_id: str
+    article_no: str
+    model: str
+    prompt_version: str
+    template_hash: str
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS article_summaries (
+    template_id TEXT NOT NULL,
+    article_no TEXT NOT NULL,
+    model TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    template_hash TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (template_id, article_no, model, prompt_version)
+) WITHOUT ROWID;
+"""
+
+
+class ArticleSummaryStore:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def get(self, key: SummaryKey) -> Optional[str]:
+        return self.get_any([key])
+
+    def get_any(self, keys: Sequence[SummaryKey]) -> Optional[str]:
+        """依序查詢，回傳第一個命中的摘要，整次查詢只計一次命中或未命中。
+
+        模板內容雜湊相符才命中；不符代表條文已更新，視為未命中。
+        """
+        summary = None
+        with self._lock:
+            for key in keys:
+                row = self._conn.execute(
+                    "SELECT summary, template_hash FROM article_summaries "
+                    "WHERE template_id = ? AND article_no = ? AND model = ? AND prompt_version = ?",
+                    (key.template_id, key.article_no, key.model, key.prompt_version),
+                ).fetchone()
+                if row is not None and row[1] == key.template_hash:
+                    summary = row[0]
+                    break
+            if summary is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        ARTICLE_SUMMARY_LOOKUPS.inc("hit" if summary is not None else "miss")
+        return summary
+
+    def put(self, key: SummaryKey, summary: str) -> None:
+        summary = summary.strip()
+        if not summary:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO article_summaries "
+                "(template_id, article_no, model, prompt_version, template_hash, summary, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key.template_id, key.article_no, key.model, key.prompt_version, key.template_hash, summary, time.time()),
+            )
+
+    def existing(self, template_id: str, model: str, template_hash: str) -> Set[str]:
+        """目前仍有效（模板雜湊與 prompt 版本相符）的條號。"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT article_no FROM article_summaries WHERE template_id = ? AND model = ? AND prompt_version = ? AND template_hash = ?",
+                (template_id, model, PROMPT_VERSION, template_hash),
+            ).fetchall()
+        return {r[0] for r in rows}
+
+    def purge_stale(self, template_id: str, template_hash: str) -> int:
+        """刪除模板內容或摘要指示已變更的摘要，回傳刪除筆數。"""
+        with self._lock:
+            cur = self._conn.execute(
+                "DELETE FROM article_summaries WHERE template_id = ? AND (template_hash != ? OR prompt_version != ?)",
+                (template_id, template_hash, PROMPT_VERSION),
+            )
+        return cur.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM article_summaries").fetchone()[0]
+            return {"path": self.path, "hits": self.hits, "misses": self.misses, "entries": entries}
+
+
+_STORES: Dict[str, ArticleSummaryStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def default_store_path() -> Optional[str]:
+    """ARTICLE_SUMMARIES=0 時停用；否則預設放在 VECTOR_DIR 內，可用 ARTICLE_SUMMARY_PATH 覆寫。"""
+    if (os.getenv("ARTICLE_SUMMARIES") or "1").strip() == "0":
+        return None
+    from .vectorstore import VSConfig
+
+    return (os.getenv("ARTICLE_SUMMARY_PATH") or "").strip() or os.path.join(VSConfig().persist_dir, "article_summaries.sqlite3")
+
+
+def get_article_summary_store() -> Optional[ArticleSummaryStore]:
+    path = default_store_path()
+    if path is None:
+        return None
+    key = os.path.abspath(path)
+    with _STORES_LOCK:
+        store = _STORES.get(key)
+        if store is None:
+            store = _STORES[key] = ArticleSummaryStore(key)
+        return store
+
+
+def summary_key(template_id: str, article_no: str, llm: BaseLLM) -> Optional[SummaryKey]:
+    """單一供應商的鍵；EchoLLM 的回答不值得保存，回傳 None；模板不存在時同樣回傳 None。"""
+    if isinstance(llm, EchoLLM):
+        return None
+    template_hash = template_content_hash(template_id)
+    if template_hash is None:
+        return None
+    return SummaryKey(template_id, normalize_article_no(article_no), model_label(llm), PROMPT_VERSION, template_hash)
+
+
+def summary_keys(template_id: str, article_no: str, llm: BaseLLM) -> List[SummaryKey]:
+    """查詢用的鍵，依 answering_providers 的順序；沒有可保存的供應商時為空。"""
+    keys = (summary_key(template_id, article_no, provider) for provider in answering_providers(llm))
+    return [key for key in keys if key is not None]
+
+
+def lookup_summary(keys: Sequence[SummaryKey]) -> Optional[str]:
+    store = get_article_summary_store() if keys else None
+    return store.get_any(keys) if store else None
+
+
+def save_summary(key: Optional[SummaryKey], summary: str) -> None:
+    store = get_article_summary_store() if key else None
+    if store and key:
+        try:
+            store.put(key, summary)
+        except sqlite3.Error:
+            logger.exception("article_summary_save_failed", extra={"template_id": key.template_id, "article": key.article_no})
+
+
+@dataclass
+class WarmupStats:
+    template_id: str
+    articles: int = 0
+    cached: int = 0
+    generated: int = 0
+    failed: int = 0
+    purged: int = 0
+    seconds: float = 0.0
+
+
+def warm_article_summaries(template_id: str, llm: Optional[BaseLLM] = None, *, concurrency: Optional[int] = None, articles: Optional[Iterable[str]] = None) -> WarmupStats:
+    """為模板中尚無有效摘要的條文產生摘要；先刪除過期摘要。供應商為 Echo 時不做任何事。"""
+    started = time.perf_counter()
+    stats = WarmupStats(template_id)
+    llm = llm or get_default_llm()
+    store = get_article_summary_store()
+    template_hash = template_content_hash(template_id)
+    if store is None or template_hash is None or isinstance(llm, EchoLLM):
+        return stats
+    stats.purged = store.purge_stale(template_id, template_hash)
+    wanted = [normalize_article_no(a) for a in articles] if articles is not None else template_articles(template_id)
+    stats.articles = len(wanted)
+    # 任一供應商已有有效摘要即不再產生
+    done: Set[str] = set()
+    for provider in answering_providers(llm):
+        done |= store.existing(template_id, model_label(provider), template_hash)
+    todo = [no for no in wanted if no not in done]
+    stats.cached = stats.articles - len(todo)
+
+    def summarize(article_no: str) -> bool:
+        text = extract_article_text(template_id, article_no)
+        if not text:
+            return False
+        try:
+            summary, producer = llm.complete_attributed(build_article_prompt(text))
+        except LLMCallError as exc:
+            logger.warning("article_summary_warmup_failed", extra={"template_id": template_id, "article": article_no, "reason": exc.reason})
+            return False
+        key = summary_key(template_id, article_no, producer)
+        if key is None:
+            return False
+        store.put(key, summary)
+        return True
+
+    workers = concurrency or max(1, int(os.getenv("ARTICLE_SUMMARY_WARMUP_CONCURRENCY", "4")))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="article-summary") as pool:
+        for ok in pool.map(summarize, todo):
+            if ok:
+                stats.generated += 1
+            else:
+                stats.failed += 1
+    stats.seconds = round(time.perf_counter() - started, 3)
+    return stats
+
+
+_WARMING: Set[str] = set()
+_WARMING_LOCK = threading.Lock()
+
+
+def start_summary_warmup(template_id: str) -> Optional[threading.Thread]:
+    """ingest 模板後呼叫：刪除過期摘要；ARTICLE_SUMMARY_WARMUP=1 時另於背景執行緒預先產生全部條文摘要。"""
+    store = get_article_summary_store()
+    template_hash = template_content_hash(template_id)
+    if store is None or template_hash is None:
+        return None
+    store.purge_stale(template_id, template_hash)
+    if (os.getenv("ARTICLE_SUMMARY_WARMUP") or "0").strip() != "1":
+        return None
+    with _WARMING_LOCK:
+        if template_id in _WARMING:
+            return None
+        _WARMING.add(template_id)
+
+    def run() -> None:
+        try:
+            stats = warm_article_summaries(template_id)
+            logger.info("article_summary_warmup_done", extra={"template_id": template_id, "generated": stats.generated, "failed": stats.failed, "seconds": stats.seconds})
+        except Exception:
+            logger.exception("article_summary_warmup_crashed", extra={"template_id": template_id})
+        finally:
+            with _WARMING_LOCK:
+                _WARMING.discard(template_id)
+
+    thread = threading.Thread(target=run, name=f"article-summary-{template_id}", daemon=True)
+    thread.start()
+    return thread
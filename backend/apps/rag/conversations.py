@@ -0,0 +1,279 @@
+"""伺服器端對話 session：回應帶 conversation_id，之後的請求只需送出新訊息，歷史由伺服器保存。
+
+- 未帶 conversation_id 的請求開新對話（以請求中的 history 為起點）；回答完成後才寫入本輪的問與答。
+- 每個對話只保留最近 max_turns 則；最後一次寫入後超過 ttl_seconds 即過期，對話數超過 max_sessions
+  時淘汰最久未更新者。
+- store 於 settings.CONVERSATION_STORE 選擇：sqlite（預設，多個 worker 共用一個檔案）或 memory（單一行程）。
+- 同一對話的並行請求讀到相同歷史，問答依完成順序寫入。
+"""
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from apps.api.schemas import ChatTurn
+from apps.common.metrics import CONVERSATION_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+# (role, content)
+Turn = Tuple[str, str]
+
+
+class ConversationNotFound(LookupError):
+    """conversation_id 不存在或已過期。"""
+
+
+def new_conversation_id() -> str:
+    return uuid.uuid4().hex
+
+
+class ConversationStore:
+    def __init__(self, *, ttl_seconds: float = 86400, max_turns: int = 30, max_sessions: int = 10000) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_turns = max(1, max_turns)
+        self.max_sessions = max(1, max_sessions)
+
+    def get(self, conversation_id: str, now: Optional[float] = None) -> Optional[List[Turn]]:
+        """未過期的對話回傳其回合（舊到新），否則 None。"""
+        raise NotImplementedError
+
+    def append(self, conversation_id: str, turns: Sequence[Turn], now: Optional[float] = None) -> None:
+        """附加回合並更新到期時間；對話不存在或已過期時以這些回合建立新對話。"""
+        raise NotImplementedError
+
+    def delete(self, conversation_id: str) -> None:
+        raise NotImplementedError
+
+    def purge(self, now: Optional[float] = None) -> int:
+        """刪除過期與超出 max_sessions 的對話，回傳刪除數。"""
+        raise NotImplementedError
+
+    def reset(self) -> None:
+        raise NotImplementedError
+
+
+class MemoryConversationStore(ConversationStore):
+    def __init__(self, **limits: Any) -> None:
+        super().__init__(**limits)
+        # conversation_id -> (updated_at, turns)，依更新時間排序
+        self._sessions: "OrderedDict[str, Tuple[float, List[Turn]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, conversation_id: str, now: Optional[float] = None) -> Optional[List[Turn]]:
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._sessions.get(conversation_id)
+            if entry is None:
+                return None
+            if entry[0] <= now - self.ttl_seconds:
+                del self._sessions[conversation_id]
+                return None
+            return list(entry[1])
+
+    def append(self, conversation_id: str, turns: Sequence[Turn], now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._sessions.pop(conversation_id, None)
+            current = entry[1] if entry is not None and entry[0] > now - self.ttl_seconds else []
+            self._sessions[conversation_id] = (now, (current + list(turns))[-self.max_turns:])
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def delete(self, conversation_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(conversation_id, None)
+
+    def purge(self, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        with self._lock:
+            expired = [cid for cid, (updated, _) in self._sessions.items() if updated <= now - self.ttl_seconds]
+            for cid in expired:
+                del self._sessions[cid]
+            return len(expired)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._sessions.clear()
+
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    updated_at REAL NOT NULL,
+    next_seq INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS conversations_updated_at ON conversations (updated_at);
+CREATE TABLE IF NOT EXISTS conversation_turns (
+    conversation_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    PRIMARY KEY (conversation_id, seq)
+) WITHOUT ROWID;
+"""
+
+
+class SQLiteConversationStore(ConversationStore):
+    """多個行程開啟同一檔案即共用對話；每次 append 為一個 BEGIN IMMEDIATE 交易。"""
+
+    # 每隔多少次 append 清除過期與超出上限的對話（讀取時過期的對話已視為不存在）
+    PURGE_EVERY = 100
+
+    def __init__(self, path: str, **limits: Any) -> None:
+        super().__init__(**limits)
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SQLITE_SCHEMA)
+        self._appends_since_purge = 0
+
+    def get(self, conversation_id: str, now: Optional[float] = None) -> Optional[List[Turn]]:
+        now = time.time() if now is None else now
+        with self._lock:
+            row = self._conn.execute("SELECT updated_at FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+            if row is None or row[0] <= now - self.ttl_seconds:
+                return None
+            rows = self._conn.execute(
+                "SELECT role, content FROM conversation_turns WHERE conversation_id = ? ORDER BY seq", (conversation_id,)
+            ).fetchall()
+        return [(role, content) for role, content in rows]
+
+    def append(self, conversation_id: str, turns: Sequence[Turn], now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT updated_at, next_seq FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+                seq = 0
+                if row is not None and row[0] > now - self.ttl_seconds:
+                    seq = row[1]
+                else:
+                    self._conn.execute("DELETE FROM conversation_turns WHERE conversation_id = ?", (conversation_id,))
+                self._conn.executemany(
+                    "INSERT INTO conversation_turns (conversation_id, seq, role, content) VALUES (?, ?, ?, ?)",
+                    [(conversation_id, seq + i, role, content) for i, (role, content) in enumerate(turns)],
+                )
+                seq += len(turns)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO conversations (id, updated_at, next_seq) VALUES (?, ?, ?)", (conversation_id, now, seq)
+                )
+                self._conn.execute(
+                    "DELETE FROM conversation_turns WHERE conversation_id = ? AND seq < ?", (conversation_id, seq - self.max_turns)
+                )
+                self._appends_since_purge += 1
+                if self._appends_since_purge >= self.PURGE_EVERY:
+                    self._appends_since_purge = 0
+                    self._purge_locked(now)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _delete_where_locked(self, condition: str, params: Tuple[Any, ...]) -> int:
+        self._conn.execute(
+            f"DELETE FROM conversation_turns WHERE conversation_id IN (SELECT id FROM conversations WHERE {condition})", params
+        )
+        return self._conn.execute(f"DELETE FROM conversations WHERE {condition}", params).rowcount
+
+    def _purge_locked(self, now: float) -> int:
+        removed = self._delete_where_locked("updated_at <= ?", (now - self.ttl_seconds,))
+        removed += self._delete_where_locked(
+            "id IN (SELECT id FROM conversations ORDER BY updated_at DESC LIMIT -1 OFFSET ?)", (self.max_sessions,)
+        )
+        return removed
+
+    def delete(self, conversation_id: str) -> None:
+        with self._lock:
+            self._delete_where_locked("id = ?", (conversation_id,))
+
+    def purge(self, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                removed = self._purge_locked(now)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return removed
+
+    def reset(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM conversation_turns")
+            self._conn.execute("DELETE FROM conversations")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_STORE: Optional[ConversationStore] = None
+_STORE_LOCK = threading.Lock()
+
+
+def create_conversation_store(kind: str, *, sqlite_path: str = "", **limits: Any) -> ConversationStore:
+    kind = (kind or "sqlite").strip().lower()
+    if kind == "memory":
+        return MemoryConversationStore(**limits)
+    if kind == "sqlite":
+        return SQLiteConversationStore(sqlite_path, **limits)
+    raise ValueError(f"Unknown CONVERSATION_STORE {kind!r}; expected sqlite or memory")
+
+
+def get_conversation_store() -> ConversationStore:
+    global _STORE
+    if _STORE is None:
+        with _STORE_LOCK:
+            if _STORE is None:
+                from django.conf import settings
+
+                _STORE = create_conversation_store(
+                    settings.CONVERSATION_STORE,
+                    sqlite_path=settings.CONVERSATION_SQLITE_PATH,
+                    ttl_seconds=settings.CONVERSATION_TTL_SECONDS,
+                    max_turns=settings.CONVERSATION_MAX_TURNS,
+                    max_sessions=settings.CONVERSATION_MAX_SESSIONS,
+                )
+    return _STORE
+
+
+@dataclass
+class Conversation:
+    conversation_id: str
+    # 交給 RAG 的歷史
+    history: List[ChatTurn]
+    # 新對話的起始回合（請求中的 history），與本輪問答一起寫入
+    seed: List[Turn] = field(default_factory=list)
+
+
+def open_conversation(conversation_id: Optional[str], history: Optional[List[ChatTurn]]) -> Conversation:
+    """取得對話歷史；conversation_id 不存在或已過期時拋出 ConversationNotFound。"""
+    if conversation_id is None:
+        turns = list(history or [])
+        return Conversation(new_conversation_id(), turns, [(t.role, t.content) for t in turns])
+    stored = get_conversation_store().get(conversation_id)
+    CONVERSATION_LOOKUPS.inc("miss" if stored is None else "hit")
+    if stored is None:
+        raise ConversationNotFound(conversation_id)
+    # 寫入前已驗證過，不必再次檢查長度
+    return Conversation(conversation_id, [ChatTurn.model_construct(role=role, content=content) for role, content in stored])
+
+
+def record_exchange(conversation: Conversation, message: str, answer: str) -> None:
+    """回答完成後寫入本輪問答；store 故障只記錄錯誤，不影響已產生的回答。"""
+    try:
+        get_conversation_store().append(conversation.conversation_id, conversation.seed + [("user", message), ("assistant", answer)])
+    except sqlite3.Error:
+        logger.exception("conversation_append_failed", extra={"conversation_id": conversation.conversation_id})
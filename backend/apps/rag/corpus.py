@@ -0,0 +1,57 @@
+"""語料版本（corpus generation）：任何改變索引內容的 ingest 都會產生新的版本 token。
+
+版本存於 VECTOR_DIR 下的小檔案，讓多個 worker 程序都能察覺變更；讀取時以
+(inode, mtime) 快取，熱路徑上只多一次 stat。依賴語料內容的快取（例如回答快取）以此判斷是否失效。
+"""
+from __future__ import annotations
+
+import os
+import threading
+import uuid
+from typing import Optional, Tuple
+
+_FILENAME = "corpus_generation"
+_lock = threading.Lock()
+_cached: Optional[Tuple[str, Tuple[int, int], str]] = None  # (path, (inode, mtime_ns), token)
+
+
+def _generation_path(persist_dir: Optional[str] = None) -> str:
+    if persist_dir is None:
+        from .vectorstore import VSConfig
+
+        persist_dir = VSConfig().persist_dir
+    return os.path.join(persist_dir, _FILENAME)
+
+
+def get_corpus_generation(persist_dir: Optional[str] = None) -> str:
+    global _cached
+    path = _generation_path(persist_dir)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return ""
+    # os.replace 每次都產生新 inode，搭配 mtime 判斷即使同一時間刻度內連續更新也不會誤用舊值
+    version = (st.st_ino, st.st_mtime_ns)
+    cached = _cached
+    if cached and cached[0] == path and cached[1] == version:
+        return cached[2]
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            token = fh.read().strip()
+    except FileNotFoundError:
+        return ""
+    with _lock:
+        _cached = (path, version, token)
+    return token
+
+
+def bump_corpus_generation(persist_dir: Optional[str] = None) -> str:
+    """寫入新的版本 token（先寫暫存檔再 os.replace，確保讀方看不到半寫入的內容）。"""
+    path = _generation_path(persist_dir)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    token = uuid.uuid4().hex
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        fh.write(token)
+    os.replace(tmp, path)
+    return token
@@ -4,6 +4,9 @@ from __future__ import annotations
 import os
 import logging
 from typing import Dict, Any, List, Optional
+from dataclasses import asdict
+from .answer_cache import get_answer_cache
+from .manifest import EmbedderMismatchError
 from .vectorstore import ChromaVectorStore, LocalEmbedding, GoogleEmbedding
 
 logger = logging.getLogger(__name__)
@@ -15,6 +18,9 @@ def diagnose_rag_system() -> Dict[str, Any]:
         "status": "unknown",
         "embedding_type": "unknown", 
         "vector_store": {"status": "unknown", "collection_count": 0},
+        "embedding_cache": None,
+        "lexical_index": None,
+        "answer_cache": None,
         "issues": [],
         "recommendations": []
     }
@@ -39,11 +45,25 @@ def diagnose_rag_system() -> Dict[str, Any]:
             results = store.query("test query", top_k=1)
             diagnostics["vector_store"]["status"] = "operational"
             diagnostics["vector_store"]["collection_count"] = len(results)
+            diagnostics["embedding_cache"] = store.embedding_cache_stats()
+            diagnostics["lexical_index"] = store.lexical_index_stats()
+            manifest = store.embedder_manifest()
+            diagnostics["vector_store"]["manifest"] = asdict(manifest) if manifest else None
+            diagnostics["vector_store"]["active_collection"] = store.active_collection_name()
+            if store.needs_reindex():
+                diagnostics["issues"].append(f"Index was built with {manifest.embedder_id if manifest else 'another embedder'}, configured embedder is {store.target_embedder.embedder_id}")
+                diagnostics["recommendations"].append("Run POST /api/v1/reindex or `python manage.py reindex` to rebuild the index")
+            answer_cache = get_answer_cache()
+            diagnostics["answer_cache"] = answer_cache.stats() if answer_cache else None
             
             if len(results) == 0:
                 diagnostics["issues"].append("Vector store is empty - no documents indexed")
                 diagnostics["recommendations"].append("Ingest some documents using /ingest endpoint")
                 
+        except EmbedderMismatchError as e:
+            diagnostics["vector_store"]["status"] = "error"
+            diagnostics["issues"].append(f"Embedder mismatch: {e}")
+            diagnostics["recommendations"].append("Restore the embedding settings used to build the index, or re-ingest into a new VECTOR_DIR")
         except Exception as e:
             diagnostics["vector_store"]["status"] = "error"
             diagnostics["issues"].append(f"Vector store error: {e}")
@@ -0,0 +1,176 @@
+"""以內容雜湊為鍵的持久化嵌入快取（SQLite）。
+
+- 鍵：(embedder_id, sha256(chunk text))；embedder_id 已涵蓋嵌入器類型、模型與維度，
+  另存 dim 欄位於讀取時再次核對，避免維度不符的舊資料被誤用。
+- 值：float32 連續位元組（compact，不存 JSON）。
+- 以 last_used 做近似 LRU，超過 max_entries 時一次淘汰最舊的一批。
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    embedder_id TEXT NOT NULL,
+    text_sha256 TEXT NOT NULL,
+    dim INTEGER NOT NULL,
+    vector BLOB NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (embedder_id, text_sha256)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used);
+"""
+
+# SQLite 單一查詢參數數量上限保守值
+_SQL_BATCH = 500
+
+
+def text_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, path: str, max_entries: int = 100_000) -> None:
+        self.path = path
+        self.max_entries = max(1, max_entries)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def get_many(self, embedder_id: str, digests: List[str]) -> Dict[str, np.ndarray]:
+        found: Dict[str, np.ndarray] = {}
+        if not digests:
+            return found
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(digests), _SQL_BATCH):
+                part = digests[i:i + _SQL_BATCH]
+                marks = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT text_sha256, dim, vector FROM embeddings WHERE embedder_id = ? AND text_sha256 IN ({marks})",
+                    [embedder_id, *part],
+                ).fetchall()
+                for digest, dim, blob in rows:
+                    vec = np.frombuffer(blob, dtype=np.float32)
+                    if vec.shape[0] == dim:
+                        found[digest] = vec
+            if found:
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE embedder_id = ? AND text_sha256 = ?",
+                    [(now, embedder_id, d) for d in found],
+                )
+        return found
+
+    def put_many(self, embedder_id: str, items: Dict[str, np.ndarray]) -> None:
+        if not items:
+            return
+        now = time.time()
+        rows = []
+        for digest, vec in items.items():
+            arr = np.ascontiguousarray(vec, dtype=np.float32)
+            if arr.ndim != 1 or arr.shape[0] == 0:
+                continue
+            rows.append((embedder_id, digest, int(arr.shape[0]), arr.tobytes(), now))
+        if not rows:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (embedder_id, text_sha256, dim, vector, last_used) VALUES (?, ?, ?, ?, ?)",
+                    rows,
+                )
+                self._evict_locked()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _evict_locked(self) -> None:
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        # 一次淘汰到上限的 90%，避免每次寫入都觸發淘汰
+        target = int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE (embedder_id, text_sha256) IN "
+            "(SELECT embedder_id, text_sha256 FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+            (count - target,),
+        )
+
+    def embed(self, embedder: Any, texts: List[str]) -> np.ndarray:
+        """以快取包裝 embedder.embed：只對未命中的文字呼叫嵌入器，輸出維持輸入順序。"""
+        if not texts:
+            return np.empty((0, getattr(embedder, "dimension", 0)), dtype=np.float32)
+        embedder_id = embedder.embedder_id
+        digests = [text_sha256(t) for t in texts]
+        cached = self.get_many(embedder_id, list(dict.fromkeys(digests)))
+
+        missing: Dict[str, str] = {}
+        for digest, text in zip(digests, texts):
+            if digest not in cached and digest not in missing:
+                missing[digest] = text
+        with self._lock:
+            self.hits += len(texts) - sum(1 for d in digests if d in missing)
+            self.misses += len(missing)
+
+        fresh: Dict[str, np.ndarray] = {}
+        if missing:
+            vectors = embedder.embed(list(missing.values()))
+            for digest, vec in zip(missing.keys(), vectors):
+                fresh[digest] = np.asarray(vec, dtype=np.float32)
+            self.put_many(embedder_id, fresh)
+
+        return np.stack([cached[d] if d in cached else fresh[d] for d in digests])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            return {
+                "path": self.path,
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": entries,
+                "max_entries": self.max_entries,
+            }
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+
+_CACHES: Dict[str, EmbeddingCache] = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def get_embedding_cache(path: str, max_entries: int = 100_000) -> EmbeddingCache:
+    """同一路徑在程序內共用一個快取實例（與 Chroma collection 單例一致）。"""
+    key = os.path.abspath(path)
+    with _CACHES_LOCK:
+        cache = _CACHES.get(key)
+        if cache is None:
+            cache = EmbeddingCache(key, max_entries=max_entries)
+            _CACHES[key] = cache
+        return cache
+
+
+def default_cache_path(persist_dir: str) -> Optional[str]:
+    """EMBEDDING_CACHE=0 時停用；否則預設放在 VECTOR_DIR 內。"""
+    if (os.getenv("EMBEDDING_CACHE") or "1").strip() == "0":
+        return None
+    return (os.getenv("EMBEDDING_CACHE_PATH") or "").strip() or os.path.join(persist_dir, "embedding_cache.sqlite3")
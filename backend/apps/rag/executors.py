@@ -0,0 +1,37 @@
+"""RAG 阻塞式 I/O（嵌入、Chroma、同步 LLM SDK）專用的有界執行緒池。
+
+async 路徑透過 run_blocking 將阻塞呼叫移出 event loop；執行緒數上限由
+RAG_IO_THREADS 控制，避免大量併發請求時無限制地建立執行緒。
+"""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_EXECUTOR_LOCK = threading.Lock()
+
+
+def get_blocking_executor() -> ThreadPoolExecutor:
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        with _EXECUTOR_LOCK:
+            if _EXECUTOR is None:
+                workers = max(1, int(os.getenv("RAG_IO_THREADS", "16")))
+                _EXECUTOR = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rag-io")
+    return _EXECUTOR
+
+
+async def run_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """在有界執行緒池執行阻塞函式；保留 contextvars（例如 trace_id）。"""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, func, *args, **kwargs)
+    return await loop.run_in_executor(get_blocking_executor(), call)
@@ -0,0 +1,271 @@
+"""本地假 LLM 伺服器：實作 Gemini REST API 的子集，供壓測與離線測試取代 Google AI Studio。
+
+以 GOOGLE_API_ENDPOINT=http://127.0.0.1:<port> 指向本伺服器後，GoogleAiStudioLLM 與 GoogleEmbedding
+會改走 REST transport 呼叫這裡。延遲分佈與錯誤率可設定：
+- POST /v1beta/models/{model}:generateContent、:streamGenerateContent：固定回答（串流時分段送出）
+- POST /v1beta/models/{model}:embedContent、:batchEmbedContents：以 LocalEmbedding 產生確定性向量
+- GET /v1beta/models/{model}：模型資訊（供啟動時 readiness 檢查）
+- GET /stats：各端點呼叫次數與注入的錯誤數；POST /stats/reset 歸零
+"""
+from __future__ import annotations
+
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "normal", "exponential", "lognormal")
+
+DEFAULT_ANSWER = (
+    "根據勞動基準法的相關規定，雇主延長勞工工作時間者，延長工作時間在二小時以內者，"
+    "按平日每小時工資額加給三分之一以上；再延長工作時間在二小時以內者，按平日每小時工資額加給三分之二以上。"
+)
+
+_PATH = re.compile(r"^/v1(?:beta)?/(?P<model>(?:models|tunedModels)/[^:/?]+):(?P<method>\w+)")
+_MODEL_PATH = re.compile(r"^/v1(?:beta)?/(?P<model>models/[^:/?]+)/?(?:\?.*)?$")
+
+
+@dataclass
+class LatencyModel:
+    """每次呼叫的延遲（毫秒）：spread 為 uniform 的相對寬度、normal 的變異係數、lognormal 的 sigma。"""
+
+    dist: str = "fixed"
+    mean_ms: float = 0.0
+    spread: float = 0.0
+
+    def __post_init__(self) -> None:
+        if self.dist not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"unknown latency distribution {self.dist!r}; expected one of {LATENCY_DISTRIBUTIONS}")
+
+    def sample(self, rng: random.Random) -> float:
+        """回傳秒數。各分佈的期望值皆為 mean_ms。"""
+        mean = self.mean_ms
+        if mean <= 0:
+            return 0.0
+        if self.dist == "uniform":
+            ms = rng.uniform(mean * (1 - self.spread), mean * (1 + self.spread))
+        elif self.dist == "normal":
+            ms = rng.gauss(mean, mean * self.spread)
+        elif self.dist == "exponential":
+            ms = rng.expovariate(1 / mean)
+        elif self.dist == "lognormal":
+            ms = rng.lognormvariate(math.log(mean) - self.spread ** 2 / 2, self.spread)
+        else:
+            ms = mean
+        return max(0.0, ms) / 1000
+
+
+@dataclass
+class FakeLLMConfig:
+    latency: LatencyModel = field(default_factory=LatencyModel)
+    embed_latency: LatencyModel = field(default_factory=LatencyModel)
+    # 以 500 INTERNAL 回應的比例
+    error_rate: float = 0.0
+    # 以 429 RESOURCE_EXHAUSTED 回應的比例
+    throttle_rate: float = 0.0
+    # 回傳空白回答的比例（服務端會改由 EchoLLM 回答）
+    empty_rate: float = 0.0
+    answer: str = DEFAULT_ANSWER
+    stream_chunks: int = 8
+    embed_dimension: int = 768
+    seed: Optional[int] = None
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config: Optional[FakeLLMConfig] = None) -> None:
+        super().__init__(address, _Handler)
+        self.config = config or FakeLLMConfig()
+        self._rng = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {}
+        self._embedder = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] = self._stats.get(key, 0) + 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+    def draw(self) -> float:
+        with self._lock:
+            return self._rng.random()
+
+    def delay(self, model: LatencyModel) -> float:
+        with self._lock:
+            return model.sample(self._rng)
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        if self._embedder is None:
+            from .vectorstore import LocalEmbedding
+
+            self._embedder = LocalEmbedding(dimension=self.config.embed_dimension)
+        with self._lock:
+            return self._embedder.embed(texts).tolist()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: FakeLLMServer
+    # 串流以連線關閉結束回應
+    protocol_version = "HTTP/1.0"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug("fake_llm %s", format % args)
+
+    def _send_json(self, status: int, payload: Any) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int, reason: str, message: str) -> None:
+        self._send_json(status, {"error": {"code": status, "message": message, "status": reason}})
+
+    def do_GET(self) -> None:
+        model = _MODEL_PATH.match(self.path)
+        if self.path.rstrip("/") == "/stats":
+            self._send_json(200, self.server.stats())
+        elif model is not None:
+            name = model.group("model")
+            self.server.count("getModel")
+            self._send_json(200, {
+                "name": name,
+                "baseModelId": name.split("/", 1)[1],
+                "version": "fake",
+                "displayName": name,
+                "description": "fake LLM server",
+                "inputTokenLimit": 1048576,
+                "outputTokenLimit": 8192,
+                "supportedGenerationMethods": ["generateContent", "streamGenerateContent", "embedContent"],
+            })
+        else:
+            self._send_error(404, "NOT_FOUND", self.path)
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_error(400, "INVALID_ARGUMENT", "invalid JSON body")
+            return
+        if self.path.rstrip("/") == "/stats/reset":
+            self.server.reset_stats()
+            self._send_json(200, {})
+            return
+        match = _PATH.match(self.path)
+        if match is None:
+            self._send_error(404, "NOT_FOUND", self.path)
+            return
+        method = match.group("method")
+        handler = {
+            "generateContent": self._generate,
+            "streamGenerateContent": self._stream,
+            "embedContent": self._embed_one,
+            "batchEmbedContents": self._embed_batch,
+        }.get(method)
+        if handler is None:
+            self._send_error(404, "NOT_FOUND", f"unsupported method {method}")
+            return
+        self.server.count(method)
+        handler(payload)
+
+    # ---- 生成 ----
+
+    def _inject_failure(self, method: str) -> bool:
+        cfg = self.server.config
+        draw = self.server.draw()
+        if draw < cfg.error_rate:
+            self.server.count(f"{method}.error")
+            self._send_error(500, "INTERNAL", "injected error")
+            return True
+        if draw < cfg.error_rate + cfg.throttle_rate:
+            self.server.count(f"{method}.throttled")
+            self._send_error(429, "RESOURCE_EXHAUSTED", "injected throttle")
+            return True
+        return False
+
+    def _answer(self, method: str) -> str:
+        if self.server.draw() < self.server.config.empty_rate:
+            self.server.count(f"{method}.empty")
+            return ""
+        return self.server.config.answer
+
+    @staticmethod
+    def _candidate(text: str) -> Dict[str, Any]:
+        return {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": 1, "index": 0}]}
+
+    def _generate(self, payload: Dict[str, Any]) -> None:
+        time.sleep(self.server.delay(self.server.config.latency))
+        if self._inject_failure("generateContent"):
+            return
+        self._send_json(200, self._candidate(self._answer("generateContent")))
+
+    def _stream(self, payload: Dict[str, Any]) -> None:
+        cfg = self.server.config
+        total = self.server.delay(cfg.latency)
+        if self._inject_failure("streamGenerateContent"):
+            return
+        text = self._answer("streamGenerateContent")
+        n = max(1, cfg.stream_chunks)
+        size = max(1, math.ceil(len(text) / n))
+        pieces = [text[i:i + size] for i in range(0, len(text), size)] or [""]
+        # REST 串流回應為逐步送出的 JSON 陣列；總延遲平均分配在各段之前
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.end_headers()
+        self.wfile.write(b"[")
+        for i, piece in enumerate(pieces):
+            time.sleep(total / len(pieces))
+            self.wfile.write((b"," if i else b"") + json.dumps(self._candidate(piece), ensure_ascii=False).encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"]")
+
+    # ---- 嵌入 ----
+
+    @staticmethod
+    def _text(content: Dict[str, Any]) -> str:
+        return "".join(part.get("text", "") for part in (content or {}).get("parts", []))
+
+    def _embed_one(self, payload: Dict[str, Any]) -> None:
+        time.sleep(self.server.delay(self.server.config.embed_latency))
+        if self._inject_failure("embedContent"):
+            return
+        [vector] = self.server.embed([self._text(payload.get("content"))])
+        self._send_json(200, {"embedding": {"values": vector}})
+
+    def _embed_batch(self, payload: Dict[str, Any]) -> None:
+        time.sleep(self.server.delay(self.server.config.embed_latency))
+        if self._inject_failure("batchEmbedContents"):
+            return
+        texts = [self._text(r.get("content")) for r in payload.get("requests") or []]
+        self._send_json(200, {"embeddings": [{"values": v} for v in self.server.embed(texts)]})
+
+
+def start_fake_llm_server(config: Optional[FakeLLMConfig] = None, host: str = "127.0.0.1", port: int = 0) -> FakeLLMServer:
+    """於背景執行緒啟動伺服器（port=0 時自動選擇），以 server.shutdown() 停止。"""
+    server = FakeLLMServer((host, port), config)
+    threading.Thread(target=server.serve_forever, name="fake-llm", daemon=True).start()
+    logger.info("fake LLM server listening on %s (%s)", server.url, json.dumps(asdict(server.config)["latency"]))
+    return server
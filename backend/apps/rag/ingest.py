@@ -1,69 +1,334 @@
 from __future__ import annotations
 
-from typing import List, Tuple
+import itertools
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
+from apps.common.metrics import INGEST_CHUNKS, INGEST_CHUNKS_PER_SECOND, INGEST_DOCUMENTS, INGEST_UPSERTS, time_stage
+
+from .embedding_cache import text_sha256
+from .templates_registry import HEADING_PATTERN, normalize_article_no
 from .vectorstore import ChromaVectorStore
 
 
+# 句子結尾：連續的中文標點或換行都歸入前一句，切分後保留原文標點
+_SENTENCE_END = re.compile(r'[。！？；\n]+')
+
+
+@dataclass(frozen=True)
+class TextChunk:
+    """切分結果：text 即原文的 source[start:end]（保留原標點）；articles 為涵蓋的條號，依出現順序。"""
+    text: str
+    start: int
+    end: int
+    articles: Tuple[str, ...] = ()
+
+    @property
+    def article(self) -> Optional[str]:
+        return self.articles[0] if self.articles else None
+
+
 def split_text(text: str, chunk_size: int = 600, overlap: int = 150) -> List[str]:
-    """改進的文本切分策略，更適合中文內容"""
-    if len(text) <= chunk_size:
-        return [text]
-    
-    chunks: List[str] = []
-    sentences = _split_sentences(text)
-    
-    current_chunk = ""
-    current_length = 0
-    
-    for sentence in sentences:
-        sentence_length = len(sentence)
-        
-        # 如果加入當前句子會超過chunk_size，先保存當前chunk
-        if current_length + sentence_length > chunk_size and current_chunk:
-            chunks.append(current_chunk.strip())
-            
-            if overlap > 0 and len(current_chunk) > overlap:
-                overlap_text = current_chunk[-overlap:]
-                current_chunk = overlap_text + sentence
-                current_length = len(current_chunk)
-            else:
-                current_chunk = sentence
-                current_length = sentence_length
+    """切分文字，回傳各 chunk 的內容；需要位置與條號時改用 iter_chunks。"""
+    return [c.text for c in iter_chunks([text], chunk_size=chunk_size, overlap=overlap)]
+
+
+def iter_chunks(pieces: Iterable[str], chunk_size: int = 600, overlap: int = 150) -> Iterator[TextChunk]:
+    """逐段讀入文字（例如逐行），邊讀邊產出 chunk；結果與片段如何切開無關。
+
+    以「第 N 條」/「第 X 章」標題為優先切點：相鄰的完整條文會合併到 chunk_size 以內，
+    章標題與其後第一條同屬一塊；單一條文超過 chunk_size 時才在句子邊界切開，
+    並保留結尾不超過 overlap 字的句子作為下一塊的開頭。
+    """
+    pending: List[_Unit] = []  # 已合併、待輸出的完整段落
+    section: List[_Unit] = []  # 讀入中的段落（自上一個條/章標題起）
+
+    def span(units: List[_Unit]) -> int:
+        return units[-1].end - units[0].start if units else 0
+
+    def emit(units: List[_Unit]) -> Iterator[TextChunk]:
+        text = "".join(u.text for u in units)
+        stripped = text.strip()
+        if not stripped:
+            return
+        start = units[0].start + len(text) - len(text.lstrip())
+        articles: List[str] = []
+        for u in units:
+            if u.article and u.article not in articles:
+                articles.append(u.article)
+        yield TextChunk(stripped, start, start + len(stripped), tuple(articles))
+
+    def split_long() -> Iterator[TextChunk]:
+        nonlocal section
+        while span(section) > chunk_size:
+            n = 1
+            while n < len(section) and section[n].end - section[0].start <= chunk_size:
+                n += 1
+            yield from emit(section[:n])
+            tail = n
+            while tail > 1 and section[n - 1].end - section[tail - 1].start <= overlap:
+                tail -= 1
+            section = section[tail:]
+
+    for unit in _iter_units(pieces, chunk_size):
+        # 段落只在標題處結束；剛讀到章標題時繼續累積，讓它與下一條同屬一段
+        if unit.boundary and section and section[-1].boundary != "chapter":
+            if pending and span(pending + section) > chunk_size:
+                yield from emit(pending)
+                pending = []
+            pending += section
+            section = []
+        section.append(unit)
+        if span(section) > chunk_size:
+            if pending:
+                yield from emit(pending)
+                pending = []
+            yield from split_long()
+    if pending and span(pending + section) > chunk_size:
+        yield from emit(pending)
+        pending = []
+    yield from emit(pending + section)
+
+
+@dataclass
+class _Unit:
+    """切分的最小單位：一個句子（含結尾標點）或一行標題，start 為在原文中的位置。"""
+    text: str
+    start: int
+    end: int
+    article: Optional[str]
+    boundary: Optional[str] = None  # article | chapter
+
+
+def _iter_units(pieces: Iterable[str], max_len: int) -> Iterator[_Unit]:
+    """把片段切成句子；分隔符號可能跨越片段，只在確定結束後才切出。超過 max_len 的句子硬切。"""
+    buffer = ""
+    offset = 0  # buffer[0] 在原文中的位置
+    line_start = True
+    article: Optional[str] = None
+
+    def make(text: str, start: int) -> _Unit:
+        nonlocal line_start, article
+        boundary = None
+        if line_start:
+            m = HEADING_PATTERN.match(text.rstrip())
+            if m:
+                boundary = "article" if m.group("article") else "chapter"
+                if m.group("article"):
+                    article = normalize_article_no(m.group("article"))
+        line_start = text.endswith("\n")
+        return _Unit(text, start, start + len(text), None if boundary == "chapter" else article, boundary)
+
+    def drain(final: bool) -> Iterator[_Unit]:
+        nonlocal buffer, offset
+        pos = 0
+        for m in _SENTENCE_END.finditer(buffer):
+            if m.end() == len(buffer) and not final:
+                # 分隔符號位於結尾，下一段可能還有延續
+                break
+            while m.end() - pos > max_len:
+                yield make(buffer[pos:pos + max_len], offset + pos)
+                pos += max_len
+            yield make(buffer[pos:m.end()], offset + pos)
+            pos = m.end()
+        while len(buffer) - pos > max_len or (final and pos < len(buffer)):
+            n = min(max_len, len(buffer) - pos)
+            yield make(buffer[pos:pos + n], offset + pos)
+            pos += n
+        buffer = buffer[pos:]
+        offset += pos
+
+    for piece in pieces:
+        if piece:
+            buffer += piece
+            yield from drain(False)
+    yield from drain(True)
+
+
+@dataclass
+class IngestStats:
+    """單一文件 ingest 的差異統計；upserts = added + updated。moved 為 unchanged 中只有位置改變（只更新 metadata）的數量。"""
+    chunks: int = 0
+    added: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    deleted: int = 0
+    moved: int = 0
+
+    @property
+    def upserts(self) -> int:
+        return self.added + self.updated
+
+
+def ingest_text(doc_id: str, text: str, *, store: Optional[ChromaVectorStore] = None) -> IngestStats:
+    """增量 ingest：以 chunk 內容雜湊比對既有索引，只嵌入/寫入新增或變動的 chunk，並批次刪除不再存在的 chunk。"""
+    return ingest_stream(doc_id, [text], store=store)
+
+
+def ingest_stream(
+    doc_id: str,
+    pieces: Iterable[str],
+    *,
+    store: Optional[ChromaVectorStore] = None,
+    batch_size: Optional[int] = None,
+) -> IngestStats:
+    """ingest_text 的串流版本：邊讀邊切分，變動的 chunk 每滿 batch_size 筆就嵌入並寫入，記憶體用量與文件大小無關。
+
+    chunk 先依內容雜湊認領既有 id（同位置優先），前段插入或刪除條文時，後面位移的 chunk 沿用原 id、只更新位置。
+    沒有相符內容的 chunk 若其位置的舊 id 仍可能被後面的 chunk 認領，先暫緩（最多 batch_size 筆）：
+    舊 id 被認領時改用新 id（新增），否則覆寫該 id（更新）。
+    """
+    started = time.perf_counter()
+    store = store or ChromaVectorStore()
+    batch_size = max(1, batch_size or int(os.getenv("INGEST_BATCH_SIZE", "64")))
+    existing = store.get_chunk_metadata(doc_id)
+    # 內容雜湊 -> 尚未認領的既有 id，依原 chunk 順序
+    by_hash: Dict[str, List[str]] = {}
+    for cid, meta in sorted(existing.items(), key=lambda item: item[1].get("chunk", 0)):
+        by_hash.setdefault(meta.get("content_hash"), []).append(cid)
+    claimed: Set[str] = set()
+    fresh_ids = itertools.count(max((_chunk_index(doc_id, cid) or 0 for cid in existing), default=-1) + 1)
+    # 暫緩的 chunk：位置上的舊 id -> (chunk, metadata)
+    deferred: "OrderedDict[str, Tuple[TextChunk, Dict[str, Any]]]" = OrderedDict()
+
+    stats = IngestStats()
+    ids: List[str] = []
+    texts: List[str] = []
+    metadatas: List[Dict[str, Any]] = []
+    moved_ids: List[str] = []
+    moved_metadatas: List[Dict[str, Any]] = []
+
+    def flush() -> None:
+        if ids:
+            with time_stage("ingest_upsert"):
+                store.upsert(ids=list(ids), texts=list(texts), metadatas=list(metadatas))
+            ids.clear()
+            texts.clear()
+            metadatas.clear()
+        if moved_ids:
+            # 內容未變、只是位置移動：不重新嵌入、不動倒排索引，也不改變語料版本
+            store.update_metadata(ids=list(moved_ids), metadatas=list(moved_metadatas))
+            moved_ids.clear()
+            moved_metadatas.clear()
+
+    def write(cid: str, chunk: TextChunk, metadata: Dict[str, Any]) -> None:
+        ids.append(cid)
+        texts.append(chunk.text)
+        metadatas.append(metadata)
+        if len(ids) >= batch_size:
+            flush()
+
+    def claim(cid: str) -> None:
+        claimed.add(cid)
+        by_hash.get(existing[cid].get("content_hash"), []).remove(cid)
+        pending = deferred.pop(cid, None)
+        if pending is not None:
+            # 舊 id 已由內容相同的 chunk 沿用，暫緩的 chunk 改用新 id
+            stats.added += 1
+            write(new_id(), *pending)
+
+    def new_id() -> str:
+        while True:
+            cid = f"{doc_id}:{next(fresh_ids)}"
+            if cid not in existing and cid not in claimed:
+                claimed.add(cid)
+                return cid
+
+    def resolve_oldest() -> None:
+        cid, pending = deferred.popitem(last=False)
+        claimed.add(cid)
+        by_hash.get(existing[cid].get("content_hash"), []).remove(cid)
+        stats.updated += 1
+        write(cid, *pending)
+
+    for i, chunk in enumerate(iter_chunks(pieces)):
+        cid = f"{doc_id}:{i}"
+        # 雜湊只含條號與內容：前段插入文字時，後面內容未變的 chunk 只需更新位置
+        h = text_sha256(f"{','.join(chunk.articles)}\n{chunk.text}")
+        stats.chunks += 1
+        metadata: Dict[str, Any] = {"document_id": doc_id, "chunk": i, "content_hash": h, "start": chunk.start, "end": chunk.end}
+        if chunk.articles:
+            # Chroma metadata 只接受純量：article 為第一個條號，articles 以逗號串接
+            metadata["article"] = chunk.article
+            metadata["articles"] = ",".join(chunk.articles)
+        candidates = by_hash.get(h)
+        if candidates:
+            match = cid if cid in candidates else candidates[0]
+            previous = existing[match]
+            claim(match)
+            stats.unchanged += 1
+            if (previous.get("chunk"), previous.get("start"), previous.get("end")) != (i, chunk.start, chunk.end):
+                stats.moved += 1
+                moved_ids.append(match)
+                moved_metadatas.append(metadata)
+                if len(moved_ids) >= batch_size:
+                    flush()
+        elif cid in existing and cid not in claimed:
+            deferred[cid] = (chunk, metadata)
+            if len(deferred) > batch_size:
+                resolve_oldest()
         else:
-            current_chunk += sentence
-            current_length += sentence_length
-    
-    # 添加最後一個chunk
-    if current_chunk.strip():
-        chunks.append(current_chunk.strip())
-    
-    return chunks
-
-def _split_sentences(text: str) -> List[str]:
-    """簡單的句子分割，適合中文文本"""
-    import re
-    # 使用中文標點符號分割句子
-    sentences = re.split(r'[。！？；\n]+', text)
-    # 過濾空句子，保留標點符號
-    result = []
-    for i, sentence in enumerate(sentences):
-        if sentence.strip():
-            # 添加原始標點符號（除了最後一個）
-            if i < len(sentences) - 1:
-                result.append(sentence + '。')
-            else:
-                result.append(sentence)
-    return result
-
-
-def ingest_text(doc_id: str, text: str) -> Tuple[int, int]:
-    """Ingest raw text into vector store; returns (#chunks, #upserts)."""
-    chunks = split_text(text)
-    ids = [f"{doc_id}:{i}" for i in range(len(chunks))]
-    metadatas = [{"document_id": doc_id, "chunk": i} for i in range(len(chunks))]
-    store = ChromaVectorStore()
-    store.upsert(ids=ids, texts=chunks, metadatas=metadatas)
-    return len(chunks), len(chunks)
+            stats.added += 1
+            if cid in existing or cid in claimed:
+                cid = new_id()
+            claimed.add(cid)
+            write(cid, chunk, metadata)
+    while deferred:
+        resolve_oldest()
+    flush()
+
+    stale = [cid for cid in existing if cid not in claimed]
+    if stale:
+        store.delete(stale)
+        stats.deleted = len(stale)
+
+    elapsed = time.perf_counter() - started
+    INGEST_DOCUMENTS.inc()
+    INGEST_CHUNKS.inc(amount=stats.chunks)
+    INGEST_UPSERTS.inc(amount=stats.upserts)
+    if elapsed > 0:
+        INGEST_CHUNKS_PER_SECOND.set(stats.chunks / elapsed)
+    return stats
+
+
+def _chunk_index(doc_id: str, chunk_id: str) -> Optional[int]:
+    prefix = f"{doc_id}:"
+    if not chunk_id.startswith(prefix):
+        return None
+    try:
+        return int(chunk_id[len(prefix):])
+    except ValueError:
+        return None
+
+
+class NdjsonFormatError(ValueError):
+    """NDJSON 內容格式錯誤（附行號）。"""
+
+
+def iter_ndjson_documents(lines: Iterable[bytes]) -> Iterator[Tuple[str, Iterator[str]]]:
+    """解析 NDJSON（每行 {"doc_id": ..., "text": ...}），逐份產出 (doc_id, 文字片段 iterator)。
 
+    連續相同 doc_id 的行視為同一文件的後續片段（原樣串接），讓單一大文件也能分行上傳；
+    呼叫端需先消耗完一份文件的片段再取下一份。
+    """
+    def records() -> Iterator[Tuple[str, str]]:
+        for lineno, raw in enumerate(lines, start=1):
+            if not raw.strip():
+                continue
+            try:
+                obj = json.loads(raw)
+            except ValueError as exc:
+                raise NdjsonFormatError(f"line {lineno}: invalid JSON") from exc
+            doc_id = obj.get("doc_id") if isinstance(obj, dict) else None
+            text = obj.get("text") if isinstance(obj, dict) else None
+            if not isinstance(doc_id, str) or not doc_id or not isinstance(text, str):
+                raise NdjsonFormatError(f'line {lineno}: expected {{"doc_id": str, "text": str}}')
+            yield doc_id, text
 
+    for doc_id, group in itertools.groupby(records(), key=lambda r: r[0]):
+        yield doc_id, (text for _, text in group)
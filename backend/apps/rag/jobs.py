@@ -0,0 +1,357 @@
+"""非同步 ingest 工作佇列（SQLite 持久化 + 程序內有界 worker pool，不需外部 broker）。
+
+- submit() 只寫入佇列並立即回傳 job id；chunking、嵌入與 upsert 由背景 worker 執行。
+- 佇列深度（排隊中 + 執行中的 job 數）達上限時丟出 QueueFull，API 回 429。
+- 每份文件各自記錄狀態與 IngestStats，可逐份查詢進度。
+- 執行中的 job 帶有租約（worker_token + lease_until），由領取它的程序定期續約；程序結束後租約到期，
+  下一次領取或送出時（同一個 BEGIN IMMEDIATE 交易內）重新排隊，已完成的文件不會重做。
+  不依賴 PID 判斷存活：容器內 PID 會被重複使用。
+"""
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .ingest import IngestStats, ingest_text
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    worker_token TEXT,
+    lease_until REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs (state, created_at);
+CREATE TABLE IF NOT EXISTS job_documents (
+    job_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    doc_id TEXT NOT NULL,
+    text TEXT NOT NULL,
+    state TEXT NOT NULL,
+    chunks INTEGER NOT NULL DEFAULT 0,
+    added INTEGER NOT NULL DEFAULT 0,
+    updated INTEGER NOT NULL DEFAULT 0,
+    unchanged INTEGER NOT NULL DEFAULT 0,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    PRIMARY KEY (job_id, position)
+) WITHOUT ROWID;
+"""
+
+# 排隊中或執行中的 job 計入佇列深度
+_PENDING_STATES = ("queued", "running")
+
+
+class QueueFull(RuntimeError):
+    """佇列已滿，呼叫端應稍後重試。"""
+
+
+IngestFn = Callable[[str, str], IngestStats]
+
+
+class IngestJobQueue:
+    def __init__(
+        self,
+        path: str,
+        *,
+        workers: int = 2,
+        max_depth: int = 32,
+        ingest_fn: Optional[IngestFn] = None,
+        poll_interval: float = 1.0,
+        retention_seconds: float = 86_400.0,
+        lease_seconds: float = 60.0,
+    ) -> None:
+        self.path = path
+        self.workers = max(1, workers)
+        self.max_depth = max(1, max_depth)
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self.lease_seconds = max(1.0, lease_seconds)
+        # 每個佇列實例（程序）唯一；PID 可能被重複使用，因此加上隨機字串
+        self.worker_token = f"{os.getpid()}-{uuid.uuid4().hex[:12]}"
+        self._ingest = ingest_fn or (lambda doc_id, text: ingest_text(doc_id, text))
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._stopping = False
+        self._stopped = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._heartbeat: Optional[threading.Thread] = None
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._recover()
+        if self.depth():
+            self.start()
+
+    # ---- 佇列操作 ----
+    def submit(self, documents: Sequence[Tuple[str, str]]) -> str:
+        """登記一個 ingest job，回傳 job id；佇列已滿時丟出 QueueFull。"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._requeue_expired_locked(now)
+                depth = self._depth_locked()
+                if depth >= self.max_depth:
+                    raise QueueFull(f"Ingest queue is full ({depth}/{self.max_depth} jobs pending)")
+                self._conn.execute(
+                    "INSERT INTO jobs (job_id, state, created_at, updated_at) VALUES (?, 'queued', ?, ?)",
+                    (job_id, now, now),
+                )
+                self._conn.executemany(
+                    "INSERT INTO job_documents (job_id, position, doc_id, text, state) VALUES (?, ?, ?, ?, 'queued')",
+                    [(job_id, i, doc_id, text) for i, (doc_id, text) in enumerate(documents)],
+                )
+                self._purge_expired_locked(now)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        self.start()
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def depth(self) -> int:
+        with self._lock:
+            return self._depth_locked()
+
+    def _depth_locked(self) -> int:
+        marks = ",".join("?" * len(_PENDING_STATES))
+        return self._conn.execute(f"SELECT COUNT(*) FROM jobs WHERE state IN ({marks})", _PENDING_STATES).fetchone()[0]
+
+    def _purge_expired_locked(self, now: float) -> None:
+        cutoff = now - self.retention_seconds
+        expired = [row[0] for row in self._conn.execute(
+            "SELECT job_id FROM jobs WHERE state IN ('completed', 'failed') AND updated_at < ?", (cutoff,)
+        )]
+        for job_id in expired:
+            self._conn.execute("DELETE FROM job_documents WHERE job_id = ?", (job_id,))
+            self._conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._conn.execute(
+                "SELECT job_id, state, created_at, updated_at FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            if job is None:
+                return None
+            rows = self._conn.execute(
+                "SELECT doc_id, state, chunks, added, updated, unchanged, deleted, error "
+                "FROM job_documents WHERE job_id = ? ORDER BY position",
+                (job_id,),
+            ).fetchall()
+        documents = [
+            {
+                "doc_id": doc_id,
+                "state": state,
+                "chunks": chunks,
+                "upserts": added + updated,
+                "added": added,
+                "updated": updated,
+                "unchanged": unchanged,
+                "deleted": deleted,
+                "error": error,
+            }
+            for doc_id, state, chunks, added, updated, unchanged, deleted, error in rows
+        ]
+        return {
+            "job_id": job[0],
+            "state": job[1],
+            "created_at": job[2],
+            "updated_at": job[3],
+            "total": len(documents),
+            "completed": sum(1 for d in documents if d["state"] == "done"),
+            "failed": sum(1 for d in documents if d["state"] == "failed"),
+            "documents": documents,
+        }
+
+    def wait(self, job_id: str, timeout: float = 30.0) -> Optional[Dict[str, Any]]:
+        """等待 job 結束（測試與命令列用）。"""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job["state"] not in _PENDING_STATES or time.monotonic() >= deadline:
+                return job
+            time.sleep(0.02)
+
+    # ---- worker ----
+    def start(self) -> None:
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            if self._stopping:
+                return
+            for i in range(len(self._threads), self.workers):
+                thread = threading.Thread(target=self._worker, name=f"rag-ingest-{i}", daemon=True)
+                self._threads.append(thread)
+                thread.start()
+            if self._heartbeat is None or not self._heartbeat.is_alive():
+                self._heartbeat = threading.Thread(target=self._renew_leases, name="rag-ingest-lease", daemon=True)
+                self._heartbeat.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopping = True
+        self._stopped.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _renew_leases(self) -> None:
+        """本程序執行中的 job 每隔 lease_seconds / 3 續約；程序結束即停止續約。"""
+        while not self._stopped.wait(self.lease_seconds / 3):
+            try:
+                with self._lock:
+                    self._conn.execute(
+                        "UPDATE jobs SET lease_until = ? WHERE state = 'running' AND worker_token = ?",
+                        (time.time() + self.lease_seconds, self.worker_token),
+                    )
+            except sqlite3.Error:
+                logger.exception("ingest lease renewal failed")
+
+    def _worker(self) -> None:
+        while not self._stopping:
+            job_id = self._claim()
+            if job_id is None:
+                # 其他程序送出的 job 沒有通知，靠定期輪詢取得
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+                continue
+            try:
+                self._run(job_id)
+            except Exception:
+                logger.exception("ingest job failed", extra={"job_id": job_id})
+                self._finish(job_id, "failed")
+
+    def _claim(self) -> Optional[str]:
+        with self._lock:
+            # BEGIN IMMEDIATE 取得寫鎖，多個程序共用同一佇列時不會重複領取
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                self._requeue_expired_locked(now)
+                row = self._conn.execute(
+                    "SELECT job_id FROM jobs WHERE state = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET state = 'running', worker_token = ?, lease_until = ?, updated_at = ? WHERE job_id = ?",
+                        (self.worker_token, now + self.lease_seconds, now, row[0]),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return row[0] if row is not None else None
+
+    def _run(self, job_id: str) -> None:
+        with self._lock:
+            pending = self._conn.execute(
+                "SELECT position, doc_id, text FROM job_documents WHERE job_id = ? AND state != 'done' ORDER BY position",
+                (job_id,),
+            ).fetchall()
+        for position, doc_id, text in pending:
+            self._update_document(job_id, position, "running")
+            try:
+                stats = self._ingest(doc_id, text)
+            except Exception as exc:
+                logger.exception("ingest_failed", extra={"job_id": job_id, "doc_id": doc_id})
+                self._update_document(job_id, position, "failed", error=str(exc))
+                continue
+            self._update_document(job_id, position, "done", stats=stats)
+        with self._lock:
+            failed = self._conn.execute(
+                "SELECT COUNT(*) FROM job_documents WHERE job_id = ? AND state = 'failed'", (job_id,)
+            ).fetchone()[0]
+        self._finish(job_id, "failed" if failed else "completed")
+
+    def _update_document(self, job_id: str, position: int, state: str, *, stats: Optional[IngestStats] = None, error: Optional[str] = None) -> None:
+        with self._lock:
+            if stats is not None:
+                # 完成後不再需要原文，釋放空間
+                self._conn.execute(
+                    "UPDATE job_documents SET state = ?, text = '', chunks = ?, added = ?, updated = ?, unchanged = ?, deleted = ?, error = NULL "
+                    "WHERE job_id = ? AND position = ?",
+                    (state, stats.chunks, stats.added, stats.updated, stats.unchanged, stats.deleted, job_id, position),
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE job_documents SET state = ?, error = ? WHERE job_id = ? AND position = ?",
+                    (state, error, job_id, position),
+                )
+            self._conn.execute("UPDATE jobs SET updated_at = ? WHERE job_id = ?", (time.time(), job_id))
+
+    def _finish(self, job_id: str, state: str) -> None:
+        with self._lock:
+            # 租約已被收回（job 已交給其他 worker）時不覆寫狀態
+            self._conn.execute(
+                "UPDATE jobs SET state = ?, updated_at = ?, lease_until = NULL WHERE job_id = ? AND worker_token = ?",
+                (state, time.time(), job_id, self.worker_token),
+            )
+
+    def _recover(self) -> None:
+        """啟動時把租約已到期的執行中 job 放回佇列。"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._requeue_expired_locked(time.time())
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _requeue_expired_locked(self, now: float) -> None:
+        """需在 BEGIN IMMEDIATE 交易內呼叫，多個程序同時復原時只有一個會改到同一個 job。"""
+        expired = [row[0] for row in self._conn.execute(
+            "SELECT job_id FROM jobs WHERE state = 'running' AND (lease_until IS NULL OR lease_until < ?)", (now,)
+        )]
+        for job_id in expired:
+            self._conn.execute(
+                "UPDATE jobs SET state = 'queued', worker_token = NULL, lease_until = NULL WHERE job_id = ?",
+                (job_id,),
+            )
+            self._conn.execute("UPDATE job_documents SET state = 'queued' WHERE job_id = ? AND state = 'running'", (job_id,))
+            logger.info("requeued ingest job %s after its lease expired", job_id)
+
+
+def default_queue_path() -> str:
+    """預設放在 VECTOR_DIR 內，可用 INGEST_QUEUE_PATH 覆寫。"""
+    from .vectorstore import VSConfig
+
+    return (os.getenv("INGEST_QUEUE_PATH") or "").strip() or os.path.join(VSConfig().persist_dir, "ingest_jobs.sqlite3")
+
+
+_QUEUE: Optional[IngestJobQueue] = None
+_QUEUE_LOCK = threading.Lock()
+
+
+def get_ingest_queue() -> IngestJobQueue:
+    global _QUEUE
+    if _QUEUE is None:
+        with _QUEUE_LOCK:
+            if _QUEUE is None:
+                _QUEUE = IngestJobQueue(
+                    default_queue_path(),
+                    workers=int(os.getenv("INGEST_WORKERS", "2")),
+                    max_depth=int(os.getenv("INGEST_QUEUE_MAX_DEPTH", "32")),
+                    lease_seconds=float(os.getenv("INGEST_JOB_LEASE_SECONDS", "60")),
+                )
+    return _QUEUE
+
+
+def resume_pending_jobs() -> None:
+    """伺服器啟動時呼叫：佇列檔已存在時立即載入，讓重啟前未完成的 job 繼續執行。"""
+    if os.path.exists(default_queue_path()):
+        get_ingest_queue()
@@ -0,0 +1,238 @@
+"""BM25 倒排索引（CJK 字元 bi-gram + 拉丁/數字 token），與向量檢索以 RRF 融合。
+
+- ingest 時由 ChromaVectorStore 同步寫入（write-through 到 VECTOR_DIR 下的 SQLite）。
+- 查詢走記憶體中的 postings；寫入的程序直接把差異套用到記憶體。語料版本（corpus generation）
+  改變且 SQLite 的 data_version 顯示有其他連線寫入時，才從 SQLite 重新載入，讓多個 worker 程序看到彼此的 ingest。
+"""
+from __future__ import annotations
+
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .corpus import get_corpus_generation
+
+
+_TOKEN_PATTERN = re.compile(r"([㐀-䶿一-鿿]+)|([a-z0-9]+)")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    chunk_id TEXT PRIMARY KEY,
+    document_id TEXT,
+    length INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    chunk_id TEXT NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (term, chunk_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_postings_chunk ON postings (chunk_id);
+"""
+
+# SQLite 單一查詢參數數量上限保守值
+_SQL_BATCH = 500
+
+
+def tokenize(text: str) -> List[str]:
+    """CJK 連續字串取 bi-gram（單字時取單字），拉丁字母與數字取整個 token。"""
+    tokens: List[str] = []
+    for cjk, latin in _TOKEN_PATTERN.findall(text.lower()):
+        if latin:
+            tokens.append(latin)
+        elif len(cjk) == 1:
+            tokens.append(cjk)
+        else:
+            tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """RRF：score(d) = Σ 1 / (k + rank)，rank 從 1 起算。"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+
+
+class LexicalIndex:
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75) -> None:
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._lengths: Dict[str, int] = {}
+        self._documents: Dict[str, Optional[str]] = {}
+        self._total_length = 0
+        self._loaded = False
+        self._loaded_generation: Optional[str] = None
+        # 載入時的 PRAGMA data_version；只有其他連線的 commit 會改變它，本連線的寫入不會
+        self._loaded_data_version: Optional[int] = None
+        self.reloads = 0
+
+    def __len__(self) -> int:
+        self._ensure_fresh()
+        return len(self._lengths)
+
+    # ---- 讀取 ----
+    def _ensure_fresh(self) -> None:
+        generation = get_corpus_generation(os.path.dirname(os.path.abspath(self.path)))
+        if generation == self._loaded_generation:
+            return
+        with self._lock:
+            if generation != self._loaded_generation:
+                data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+                # 版本改變但資料庫只被本程序寫過（差異已套用到記憶體）時不需重新載入
+                if not self._loaded or data_version != self._loaded_data_version:
+                    self._load_locked()
+                self._loaded_generation = generation
+                self._loaded_data_version = data_version
+
+    def _load_locked(self) -> None:
+        postings: Dict[str, Dict[str, int]] = {}
+        for term, chunk_id, tf in self._conn.execute("SELECT term, chunk_id, tf FROM postings"):
+            postings.setdefault(term, {})[chunk_id] = tf
+        lengths: Dict[str, int] = {}
+        documents: Dict[str, Optional[str]] = {}
+        for chunk_id, document_id, length in self._conn.execute("SELECT chunk_id, document_id, length FROM chunks"):
+            lengths[chunk_id] = length
+            documents[chunk_id] = document_id
+        self._postings, self._lengths, self._documents = postings, lengths, documents
+        self._total_length = sum(lengths.values())
+        self._loaded = True
+        self.reloads += 1
+
+    def search(self, query: str, limit: int = 50, document_ids: Optional[Iterable[str]] = None) -> List[Tuple[str, float]]:
+        """回傳依 BM25 分數排序的 [(chunk_id, score)]。"""
+        self._ensure_fresh()
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        with self._lock:
+            postings, lengths, documents = self._postings, self._lengths, self._documents
+            n = len(lengths)
+            if n == 0:
+                return []
+            avg_len = self._total_length / n
+            allowed = set(document_ids) if document_ids else None
+            scores: Dict[str, float] = {}
+            for term in terms:
+                plist = postings.get(term)
+                if not plist:
+                    continue
+                idf = math.log(1.0 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+                for chunk_id, tf in plist.items():
+                    if allowed is not None and documents.get(chunk_id) not in allowed:
+                        continue
+                    norm = self.k1 * (1.0 - self.b + self.b * lengths.get(chunk_id, 0) / avg_len)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1.0) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+        return ranked[:limit]
+
+    # ---- 寫入 ----
+    def upsert(self, ids: List[str], texts: List[str], document_ids: List[Optional[str]]) -> None:
+        rows_chunks = []
+        rows_postings = []
+        for chunk_id, text, document_id in zip(ids, texts, document_ids):
+            counts = Counter(tokenize(text))
+            rows_chunks.append((chunk_id, document_id, sum(counts.values())))
+            rows_postings.extend((term, chunk_id, tf) for term, tf in counts.items())
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                old_terms = self._chunk_terms_locked(ids)
+                self._delete_rows_locked(ids)
+                self._conn.executemany("INSERT INTO chunks (chunk_id, document_id, length) VALUES (?, ?, ?)", rows_chunks)
+                self._conn.executemany("INSERT INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)", rows_postings)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            if self._loaded:
+                self._forget_locked(ids, old_terms)
+                for chunk_id, document_id, length in rows_chunks:
+                    self._lengths[chunk_id] = length
+                    self._documents[chunk_id] = document_id
+                    self._total_length += length
+                for term, chunk_id, tf in rows_postings:
+                    self._postings.setdefault(term, {})[chunk_id] = tf
+
+    def delete(self, ids: List[str]) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                old_terms = self._chunk_terms_locked(ids)
+                self._delete_rows_locked(ids)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            if self._loaded:
+                self._forget_locked(ids, old_terms)
+
+    def _chunk_terms_locked(self, ids: List[str]) -> Dict[str, List[str]]:
+        """記憶體中已有的片段在 SQLite 的詞，供寫入後從記憶體 postings 移除；尚未載入時不需要。"""
+        known = [chunk_id for chunk_id in ids if chunk_id in self._lengths] if self._loaded else []
+        terms: Dict[str, List[str]] = {}
+        for i in range(0, len(known), _SQL_BATCH):
+            part = known[i:i + _SQL_BATCH]
+            marks = ",".join("?" * len(part))
+            for chunk_id, term in self._conn.execute(f"SELECT chunk_id, term FROM postings WHERE chunk_id IN ({marks})", part):
+                terms.setdefault(chunk_id, []).append(term)
+        return terms
+
+    def _forget_locked(self, ids: List[str], old_terms: Dict[str, List[str]]) -> None:
+        for chunk_id in ids:
+            length = self._lengths.pop(chunk_id, None)
+            if length is None:
+                continue
+            self._total_length -= length
+            self._documents.pop(chunk_id, None)
+            for term in old_terms.get(chunk_id, ()):
+                plist = self._postings.get(term)
+                if plist is None:
+                    continue
+                plist.pop(chunk_id, None)
+                if not plist:
+                    del self._postings[term]
+
+    def _delete_rows_locked(self, ids: List[str]) -> None:
+        for i in range(0, len(ids), _SQL_BATCH):
+            part = ids[i:i + _SQL_BATCH]
+            marks = ",".join("?" * len(part))
+            self._conn.execute(f"DELETE FROM postings WHERE chunk_id IN ({marks})", part)
+            self._conn.execute(f"DELETE FROM chunks WHERE chunk_id IN ({marks})", part)
+
+    def stats(self) -> Dict[str, Any]:
+        self._ensure_fresh()
+        with self._lock:
+            return {"path": self.path, "chunks": len(self._lengths), "terms": len(self._postings), "reloads": self.reloads}
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM chunks LIMIT 1").fetchone() is None
+
+
+_INDEXES: Dict[str, LexicalIndex] = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def get_lexical_index(persist_dir: str) -> LexicalIndex:
+    path = os.path.abspath(os.path.join(persist_dir, "lexical_index.sqlite3"))
+    with _INDEXES_LOCK:
+        index = _INDEXES.get(path)
+        if index is None:
+            index = LexicalIndex(path)
+            _INDEXES[path] = index
+        return index
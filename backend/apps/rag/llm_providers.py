@@ -1,20 +1,190 @@
 from __future__ import annotations
 
+import asyncio
 import logging
 import os
-from typing import Optional
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Tuple
+
+from apps.common.metrics import LLM_ERRORS, LLM_FALLBACKS
+
+from .executors import run_blocking
 
 
 logger = logging.getLogger(__name__)
 
 
+_GENAI_CONFIGURED: Optional[Tuple[str, str]] = None
+_GENAI_LOCK = threading.Lock()
+
+
+def configure_genai(api_key: Optional[str]):
+    """設定並回傳 google.generativeai；GOOGLE_API_ENDPOINT 設定時改走 REST 並指向該端點（本地假 LLM 伺服器）。
+
+    genai.configure() 會清空 SDK 快取的 client（gRPC channel / HTTP session），因此相同設定只設定一次。
+    """
+    import google.generativeai as genai
+
+    endpoint = (os.getenv("GOOGLE_API_ENDPOINT") or "").strip()
+    global _GENAI_CONFIGURED
+    with _GENAI_LOCK:
+        if _GENAI_CONFIGURED != (api_key or "", endpoint):
+            if endpoint:
+                genai.configure(api_key=api_key, transport="rest", client_options={"api_endpoint": endpoint})
+            else:
+                genai.configure(api_key=api_key)
+            _GENAI_CONFIGURED = (api_key or "", endpoint)
+    return genai
+
+
+@dataclass(frozen=True)
+class ProviderLimits:
+    """單一供應商的請求逾時與同時進行的呼叫上限。"""
+
+    timeout_seconds: float = 60.0
+    max_concurrency: int = 16
+
+    @classmethod
+    def from_env(cls, provider: str) -> "ProviderLimits":
+        """LLM_<PROVIDER>_TIMEOUT_SECONDS / LLM_<PROVIDER>_MAX_CONCURRENCY，未設定時用 LLM_TIMEOUT_SECONDS / LLM_MAX_CONCURRENCY。"""
+        prefix = f"LLM_{provider.upper()}_"
+
+        def read(name: str, default: str) -> str:
+            return (os.getenv(prefix + name) or os.getenv("LLM_" + name) or default).strip()
+
+        return cls(
+            timeout_seconds=float(read("TIMEOUT_SECONDS", str(cls.timeout_seconds))),
+            max_concurrency=max(1, int(read("MAX_CONCURRENCY", str(cls.max_concurrency)))),
+        )
+
+
+class ProviderOverloaded(RuntimeError):
+    """在逾時內等不到可用的呼叫名額。"""
+
+
+class _ConcurrencyLimit:
+    """同步與 async 呼叫共用的名額；async 以非阻塞嘗試 + 短暫 sleep 等待，不佔用執行緒也不綁定 event loop。"""
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self._slots = threading.BoundedSemaphore(limit)
+
+    @contextmanager
+    def hold(self, timeout: float) -> Iterator[None]:
+        if not self._slots.acquire(timeout=timeout):
+            raise ProviderOverloaded(f"no free slot within {timeout:.1f}s (max_concurrency={self.limit})")
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+    @asynccontextmanager
+    async def ahold(self, timeout: float) -> AsyncIterator[None]:
+        deadline = time.monotonic() + timeout
+        delay = 0.001
+        while not self._slots.acquire(blocking=False):
+            if time.monotonic() >= deadline:
+                raise ProviderOverloaded(f"no free slot within {timeout:.1f}s (max_concurrency={self.limit})")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.02)
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+
+class LLMCallError(RuntimeError):
+    """單次供應商呼叫失敗；reason 即 rag_llm_fallbacks_total 的標籤（missing_key / error / empty / overloaded）。"""
+
+    def __init__(self, reason: str, message: str = "") -> None:
+        super().__init__(message or reason)
+        self.reason = reason
+
+
 class BaseLLM:
-    def generate(self, prompt: str) -> str: 
-        raise NotImplementedError
+    """供應商實作 complete（失敗時拋出 LLMCallError）；generate / agenerate / stream 在失敗時回退 EchoLLM。"""
 
+    # 指標標籤用的供應商名稱
+    provider = "base"
+
+    def complete(self, prompt: str) -> str:
+        """單次呼叫，失敗時拋出 LLMCallError；只覆寫 generate 的子類別沿用 generate。"""
+        if type(self).generate is BaseLLM.generate:
+            raise NotImplementedError
+        return self.generate(prompt)
+
+    async def acomplete(self, prompt: str) -> str:
+        """非同步 complete；預設將同步呼叫移至有界執行緒池，供應商可覆寫為原生 async。"""
+        return await run_blocking(self.complete, prompt)
+
+    def stream_raw(self, prompt: str) -> Iterator[str]:
+        """逐段產生回答，失敗時拋出 LLMCallError；預設退化為一次回傳完整結果，供應商可覆寫為真正的串流。"""
+        yield self.complete(prompt)
+
+    # ---- 附上實際產生回答的供應商；路由器覆寫為回傳勝出者，供依模型保存結果的呼叫端使用 ----
+
+    def complete_attributed(self, prompt: str) -> Tuple[str, "BaseLLM"]:
+        return self.complete(prompt), self
+
+    async def acomplete_attributed(self, prompt: str) -> Tuple[str, "BaseLLM"]:
+        return await self.acomplete(prompt), self
+
+    def stream_attributed(self, prompt: str) -> Iterator[Tuple[str, "BaseLLM"]]:
+        for piece in self.stream_raw(prompt):
+            yield piece, self
+
+    def _fallback(self, exc: LLMCallError) -> "EchoLLM":
+        LLM_FALLBACKS.inc(self.provider, exc.reason)
+        return EchoLLM()
+
+    def fallback(self, exc: LLMCallError, prompt: str) -> str:
+        """complete 失敗後改由 EchoLLM 回答，並記錄回退指標。"""
+        return self._fallback(exc).complete(prompt)
+
+    def fallback_stream(self, exc: LLMCallError, prompt: str) -> Iterator[str]:
+        return self._fallback(exc).stream_raw(prompt)
+
+    def _sdk_error(self, op: str, exc: Exception) -> LLMCallError:
+        """將 SDK 例外轉為 LLMCallError 並記錄；供應商在 except 區塊內呼叫。"""
+        if isinstance(exc, ProviderOverloaded):
+            logger.warning("%s %s overloaded: %s", self.provider, op, exc)
+            return LLMCallError("overloaded", str(exc))
+        logger.exception("%s %s failed: %s", self.provider, op, exc)
+        LLM_ERRORS.inc(self.provider)
+        return LLMCallError("error", str(exc))
 
-class EchoLLM(BaseLLM):
     def generate(self, prompt: str) -> str:
+        try:
+            return self.complete(prompt)
+        except LLMCallError as exc:
+            return self.fallback(exc, prompt)
+
+    async def agenerate(self, prompt: str) -> str:
+        try:
+            return await self.acomplete(prompt)
+        except LLMCallError as exc:
+            return self.fallback(exc, prompt)
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        emitted = False
+        try:
+            for piece in self.stream_raw(prompt):
+                emitted = True
+                yield piece
+        except LLMCallError as exc:
+            # 已送出部分回答時無法改由其他來源接續，直接結束
+            if not emitted:
+                yield from self.fallback_stream(exc, prompt)
+
+
+class EchoLLM(BaseLLM):
+    provider = "echo"
+
+    def complete(self, prompt: str) -> str:
         if "用戶問題:" in prompt:
             try:
                 lines = prompt.split('\n')
@@ -36,38 +206,323 @@ class EchoLLM(BaseLLM):
         
         return "系統正在示範模式中運行。請配置 API key環境變數以啟用完整的 AI 功能。"
 
+    async def acomplete(self, prompt: str) -> str:
+        # 純字串處理，不需移到執行緒
+        return self.complete(prompt)
+
+    # 模擬串流：固定字數切塊，讓串流端點可離線測試
+    STREAM_CHUNK_CHARS = 8
+
+    def stream_raw(self, prompt: str) -> Iterator[str]:
+        text = self.complete(prompt)
+        for i in range(0, len(text), self.STREAM_CHUNK_CHARS):
+            yield text[i:i + self.STREAM_CHUNK_CHARS]
+
 
 class GoogleAiStudioLLM(BaseLLM):
-    def __init__(self, api_key: Optional[str], model: str = "models/gemini-1.5-flash") -> None:
+    """Gemini；GenerativeModel 與其底層 client（連線）建立一次後重複使用，呼叫數與逾時依 ProviderLimits。
+
+    async 呼叫改用 GenerativeServiceAsyncClient：grpc.aio channel 綁定建立它的 event loop（WSGI 下
+    async_to_sync 每次都是新的 loop），而 SDK 的預設 async client 是全程序共用的，因此每個 loop 各建一個。
+    """
+
+    provider = "google"
+
+    def __init__(self, api_key: Optional[str], model: str = "models/gemini-1.5-flash", limits: Optional[ProviderLimits] = None) -> None:
         self.api_key = api_key
         if model.startswith("models/") or model.startswith("tunedModels/"):
             self.model = model
         else:
             self.model = f"models/{model}"
+        self.limits = limits or ProviderLimits.from_env(self.provider)
+        self._slots = _ConcurrencyLimit(self.limits.max_concurrency)
+        self._model: Any = None
+        self._model_lock = threading.Lock()
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
 
-    def generate(self, prompt: str) -> str:
+    def _generative_model(self) -> Any:
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    genai = configure_genai(self.api_key)
+                    self._model = genai.GenerativeModel(self.model)
+        return self._model
+
+    @property
+    def _request_options(self) -> Dict[str, Any]:
+        return {"timeout": self.limits.timeout_seconds}
+
+    def warm(self, check: bool = False) -> None:
+        """預先匯入 SDK、建立 GenerativeModel 與同步 client；check=True 時以 get_model 確認端點與金鑰可用。"""
+        if not self.api_key:
+            return
+        self._generative_model()
+        from google.generativeai import client as genai_client
+
+        # SDK 快取的預設 client，GenerativeModel 第一次呼叫時取用同一個
+        genai_client.get_default_generative_client()
+        if check:
+            configure_genai(self.api_key).get_model(self.model, request_options=self._request_options)
+
+    def _require_key(self) -> None:
         if not self.api_key:
             logger.warning("Google API key missing, fallback to echo")
-            return EchoLLM().generate(prompt)
-        try:
-            import google.generativeai as genai 
+            raise LLMCallError("missing_key")
 
-            genai.configure(api_key=self.api_key)
-            model = genai.GenerativeModel(self.model)
-            resp = model.generate_content(prompt)
+    @staticmethod
+    def _checked(text: str) -> str:
+        if not text.strip():
+            raise LLMCallError("empty")
+        return text.strip()
+
+    def complete(self, prompt: str) -> str:
+        self._require_key()
+        try:
+            with self._slots.hold(self.limits.timeout_seconds):
+                resp = self._generative_model().generate_content(prompt, request_options=self._request_options)
             text = getattr(resp, "text", None) or ""
-            return text.strip() or EchoLLM().generate(prompt)
         except Exception as exc:  # pragma: no cover - external SDK
-            logger.exception("Google AI generate failed: %s", exc)
-            return EchoLLM().generate(prompt)
+            raise self._sdk_error("generate", exc) from exc
+        return self._checked(text)
 
+    def _async_client(self) -> Any:
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            from google.ai import generativelanguage as glm
 
-def get_default_llm() -> BaseLLM:
-    """Return Gemini or Echo based on GOOGLE_API_KEY. Simplified provider pipeline."""
+            client = self._async_clients[loop] = glm.GenerativeServiceAsyncClient(client_options={"api_key": self.api_key})
+        return client
+
+    async def acomplete(self, prompt: str) -> str:
+        if os.getenv("GOOGLE_API_ENDPOINT"):
+            # REST transport 不支援 async 呼叫，改由執行緒池執行同步 complete
+            return await super().acomplete(prompt)
+        self._require_key()
+        try:
+            from google.ai import generativelanguage as glm
+
+            request = glm.GenerateContentRequest(
+                model=self.model, contents=[glm.Content(role="user", parts=[glm.Part(text=prompt)])]
+            )
+            async with self._slots.ahold(self.limits.timeout_seconds):
+                resp = await self._async_client().generate_content(request=request, timeout=self.limits.timeout_seconds)
+            text = "".join(part.text for candidate in resp.candidates[:1] for part in candidate.content.parts)
+        except Exception as exc:  # pragma: no cover - external SDK
+            raise self._sdk_error("agenerate", exc) from exc
+        return self._checked(text)
+
+    def stream_raw(self, prompt: str) -> Iterator[str]:
+        self._require_key()
+        emitted = False
+        try:
+            # 名額持有到串流結束
+            with self._slots.hold(self.limits.timeout_seconds):
+                for chunk in self._generative_model().generate_content(prompt, stream=True, request_options=self._request_options):
+                    text = getattr(chunk, "text", None) or ""
+                    if text:
+                        emitted = True
+                        yield text
+        except Exception as exc:  # pragma: no cover - external SDK
+            raise self._sdk_error("stream", exc) from exc
+        if not emitted:
+            raise LLMCallError("empty")
+
+
+class OpenAILLM(BaseLLM):
+    """OpenAI Chat Completions；client（httpx 連線池）建立一次後重複使用，SDK 不重試（交由路由器改送其他供應商）。
+
+    OPENAI_BASE_URL 由 SDK 自行讀取，可指向相容的服務。async client 綁定 event loop，因此每個 loop 各建一個。
+    """
+
+    provider = "openai"
+
+    def __init__(self, api_key: Optional[str], model: str = "gpt-4o-mini", limits: Optional[ProviderLimits] = None) -> None:
+        self.api_key = api_key
+        self.model = model
+        self.limits = limits or ProviderLimits.from_env(self.provider)
+        self._slots = _ConcurrencyLimit(self.limits.max_concurrency)
+        self._client: Any = None
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
+        self._client_lock = threading.Lock()
+
+    def _options(self) -> Dict[str, Any]:
+        return {"api_key": self.api_key, "timeout": self.limits.timeout_seconds, "max_retries": 0}
+
+    def _sync_client(self) -> Any:
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from openai import OpenAI
+
+                    self._client = OpenAI(**self._options())
+        return self._client
+
+    def _async_client(self) -> Any:
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            from openai import AsyncOpenAI
+
+            client = self._async_clients[loop] = AsyncOpenAI(**self._options())
+        return client
+
+    def warm(self, check: bool = False) -> None:
+        """預先匯入 SDK 並建立同步 client；check=True 時以 models.retrieve 確認端點與金鑰可用。"""
+        if not self.api_key:
+            return
+        client = self._sync_client()
+        if check:
+            client.models.retrieve(self.model)
+
+    def _messages(self, prompt: str) -> list:
+        return [{"role": "user", "content": prompt}]
+
+    def _require_key(self) -> None:
+        if not self.api_key:
+            logger.warning("OpenAI API key missing, fallback to echo")
+            raise LLMCallError("missing_key")
+
+    @staticmethod
+    def _checked(resp: Any) -> str:
+        text = (resp.choices[0].message.content or "") if resp.choices else ""
+        if not text.strip():
+            raise LLMCallError("empty")
+        return text.strip()
+
+    def complete(self, prompt: str) -> str:
+        self._require_key()
+        try:
+            with self._slots.hold(self.limits.timeout_seconds):
+                resp = self._sync_client().chat.completions.create(model=self.model, messages=self._messages(prompt))
+        except Exception as exc:  # pragma: no cover - external SDK
+            raise self._sdk_error("generate", exc) from exc
+        return self._checked(resp)
+
+    async def acomplete(self, prompt: str) -> str:
+        self._require_key()
+        try:
+            async with self._slots.ahold(self.limits.timeout_seconds):
+                resp = await self._async_client().chat.completions.create(model=self.model, messages=self._messages(prompt))
+        except Exception as exc:  # pragma: no cover - external SDK
+            raise self._sdk_error("agenerate", exc) from exc
+        return self._checked(resp)
+
+    def stream_raw(self, prompt: str) -> Iterator[str]:
+        self._require_key()
+        emitted = False
+        try:
+            with self._slots.hold(self.limits.timeout_seconds):
+                for chunk in self._sync_client().chat.completions.create(model=self.model, messages=self._messages(prompt), stream=True):
+                    text = (chunk.choices[0].delta.content or "") if chunk.choices else ""
+                    if text:
+                        emitted = True
+                        yield text
+        except Exception as exc:  # pragma: no cover - external SDK
+            raise self._sdk_error("stream", exc) from exc
+        if not emitted:
+            raise LLMCallError("empty")
+
+
+# 供應商設定：(名稱, 金鑰, 模型, 端點)
+ProviderSpec = Tuple[str, str, str, str]
+
+
+def configured_providers() -> Tuple[ProviderSpec, ...]:
+    """依 LLM_PROVIDER（auto / openai / gemini）與各金鑰列出可用的供應商；auto 時依序為 OpenAI、Gemini。"""
+    mode = (os.getenv("LLM_PROVIDER") or "auto").strip().lower()
+    specs = []
+    openai_key = (os.getenv("OPENAI_API_KEY") or "").strip()
+    if openai_key and mode in ("auto", "openai"):
+        openai_model = (os.getenv("OPENAI_MODEL") or "gpt-4o-mini").strip()
+        specs.append(("openai", openai_key, openai_model, (os.getenv("OPENAI_BASE_URL") or "").strip()))
     google_key = (os.getenv("GOOGLE_API_KEY") or "").strip()
-    gemini_model = (os.getenv("GEMINI_MODEL") or "models/gemini-2.5-flash-lite").strip()
-    if google_key:
-        return GoogleAiStudioLLM(api_key=google_key, model=gemini_model)
-    return EchoLLM()
+    if google_key and mode in ("auto", "gemini"):
+        gemini_model = (os.getenv("GEMINI_MODEL") or "models/gemini-2.5-flash-lite").strip()
+        specs.append(("google", google_key, gemini_model, (os.getenv("GOOGLE_API_ENDPOINT") or "").strip()))
+    return tuple(specs)
+
+
+class LLMRegistry:
+    """行程內共用的 LLM client：依設定（供應商、金鑰、模型、端點）建立一次，之後每個請求重複使用。
+
+    沒有可用供應商時為 EchoLLM；一個時直接使用該供應商；多個時以 LLMRouter 依延遲選擇並對沖。
+    """
+
+    def __init__(self) -> None:
+        self._clients: Dict[Tuple[ProviderSpec, ...], BaseLLM] = {}
+        self._lock = threading.Lock()
+        self._status: Dict[str, Any] = {"warmed": False, "ready": None, "error": None}
+
+    @staticmethod
+    def _build_provider(spec: ProviderSpec) -> BaseLLM:
+        name, api_key, model, _endpoint = spec
+        if name == "openai":
+            return OpenAILLM(api_key=api_key, model=model)
+        return GoogleAiStudioLLM(api_key=api_key, model=model)
 
+    @classmethod
+    def _build(cls, specs: Tuple[ProviderSpec, ...]) -> BaseLLM:
+        providers = [cls._build_provider(spec) for spec in specs]
+        if not providers:
+            return EchoLLM()
+        if len(providers) == 1:
+            return providers[0]
+        from .llm_router import LLMRouter
 
+        return LLMRouter(providers)
+
+    def default(self) -> BaseLLM:
+        key = configured_providers()
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = self._clients[key] = self._build(key)
+        return client
+
+    def warm(self, check: bool = False) -> Dict[str, Any]:
+        """建立預設 client 並預熱；check=True 時做一次 readiness 呼叫。失敗只記錄，不影響啟動。"""
+        started = time.perf_counter()
+        llm = self.default()
+        status: Dict[str, Any] = {"provider": llm.provider, "model": getattr(llm, "model", None), "warmed": False, "ready": None, "error": None}
+        try:
+            warm = getattr(llm, "warm", None)
+            if warm is not None:
+                warm(check=check)
+            status["warmed"] = True
+            if check:
+                status["ready"] = True
+        except Exception as exc:
+            logger.warning("LLM warm-up failed for %s: %s", llm.provider, exc)
+            status.update(ready=False if check else None, error=str(exc))
+        status["warmup_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        self._status = status
+        return status
+
+    def status(self) -> Dict[str, Any]:
+        return dict(self._status)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clients.clear()
+
+
+_REGISTRY = LLMRegistry()
+
+
+def get_llm_registry() -> LLMRegistry:
+    return _REGISTRY
+
+
+def warm_llm_clients() -> Dict[str, Any]:
+    """啟動時呼叫（wsgi/asgi）：LLM_WARMUP=0 時略過；LLM_WARMUP_CHECK=1 時同時做 readiness 呼叫。"""
+    if (os.getenv("LLM_WARMUP") or "1").strip() == "0":
+        return _REGISTRY.status()
+    return _REGISTRY.warm(check=(os.getenv("LLM_WARMUP_CHECK") or "0").strip() == "1")
+
+
+def get_default_llm() -> BaseLLM:
+    """Return the shared client for the configured providers: Echo, a single provider, or an LLMRouter over several."""
+    return _REGISTRY.default()
@@ -0,0 +1,315 @@
+"""多供應商 LLM 路由：依滾動視窗內的延遲與錯誤率選擇最快的健康供應商，並以對沖請求壓低尾延遲。
+
+- 每個供應商保留最近 LLM_ROUTER_WINDOW_SECONDS 秒（最多 LLM_ROUTER_WINDOW_SIZE 筆）的呼叫結果
+- 錯誤率超過 LLM_ROUTER_MAX_ERROR_RATE 視為不健康，排在健康者之後；錯誤隨視窗過期後自動恢復
+- 主要供應商超過其 p95（成功樣本不足時用 LLM_HEDGE_AFTER_MS）仍未回應，對次佳者送出一次對沖請求，取先成功者
+- 呼叫失敗立即改送下一個供應商；全部失敗時由 BaseLLM 回退 EchoLLM
+- 串流無法合併兩個來源的輸出：只在第一段輸出前失敗時改送下一個供應商，不對沖
+"""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from apps.common.metrics import LLM_FAILOVERS, LLM_HEDGES, LLM_REQUESTS, LLM_ROUTED
+
+from .llm_providers import BaseLLM, LLMCallError
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RouterConfig:
+    window_seconds: float = 60.0
+    window_size: int = 200
+    max_error_rate: float = 0.5
+    # 樣本少於此數時不判定為不健康，也不以 p95 決定對沖時間
+    min_samples: int = 5
+    hedge: bool = True
+    hedge_after_ms: float = 2000.0
+
+    @classmethod
+    def from_env(cls) -> "RouterConfig":
+        return cls(
+            window_seconds=float(os.getenv("LLM_ROUTER_WINDOW_SECONDS", cls.window_seconds)),
+            window_size=max(1, int(os.getenv("LLM_ROUTER_WINDOW_SIZE", cls.window_size))),
+            max_error_rate=float(os.getenv("LLM_ROUTER_MAX_ERROR_RATE", cls.max_error_rate)),
+            min_samples=max(1, int(os.getenv("LLM_ROUTER_MIN_SAMPLES", cls.min_samples))),
+            hedge=(os.getenv("LLM_HEDGE") or "1").strip() != "0",
+            hedge_after_ms=float(os.getenv("LLM_HEDGE_AFTER_MS", cls.hedge_after_ms)),
+        )
+
+
+@dataclass(frozen=True)
+class ProviderHealth:
+    provider: str
+    calls: int
+    errors: int
+    error_rate: float
+    # 成功呼叫延遲（秒）；沒有成功樣本時為 None
+    p50: Optional[float]
+    p95: Optional[float]
+    successes: int
+
+
+def _percentile(ordered: Sequence[float], q: float) -> float:
+    # nearest-rank
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+class ProviderStats:
+    """單一供應商的滾動視窗：(時間, 延遲) 紀錄，延遲為 None 表示失敗。"""
+
+    def __init__(self, provider: str, window_seconds: float, window_size: int, clock: Callable[[], float] = time.monotonic) -> None:
+        self.provider = provider
+        self.window_seconds = window_seconds
+        self._clock = clock
+        self._samples: Deque[Tuple[float, Optional[float]]] = deque(maxlen=window_size)
+        self._lock = threading.Lock()
+
+    def record(self, latency: Optional[float]) -> None:
+        with self._lock:
+            self._samples.append((self._clock(), latency))
+
+    def health(self) -> ProviderHealth:
+        cutoff = self._clock() - self.window_seconds
+        with self._lock:
+            while self._samples and self._samples[0][0] < cutoff:
+                self._samples.popleft()
+            outcomes = [latency for _, latency in self._samples]
+        latencies = sorted(x for x in outcomes if x is not None)
+        errors = len(outcomes) - len(latencies)
+        return ProviderHealth(
+            provider=self.provider,
+            calls=len(outcomes),
+            errors=errors,
+            error_rate=errors / len(outcomes) if outcomes else 0.0,
+            p50=_percentile(latencies, 0.50) if latencies else None,
+            p95=_percentile(latencies, 0.95) if latencies else None,
+            successes=len(latencies),
+        )
+
+
+_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_EXECUTOR_LOCK = threading.Lock()
+
+
+def get_router_executor() -> ThreadPoolExecutor:
+    """同步路徑的對沖呼叫專用執行緒池；與 RAG I/O 池分開，避免在池內等待池而死結。"""
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        with _EXECUTOR_LOCK:
+            if _EXECUTOR is None:
+                workers = max(2, int(os.getenv("LLM_ROUTER_THREADS", "32")))
+                _EXECUTOR = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm-route")
+    return _EXECUTOR
+
+
+class LLMRouter(BaseLLM):
+    provider = "router"
+
+    def __init__(self, providers: Sequence[BaseLLM], config: Optional[RouterConfig] = None, clock: Callable[[], float] = time.monotonic) -> None:
+        if not providers:
+            raise ValueError("LLMRouter needs at least one provider")
+        self.providers = list(providers)
+        self.config = config or RouterConfig.from_env()
+        self._clock = clock
+        self._stats = [ProviderStats(p.provider, self.config.window_seconds, self.config.window_size, clock) for p in self.providers]
+
+    @property
+    def model(self) -> str:
+        return ",".join(f"{p.provider}:{getattr(p, 'model', '')}" for p in self.providers)
+
+    def health(self) -> List[ProviderHealth]:
+        return [stats.health() for stats in self._stats]
+
+    def rank(self) -> List[int]:
+        """供應商索引，依（不健康、p50 延遲、設定順序）排序；尚無成功樣本者延遲視為 0，讓它先被試用。"""
+        cfg = self.config
+        healths = self.health()
+
+        def key(idx: int) -> Tuple[bool, float, int]:
+            h = healths[idx]
+            unhealthy = h.calls >= cfg.min_samples and h.error_rate > cfg.max_error_rate
+            return (unhealthy, h.p50 if h.p50 is not None else 0.0, idx)
+
+        return sorted(range(len(self.providers)), key=key)
+
+    def hedge_delay(self, idx: int) -> float:
+        h = self._stats[idx].health()
+        if h.successes >= self.config.min_samples and h.p95 is not None:
+            return h.p95
+        return self.config.hedge_after_ms / 1000
+
+    def warm(self, check: bool = False) -> None:
+        """預熱所有供應商；只有全部失敗時才拋出例外。"""
+        failures = []
+        for provider in self.providers:
+            warm = getattr(provider, "warm", None)
+            if warm is None:
+                continue
+            try:
+                warm(check=check)
+            except Exception as exc:
+                logger.warning("LLM warm-up failed for %s: %s", provider.provider, exc)
+                failures.append(f"{provider.provider}: {exc}")
+        if failures and len(failures) == len(self.providers):
+            raise RuntimeError("; ".join(failures))
+
+    # ---- 單次呼叫（記錄延遲與成敗；rag_llm_requests_total 只在這裡依實際供應商計數）----
+
+    def _call(self, idx: int, prompt: str) -> str:
+        provider = self.providers[idx]
+        LLM_REQUESTS.inc(provider.provider)
+        started = self._clock()
+        try:
+            text = provider.complete(prompt)
+        except LLMCallError:
+            self._stats[idx].record(None)
+            raise
+        except Exception as exc:
+            self._stats[idx].record(None)
+            logger.exception("%s generate failed: %s", provider.provider, exc)
+            raise LLMCallError("error", str(exc)) from exc
+        self._stats[idx].record(self._clock() - started)
+        return text
+
+    async def _acall(self, idx: int, prompt: str) -> str:
+        provider = self.providers[idx]
+        LLM_REQUESTS.inc(provider.provider)
+        started = self._clock()
+        try:
+            # 輸給對沖請求而被取消（CancelledError）時不記錄：已等待的時間不是成功延遲，計入會讓卡住的供應商看起來健康
+            text = await provider.acomplete(prompt)
+        except LLMCallError:
+            self._stats[idx].record(None)
+            raise
+        except Exception as exc:
+            self._stats[idx].record(None)
+            logger.exception("%s agenerate failed: %s", provider.provider, exc)
+            raise LLMCallError("error", str(exc)) from exc
+        self._stats[idx].record(self._clock() - started)
+        return text
+
+    # ---- 路由 ----
+
+    def complete(self, prompt: str) -> str:
+        return self.complete_attributed(prompt)[0]
+
+    async def acomplete(self, prompt: str) -> str:
+        return (await self.acomplete_attributed(prompt))[0]
+
+    def stream_raw(self, prompt: str) -> Iterator[str]:
+        for piece, _ in self.stream_attributed(prompt):
+            yield piece
+
+    def complete_attributed(self, prompt: str) -> Tuple[str, BaseLLM]:
+        order = self.rank()
+        executor = get_router_executor()
+        pending: Dict[Future, int] = {}
+        last = LLMCallError("error", "no provider available")
+        hedged = False
+
+        def launch() -> float:
+            idx = order.pop(0)
+            ctx = contextvars.copy_context()
+            pending[executor.submit(ctx.run, self._call, idx, prompt)] = idx
+            return time.monotonic() + self.hedge_delay(idx)
+
+        hedge_at = launch()
+        while pending:
+            timeout = max(0.0, hedge_at - time.monotonic()) if self.config.hedge and not hedged and order else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                hedged = True
+                LLM_HEDGES.inc(self.providers[order[0]].provider)
+                launch()
+                continue
+            for future in done:
+                idx = pending.pop(future)
+                try:
+                    text = future.result()
+                except LLMCallError as exc:
+                    last = exc
+                    continue
+                # 落後的呼叫在背景完成，結果仍計入其統計
+                LLM_ROUTED.inc(self.providers[idx].provider)
+                return text, self.providers[idx]
+            if not pending and order:
+                LLM_FAILOVERS.inc(self.providers[order[0]].provider)
+                hedge_at = launch()
+        raise last
+
+    async def acomplete_attributed(self, prompt: str) -> Tuple[str, BaseLLM]:
+        order = self.rank()
+        pending: Dict[asyncio.Future, int] = {}
+        last = LLMCallError("error", "no provider available")
+        hedged = False
+
+        def launch() -> float:
+            idx = order.pop(0)
+            pending[asyncio.ensure_future(self._acall(idx, prompt))] = idx
+            return time.monotonic() + self.hedge_delay(idx)
+
+        hedge_at = launch()
+        try:
+            while pending:
+                timeout = max(0.0, hedge_at - time.monotonic()) if self.config.hedge and not hedged and order else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    LLM_HEDGES.inc(self.providers[order[0]].provider)
+                    launch()
+                    continue
+                for task in done:
+                    idx = pending.pop(task)
+                    try:
+                        text = task.result()
+                    except LLMCallError as exc:
+                        last = exc
+                        continue
+                    LLM_ROUTED.inc(self.providers[idx].provider)
+                    return text, self.providers[idx]
+                if not pending and order:
+                    LLM_FAILOVERS.inc(self.providers[order[0]].provider)
+                    hedge_at = launch()
+        finally:
+            for task in pending:
+                task.cancel()
+        raise last
+
+    def stream_attributed(self, prompt: str) -> Iterator[Tuple[str, BaseLLM]]:
+        last = LLMCallError("error", "no provider available")
+        for attempt, idx in enumerate(self.rank()):
+            provider = self.providers[idx]
+            if attempt:
+                LLM_FAILOVERS.inc(provider.provider)
+            LLM_REQUESTS.inc(provider.provider)
+            started = self._clock()
+            emitted = False
+            try:
+                for piece in provider.stream_raw(prompt):
+                    emitted = True
+                    yield piece, provider
+            except LLMCallError as exc:
+                last = exc
+            except Exception as exc:
+                logger.exception("%s stream failed: %s", provider.provider, exc)
+                last = LLMCallError("error", str(exc))
+            else:
+                self._stats[idx].record(self._clock() - started)
+                LLM_ROUTED.inc(provider.provider)
+                return
+            self._stats[idx].record(None)
+            if emitted:
+                raise last
+        raise last
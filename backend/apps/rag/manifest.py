@@ -0,0 +1,165 @@
+"""Chroma collection 的嵌入器清單（manifest）與服務中 collection 的切換指標。
+
+記錄 collection 建立時使用的嵌入器類型、模型、維度與距離度量，存成 VECTOR_DIR 下的
+`<collection>.manifest.json`。啟動時只讀這個檔案判斷相容性，不需呼叫嵌入器或試查詢；
+不相容時丟出 EmbedderMismatchError，絕不自動刪除既有資料。
+
+collection 依嵌入器版本命名；`active_collection` 檔案記錄目前服務中的是哪一個，
+重新索引完成後原子地改寫它即完成切換。
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+from dataclasses import asdict, dataclass, replace
+from typing import Any, Optional, Tuple
+
+
+class EmbedderMismatchError(RuntimeError):
+    """目前設定的嵌入器與 collection 內既有向量不相容。"""
+
+
+@dataclass(frozen=True)
+class EmbedderManifest:
+    embedder_id: str
+    embedder_type: str
+    model: str
+    # Google 嵌入在第一次寫入前無法得知維度（不為此發出網路請求），屆時再補上
+    dimension: Optional[int] = None
+    metric: str = "l2"
+
+    def with_dimension(self, dimension: int) -> "EmbedderManifest":
+        return replace(self, dimension=dimension)
+
+
+def describe_embedder(embedder: Any, metric: str = "l2") -> EmbedderManifest:
+    dimension = getattr(embedder, "dimension", None)
+    return EmbedderManifest(
+        embedder_id=embedder.embedder_id,
+        embedder_type=type(embedder).__name__,
+        model=str(getattr(embedder, "model", "") or ""),
+        dimension=int(dimension) if dimension else None,
+        metric=metric,
+    )
+
+
+def manifest_path(persist_dir: str, collection_name: str) -> str:
+    return os.path.join(persist_dir, f"{collection_name}.manifest.json")
+
+
+def read_manifest(persist_dir: str, collection_name: str) -> Optional[EmbedderManifest]:
+    try:
+        with open(manifest_path(persist_dir, collection_name), "r", encoding="utf-8") as fh:
+            data = json.load(fh)
+    except FileNotFoundError:
+        return None
+    return EmbedderManifest(
+        embedder_id=data["embedder_id"],
+        embedder_type=data.get("embedder_type", ""),
+        model=data.get("model", ""),
+        dimension=data.get("dimension"),
+        metric=data.get("metric", "l2"),
+    )
+
+
+def write_manifest(persist_dir: str, collection_name: str, manifest: EmbedderManifest) -> None:
+    """先寫暫存檔再 os.replace，讀方不會看到半寫入的內容。"""
+    path = manifest_path(persist_dir, collection_name)
+    os.makedirs(persist_dir, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(asdict(manifest), fh, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def check_compatible(stored: EmbedderManifest, current: EmbedderManifest, collection_name: str) -> None:
+    problems = []
+    if stored.embedder_id != current.embedder_id:
+        problems.append(f"embedder {stored.embedder_id!r} != {current.embedder_id!r}")
+    if stored.metric != current.metric:
+        problems.append(f"metric {stored.metric!r} != {current.metric!r}")
+    if stored.dimension and current.dimension and stored.dimension != current.dimension:
+        problems.append(f"dimension {stored.dimension} != {current.dimension}")
+    if problems:
+        raise EmbedderMismatchError(
+            f"Collection {collection_name!r} was built with a different embedder ({'; '.join(problems)}). "
+            "Restore the original embedding settings, or point VECTOR_DIR at a new directory and re-ingest."
+        )
+
+
+def check_dimension(manifest: EmbedderManifest, dimension: int, collection_name: str) -> None:
+    if manifest.dimension and manifest.dimension != dimension:
+        raise EmbedderMismatchError(
+            f"Embedding dimension {dimension} does not match collection {collection_name!r} "
+            f"(built with {manifest.embedder_id}, dimension {manifest.dimension})."
+        )
+
+
+# ---- 目前服務中的 collection（blue/green 切換指標）----
+_ACTIVE_FILENAME = "active_collection"
+
+
+def active_pointer_path(persist_dir: str) -> str:
+    return os.path.join(persist_dir, _ACTIVE_FILENAME)
+
+
+def active_pointer_version(persist_dir: str) -> Optional[Tuple[int, int]]:
+    """以 (inode, mtime_ns) 表示指標版本；熱路徑上只需一次 stat 即可察覺其他程序的切換。"""
+    try:
+        st = os.stat(active_pointer_path(persist_dir))
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns)
+
+
+def read_active_collection(persist_dir: str) -> Optional[str]:
+    try:
+        with open(active_pointer_path(persist_dir), "r", encoding="utf-8") as fh:
+            return fh.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def write_active_collection(persist_dir: str, collection_name: str) -> None:
+    """切換服務中的 collection；os.replace 保證讀方只會看到切換前或切換後的名稱。"""
+    path = active_pointer_path(persist_dir)
+    os.makedirs(persist_dir, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        fh.write(collection_name)
+    os.replace(tmp, path)
+
+
+def remove_manifest(persist_dir: str, collection_name: str) -> None:
+    try:
+        os.remove(manifest_path(persist_dir, collection_name))
+    except FileNotFoundError:
+        pass
+
+
+# ---- 重新索引期間的雙寫目標 ----
+_SHADOW_FILENAME = "reindex_target"
+
+
+def read_shadow_collection(persist_dir: str) -> Optional[str]:
+    """重新索引進行中時回傳新 collection 名稱；ingest 會同時寫入它，切換時不漏資料。"""
+    try:
+        with open(os.path.join(persist_dir, _SHADOW_FILENAME), "r", encoding="utf-8") as fh:
+            return fh.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def write_shadow_collection(persist_dir: str, collection_name: Optional[str]) -> None:
+    path = os.path.join(persist_dir, _SHADOW_FILENAME)
+    if collection_name is None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        return
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        fh.write(collection_name)
+    os.replace(tmp, path)
@@ -0,0 +1,449 @@
+"""RAG 熱路徑的微基準：離線（EchoLLM + LocalEmbedding）在 1k/10k/100k 合成語料上量測 ops/sec 與百分位數。
+
+由 `python manage.py ragbench` 或 `pytest -m benchmark` 執行；結果寫成 JSON，可與儲存的基準比較，
+ops/sec 低於基準超過門檻即視為退化。合成語料以 seed 產生並快取在 RAG_BENCH_DIR，重跑時不需重新嵌入。
+"""
+from __future__ import annotations
+
+import itertools
+import json
+import logging
+import math
+import os
+import platform
+import random
+import re
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+DEFAULT_THRESHOLD = 0.2
+CORPUS_SEED = 20240611
+# 語料產生方式改變時遞增，讓快取的語料失效
+CORPUS_VERSION = 1
+CORPUS_BATCH_SIZE = 256
+
+QUERIES = (
+    "加班費如何計算",
+    "特別休假有幾天",
+    "雇主資遣員工需要預告嗎",
+    "工作時間每日不得超過幾小時",
+    "產假期間工資怎麼給",
+    "退休金的提撥比例",
+    "延長工作時間的工資加給",
+    "勞工請婚假可以請幾天",
+)
+
+_SENTENCE = re.compile(r"[^。；\n]+[。；]")
+
+
+def parse_size(value: str) -> int:
+    """'10k' -> 10000、'1m' -> 1000000、'500' -> 500。"""
+    raw = value.strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(raw[-1:], 1)
+    number = raw[:-1] if scale != 1 else raw
+    size = int(float(number) * scale)
+    if size <= 0:
+        raise ValueError(f"invalid corpus size: {value!r}")
+    return size
+
+
+def format_size(size: int) -> str:
+    if size % 1_000_000 == 0:
+        return f"{size // 1_000_000}m"
+    if size % 1_000 == 0:
+        return f"{size // 1_000}k"
+    return str(size)
+
+
+def bench_dir() -> Path:
+    return Path(os.getenv("RAG_BENCH_DIR") or Path(tempfile.gettempdir()) / "rag-bench")
+
+
+# ---- 合成語料 ----
+
+def _template_sentences() -> List[str]:
+    from .templates_registry import load_template_text
+
+    text = load_template_text("labor_standards_act")
+    return [s.strip() for s in _SENTENCE.findall(text) if len(s.strip()) >= 8]
+
+
+def synthetic_chunks(n: int, *, seed: int = CORPUS_SEED) -> List[Dict[str, Any]]:
+    """以勞基法句子隨機組合出 n 個 chunk（條號標題 + 2~6 句），相同 seed 產生相同內容。"""
+    rng = random.Random(seed)
+    sentences = _template_sentences()
+    chunks = []
+    for i in range(n):
+        article = str(rng.randint(1, 86))
+        body = "".join(rng.sample(sentences, rng.randint(2, 6)))
+        doc = f"bench-{i // 50:05d}"
+        chunks.append({
+            "id": f"{doc}-{i % 50}",
+            "text": f"第 {article} 條\n{body}",
+            "metadata": {"document_id": doc, "chunk": i % 50, "article": article, "articles": article},
+        })
+    return chunks
+
+
+@contextmanager
+def offline_env() -> Iterator[None]:
+    """移除雲端金鑰並停用回答快取，確保使用 LocalEmbedding 與 EchoLLM、每次都走完整管線。"""
+    overrides = {"GOOGLE_API_KEY": None, "ANSWER_CACHE": "0"}
+    saved = {k: os.environ.get(k) for k in overrides}
+    try:
+        for key, value in overrides.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        yield
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def build_corpus(size: int, root: Optional[Path] = None, *, seed: int = CORPUS_SEED):
+    """建立（或重用快取的）size 個 chunk 的向量庫；需在 offline_env() 內呼叫。"""
+    from .vectorstore import ChromaVectorStore, VSConfig
+
+    corpus_dir = (root or bench_dir()) / f"corpus-{format_size(size)}"
+    marker = corpus_dir / "corpus.json"
+    expected = {"size": size, "seed": seed, "version": CORPUS_VERSION}
+    try:
+        if json.loads(marker.read_text(encoding="utf-8")) == expected:
+            return ChromaVectorStore(VSConfig(persist_dir=str(corpus_dir), hybrid_search=True))
+    except (OSError, ValueError):
+        pass
+    shutil.rmtree(corpus_dir, ignore_errors=True)
+    corpus_dir.mkdir(parents=True, exist_ok=True)
+    store = ChromaVectorStore(VSConfig(persist_dir=str(corpus_dir), hybrid_search=True))
+    chunks = synthetic_chunks(size, seed=seed)
+    started = time.perf_counter()
+    for i in range(0, size, CORPUS_BATCH_SIZE):
+        batch = chunks[i:i + CORPUS_BATCH_SIZE]
+        store.upsert([c["id"] for c in batch], [c["text"] for c in batch], [c["metadata"] for c in batch])
+    logger.info("bench corpus %s built in %.1fs", format_size(size), time.perf_counter() - started)
+    marker.write_text(json.dumps(expected), encoding="utf-8")
+    return store
+
+
+# ---- 量測 ----
+
+@dataclass
+class BenchResult:
+    name: str
+    corpus: Optional[str]
+    ops: int
+    ops_per_sec: float
+    mean_us: float
+    p50_us: float
+    p95_us: float
+    p99_us: float
+    min_us: float
+    max_us: float
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}[{self.corpus}]" if self.corpus else self.name
+
+
+def _percentile(sorted_ns: Sequence[int], pct: float) -> float:
+    # nearest-rank
+    idx = max(0, math.ceil(pct / 100 * len(sorted_ns)) - 1)
+    return sorted_ns[idx] / 1000
+
+
+def measure(name: str, op: Callable[[], Any], *, corpus: Optional[str] = None, min_time: float = 1.0,
+            warmup: int = 3, min_ops: int = 5, max_ops: int = 1_000_000) -> BenchResult:
+    """重複呼叫 op 直到累計 min_time 秒（至少 min_ops 次），逐次以 perf_counter_ns 計時。"""
+    for _ in range(warmup):
+        op()
+    samples: List[int] = []
+    budget = int(min_time * 1e9)
+    spent = 0
+    clock = time.perf_counter_ns
+    while (spent < budget or len(samples) < min_ops) and len(samples) < max_ops:
+        t0 = clock()
+        op()
+        elapsed = clock() - t0
+        samples.append(elapsed)
+        spent += elapsed
+    samples.sort()
+    total = sum(samples) or 1
+    return BenchResult(
+        name=name,
+        corpus=corpus,
+        ops=len(samples),
+        ops_per_sec=round(len(samples) / (total / 1e9), 2),
+        mean_us=round(total / len(samples) / 1000, 2),
+        p50_us=round(_percentile(samples, 50), 2),
+        p95_us=round(_percentile(samples, 95), 2),
+        p99_us=round(_percentile(samples, 99), 2),
+        min_us=round(samples[0] / 1000, 2),
+        max_us=round(samples[-1] / 1000, 2),
+    )
+
+
+# ---- 案例 ----
+
+@dataclass
+class BenchContext:
+    chunks: List[Dict[str, Any]]
+    store: Any = None
+    corpus: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class BenchCase:
+    name: str
+    # 回傳無參數的 op；由 setup 預先準備輸入，量測只含 op 本身
+    setup: Callable[[BenchContext], Callable[[], Any]]
+    needs_corpus: bool = False
+
+
+CASES: Dict[str, BenchCase] = {}
+
+
+def bench_case(name: str, *, needs_corpus: bool = False):
+    def register(setup: Callable[[BenchContext], Callable[[], Any]]):
+        CASES[name] = BenchCase(name, setup, needs_corpus)
+        return setup
+    return register
+
+
+def _cycle(items: Sequence[Any]) -> Callable[[], Any]:
+    return itertools.cycle(items).__next__
+
+
+@bench_case("embed.vectorize")
+def _bench_vectorize(ctx: BenchContext):
+    from .vectorstore import LocalEmbedding
+
+    embedder = LocalEmbedding()
+    texts = _cycle([c["text"] for c in ctx.chunks[:200]])
+    return lambda: embedder._vectorize(texts())
+
+
+@bench_case("embed.batch64")
+def _bench_embed_batch(ctx: BenchContext):
+    from .vectorstore import LocalEmbedding
+
+    embedder = LocalEmbedding()
+    texts = [c["text"] for c in ctx.chunks[:64]]
+    return lambda: embedder.embed(texts)
+
+
+@bench_case("ingest.split_text")
+def _bench_split_text(ctx: BenchContext):
+    from .ingest import split_text
+    from .templates_registry import load_template_text
+
+    text = load_template_text("labor_standards_act")
+    return lambda: split_text(text)
+
+
+@bench_case("service.normalize_chinese_numbers")
+def _bench_normalize(ctx: BenchContext):
+    from .service import normalize_chinese_numbers
+
+    messages = _cycle(["勞基法第三十二條規定延長工作時間", "第一百二十條的罰則", "第二十四條 加班費", "特休有幾天"])
+    return lambda: normalize_chinese_numbers(messages())
+
+
+@bench_case("service.query_analysis")
+def _bench_query_analysis(ctx: BenchContext):
+    from .query_analysis import analyze_query
+
+    # 每個請求只執行一次的完整分析：條號、模型詢問、法規名稱與重排用查詢詞
+    messages = _cycle(["勞基法第三十二條規定延長工作時間", "第一百二十條的罰則", "第二十四條 加班費", "特休有幾天"])
+    return lambda: analyze_query(messages())
+
+
+@bench_case("service.text_similarity")
+def _bench_similarity(ctx: BenchContext):
+    from .service import _calculate_text_similarity
+
+    pairs = _cycle([(q, c["text"]) for q, c in zip(itertools.cycle(QUERIES), ctx.chunks[:64])])
+
+    def op():
+        query, text = pairs()
+        return _calculate_text_similarity(query, text)
+    return op
+
+
+def _contexts(ctx: BenchContext, n: int = 20, scored: bool = False):
+    from .service import RetrievedChunk
+
+    return [
+        RetrievedChunk(id=c["id"], document_id=None, text=c["text"], score=(1.0 / (i + 1)) if scored else None,
+                       article=c["metadata"]["article"])
+        for i, c in enumerate(ctx.chunks[:n])
+    ]
+
+
+@bench_case("service.filter_and_rank")
+def _bench_filter_and_rank(ctx: BenchContext):
+    from .service import _filter_and_rank_contexts
+
+    # 未帶分數的 regex 相似度路徑（非混合檢索或 DemoRetriever 時使用）
+    contexts = _contexts(ctx)
+    queries = _cycle(QUERIES)
+    return lambda: _filter_and_rank_contexts(queries(), contexts)
+
+
+@bench_case("service.build_prompt")
+def _bench_build_prompt(ctx: BenchContext):
+    from apps.api.schemas import ChatTurn
+
+    from .service import build_prompt
+
+    contexts = _contexts(ctx, n=8, scored=True)
+    history = [ChatTurn(role="user", content="請問特休怎麼算"), ChatTurn(role="assistant", content="依第 38 條規定。")]
+    queries = _cycle(QUERIES)
+    return lambda: build_prompt(queries(), history, contexts)
+
+
+@bench_case("templates.extract_article_text")
+def _bench_extract_article(ctx: BenchContext):
+    from .templates_registry import extract_article_text
+
+    articles = _cycle([str(n) for n in range(1, 87)])
+    return lambda: extract_article_text("labor_standards_act", articles())
+
+
+@bench_case("article_summaries.lookup")
+def _bench_summary_lookup(ctx: BenchContext):
+    from .article_summaries import PROMPT_VERSION, ArticleSummaryStore, SummaryKey
+    from .templates_registry import template_articles, template_content_hash
+
+    # 第N條快速路徑命中時的成本：以條號查 SQLite 摘要儲存
+    root = bench_dir()
+    root.mkdir(parents=True, exist_ok=True)
+    store = ArticleSummaryStore(str(root / "article_summaries.sqlite3"))
+    digest = template_content_hash("labor_standards_act") or ""
+    keys = [SummaryKey("labor_standards_act", no, "bench:model", PROMPT_VERSION, digest) for no in template_articles("labor_standards_act")]
+    for key in keys:
+        store.put(key, f"第{key.article_no}條摘要。" * 20)
+    next_key = _cycle(keys)
+    return lambda: store.get(next_key())
+
+
+@bench_case("vectorstore.query", needs_corpus=True)
+def _bench_query(ctx: BenchContext):
+    queries = _cycle(QUERIES)
+    return lambda: ctx.store.query(queries(), top_k=10)
+
+
+@bench_case("service.answer_with_rag", needs_corpus=True)
+def _bench_answer(ctx: BenchContext):
+    from . import service
+
+    queries = _cycle(QUERIES)
+
+    def op():
+        # 以基準語料替換服務用的向量庫；回答由 EchoLLM 產生
+        previous, service._VECTOR_STORE = service._VECTOR_STORE, ctx.store
+        try:
+            return service.answer_with_rag(queries(), None)
+        finally:
+            service._VECTOR_STORE = previous
+    return op
+
+
+# ---- 套件執行與比較 ----
+
+@dataclass
+class SuiteResults:
+    results: Dict[str, BenchResult] = field(default_factory=dict)
+    meta: Dict[str, Any] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"meta": self.meta, "results": {k: asdict(r) for k, r in self.results.items()}}
+
+
+def select_cases(names: Optional[Sequence[str]] = None) -> List[BenchCase]:
+    """依名稱或前綴（例如 "service."）挑選案例；未指定時全部執行。"""
+    if not names:
+        return list(CASES.values())
+    selected = [c for c in CASES.values() if any(c.name == n or c.name.startswith(n) for n in names)]
+    if not selected:
+        raise KeyError(f"no benchmark case matches {list(names)}; available: {sorted(CASES)}")
+    return selected
+
+
+def run_suite(sizes: Sequence[int] = DEFAULT_SIZES, cases: Optional[Sequence[str]] = None, *,
+              min_time: float = 1.0, root: Optional[Path] = None,
+              on_result: Optional[Callable[[BenchResult], None]] = None) -> SuiteResults:
+    """與語料無關的案例執行一次；需要向量庫的案例對每個語料大小各執行一次。"""
+    selected = select_cases(cases)
+    suite = SuiteResults(meta={
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "min_time": min_time,
+        "sizes": [format_size(s) for s in sizes],
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    })
+
+    def record(result: BenchResult) -> None:
+        suite.results[result.key] = result
+        if on_result is not None:
+            on_result(result)
+
+    with offline_env():
+        base = BenchContext(chunks=synthetic_chunks(200))
+        for case in selected:
+            if not case.needs_corpus:
+                record(measure(case.name, case.setup(base), min_time=min_time))
+        corpus_cases = [c for c in selected if c.needs_corpus]
+        for size in sizes if corpus_cases else ():
+            ctx = BenchContext(chunks=base.chunks, store=build_corpus(size, root), corpus=format_size(size))
+            for case in corpus_cases:
+                record(measure(case.name, case.setup(ctx), corpus=ctx.corpus, min_time=min_time))
+    return suite
+
+
+def write_results(suite: SuiteResults, path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(suite.to_dict(), ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+
+
+def load_results(path: Path) -> SuiteResults:
+    data = json.loads(Path(path).read_text(encoding="utf-8"))
+    return SuiteResults(
+        results={k: BenchResult(**v) for k, v in (data.get("results") or {}).items()},
+        meta=data.get("meta") or {},
+    )
+
+
+@dataclass
+class Comparison:
+    key: str
+    baseline_ops: float
+    current_ops: float
+    # 相對基準的 ops/sec 變化（-0.25 表示慢了 25%）
+    change: float
+    regressed: bool
+
+
+def compare(current: SuiteResults, baseline: SuiteResults, threshold: float = DEFAULT_THRESHOLD) -> List[Comparison]:
+    """只比較兩邊都有的案例；ops/sec 下降超過 threshold 比例即為退化。"""
+    out = []
+    for key, result in current.results.items():
+        base = baseline.results.get(key)
+        if base is None or base.ops_per_sec <= 0:
+            continue
+        change = result.ops_per_sec / base.ops_per_sec - 1
+        out.append(Comparison(key, base.ops_per_sec, result.ops_per_sec, round(change, 4), change < -threshold))
+    return out
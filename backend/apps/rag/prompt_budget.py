@@ -0,0 +1,440 @@
+"""依 token 預算組裝 RAG 提示：來源、近期對話與回答指引各有配額，較早的對話壓縮成滾動摘要。
+
+- token 以 TokenEstimator 估算：預設 CJK 字元每字約 1 token、其他字元每 PROMPT_CHARS_PER_TOKEN（4）個約 1 token；
+  PROMPT_TOKEN_ESTIMATOR=tiktoken[:encoding] 改用 tiktoken（需 pip install tiktoken）。
+- 系統提示、用戶問題與回答指引一定完整保留，先從 PROMPT_MAX_TOKENS 扣除；剩餘預算依序給來源
+  （PROMPT_CONTEXT_TOKENS）、近期對話（PROMPT_HISTORY_TOKENS，來源未用完的部分也給對話）與較早對話的摘要
+  （PROMPT_SUMMARY_TOKENS）。
+- 放不進近期對話的較早回合合併成摘要，以對話前綴的雜湊為鍵快取；對話每多一回合，只需把新移出的回合併入
+  上一份摘要，不必重新摘要整段對話。
+- 對話總長以 TOTAL_HISTORY_MAX_CHARS 為上限，超過時捨棄最舊的回合。
+"""
+from __future__ import annotations
+
+import functools
+import hashlib
+import logging
+import math
+import os
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from apps.common.limits import TOTAL_HISTORY_MAX_CHARS
+from apps.common.metrics import PROMPT_HISTORY_SUMMARIES
+
+from .llm_providers import BaseLLM, EchoLLM, LLMCallError, get_default_llm
+
+logger = logging.getLogger(__name__)
+
+# (role, content)
+Turn = Tuple[str, str]
+
+
+class TokenEstimator:
+    name = "base"
+
+    def count(self, text: str) -> int:
+        raise NotImplementedError
+
+
+class HeuristicTokenEstimator(TokenEstimator):
+    """不需 tokenizer 的估算：中日韓文字與全形標點每字 1 token，其餘每 chars_per_token 個字元 1 token。"""
+
+    # 以連續區段比對，只加總 match 的長度，不另外建立字串
+    _WIDE_RUNS = re.compile(r"[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]+")
+
+    # 來源行、回答指引等短字串在請求間大量重複，記住最近的估算結果
+    MEMO_MAX_CHARS = 512
+
+    def __init__(self, chars_per_token: float = 4.0, memo_size: int = 4096) -> None:
+        self.chars_per_token = max(0.5, chars_per_token)
+        self.name = f"heuristic:{self.chars_per_token:g}"
+        self._memo = functools.lru_cache(maxsize=memo_size)(self._count)
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        return self._memo(text) if len(text) <= self.MEMO_MAX_CHARS else self._count(text)
+
+    def _count(self, text: str) -> int:
+        wide = 0 if text.isascii() else sum(m.end() - m.start() for m in self._WIDE_RUNS.finditer(text))
+        return wide + math.ceil((len(text) - wide) / self.chars_per_token)
+
+
+class TiktokenEstimator(TokenEstimator):
+    def __init__(self, encoding: str = "cl100k_base") -> None:
+        try:
+            import tiktoken
+        except ImportError as exc:  # pragma: no cover - 依安裝環境而定
+            raise RuntimeError("PROMPT_TOKEN_ESTIMATOR=tiktoken requires `pip install tiktoken`") from exc
+        self._encoding = tiktoken.get_encoding(encoding)
+        self.name = f"tiktoken:{encoding}"
+
+    def count(self, text: str) -> int:
+        return len(self._encoding.encode(text, disallowed_special=())) if text else 0
+
+
+_ESTIMATOR: Optional[TokenEstimator] = None
+_ESTIMATOR_LOCK = threading.Lock()
+
+
+def get_token_estimator() -> TokenEstimator:
+    """依 PROMPT_TOKEN_ESTIMATOR（heuristic / tiktoken[:encoding]）建立估算器；設定只在第一次呼叫時讀取。"""
+    global _ESTIMATOR
+    if _ESTIMATOR is None:
+        with _ESTIMATOR_LOCK:
+            if _ESTIMATOR is None:
+                spec = (os.getenv("PROMPT_TOKEN_ESTIMATOR") or "heuristic").strip().lower()
+                kind, _, arg = spec.partition(":")
+                if kind == "heuristic":
+                    _ESTIMATOR = HeuristicTokenEstimator(float((os.getenv("PROMPT_CHARS_PER_TOKEN") or "4").strip()))
+                elif kind == "tiktoken":
+                    _ESTIMATOR = TiktokenEstimator(arg or "cl100k_base")
+                else:
+                    raise ValueError(f"Unknown PROMPT_TOKEN_ESTIMATOR: {spec}")
+    return _ESTIMATOR
+
+
+def clip_to_tokens(text: str, max_tokens: int, estimator: TokenEstimator) -> str:
+    """截斷到估算值不超過 max_tokens（保留開頭，截斷時以「…」結尾）。"""
+    if estimator.count(text) <= max_tokens:
+        return text
+    if max_tokens <= 1:
+        return ""
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimator.count(text[:mid]) + 1 <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo] + "…" if lo else ""
+
+
+@dataclass(frozen=True)
+class PromptBudget:
+    max_tokens: int = 3000
+    context_tokens: int = 1500
+    history_tokens: int = 800
+    summary_tokens: int = 200
+
+    @classmethod
+    def from_env(cls) -> "PromptBudget":
+        return cls(
+            max_tokens=int(os.getenv("PROMPT_MAX_TOKENS", str(cls.max_tokens))),
+            context_tokens=int(os.getenv("PROMPT_CONTEXT_TOKENS", str(cls.context_tokens))),
+            history_tokens=int(os.getenv("PROMPT_HISTORY_TOKENS", str(cls.history_tokens))),
+            summary_tokens=int(os.getenv("PROMPT_SUMMARY_TOKENS", str(cls.summary_tokens))),
+        )
+
+
+_BUDGET: Optional[PromptBudget] = None
+
+
+def get_prompt_budget() -> PromptBudget:
+    """行程內共用的 PromptBudget；PROMPT_* 設定只在第一次呼叫時讀取。"""
+    global _BUDGET
+    if _BUDGET is None:
+        _BUDGET = PromptBudget.from_env()
+    return _BUDGET
+
+
+def prefix_hashes(turns: Sequence[Turn]) -> List[str]:
+    """第 i 項為 turns[:i+1] 的鏈式雜湊，延長對話不影響既有前綴的雜湊。"""
+    hashes: List[str] = []
+    digest = ""
+    for role, content in turns:
+        digest = hashlib.sha256(f"{digest}\x00{role}\x00{content}".encode("utf-8")).hexdigest()
+        hashes.append(digest)
+    return hashes
+
+
+class HistorySummaryCache:
+    """(摘要器, 對話前綴雜湊) -> 摘要的 LRU；鍵不含 token 上限，取出後由呼叫端截到當次可用的空間。"""
+
+    def __init__(self, max_entries: int = 1024) -> None:
+        self.max_entries = max(1, max_entries)
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str]) -> Optional[str]:
+        with self._lock:
+            summary = self._entries.get(key)
+            if summary is not None:
+                self._entries.move_to_end(key)
+            return summary
+
+    def put(self, key: Tuple[str, str], summary: str) -> None:
+        with self._lock:
+            self._entries[key] = summary
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+_SUMMARY_CACHE: Optional[HistorySummaryCache] = None
+_SUMMARY_CACHE_LOCK = threading.Lock()
+
+
+def get_history_summary_cache() -> HistorySummaryCache:
+    global _SUMMARY_CACHE
+    if _SUMMARY_CACHE is None:
+        with _SUMMARY_CACHE_LOCK:
+            if _SUMMARY_CACHE is None:
+                _SUMMARY_CACHE = HistorySummaryCache(int(os.getenv("PROMPT_SUMMARY_CACHE_SIZE", "1024")))
+    return _SUMMARY_CACHE
+
+
+_SENTENCE_END = re.compile(r"[。！？!?\n]")
+
+
+class ExtractiveSummarizer:
+    """每回合保留第一句（最多 line_chars 字）；超過預算時捨棄最舊的行。不呼叫 LLM。"""
+
+    name = "extractive"
+
+    def __init__(self, line_chars: int = 80) -> None:
+        self.line_chars = line_chars
+
+    def _line(self, role: str, content: str) -> str:
+        first = next((s.strip() for s in _SENTENCE_END.split(content) if s.strip()), "")
+        if len(first) > self.line_chars:
+            first = first[: self.line_chars] + "…"
+        return f"{role}: {first}"
+
+    def extend(self, previous: str, turns: Sequence[Turn], max_tokens: int, estimator: TokenEstimator) -> str:
+        lines = (previous.splitlines() if previous else []) + [self._line(role, content) for role, content in turns]
+        costs = [estimator.count(line) + 1 for line in lines]
+        total = sum(costs)
+        start = 0
+        while start < len(lines) and total > max_tokens:
+            total -= costs[start]
+            start += 1
+        return "\n".join(lines[start:])
+
+
+HISTORY_SUMMARY_INSTRUCTIONS = (
+    "請將「先前摘要」與「新增對話」整理成一份更新後的對話摘要，用繁體中文，不超過 {chars} 字。\n"
+    "保留用戶關心的問題、已確認的事實、數字與條號；只輸出摘要本身。\n"
+)
+
+
+class LLMSummarizer:
+    """以 LLM 把新移出近期對話的回合併入上一份摘要；呼叫失敗時拋出 LLMCallError。"""
+
+    def __init__(self, llm: BaseLLM) -> None:
+        self.llm = llm
+        self.name = f"llm:{llm.provider}:{getattr(llm, 'model', '')}"
+
+    def extend(self, previous: str, turns: Sequence[Turn], max_tokens: int, estimator: TokenEstimator) -> str:
+        convo = "\n".join(f"{role}: {content}" for role, content in turns)
+        prompt = (
+            HISTORY_SUMMARY_INSTRUCTIONS.format(chars=max_tokens)
+            + f"\n先前摘要:\n{previous or '（無）'}\n\n新增對話:\n{convo}\n"
+        )
+        summary = self.llm.complete(prompt).strip()
+        return clip_to_tokens(summary, max_tokens, estimator)
+
+
+def get_history_summarizer() -> Any:
+    """PROMPT_HISTORY_SUMMARIZER=extractive（預設）或 llm；未設定 LLM 供應商時一律 extractive。"""
+    if (os.getenv("PROMPT_HISTORY_SUMMARIZER") or "extractive").strip().lower() == "llm":
+        llm = get_default_llm()
+        if not isinstance(llm, EchoLLM):
+            return LLMSummarizer(llm)
+    return ExtractiveSummarizer()
+
+
+def summarize_history(
+    turns: Sequence[Turn],
+    max_tokens: int,
+    estimator: TokenEstimator,
+    *,
+    summarizer: Any = None,
+    cache: Optional[HistorySummaryCache] = None,
+    cache_tokens: Optional[int] = None,
+) -> str:
+    """較早回合的滾動摘要：命中整個前綴直接回傳；否則從最長的已快取前綴接續，只摘要其後的回合。
+
+    摘要以 cache_tokens（摘要區段的上限，預設為 max_tokens）產生並快取，回傳前再截到 max_tokens，
+    檢索內容多寡改變當次可用空間時仍命中同一份摘要。
+    """
+    if not turns or max_tokens <= 0:
+        return ""
+    summarizer = summarizer or get_history_summarizer()
+    cache = cache or get_history_summary_cache()
+    target = max(max_tokens, cache_tokens or 0)
+    hashes = prefix_hashes(turns)
+
+    def key(digest: str) -> Tuple[str, str]:
+        return (summarizer.name, digest)
+
+    summary = cache.get(key(hashes[-1]))
+    cache.record(summary is not None)
+    if summary is not None:
+        PROMPT_HISTORY_SUMMARIES.inc("hit")
+        return _fit_summary(summary, max_tokens, estimator)
+    start, previous = 0, ""
+    for i in range(len(hashes) - 2, -1, -1):
+        cached = cache.get(key(hashes[i]))
+        if cached is not None:
+            start, previous = i + 1, cached
+            break
+    PROMPT_HISTORY_SUMMARIES.inc("extended" if start else "miss")
+    try:
+        summary = summarizer.extend(previous, turns[start:], target, estimator)
+    except LLMCallError as exc:
+        # 回退的摘要不寫入快取，下一回合再交給 LLM
+        logger.warning("history_summary_failed", extra={"reason": exc.reason})
+        return ExtractiveSummarizer().extend(previous, turns[start:], max_tokens, estimator)
+    cache.put(key(hashes[-1]), summary)
+    return _fit_summary(summary, max_tokens, estimator)
+
+
+def _fit_summary(summary: str, max_tokens: int, estimator: TokenEstimator) -> str:
+    """截到 max_tokens：先捨棄最舊的行（與 ExtractiveSummarizer 相同），只剩一行仍過長時截斷。"""
+    lines = summary.splitlines()
+    while len(lines) > 1 and estimator.count("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return clip_to_tokens("\n".join(lines), max_tokens, estimator)
+
+
+def cap_history_chars(turns: Sequence[Turn], max_chars: int = TOTAL_HISTORY_MAX_CHARS) -> List[Turn]:
+    """保留最新的回合，使內容總字元數不超過 max_chars。"""
+    kept: List[Turn] = []
+    total = 0
+    for role, content in reversed(turns):
+        total += len(content)
+        if total > max_chars:
+            break
+        kept.append((role, content))
+    kept.reverse()
+    return kept
+
+
+@dataclass
+class BudgetedPrompt:
+    text: str
+    # 各區段估算值的總和（每段多計 1 個換行，略高於重新估算整份提示）
+    tokens: int
+    # 各區段估算的 token 數
+    sections: Dict[str, int]
+    contexts_dropped: int = 0
+    turns_summarized: int = 0
+    turns_dropped: int = 0
+
+
+def assemble_prompt(
+    *,
+    system_prompt: str,
+    source_lines: Sequence[str],
+    no_sources_text: str,
+    history: Sequence[Turn],
+    message: str,
+    instructions: str,
+    budget: Optional[PromptBudget] = None,
+    estimator: Optional[TokenEstimator] = None,
+    summarizer: Any = None,
+) -> BudgetedPrompt:
+    """依預算挑選來源（依排序取前幾條）、近期回合（由新到舊）與較早回合的摘要，組成與 build_prompt 相同格式的提示。"""
+    budget = budget or get_prompt_budget()
+    estimator = estimator or get_token_estimator()
+    system_line = f"系統提示: {system_prompt}" if system_prompt else ""
+    question_line = f"用戶問題: {message}"
+    instructions_line = "回答指引: " + instructions
+    fixed = sum(estimator.count(p) + 1 for p in (system_line, "相關資料來源:", "對話記錄:", question_line, instructions_line) if p)
+    remaining = max(0, budget.max_tokens - fixed)
+
+    # 來源：依排序放入，放不下即停止
+    context_cap = min(budget.context_tokens, remaining)
+    sources: List[str] = []
+    context_used = 0
+    for line in source_lines:
+        cost = estimator.count(line) + 1
+        if context_used + cost > context_cap:
+            break
+        sources.append(line)
+        context_used += cost
+    if not sources:
+        context_used = estimator.count(no_sources_text) + 1
+    remaining = max(0, remaining - context_used)
+
+    # 對話：先套用總字元上限，再由新到舊放入近期回合；放不下的較早回合改成摘要
+    capped = cap_history_chars(history)
+    turns_dropped = len(history) - len(capped)
+    lines = [f"{role}: {content}" for role, content in capped]
+    costs = [estimator.count(line) + 1 for line in lines]
+    history_cap = min(budget.history_tokens + max(0, budget.context_tokens - context_used), remaining)
+    summary_cap = 0
+    if sum(costs) > history_cap:
+        summary_cap = min(budget.summary_tokens, remaining)
+        history_cap = min(history_cap, remaining - summary_cap)
+    keep_from = len(lines)
+    history_used = 0
+    while keep_from > 0 and history_used + costs[keep_from - 1] <= history_cap:
+        keep_from -= 1
+        history_used += costs[keep_from]
+    recent = lines[keep_from:]
+    if not recent and lines and history_cap > 0:
+        # 最新一則過長時截斷保留開頭，避免完全失去上一輪的脈絡
+        clipped = clip_to_tokens(lines[-1], history_cap - 1, estimator)
+        if clipped:
+            recent = [clipped]
+            keep_from = len(lines) - 1
+            history_used = estimator.count(clipped) + 1
+    older = capped[:keep_from]
+    summary_header = "對話摘要（較早的對話）:"
+    summary_room = summary_cap - estimator.count(summary_header) - 2
+    summary = ""
+    if older and summary_room > 0:
+        full_room = budget.summary_tokens - estimator.count(summary_header) - 2
+        summary = summarize_history(older, summary_room, estimator, summarizer=summarizer, cache_tokens=full_room)
+    summary_block = f"{summary_header}\n{summary}" if summary else ""
+    summary_used = estimator.count(summary_block) + 1 if summary else 0
+
+    parts = [
+        system_line,
+        "相關資料來源:",
+        "\n".join(sources) if sources else no_sources_text,
+        summary_block,
+        "對話記錄:",
+        "\n".join(recent),
+        question_line,
+        instructions_line,
+    ]
+    sections = {
+        "instructions": fixed,
+        "contexts": context_used,
+        "history": history_used,
+        "summary": summary_used,
+    }
+    return BudgetedPrompt(
+        text="\n".join(p for p in parts if p),
+        # 各區段已含換行的估算，不再重新估算整份提示
+        tokens=sum(sections.values()),
+        sections=sections,
+        contexts_dropped=len(source_lines) - len(sources),
+        turns_summarized=len(older) if summary else 0,
+        turns_dropped=turns_dropped + (len(older) if not summary else 0),
+    )
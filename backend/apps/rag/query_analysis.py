@@ -0,0 +1,146 @@
+"""查詢分析：每個請求只執行一次，後續階段（回答快取、意圖判斷、條文快速路徑、檢索、重排、提示組裝）共用結果。
+
+- normalized：條號統一寫成「第N條」（中文數字含百/零、全形數字、「第九條之一」/「第 9-1 條」皆轉成阿拉伯數字）
+- articles：依出現順序的條號（normalize_article_no 格式，例如 "38"、"9-1"）
+- model_inquiry：是否在詢問目前使用的模型
+- law_mentions / unknown_law：提到的已登記法規（template_id）與是否提到未登記的法規
+- tokens / phrases：重排相似度使用的查詢詞，不必對每個候選片段重新切詞
+"""
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import FrozenSet, List, Optional, Tuple
+
+from .templates_registry import normalize_article_no, resolve_law_mentions
+
+_CN_DIGITS = {"零": 0, "〇": 0, "一": 1, "二": 2, "兩": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+_CN_UNITS = {"十": 10, "百": 100, "千": 1000}
+_FULLWIDTH_DIGITS = str.maketrans("０１２３４５６７８９", "0123456789")
+
+_NUM = r"[0-9０-９零〇一二兩三四五六七八九十百千]"
+# 第 N 條、第 N-M 條、第 N 條之 M（數字之間允許空白，例如「第 二 十 三 條」）
+ARTICLE_MENTION_PATTERN = re.compile(
+    rf"第\s*({_NUM}(?:[\s{_NUM[1:-1]}]*{_NUM})?)\s*(?:-\s*([0-9０-９]+)\s*)?條(?:\s*之\s*({_NUM}+))?"
+)
+MODEL_INQUIRY_PATTERN = re.compile(
+    r"(你|您).*(用|使用).*(什麼|哪個).*(模型|model)|(模型|model).*(是|為).*(什麼|哪個)|what\s+model|which\s+model",
+    re.IGNORECASE,
+)
+_CJK_PHRASE = re.compile(r"[\u4e00-\u9fff]{2,}")
+_LATIN_WORD = re.compile(r"[a-zA-Z]+")
+_KEY_CHARS = re.compile(r"[法條假期資給薪工時]")
+
+
+def parse_chinese_num(s: str) -> int:
+    """解析中文或阿拉伯數字（至 9999）：「二十三」、「一百零五」、「一百二」（=120）、「３８」；無法解析時回傳 0。"""
+    s = "".join(s.split())
+    if not s:
+        return 0
+    if s.isdigit():
+        return int(s.translate(_FULLWIDTH_DIGITS))
+    total = 0
+    digit: Optional[int] = None
+    last_unit = 0
+    after_unit = False
+    for ch in s:
+        if ch in _CN_DIGITS:
+            digit = _CN_DIGITS[ch]
+            after_unit = after_unit and digit != 0
+        elif ch in _CN_UNITS:
+            unit = _CN_UNITS[ch]
+            total += (1 if digit is None else digit) * unit
+            digit, last_unit, after_unit = None, unit, True
+        else:
+            return 0
+    if digit:
+        # 「一百二」為 120：單位後直接接的個位數沿用下一級單位
+        total += digit * (last_unit // 10) if after_unit and last_unit >= 100 else digit
+    return total
+
+
+def _article_no(match: "re.Match[str]") -> Optional[str]:
+    main = parse_chinese_num(match.group(1))
+    if main <= 0:
+        return None
+    sub_raw = match.group(2) or match.group(3)
+    if sub_raw is None:
+        return str(main)
+    sub = parse_chinese_num(sub_raw)
+    return normalize_article_no(f"{main}-{sub}") if sub > 0 else None
+
+
+def _normalize_articles(text: str) -> Tuple[str, Tuple[str, ...]]:
+    """單次掃描：回傳 (條號統一為「第N條」的文字, 依出現順序去重的條號)。"""
+    parts: List[str] = []
+    articles: List[str] = []
+    pos = 0
+    for match in ARTICLE_MENTION_PATTERN.finditer(text):
+        no = _article_no(match)
+        if no is None:
+            continue
+        parts.append(text[pos:match.start()])
+        parts.append(f"第{no}條")
+        pos = match.end()
+        if no not in articles:
+            articles.append(no)
+    if not parts:
+        return text, ()
+    parts.append(text[pos:])
+    return "".join(parts), tuple(articles)
+
+
+def normalize_article_mentions(text: str) -> str:
+    """只做條號正規化（不做其餘分析）。"""
+    return _normalize_articles(text)[0]
+
+
+def extract_query_tokens(text: str) -> FrozenSet[str]:
+    """重排相似度使用的詞：連續兩個以上的中文字、英文字詞（小寫）與法規常見關鍵字。"""
+    return frozenset(_CJK_PHRASE.findall(text) + _LATIN_WORD.findall(text.lower()) + _KEY_CHARS.findall(text))
+
+
+def extract_query_phrases(text: str) -> Tuple[str, ...]:
+    return tuple(_CJK_PHRASE.findall(text))
+
+
+@dataclass(frozen=True)
+class QueryAnalysis:
+    text: str
+    normalized: str
+    articles: Tuple[str, ...]
+    model_inquiry: bool
+    law_mentions: Tuple[str, ...]
+    unknown_law: bool
+    tokens: FrozenSet[str]
+    phrases: Tuple[str, ...]
+
+    @property
+    def article(self) -> Optional[str]:
+        """第一個提到的條號。"""
+        return self.articles[0] if self.articles else None
+
+
+class QueryAnalyzer:
+    """單次掃描產生 QueryAnalysis；正則於模組載入時編譯。"""
+
+    def analyze(self, text: str) -> QueryAnalysis:
+        normalized, articles = _normalize_articles(text)
+        mentioned, unknown = resolve_law_mentions(text)
+        return QueryAnalysis(
+            text=text,
+            normalized=normalized,
+            articles=articles,
+            model_inquiry=MODEL_INQUIRY_PATTERN.search(text) is not None,
+            law_mentions=tuple(mentioned),
+            unknown_law=unknown,
+            tokens=extract_query_tokens(normalized),
+            phrases=extract_query_phrases(normalized),
+        )
+
+
+QUERY_ANALYZER = QueryAnalyzer()
+
+
+def analyze_query(text: str) -> QueryAnalysis:
+    return QUERY_ANALYZER.analyze(text)
@@ -0,0 +1,316 @@
+"""Blue/green 重新索引：嵌入器變更時在背景建立新版本 collection，完成後原子切換。
+
+流程：
+1. 依設定的嵌入器建立 `documents-<embedder_id>` collection，並登記為雙寫目標
+   （期間的 ingest 會同時寫入新舊兩個 collection）。
+2. 分批從服務中的 collection 讀出 chunk，以新嵌入器嵌入後寫入；查詢仍走舊 collection。
+3. 再跑一輪比對確認沒有差異後，改寫 active_collection 指標完成切換。
+4. 等待短暫寬限期讓進行中的查詢結束，再刪除舊世代的 collection。
+
+進度（已處理數、速率、ETA）寫入 VECTOR_DIR/reindex_status.json，
+供 `GET /api/v1/reindex` 與 `manage.py reindex --status` 讀取。
+同一時間只允許一個重新索引：以 VECTOR_DIR/reindex.lock 的檔案鎖（flock；Windows 為 msvcrt.locking）互斥，
+持有的程序結束時由作業系統釋放，容器重啟後 PID 重複使用也不會留下永久的鎖。
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+    import msvcrt
+
+from .manifest import describe_embedder, write_manifest, write_shadow_collection
+from .vectorstore import COLLECTION_NAME, ChromaVectorStore, collection_name_for
+
+logger = logging.getLogger(__name__)
+
+_STATUS_FILENAME = "reindex_status.json"
+_LOCK_FILENAME = "reindex.lock"
+
+
+class ReindexInProgress(RuntimeError):
+    """已有另一個重新索引在執行。"""
+
+
+@dataclass
+class ReindexProgress:
+    state: str = "idle"  # idle | running | completed | failed | interrupted
+    phase: Optional[str] = None  # copy | verify | flip | gc
+    source: Optional[str] = None
+    target: Optional[str] = None
+    target_embedder: Optional[str] = None
+    total: int = 0
+    done: int = 0
+    passes: int = 0
+    rate_per_sec: float = 0.0
+    eta_seconds: Optional[float] = None
+    started_at: Optional[float] = None
+    updated_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    dropped: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+    pid: Optional[int] = None
+
+
+def _status_path(persist_dir: str) -> str:
+    return os.path.join(persist_dir, _STATUS_FILENAME)
+
+
+def _write_status(persist_dir: str, progress: ReindexProgress) -> None:
+    progress.updated_at = time.time()
+    path = _status_path(persist_dir)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(asdict(progress), fh)
+    os.replace(tmp, path)
+
+
+def _try_lock(fd: int) -> bool:
+    """以作業系統的檔案鎖取得獨占鎖（不等待）；持有者結束時由核心釋放，不依賴 PID。"""
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def _unlock(fd: int) -> None:
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+def _open_lock_file(persist_dir: str) -> int:
+    os.makedirs(persist_dir, exist_ok=True)
+    return os.open(os.path.join(persist_dir, _LOCK_FILENAME), os.O_CREAT | os.O_RDWR)
+
+
+def reindex_lock_held(persist_dir: str) -> bool:
+    """是否有程序持有重新索引鎖；持有者異常結束後鎖即釋放。"""
+    fd = _open_lock_file(persist_dir)
+    try:
+        if not _try_lock(fd):
+            return True
+        _unlock(fd)
+        return False
+    finally:
+        os.close(fd)
+
+
+def read_reindex_status(persist_dir: str) -> ReindexProgress:
+    try:
+        with open(_status_path(persist_dir), "r", encoding="utf-8") as fh:
+            progress = ReindexProgress(**json.load(fh))
+    except FileNotFoundError:
+        return ReindexProgress()
+    if progress.state == "running" and not reindex_lock_held(persist_dir):
+        # 執行中的程序已結束卻沒留下結果：視為中斷，可重新執行
+        progress.state = "interrupted"
+    return progress
+
+
+@contextmanager
+def _reindex_lock(persist_dir: str, wait_seconds: float = 1.0) -> Iterator[None]:
+    """鎖檔保留在磁碟上，只以檔案鎖表示持有；短暫等待讓 read_reindex_status 的探測先釋放。"""
+    fd = _open_lock_file(persist_dir)
+    deadline = time.monotonic() + wait_seconds
+    while not _try_lock(fd):
+        if time.monotonic() >= deadline:
+            os.close(fd)
+            raise ReindexInProgress("Reindex already running")
+        time.sleep(0.05)
+    try:
+        yield
+    finally:
+        _unlock(fd)
+        os.close(fd)
+
+
+def _all_ids(collection: Any) -> Set[str]:
+    return set(collection.get(include=[]).get("ids") or [])
+
+
+def _copy_pass(
+    store: ChromaVectorStore,
+    source: Any,
+    target: Any,
+    embedder: Any,
+    batch_size: int,
+    report: Callable[[int], None],
+) -> int:
+    """把 source 與 target 的差異同步到 target，回傳變更的 chunk 數。"""
+    changed = 0
+    offset = 0
+    while True:
+        page = source.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+        ids = page.get("ids") or []
+        if not ids:
+            break
+        texts = page.get("documents") or [""] * len(ids)
+        metadatas = page.get("metadatas") or [None] * len(ids)
+        existing = target.get(ids=ids, include=["documents"])
+        current = dict(zip(existing.get("ids") or [], existing.get("documents") or []))
+        todo = [i for i, cid in enumerate(ids) if current.get(cid) != texts[i]]
+        if todo:
+            todo_texts = [texts[i] for i in todo]
+            target.upsert(
+                ids=[ids[i] for i in todo],
+                embeddings=store.embed_documents(embedder, todo_texts),
+                metadatas=[metadatas[i] for i in todo],
+                documents=todo_texts,
+            )
+            changed += len(todo)
+        offset += len(ids)
+        report(len(ids))
+    extra = list(_all_ids(target) - _all_ids(source))
+    if extra:
+        target.delete(ids=extra)
+        changed += len(extra)
+    return changed
+
+
+def gc_inactive_collections(store: ChromaVectorStore) -> List[str]:
+    """刪除非服務中的舊世代 collection（含版本化之前的 `documents`）。"""
+    active = store.active_collection_name()
+    dropped = []
+    for name in store.list_collection_names():
+        if name != active and (name == COLLECTION_NAME or name.startswith(f"{COLLECTION_NAME}-")):
+            store.drop_collection(name)
+            dropped.append(name)
+    if dropped:
+        logger.info("dropped inactive collections: %s", ", ".join(dropped))
+    return dropped
+
+
+def reindex(
+    store: Optional[ChromaVectorStore] = None,
+    *,
+    batch_size: Optional[int] = None,
+    gc: bool = True,
+    grace_seconds: Optional[float] = None,
+    max_passes: int = 3,
+    on_progress: Optional[Callable[[ReindexProgress], None]] = None,
+) -> ReindexProgress:
+    """以設定的嵌入器重建索引並切換；已是最新時直接回傳。"""
+    store = store or ChromaVectorStore()
+    persist_dir = store.config.persist_dir
+    batch_size = max(1, batch_size or int(os.getenv("REINDEX_BATCH_SIZE", "256")))
+    grace = float(os.getenv("REINDEX_GC_GRACE_SECONDS", "5")) if grace_seconds is None else grace_seconds
+
+    embedder = store.target_embedder
+    source_name = store.active_collection_name()
+    target_name = collection_name_for(embedder.embedder_id)
+    progress = ReindexProgress(
+        state="running",
+        source=source_name,
+        target=target_name,
+        target_embedder=embedder.embedder_id,
+        started_at=time.time(),
+        pid=os.getpid(),
+    )
+
+    def publish() -> None:
+        _write_status(persist_dir, progress)
+        if on_progress is not None:
+            on_progress(progress)
+
+    with _reindex_lock(persist_dir):
+        try:
+            if source_name != target_name:
+                source = store.open_collection(source_name)
+                target = store.open_collection(target_name)
+                metric = (target.metadata or {}).get("hnsw:space", "l2")
+                write_manifest(persist_dir, target_name, describe_embedder(embedder, metric=metric))
+                write_shadow_collection(persist_dir, target_name)
+                try:
+                    progress.total = source.count()
+
+                    def report(n: int) -> None:
+                        if progress.phase == "copy":
+                            progress.done = min(progress.total, progress.done + n)
+                        elapsed = max(1e-6, time.time() - (progress.started_at or time.time()))
+                        progress.rate_per_sec = round(progress.done / elapsed, 2)
+                        remaining = max(0, progress.total - progress.done)
+                        progress.eta_seconds = round(remaining / progress.rate_per_sec, 1) if progress.rate_per_sec else None
+                        publish()
+
+                    progress.phase = "copy"
+                    publish()
+                    while progress.passes < max_passes:
+                        changed = _copy_pass(store, source, target, embedder, batch_size, report)
+                        progress.passes += 1
+                        logger.info("reindex pass %d synced %d chunks into %s", progress.passes, changed, target_name)
+                        if changed == 0:
+                            break
+                        progress.phase = "verify"
+                        publish()
+
+                    progress.phase = "flip"
+                    publish()
+                    # 指標改寫後才停止雙寫；新的寫入直接進入新 collection
+                    store.activate(target_name)
+                finally:
+                    write_shadow_collection(persist_dir, None)
+
+            if gc:
+                progress.phase = "gc"
+                publish()
+                if grace > 0 and source_name != target_name:
+                    # 讓其他程序進行中的查詢結束；它們下一次存取就會讀到新指標
+                    time.sleep(grace)
+                progress.dropped = gc_inactive_collections(store)
+        except Exception as exc:
+            progress.state = "failed"
+            progress.error = str(exc)
+            progress.finished_at = time.time()
+            publish()
+            raise
+
+    progress.state = "completed"
+    progress.phase = None
+    progress.eta_seconds = 0.0
+    progress.finished_at = time.time()
+    publish()
+    return progress
+
+
+_BACKGROUND: Dict[str, threading.Thread] = {}
+_BACKGROUND_LOCK = threading.Lock()
+
+
+def start_background_reindex(store: ChromaVectorStore, **kwargs: Any) -> threading.Thread:
+    """在背景執行緒重新索引，查詢在切換前持續走舊 collection。"""
+    persist_dir = store.config.persist_dir
+    with _BACKGROUND_LOCK:
+        running = _BACKGROUND.get(persist_dir)
+        if (running is not None and running.is_alive()) or read_reindex_status(persist_dir).state == "running":
+            raise ReindexInProgress("Reindex already running")
+
+        def run() -> None:
+            try:
+                reindex(store, **kwargs)
+            except ReindexInProgress:
+                logger.warning("reindex skipped: another reindex is running")
+            except Exception:
+                logger.exception("background reindex failed")
+
+        thread = threading.Thread(target=run, name="rag-reindex", daemon=True)
+        _BACKGROUND[persist_dir] = thread
+        thread.start()
+        return thread
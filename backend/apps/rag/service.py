@@ -1,20 +1,32 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 import os
 import re
+import time
+
+import numpy as np
 
 from apps.api.schemas import ChatTurn, ChatResponse, ChatSource
-from .templates_registry import list_templates, load_template_text, extract_article_text, find_article_any
-from .llm_providers import get_default_llm
+from apps.common.metrics import LLM_REQUESTS, PROMPT_TOKENS, VECTOR_COLLECTION_CHUNKS, observe_stage, time_stage
+from apps.common.timing import annotate_request, record_value
+from .templates_registry import REGISTRY, article_reference, find_article_any
+from .answer_cache import AnswerCache, AnswerCacheKey, get_answer_cache, make_cache_key
+from .corpus import get_corpus_generation
+from .article_summaries import build_article_prompt, lookup_summary, save_summary, summary_key, summary_keys
+from .executors import run_blocking
+from .llm_providers import BaseLLM, LLMCallError, get_default_llm
+from .llm_router import LLMRouter
+from .prompt_budget import BudgetedPrompt, assemble_prompt, get_token_estimator
+from .query_analysis import QueryAnalysis, analyze_query, extract_query_phrases, extract_query_tokens, normalize_article_mentions, parse_chinese_num
 from .vectorstore import ChromaVectorStore
 
-# 預編譯：條文編號匹配（提升效能並避免重複定義）
-CHINESE_ARTICLE_PATTERN = re.compile(r"第\s*([0-9０-９一二三四五六七八九十]+)\s*條")
+# 回答中的 [n] / [n, m] 內文引用
+INLINE_CITATION_PATTERN = re.compile(r"\[(\s*\d+(\s*,\s*\d+)*)\]")
 
 def _resolve_model_provider_and_name() -> tuple[str, str]:
-    """根據環境變數推斷實際使用之模型供應商與名稱，與 get_default_llm 的邏輯一致。"""
+    """根據環境變數推斷模型供應商與名稱（與 configured_providers 相同的優先順序）；多個供應商由路由器選擇時回報首選者。"""
     provider_env = (os.getenv("LLM_PROVIDER") or "auto").strip().lower()
 
     has_openai = (os.getenv("OPENAI_API_KEY") or "").strip() != ""
@@ -36,35 +48,9 @@ def _resolve_model_provider_and_name() -> tuple[str, str]:
         return ("Google Gemini", gemini_model)
     return ("Echo", "demo")
 
-def parse_chinese_num(s: str) -> int:
-    """快速解析常見中文數字（至 99）。
-
-    依序處理「十」「X十」「十X」「X十Y」等模式，其他情形回傳 0。
-    """
-    mapping = {'一': 1, '二': 2, '三': 3, '四': 4, '五': 5, '六': 6, '七': 7, '八': 8, '九': 9}
-    if s in mapping:
-        return mapping[s]
-    if s == '十':
-        return 10
-    if s.startswith('十'):
-        return 10 + mapping.get(s[1], 0)
-    if s.endswith('十'):
-        return mapping.get(s[0], 0) * 10
-    if '十' in s:
-        left, right = s.split('十', 1)
-        return mapping.get(left, 0) * 10 + mapping.get(right, 0)
-    return 0
-
 def normalize_chinese_numbers(text: str) -> str:
-    """將輸入中文字串中的「第X條」中文數字轉為阿拉伯數字，提升檢索精度。"""
-    def replacer(match: "re.Match[str]") -> str:
-        chinese_num = match.group(1)
-        if chinese_num.isdigit():
-            return match.group(0)
-        parsed = parse_chinese_num(chinese_num)
-        return f"第{parsed}條" if parsed > 0 else match.group(0)
-
-    return CHINESE_ARTICLE_PATTERN.sub(replacer, text)
+    """將「第X條」統一為阿拉伯數字的「第N條」，提升檢索精度（見 query_analysis）。"""
+    return normalize_article_mentions(text)
 
 
 _VECTOR_STORE: Optional[ChromaVectorStore] = None
@@ -76,11 +62,23 @@ def get_vector_store() -> ChromaVectorStore:
     return _VECTOR_STORE
 
 
+def _vector_collection_sizes():
+    store = get_vector_store()
+    return [((store.active_collection_name(),), store.count())]
+
+
+VECTOR_COLLECTION_CHUNKS.set_function(_vector_collection_sizes)
+
+
 @dataclass
 class RetrievedChunk:
     id: str
     document_id: Optional[int]
     text: str
+    # 檢索階段的融合分數（RRF）；None 表示未經混合檢索排序
+    score: Optional[float] = None
+    # 切分時記錄的條號（chunk metadata 的 article）
+    article: Optional[str] = None
 
 
 class DemoRetriever:
@@ -100,52 +98,31 @@ class DemoRetriever:
         return results or [RetrievedChunk(id="0", document_id=None, text=self.corpus[0])]
 
 
-def build_prompt(message: str, history: Optional[List[ChatTurn]], contexts: List[RetrievedChunk], *, inline_citations: Optional[bool] = None) -> str:
-    system_prompt = (os.getenv("SYSTEM_PROMPT") or "").strip()
+def build_prompt(query: Union[str, QueryAnalysis], history: Optional[List[ChatTurn]], contexts: List[RetrievedChunk], *, inline_citations: Optional[bool] = None) -> str:
+    return build_budgeted_prompt(query, history, contexts, inline_citations=inline_citations).text
 
 
-    model_provider, model_name = _resolve_model_provider_and_name()
+def build_budgeted_prompt(query: Union[str, QueryAnalysis], history: Optional[List[ChatTurn]], contexts: List[RetrievedChunk], *, inline_citations: Optional[bool] = None) -> BudgetedPrompt:
+    """依 PromptBudget 組裝提示：來源、近期對話與較早對話的摘要各有 token 配額（見 prompt_budget）。"""
+    if isinstance(query, str):
+        query = analyze_query(query)
+    system_prompt = (os.getenv("SYSTEM_PROMPT") or "").strip()
 
     if inline_citations is None:
         inline_default = (os.getenv("INLINE_CITATIONS_DEFAULT") or "").strip()
         inline_citations = inline_default == "1"
 
-    
-    import re as _re_fast
-    def normalize_chinese_numbers_local(text: str) -> str:
-        def parse_chinese_num(s: str) -> int:
-            d = {'一':1,'二':2,'三':3,'四':4,'五':5,'六':6,'七':7,'八':8,'九':9}
-            if s in d: return d[s]
-            if s == '十': return 10
-            if s.startswith('十'): return 10 + d.get(s[1], 0)
-            if s.endswith('十'): return d.get(s[0], 0) * 10
-            if '十' in s: 
-                p = s.split('十')
-                return d.get(p[0], 0) * 10 + d.get(p[1], 0)
-            return 0
-        
-        def replacer(match):
-            chinese_num = match.group(1)
-            if chinese_num.isdigit():
-                return match.group(0) 
-            parsed = parse_chinese_num(chinese_num)
-            return f"第{parsed}條" if parsed > 0 else match.group(0)
-        
-        return _re_fast.sub(r'第\s*([0-9０-９一二三四五六七八九十]+)\s*條', replacer, text)
-    
-    normalized_message = normalize_chinese_numbers(message)
-    filtered_contexts = _filter_and_rank_contexts(normalized_message, contexts)
-    
-    sources_list = "\n".join(
+    with time_stage("rerank"):
+        filtered_contexts = _filter_and_rank_contexts(query, contexts)
+
+    source_lines = [
         (
             f"- {c.text[:200]}{'…' if len(c.text) > 200 else ''}"
             if not inline_citations
             else f"- [source] {c.text[:200]}{'…' if len(c.text) > 200 else ''}"
         )
         for c in filtered_contexts
-    )
-
-    hist = "\n".join(f"{t.role}: {t.content}" for t in (history or []))
+    ]
 
     instructions = [
         "請儘可能回答用戶的問題，優先使用提供的資料來源。",
@@ -161,63 +138,64 @@ def build_prompt(message: str, history: Optional[List[ChatTurn]], contexts: List
     if not filtered_contexts:
         instructions.insert(0, "注意：沒有找到直接相關的資料來源，請基於勞基法和勞動相關的一般知識盡力回答，並說明回答基礎。")
     
-    parts = [
-        (f"系統提示: {system_prompt}" if system_prompt else ""),
-        "相關資料來源:",
-        sources_list if sources_list else "無相關資料（請檢查文件是否已正確建立索引）",
-        "對話記錄:",
-        hist,
-        f"用戶問題: {message}",
-        "回答指引: " + " ".join(instructions),
-    ]
-    return "\n".join(p for p in parts if p)
+    prompt = assemble_prompt(
+        system_prompt=system_prompt,
+        source_lines=source_lines,
+        no_sources_text="無相關資料（請檢查文件是否已正確建立索引）",
+        history=[(t.role, t.content) for t in (history or [])],
+        message=query.text,
+        instructions=" ".join(instructions),
+    )
+    annotate_request(
+        prompt_sections=prompt.sections,
+        contexts_dropped=prompt.contexts_dropped,
+        turns_summarized=prompt.turns_summarized,
+        turns_dropped=prompt.turns_dropped,
+    )
+    return prompt
 
 
-def _calculate_text_similarity(query: str, text: str) -> float:
-    """計算查詢與文本的相似度分數 (0-1)"""
-    import re
-    
-    
-    def extract_tokens(text):
-        chinese_words = re.findall(r'[\u4e00-\u9fff]{2,}', text)
-        english_words = re.findall(r'[a-zA-Z]+', text.lower())
-        
-        important_chars = re.findall(r'[法條假期資給薪工時]', text)
-        return set(chinese_words + english_words + important_chars)
-    
-    query_tokens = extract_tokens(query)
-    text_tokens = extract_tokens(text)
-    
+def _calculate_text_similarity(query: Union[str, QueryAnalysis], text: str) -> float:
+    """計算查詢與文本的相似度分數 (0-1)；傳入 QueryAnalysis 時沿用已切好的查詢詞，只需切分文本。"""
+    if isinstance(query, QueryAnalysis):
+        query_tokens, query_phrases = query.tokens, query.phrases
+    else:
+        query_tokens, query_phrases = extract_query_tokens(query), extract_query_phrases(query)
+    text_tokens = extract_query_tokens(text)
+
     if not query_tokens or not text_tokens:
         return 0.0
-    
+
     intersection = query_tokens.intersection(text_tokens)
     union = query_tokens.union(text_tokens)
     jaccard = len(intersection) / len(union) if union else 0.0
-    
-
 
     keyword_matches = sum(1 for token in query_tokens if token in text)
     keyword_score = keyword_matches / len(query_tokens) if query_tokens else 0.0
-    
-    query_phrases = re.findall(r'[\u4e00-\u9fff]{2,}', query)
+
     phrase_matches = sum(1 for phrase in query_phrases if phrase in text)
     phrase_score = phrase_matches / len(query_phrases) if query_phrases else 0.0
     
     return 0.4 * jaccard + 0.3 * keyword_score + 0.3 * phrase_score
 
-def _filter_and_rank_contexts(query: str, contexts: List[RetrievedChunk]) -> List[RetrievedChunk]:
+def _filter_and_rank_contexts(query: Union[str, QueryAnalysis], contexts: List[RetrievedChunk]) -> List[RetrievedChunk]:
     """過濾和排序上下文，移除重複和低相關性內容"""
     if not contexts:
         return []
     
-    # 計算相似度分數
-    scored_contexts = []
-    for ctx in contexts:
-        similarity = _calculate_text_similarity(query, ctx.text)
-        scored_contexts.append((similarity, ctx))
-    
-    scored_contexts.sort(key=lambda x: x[0], reverse=True)
+    if all(ctx.score is not None for ctx in contexts):
+        # 混合檢索已依 BM25 + 向量排名融合排序，不需再對全文做 regex 相似度計算
+        scored_contexts = [(1.0, ctx) for ctx in contexts]
+    else:
+        if isinstance(query, str):
+            query = analyze_query(query)
+        # 計算相似度分數
+        scored_contexts = []
+        for ctx in contexts:
+            similarity = _calculate_text_similarity(query, ctx.text)
+            scored_contexts.append((similarity, ctx))
+        
+        scored_contexts.sort(key=lambda x: x[0], reverse=True)
     
     
     filtered = []
@@ -244,98 +222,80 @@ def _filter_and_rank_contexts(query: str, contexts: List[RetrievedChunk]) -> Lis
     
     return filtered
 
-def answer_with_rag(message: str, history: Optional[List[ChatTurn]], top_k: int = 10, *, doc_ids: Optional[List[str]] = None, inline_citations: Optional[bool] = None) -> ChatResponse:
-    import re as _re_fast
-    
+@dataclass
+class PreparedAnswer:
+    """LLM 呼叫前的準備結果：sources 已就緒；answer 非 None 時代表不需經過 LLM。"""
+    sources: List[ChatSource]
+    prompt: Optional[str] = None
+    answer: Optional[str] = None
+    strip_citations: bool = False
+    # 條文快速路徑的 (模板, 條號)：LLM 成功產生的摘要以實際回答的供應商為鍵寫回摘要儲存
+    summary_article: Optional[Tuple[str, str]] = None
+    # prompt 的估算 token 數（無 prompt 時為 0）
+    prompt_tokens: int = 0
+
+
+def _record_prompt_tokens(path: str, tokens: int) -> int:
+    PROMPT_TOKENS.observe(tokens, path)
+    record_value("prompt_tokens", tokens)
+    return tokens
+
+
+def _prepare_answer(query: QueryAnalysis, history: Optional[List[ChatTurn]], top_k: int = 10, *, doc_ids: Optional[List[str]] = None, inline_citations: Optional[bool] = None, query_vector: Optional[np.ndarray] = None) -> PreparedAnswer:
+    """依查詢分析結果執行意圖判斷、條文快速路徑與檢索，產生 prompt 與來源（阻塞式與串流端點共用）。"""
     # 若使用者詢問目前使用的模型，直接由伺服器回覆供應商與模型名稱（避免經過 LLM）
-    intent_patterns = [
-        r"(你|您).*(用|使用).*(什麼|哪個).*(模型|model)",
-        r"(模型|model).*(是|為).*(什麼|哪個)",
-        r"what\s+model|which\s+model",
-    ]
-    lowered = message.lower().strip()
-    if any(_re_fast.search(p, message) or _re_fast.search(p, lowered) for p in intent_patterns):
+    if query.model_inquiry:
         provider, model = _resolve_model_provider_and_name()
         answer = f"目前使用的模型為：{provider} {model}。"
-        return ChatResponse(answer=answer, sources=[])
-
-    def normalize_chinese_numbers(text: str) -> str:
-        def parse_chinese_num(s: str) -> int:
-            d = {'一':1,'二':2,'三':3,'四':4,'五':5,'六':6,'七':7,'八':8,'九':9}
-            if s in d: return d[s]
-            if s == '十': return 10
-            if s.startswith('十'): return 10 + d.get(s[1], 0)
-            if s.endswith('十'): return d.get(s[0], 0) * 10
-            if '十' in s: 
-                p = s.split('十')
-                return d.get(p[0], 0) * 10 + d.get(p[1], 0)
-            return 0
-        
-        def replacer(match):
-            chinese_num = match.group(1)
-            if chinese_num.isdigit():
-                return match.group(0) 
-            parsed = parse_chinese_num(chinese_num)
-            return f"第{parsed}條" if parsed > 0 else match.group(0)
-        
-        return _re_fast.sub(r'第\s*([0-9０-９一二三四五六七八九十]+)\s*條', replacer, text)
-    
-    # 正規化用戶輸入
-    normalized_message = normalize_chinese_numbers(message)
-    
-    def parse_chinese_num(s: str) -> int:
-        """快速解析中文數字到100"""
-        d = {'一':1,'二':2,'三':3,'四':4,'五':5,'六':6,'七':7,'八':8,'九':9}
-        if s in d: return d[s]
-        if s == '十': return 10
-        if s.startswith('十'): return 10 + d.get(s[1], 0)
-        if s.endswith('十'): return d.get(s[0], 0) * 10
-        if '十' in s: 
-            p = s.split('十')
-            return d.get(p[0], 0) * 10 + d.get(p[1], 0)
-        return 0
-    
-    article_num = None
-    m = CHINESE_ARTICLE_PATTERN.findall(normalized_message)
-    if m:
-        raw = m[0]
-        if raw.isdigit() or any(c in '０-９' for c in raw):
-            article_num = raw
-        else:
-            parsed = parse_chinese_num(raw)
-            article_num = str(parsed) if parsed > 0 else None
-    
+        annotate_request(path="model_intent")
+        return PreparedAnswer(sources=[], answer=answer)
+
+    normalized_message = query.normalized
+    article_num = query.article
+    mentions = (query.law_mentions, query.unknown_law)
+
     if article_num:
-        hit = find_article_any(article_num)
+        with time_stage("article_lookup"):
+            hit = find_article_any(article_num, mentions=mentions)
         if hit:
             tid, full = hit
-            
-            llm = get_default_llm()
-            summarize_instructions = (
-                "請嚴格依據下列條文，用繁體中文回答：\n"
-                "1) 先給一句話結論。\n"
-                "2) 接著條列重點 3-6 點（精簡、準確）。\n"
-                "3) 不要貼出全文，不要使用數字型內文引用。\n"
-                "4) 若條文有列舉項目，請歸納而非照抄。\n"
-            )
-            prompt = f"{summarize_instructions}\n--- 條文開始 ---\n{full}\n--- 條文結束 ---\n"
-            answer = llm.generate(prompt)
-            
+            prompt = build_article_prompt(full)
+
             MAX_SNIPPET_CHARS = int(os.getenv("SNIPPET_MAX_CHARS", "300"))
             def _truncate(text: str) -> str:
                 return (text[:MAX_SNIPPET_CHARS] + "…") if len(text) > MAX_SNIPPET_CHARS else text
             
             # 提取條文編號作為引用
-            article_ref = f"勞基法第{article_num}條"
+            article_ref = article_reference(tid, article_num)
             sources = [ChatSource(id=f"article:{article_num}", document_id=tid, snippet=_truncate(full), article_reference=article_ref)]
-            return ChatResponse(answer=answer, sources=sources)
+            keys = summary_keys(tid, article_num, get_default_llm())
+            with time_stage("article_summary"):
+                summary = lookup_summary(keys)
+            if summary is not None:
+                annotate_request(path="article_summary", article=article_num, template_id=tid)
+                return PreparedAnswer(sources=sources, answer=summary)
+            tokens = _record_prompt_tokens("article_fast_path", get_token_estimator().count(prompt))
+            annotate_request(path="article_fast_path", article=article_num, template_id=tid, prompt_chars=len(prompt))
+            return PreparedAnswer(sources=sources, prompt=prompt, summary_article=(tid, article_num) if keys else None, prompt_tokens=tokens)
     
     store = None
     contexts = []
+    candidates = 0
     try:
         store = get_vector_store()
-        results = store.query(normalized_message, top_k=top_k, filter_document_ids=doc_ids)
-        contexts = [RetrievedChunk(id=r["id"], document_id=(r.get("metadata") or {}).get("document_id"), text=r["text"]) for r in results]  # type: ignore[index]
+        with time_stage("retrieval"):
+            results = store.query(normalized_message, top_k=top_k, filter_document_ids=doc_ids, query_vector=query_vector)
+        candidates = len(results)
+        contexts = [
+            RetrievedChunk(
+                id=r["id"],
+                document_id=(r.get("metadata") or {}).get("document_id"),
+                text=r["text"],
+                score=r.get("rrf_score"),
+                article=(r.get("metadata") or {}).get("article"),
+            )
+            for r in results
+        ]  # type: ignore[index]
         
         if len(contexts) < 2:
             import logging
@@ -346,18 +306,7 @@ def answer_with_rag(message: str, history: Optional[List[ChatTurn]], top_k: int
         logging.error(f"RAG vector search failed: {e}")
         contexts = []
     try:
-        import re as _re
-        
-        target_article = None
-        m = CHINESE_ARTICLE_PATTERN.findall(normalized_message)
-        if m:
-            raw = m[0]
-            if raw.isdigit() or any(c in '０-９' for c in raw):
-                target_article = raw
-            else:
-                parsed = parse_chinese_num(raw)
-                target_article = str(parsed) if parsed > 0 else None
-        
+        target_article = article_num
         if target_article:
             patterns = [f"第{target_article}條", f"第 {target_article} 條"]
             prioritized = []
@@ -374,48 +323,240 @@ def answer_with_rag(message: str, history: Optional[List[ChatTurn]], top_k: int
                 contexts = new_list[:top_k]
             else:
                 fallback: List[RetrievedChunk] = []
-                for meta in list_templates():
-                    full = extract_article_text(meta.template_id, target_article)
-                    if full:
-                        fallback.append(
-                            RetrievedChunk(id=f"template:{meta.template_id}:article:{target_article}", document_id=meta.template_id, text=full)
-                        )
-                        break
+                with time_stage("article_lookup"):
+                    hit = find_article_any(target_article, mentions=mentions)
+                if hit:
+                    fallback.append(
+                        RetrievedChunk(id=f"template:{hit[0]}:article:{target_article}", document_id=hit[0], text=hit[1], score=1.0)
+                    )
                 if fallback:
                     contexts = (fallback + contexts)[:top_k]
     except Exception:
         pass
-    llm = get_default_llm()
-    prompt = build_prompt(message, history, contexts, inline_citations=inline_citations)
-    answer = llm.generate(prompt)
-    import re
-    if not inline_citations:
-        answer = re.sub(r"\[(\s*\d+(\s*,\s*\d+)*)\]", "", answer)
+    with time_stage("prompt_build"):
+        budgeted = build_budgeted_prompt(query, history, contexts, inline_citations=inline_citations)
+    prompt = budgeted.text
+    _record_prompt_tokens("rag", budgeted.tokens)
 
     # 不再自動附加模型標註；如需模型資訊，改由使用者詢問時回覆
     MAX_SNIPPET_CHARS = int(os.getenv("SNIPPET_MAX_CHARS", "300"))
     def _truncate(text: str) -> str:
         return (text[:MAX_SNIPPET_CHARS] + "…") if len(text) > MAX_SNIPPET_CHARS else text
 
-    def _extract_article_reference(text: str, context_id: str) -> Optional[str]:
+    def _extract_article_reference(c: RetrievedChunk) -> Optional[str]:
         # 僅在 context_id 明確包含 article 標記時給出條文引用，避免從一般片段誤判
-        if "article:" in context_id:
+        if "article:" in c.id:
             import re
-            tail = context_id.split("article:")[-1]
-            m = re.search(r"(\d+)", tail)
+            tail = c.id.split("article:")[-1]
+            m = re.search(r"(\d+(?:-\d+)?)", tail)
             if m:
-                return f"勞基法第{m.group(1)}條"
+                return article_reference(str(c.document_id or ""), m.group(1))
+        # 範本文件的 chunk 在切分時記錄了條號
+        if c.article and str(c.document_id or "") in REGISTRY:
+            return article_reference(str(c.document_id), c.article)
         return None
 
     sources = []
     for c in contexts:
-        article_ref = _extract_article_reference(c.text, c.id)
+        article_ref = _extract_article_reference(c)
         sources.append(ChatSource(
             id=c.id, 
             document_id=c.document_id, 
             snippet=_truncate(c.text),
             article_reference=article_ref
         ))
-    return ChatResponse(answer=answer, sources=sources)
+    annotate_request(path="rag", candidates=candidates, contexts=len(contexts), prompt_chars=len(prompt))
+    return PreparedAnswer(sources=sources, prompt=prompt, strip_citations=not inline_citations, prompt_tokens=budgeted.tokens)
+
+
+@dataclass
+class _CacheProbe:
+    cache: AnswerCache
+    key: AnswerCacheKey
+    generation: str
+    hit: Optional[ChatResponse]
+    query_vector: Optional[np.ndarray]
+
+
+def _probe_answer_cache(query: QueryAnalysis, history: Optional[List[ChatTurn]], top_k: int, doc_ids: Optional[List[str]], inline_citations: Optional[bool]) -> Optional[_CacheProbe]:
+    """查詢回答快取；有對話歷史或快取停用時回傳 None。"""
+    cache = get_answer_cache()
+    if cache is None or history:
+        return None
+    normalized = query.normalized
+    provider, model = _resolve_model_provider_and_name()
+    key = make_cache_key(normalized, doc_ids=doc_ids, top_k=top_k, inline_citations=inline_citations, model=f"{provider}:{model}")
+    generation = get_corpus_generation()
+
+    def _embed() -> Optional[np.ndarray]:
+        try:
+            return get_vector_store().embed_query(normalized)
+        except Exception:
+            return None
+
+    with time_stage("answer_cache"):
+        hit, vector = cache.get(key, _embed, generation=generation)
+    annotate_request(answer_cache="hit" if hit is not None else "miss")
+    return _CacheProbe(cache=cache, key=key, generation=generation, hit=hit, query_vector=vector)
+
+
+def _count_llm_request(llm: BaseLLM) -> None:
+    """LLMRouter 在每次實際的供應商呼叫（含對沖與改送）時自行計數，這裡只計單一供應商。"""
+    if not isinstance(llm, LLMRouter):
+        LLM_REQUESTS.inc(llm.provider)
+
+
+def _generate(llm: BaseLLM, prepared: PreparedAnswer) -> Tuple[str, bool]:
+    """回傳 (回答, 是否由供應商產生)；回退 EchoLLM 的回答不寫入回答快取或條文摘要。"""
+    prompt = prepared.prompt or ""
+    try:
+        answer, producer = llm.complete_attributed(prompt)
+    except LLMCallError as exc:
+        return llm.fallback(exc, prompt), False
+    if prepared.summary_article is not None:
+        save_summary(summary_key(*prepared.summary_article, producer), answer)
+    return answer, True
+
+
+async def _agenerate(llm: BaseLLM, prepared: PreparedAnswer) -> Tuple[str, bool]:
+    prompt = prepared.prompt or ""
+    try:
+        answer, producer = await llm.acomplete_attributed(prompt)
+    except LLMCallError as exc:
+        return llm.fallback(exc, prompt), False
+    if prepared.summary_article is not None:
+        await run_blocking(save_summary, summary_key(*prepared.summary_article, producer), answer)
+    return answer, True
+
+
+def _stream(llm: BaseLLM, prepared: PreparedAnswer) -> Iterator[str]:
+    prompt = prepared.prompt or ""
+    if prepared.summary_article is None:
+        yield from llm.stream(prompt)
+        return
+    pieces: List[str] = []
+    producer = llm
+    try:
+        for piece, producer in llm.stream_attributed(prompt):
+            pieces.append(piece)
+            yield piece
+    except LLMCallError as exc:
+        if not pieces:
+            yield from llm.fallback_stream(exc, prompt)
+        return
+    save_summary(summary_key(*prepared.summary_article, producer), "".join(pieces))
+
+
+def answer_with_rag(message: str, history: Optional[List[ChatTurn]], top_k: int = 10, *, doc_ids: Optional[List[str]] = None, inline_citations: Optional[bool] = None) -> ChatResponse:
+    with time_stage("normalize"):
+        query = analyze_query(message)
+    probe = _probe_answer_cache(query, history, top_k, doc_ids, inline_citations)
+    if probe and probe.hit is not None:
+        return probe.hit
+    prepared = _prepare_answer(query, history, top_k, doc_ids=doc_ids, inline_citations=inline_citations, query_vector=probe.query_vector if probe else None)
+    cacheable = True
+    if prepared.answer is not None:
+        response = ChatResponse(answer=prepared.answer, sources=prepared.sources)
+    else:
+        llm = get_default_llm()
+        _count_llm_request(llm)
+        with time_stage("llm_generate"):
+            answer, cacheable = _generate(llm, prepared)
+        if prepared.strip_citations:
+            answer = INLINE_CITATION_PATTERN.sub("", answer)
+        response = ChatResponse(answer=answer, sources=prepared.sources)
+    if probe and cacheable:
+        probe.cache.put(probe.key, response, probe.query_vector, generation=probe.generation)
+    return response
+
+
+async def aanswer_with_rag(message: str, history: Optional[List[ChatTurn]], top_k: int = 10, *, doc_ids: Optional[List[str]] = None, inline_citations: Optional[bool] = None) -> ChatResponse:
+    """answer_with_rag 的 async 版本：檢索（嵌入 + Chroma）移至有界執行緒池，LLM 等待不佔用執行緒。"""
+    with time_stage("normalize"):
+        query = analyze_query(message)
+    probe = await run_blocking(_probe_answer_cache, query, history, top_k, doc_ids, inline_citations)
+    if probe and probe.hit is not None:
+        return probe.hit
+    prepared = await run_blocking(_prepare_answer, query, history, top_k, doc_ids=doc_ids, inline_citations=inline_citations, query_vector=probe.query_vector if probe else None)
+    cacheable = True
+    if prepared.answer is not None:
+        response = ChatResponse(answer=prepared.answer, sources=prepared.sources)
+    else:
+        llm = get_default_llm()
+        _count_llm_request(llm)
+        with time_stage("llm_generate"):
+            answer, cacheable = await _agenerate(llm, prepared)
+        if prepared.strip_citations:
+            answer = INLINE_CITATION_PATTERN.sub("", answer)
+        response = ChatResponse(answer=answer, sources=prepared.sources)
+    if probe and cacheable:
+        probe.cache.put(probe.key, response, probe.query_vector, generation=probe.generation)
+    return response
+
+
+class _CitationStripper:
+    """串流時移除 [n] 內文引用；可能跨 chunk 的未閉合 "[" 片段先暫存到下一段。"""
+
+    _HOLD_MAX = 32
+
+    def __init__(self) -> None:
+        self._buf = ""
+
+    def feed(self, piece: str) -> str:
+        text = self._buf + piece
+        cut = text.rfind("[")
+        if cut != -1 and "]" not in text[cut:] and len(text) - cut <= self._HOLD_MAX:
+            text, self._buf = text[:cut], text[cut:]
+        else:
+            self._buf = ""
+        return INLINE_CITATION_PATTERN.sub("", text)
+
+    def flush(self) -> str:
+        text, self._buf = self._buf, ""
+        return INLINE_CITATION_PATTERN.sub("", text)
+
+
+def stream_answer_with_rag(message: str, history: Optional[List[ChatTurn]], top_k: int = 10, *, doc_ids: Optional[List[str]] = None, inline_citations: Optional[bool] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """串流版 answer_with_rag，依序產生 (event, data)：sources → delta* → done。"""
+    started = time.perf_counter()
+    with time_stage("normalize"):
+        query = analyze_query(message)
+    prepared = _prepare_answer(query, history, top_k, doc_ids=doc_ids, inline_citations=inline_citations)
+    retrieval_ms = (time.perf_counter() - started) * 1000
+    yield "sources", {"sources": [s.model_dump() for s in prepared.sources]}
+
+    first_token_ms: Optional[float] = None
+    llm_started: Optional[float] = None
+    if prepared.answer is not None:
+        pieces: Iterable[str] = [prepared.answer]
+    else:
+        llm = get_default_llm()
+        _count_llm_request(llm)
+        llm_started = time.perf_counter()
+        pieces = _stream(llm, prepared)
+    stripper = _CitationStripper() if prepared.strip_citations else None
+    for piece in pieces:
+        text = stripper.feed(piece) if stripper else piece
+        if not text:
+            continue
+        if first_token_ms is None:
+            first_token_ms = (time.perf_counter() - started) * 1000
+        yield "delta", {"text": text}
+    if stripper:
+        tail = stripper.flush()
+        if tail:
+            yield "delta", {"text": tail}
+
+    if llm_started is not None:
+        observe_stage("llm_generate", time.perf_counter() - llm_started)
+    total_ms = (time.perf_counter() - started) * 1000
+    yield "done", {
+        "timings": {
+            "retrieval_ms": round(retrieval_ms, 1),
+            "first_token_ms": round(first_token_ms if first_token_ms is not None else total_ms, 1),
+            "total_ms": round(total_ms, 1),
+            "prompt_tokens": prepared.prompt_tokens,
+        }
+    }
 
 
@@ -2,8 +2,11 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple
+import hashlib
 import re
+import threading
+import time
 
 
 TEMPLATES_DIR: Path = Path(__file__).resolve().parent.parent.parent / "templates"
@@ -15,6 +18,8 @@ class TemplateMeta:
     filename: str
     title: str
     description: str = ""
+    # 查詢中可辨識的其他名稱（簡稱、全名）
+    aliases: Tuple[str, ...] = ()
 
 
 REGISTRY: Dict[str, TemplateMeta] = {
@@ -23,6 +28,7 @@ REGISTRY: Dict[str, TemplateMeta] = {
         filename="labor_standards_act.txt",
         title="勞基法",
         description="常見勞動權益規範摘要，供測試 RAG 檢索用。",
+        aliases=("勞動基準法",),
     ),
 }
 
@@ -31,54 +37,235 @@ def list_templates() -> List[TemplateMeta]:
     return list(REGISTRY.values())
 
 
+def _alternate_paths(primary: Path) -> List[Path]:
+    # 支援 .txt/.md 自動切換，優先使用登記檔名，若不存在則嘗試同名其他副檔名
+    if primary.suffix.lower() == ".txt":
+        return [primary.with_suffix('.md')]
+    if primary.suffix.lower() == ".md":
+        return [primary.with_suffix('.txt')]
+    return [primary.with_suffix('.txt'), primary.with_suffix('.md')]
+
+
 def load_template_text(template_id: str) -> str:
+    return _resolve_template_path(template_id).read_text(encoding="utf-8")
+
+
+# 條文/章節標題（整行）：允許前置空白、全形空白與 Markdown 標題符號，條號支援「9-1」
+HEADING_PATTERN = re.compile(
+    r"^[ \t\u3000#]*(?P<head>第[ \t\u3000]*(?:"
+    r"(?P<article>\d+(?:-\d+)?)[ \t\u3000]*條(?:[ \t\u3000]*[（(][^）)\n]*[）)])?[ \t\u3000]*$"
+    r"|[一二三四五六七八九十百零〇0-9]+[ \t\u3000]*章"
+    r"))",
+    re.M,
+)
+_FULLWIDTH_DIGITS = str.maketrans("０１２３４５６７８９－", "0123456789-")
+# 同一模板兩次檢查檔案 mtime 的最短間隔（秒），避免每次查詢都 stat
+_STAT_INTERVAL = 1.0
+
+
+def normalize_article_no(article_no: str) -> str:
+    """統一條號格式：全形轉半形、移除空白與前導零（"０７" -> "7"、"9 - 1" -> "9-1"）。"""
+    raw = "".join(str(article_no).translate(_FULLWIDTH_DIGITS).split())
+    parts = raw.split("-")
+    if not all(p.isdigit() for p in parts):
+        return raw
+    return "-".join(str(int(p)) for p in parts)
+
+
+@dataclass
+class _TemplateIndex:
+    path: Path
+    mtime_ns: int
+    text: str
+    articles: Dict[str, Tuple[int, int]]
+    checked_at: float
+    # 全文 sha256；內容改變時依此讓衍生資料（條文摘要）失效
+    content_hash: str = ""
+
+
+def _resolve_template_path(template_id: str) -> Path:
     meta = REGISTRY.get(template_id)
     if not meta:
         raise FileNotFoundError(f"Unknown template_id: {template_id}")
-    # 支援 .txt/.md 自動切換，優先使用登記檔名，若不存在則嘗試同名其他副檔名
     primary = TEMPLATES_DIR / meta.filename
     if primary.exists():
-        return primary.read_text(encoding="utf-8")
-    candidates = []
-    # 嘗試交替副檔名
-    if primary.suffix.lower() == ".txt":
-        candidates.append(primary.with_suffix('.md'))
-    elif primary.suffix.lower() == ".md":
-        candidates.append(primary.with_suffix('.txt'))
-    else:
-        candidates.extend([primary.with_suffix('.txt'), primary.with_suffix('.md')])
-    for p in candidates:
+        return primary
+    for p in _alternate_paths(primary):
         if p.exists():
-            return p.read_text(encoding="utf-8")
-    # 找不到任何檔案
-    raise FileNotFoundError(f"Template file not found for {template_id}: tried {primary} and {', '.join(map(str, candidates))}")
+            return p
+    raise FileNotFoundError(f"Template file not found for {template_id}: tried {primary} and {', '.join(map(str, _alternate_paths(primary)))}")
 
 
-def extract_article_text(template_id: str, article_no: str) -> str | None:
-    """從模板全文中擷取指定條文（例如 "70" -> "第70條 ..." 到下一條或章節為止）。"""
+def _build_article_offsets(text: str) -> Dict[str, Tuple[int, int]]:
+    """單次掃描全文，回傳 {條號: (start, end)}；條文範圍到下一個條/章標題或文件結尾為止。"""
+    headings = list(HEADING_PATTERN.finditer(text))
+    articles: Dict[str, Tuple[int, int]] = {}
+    for i, m in enumerate(headings):
+        no = m.group("article")
+        if not no or no in articles:
+            continue
+        start = m.start("head")
+        end = headings[i + 1].start() if i + 1 < len(headings) else len(text)
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        articles[no] = (start, end)
+    return articles
+
+
+_INDEX: Dict[str, _TemplateIndex] = {}
+# 條號 -> 含該條的 template_id（依 REGISTRY 順序）
+_ARTICLE_TEMPLATES: Dict[str, List[str]] = {}
+_INDEX_LOCK = threading.Lock()
+
+
+def _rebuild_article_map_locked() -> None:
+    # 建好新表再整個替換，讀取端不需加鎖
+    global _ARTICLE_TEMPLATES
+    mapping: Dict[str, List[str]] = {}
+    for tid in REGISTRY:
+        idx = _INDEX.get(tid)
+        if idx is None:
+            continue
+        for no in idx.articles:
+            mapping.setdefault(no, []).append(tid)
+    _ARTICLE_TEMPLATES = mapping
+
+
+def _get_index(template_id: str) -> Optional[_TemplateIndex]:
+    """取得模板索引；首次使用時建立，之後依檔案 mtime（節流檢查）決定是否重建。"""
+    idx = _INDEX.get(template_id)
+    now = time.monotonic()
+    if idx is not None and now - idx.checked_at < _STAT_INTERVAL:
+        return idx
     try:
-        text = load_template_text(template_id)
-    except Exception:
+        path = _resolve_template_path(template_id)
+        mtime = path.stat().st_mtime_ns
+    except (FileNotFoundError, OSError):
+        return None
+    if idx is not None and idx.path == path and idx.mtime_ns == mtime:
+        idx.checked_at = now
+        return idx
+    text = path.read_text(encoding="utf-8")
+    new_idx = _TemplateIndex(
+        path=path,
+        mtime_ns=mtime,
+        text=text,
+        articles=_build_article_offsets(text),
+        checked_at=now,
+        content_hash=hashlib.sha256(text.encode("utf-8")).hexdigest(),
+    )
+    with _INDEX_LOCK:
+        _INDEX[template_id] = new_idx
+        _rebuild_article_map_locked()
+    return new_idx
+
+
+_ALL_CHECKED_AT = 0.0
+
+
+def _ensure_all_indexed() -> None:
+    # 全部模板共用一次節流檢查，查詢成本不隨登記法規數量成長
+    global _ALL_CHECKED_AT
+    now = time.monotonic()
+    if now - _ALL_CHECKED_AT < _STAT_INTERVAL and len(_INDEX) >= len(REGISTRY):
+        return
+    for tid in REGISTRY:
+        _get_index(tid)
+    _ALL_CHECKED_AT = now
+
+
+def extract_article_text(template_id: str, article_no: str) -> str | None:
+    """從模板全文中擷取指定條文（例如 "70" -> "第 70 條 ..." 到下一條或章節為止）。"""
+    idx = _get_index(template_id)
+    if idx is None:
         return None
-    # 正則：從 第{n}條 開始，吃到下一個 "第xx條" 或 "第xx章" 或文件結尾
-    pattern = rf"第\s*{re.escape(str(article_no))}\s*條[\s\S]*?(?=\n第\s*\d+\s*條|\n第\s*[一二三四五六七八九十百零〇0-9]+\s*章|\Z)"
-    m = re.search(pattern, text)
-    return m.group(0) if m else None
+    span = idx.articles.get(normalize_article_no(article_no))
+    return idx.text[span[0]:span[1]] if span else None
+
+
+def template_content_hash(template_id: str) -> Optional[str]:
+    idx = _get_index(template_id)
+    return idx.content_hash if idx else None
+
+
+def template_articles(template_id: str) -> List[str]:
+    """模板中所有條號，依出現順序。"""
+    idx = _get_index(template_id)
+    return list(idx.articles) if idx else []
 
 
-_ARTICLE_CACHE: Dict[Tuple[str, str], Optional[str]] = {}
+# 引用法規名稱 + 條號，例如「民法第184條」；用來辨識使用者指定的法規
+_LAW_BEFORE_ARTICLE = re.compile(r"([\u4e00-\u9fff]{1,16}?(?:法|條例|規則|細則|辦法))\s*第\s*[0-9０-９一二三四五六七八九十百零〇\-]+\s*條")
 
 
-def find_article_any(article_no: str) -> Optional[Tuple[str, str]]:
-    """查找所有模板中第 {article_no} 條的全文，回傳 (template_id, text)。"""
-    key_hits: List[Tuple[str, str]] = []
-    for tid in REGISTRY.keys():
-        k = (tid, article_no)
-        if k not in _ARTICLE_CACHE:
-            _ARTICLE_CACHE[k] = extract_article_text(tid, article_no)
-        txt = _ARTICLE_CACHE[k]
-        if txt:
-            key_hits.append((tid, txt))
-    return key_hits[0] if key_hits else None
+def _template_names(meta: TemplateMeta) -> Tuple[str, ...]:
+    return tuple(n for n in (meta.title, *meta.aliases) if n)
 
 
+_LAW_NAMES: Optional[Tuple[Tuple[str, ...], "re.Pattern[str]", Dict[str, str]]] = None
+
+
+def _law_name_index() -> Tuple["re.Pattern[str]", Dict[str, str]]:
+    """所有已登記法規名稱的單一 alternation 正則（長名稱優先），REGISTRY 變動時重建。"""
+    global _LAW_NAMES
+    keys = tuple(REGISTRY)
+    if _LAW_NAMES is None or _LAW_NAMES[0] != keys:
+        name_to_tid: Dict[str, str] = {}
+        for tid, meta in REGISTRY.items():
+            for name in _template_names(meta):
+                name_to_tid.setdefault(name, tid)
+        names = sorted(name_to_tid, key=len, reverse=True)
+        pattern = re.compile("|".join(map(re.escape, names))) if names else re.compile(r"(?!)")
+        _LAW_NAMES = (keys, pattern, name_to_tid)
+    return _LAW_NAMES[1], _LAW_NAMES[2]
+
+
+def resolve_law_mentions(query: str) -> Tuple[List[str], bool]:
+    """找出查詢中提到的已登記法規，回傳 (template_ids, 是否提到未登記的法規)。"""
+    pattern, name_to_tid = _law_name_index()
+    mentioned: List[str] = []
+    for m in pattern.finditer(query):
+        tid = name_to_tid[m.group(0)]
+        if tid not in mentioned:
+            mentioned.append(tid)
+    unknown = False
+    for m in _LAW_BEFORE_ARTICLE.finditer(query):
+        prefix = m.group(1)
+        if not any(prefix.endswith(name) for name in name_to_tid):
+            unknown = True
+            break
+    return mentioned, unknown
+
+
+def article_reference(template_id: str, article_no: str) -> str:
+    """條文引用標籤，例如「勞基法第70條」；未登記的模板沿用預設法規名稱。"""
+    meta = REGISTRY.get(template_id)
+    title = meta.title if meta else "勞基法"
+    return f"{title}第{normalize_article_no(article_no)}條"
+
+
+def find_article_any(
+    article_no: str, query: Optional[str] = None, *, mentions: Optional[Tuple[Sequence[str], bool]] = None
+) -> Optional[Tuple[str, str]]:
+    """查找第 {article_no} 條的全文，回傳 (template_id, text)。
+
+    若 query 提到特定法規（例如「勞基法」），只在該法規中查找；若只提到未登記的法規
+    （例如「民法」），回傳 None 而不是誤用其他法規的同號條文。已分析過查詢時可直接傳入
+    resolve_law_mentions 的結果 mentions。
+    """
+    _ensure_all_indexed()
+    no = normalize_article_no(article_no)
+    candidates = _ARTICLE_TEMPLATES.get(no)
+    if mentions is None and query:
+        mentions = resolve_law_mentions(query)
+    if mentions is not None:
+        mentioned, unknown = mentions
+        if mentioned:
+            candidates = [tid for tid in mentioned if tid in (candidates or [])]
+        elif unknown:
+            return None
+    if not candidates:
+        return None
+    tid = candidates[0]
+    text = extract_article_text(tid, no)
+    return (tid, text) if text else None
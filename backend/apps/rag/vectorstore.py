@@ -1,53 +1,143 @@
 from __future__ import annotations
 
+import logging
 import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 import hashlib
-import math
+
+import numpy as np
+
+from apps.common.metrics import time_stage
+
+from .corpus import bump_corpus_generation
+from .embedding_cache import EmbeddingCache, default_cache_path, get_embedding_cache
+from .lexical_index import LexicalIndex, get_lexical_index, reciprocal_rank_fusion
+from .llm_providers import configure_genai
+from .manifest import (
+    EmbedderManifest,
+    EmbedderMismatchError,
+    active_pointer_version,
+    check_compatible,
+    check_dimension,
+    describe_embedder,
+    read_active_collection,
+    read_manifest,
+    read_shadow_collection,
+    remove_manifest,
+    write_active_collection,
+    write_manifest,
+)
+
+logger = logging.getLogger(__name__)
 
 
 @dataclass
 class VSConfig:
     persist_dir: str = os.getenv("VECTOR_DIR", "backend/chroma")
     embedding_model: str = os.getenv("EMBEDDING_MODEL", "models/text-embedding-004")
+    embedding_cache_max_entries: int = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "100000"))
+    # 混合檢索：BM25 倒排索引與向量檢索並行，以 RRF 融合；HYBRID_SEARCH=0 時只用向量
+    hybrid_search: bool = (os.getenv("HYBRID_SEARCH") or "1").strip() != "0"
+    rrf_k: int = int(os.getenv("RRF_K", "60"))
 
 
 class GoogleEmbedding:
-    def __init__(self, model: str) -> None:
+    """
+    Google Generative AI 嵌入：
+    - 以 SDK 的批次呼叫（embed_content 傳入 list）一次送出 batch_size 筆。
+    - 多個批次以有界 thread pool 併發送出，輸出順序與輸入一致。
+    - 每個批次獨立重試（指數退避 + full jitter），單一暫時性錯誤不會讓整次 ingest 失敗。
+    - client 可注入（測試用假客戶端），需提供 embed_content(model=..., content=...)。
+    """
+
+    def __init__(
+        self,
+        model: str,
+        *,
+        client: Any = None,
+        batch_size: Optional[int] = None,
+        concurrency: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+    ) -> None:
         self.model = model
+        self.batch_size = max(1, batch_size or int(os.getenv("EMBEDDING_BATCH_SIZE", "100")))
+        self.concurrency = max(1, concurrency or int(os.getenv("EMBEDDING_CONCURRENCY", "4")))
+        self.max_retries = max(0, max_retries if max_retries is not None else int(os.getenv("EMBEDDING_MAX_RETRIES", "3")))
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._sleep = time.sleep
+        if client is not None:
+            self._enabled = True
+            self._client = client
+            return
         self._enabled = bool(os.getenv("GOOGLE_API_KEY"))
         if self._enabled:
             try:
-                import google.generativeai as genai
-                genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-                self._genai = genai
+                self._client = configure_genai(os.getenv("GOOGLE_API_KEY"))
             except ImportError:
                 self._enabled = False
                 raise RuntimeError("Google GenerativeAI SDK not installed. Run: pip install google-generativeai")
         else:
             raise RuntimeError("GOOGLE_API_KEY not set")
 
+    @property
+    def embedder_id(self) -> str:
+        return f"google:{self.model}"
+
+    @staticmethod
+    def _extract_vectors(resp: Any, expected: int) -> List[List[float]]:
+        # Normalize different SDK response shapes
+        try:
+            emb = resp.get("embedding")  # type: ignore[attr-defined]
+        except Exception:
+            emb = getattr(resp, "embedding", None)
+        # Some versions return {"embedding": {"values": [...]}}
+        if isinstance(emb, dict) and "values" in emb:
+            emb = emb.get("values")
+        if not isinstance(emb, list):
+            emb = []
+        # 單筆請求回傳一維 list；批次請求回傳 list of list
+        if emb and not isinstance(emb[0], list):
+            emb = [emb]
+        if len(emb) != expected:
+            raise RuntimeError(f"Embedding response size mismatch: expected {expected}, got {len(emb)}")
+        return emb  # type: ignore[return-value]
+
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        attempt = 0
+        while True:
+            try:
+                resp = self._client.embed_content(model=self.model, content=batch)
+                return self._extract_vectors(resp, len(batch))
+            except Exception as exc:
+                if attempt >= self.max_retries:
+                    raise
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+                logger.warning("Embedding batch failed (attempt %d/%d), retry in %.2fs: %s", attempt + 1, self.max_retries, delay, exc)
+                self._sleep(delay)
+                attempt += 1
+
     def embed(self, texts: List[str]) -> List[List[float]]:
-        # Batch embed via google generative ai
-        # API expects one text at a time for embed_content; loop for simplicity
         if not self._enabled:
             raise RuntimeError("GOOGLE_API_KEY not set")
-        vectors: List[List[float]] = []
-        for t in texts:
-            resp = self._genai.embed_content(model=self.model, content=t)
-            # Normalize different SDK response shapes
-            try:
-                emb = resp.get("embedding")  # type: ignore[attr-defined]
-            except Exception:
-                emb = getattr(resp, "embedding", None)
-            # Some versions return {"embedding": {"values": [...]}}
-            if isinstance(emb, dict) and "values" in emb:
-                emb = emb.get("values")
-            if not isinstance(emb, list):
-                emb = []
-            vectors.append(emb)  # type: ignore[list-item]
-        return vectors
+        if not texts:
+            return []
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) == 1 or self.concurrency == 1:
+            results = [self._embed_batch(b) for b in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.concurrency, len(batches))) as pool:
+                # map 依提交順序回傳結果，保證輸出順序與輸入一致
+                results = list(pool.map(self._embed_batch, batches))
+        return [vec for batch in results for vec in batch]
 
 
 class LocalEmbedding:
@@ -55,10 +145,22 @@ class LocalEmbedding:
     簡易本地嵌入（無外部依賴）：
     - 將 tokens hash 到固定維度（默認 256）做累加，並做 L2 正規化。
     - 僅用於無 Google API key 的開發/測試環境，效果有限但可用於檢索驗證。
+    - 以 NumPy 批次向量化：整批 tokenize 後用 bincount 建立 float32 矩陣，
+      token→bucket 以記憶表快取，輸出與舊版逐筆 sha1 實作在 float32 精度下逐位元一致。
     """
 
+    # 向量格式版本：演算法或 hash 方式有任何改變都必須遞增，避免混用舊 collection
+    VERSION = 1
+    # token→bucket 記憶表上限（超過即清空重建，避免長駐程序無限成長）
+    BUCKET_CACHE_MAX = 200_000
+
     def __init__(self, dimension: int = 256) -> None:
         self.dimension = max(16, dimension)
+        self._buckets: Dict[str, int] = {}
+
+    @property
+    def embedder_id(self) -> str:
+        return f"local-hash-v{self.VERSION}-d{self.dimension}"
 
     def _tokenize(self, text: str) -> List[str]:
         # 中文/無空白語言：使用字元 bi-gram + 單字元
@@ -69,20 +171,89 @@ class LocalEmbedding:
 
     def _hash_token(self, token: str) -> int:
         # 使用 sha1 對 token 做 hash，取整數
-        return int(hashlib.sha1(token.encode("utf-8")).hexdigest(), 16)
-
-    def _vectorize(self, text: str) -> List[float]:
-        vec = [0.0] * self.dimension
-        for tok in self._tokenize(text):
-            h = self._hash_token(tok)
-            idx = h % self.dimension
-            vec[idx] += 1.0
-        # L2 normalize
-        norm = math.sqrt(sum(v * v for v in vec)) or 1.0
-        return [v / norm for v in vec]
+        return int.from_bytes(hashlib.sha1(token.encode("utf-8")).digest(), "big")
 
-    def embed(self, texts: List[str]) -> List[List[float]]:
-        return [self._vectorize(t) for t in texts]
+    def _bucket(self, token: str) -> int:
+        idx = self._buckets.get(token)
+        if idx is None:
+            if len(self._buckets) >= self.BUCKET_CACHE_MAX:
+                self._buckets.clear()
+            idx = self._hash_token(token) % self.dimension
+            self._buckets[token] = idx
+        return idx
+
+    def _vectorize(self, text: str) -> np.ndarray:
+        return self.embed([text])[0]
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """批次嵌入，回傳 shape=(len(texts), dimension) 的 float32 矩陣。"""
+        n = len(texts)
+        dim = self.dimension
+        bucket = self._bucket
+        flat: List[int] = []
+        for row, text in enumerate(texts):
+            base = row * dim
+            flat.extend(base + bucket(tok) for tok in self._tokenize(text))
+        counts = np.bincount(np.asarray(flat, dtype=np.int64), minlength=n * dim)
+        counts = counts.reshape(n, dim).astype(np.float64)
+        # L2 normalize（以 float64 計算再轉 float32，與舊版 list[float] 寫入 Chroma 後的值一致）
+        norms = np.sqrt(np.einsum("ij,ij->i", counts, counts))
+        norms[norms == 0.0] = 1.0
+        return (counts / norms[:, None]).astype(np.float32)
+
+
+# 加入版本化命名之前的 collection 名稱；新的 collection 依嵌入器命名（見 collection_name_for）
+COLLECTION_NAME = "documents"
+
+
+def collection_name_for(embedder_id: str) -> str:
+    """依嵌入器版本命名 collection（符合 Chroma 名稱限制：3-63 字元、英數與 ._-）。"""
+    slug = re.sub(r"[^a-zA-Z0-9._-]+", "-", embedder_id).strip("-._")
+    name = f"{COLLECTION_NAME}-{slug}"
+    if len(name) > 63:
+        name = f"{name[:54].rstrip('-._')}-{hashlib.sha1(embedder_id.encode('utf-8')).hexdigest()[:8]}"
+    return name
+
+
+def select_embedder(config: VSConfig) -> Any:
+    """依設定選擇嵌入器：優先使用 Google Embedding，回退到本地嵌入。"""
+    try:
+        if os.getenv("GOOGLE_API_KEY"):
+            return GoogleEmbedding(config.embedding_model)
+        return LocalEmbedding()
+    except RuntimeError:
+        # Google API 不可用時回退到本地嵌入
+        return LocalEmbedding()
+
+
+def embedder_from_manifest(manifest: EmbedderManifest) -> Any:
+    """重建 collection 當初使用的嵌入器，讓切換前仍能以原嵌入器服務查詢。"""
+    embedder: Any = None
+    try:
+        if manifest.embedder_type == "LocalEmbedding":
+            embedder = LocalEmbedding(dimension=manifest.dimension or 256)
+        elif manifest.embedder_type == "GoogleEmbedding":
+            embedder = GoogleEmbedding(manifest.model)
+    except RuntimeError as exc:
+        raise EmbedderMismatchError(f"Embedder {manifest.embedder_id!r} used by the index is unavailable: {exc}") from exc
+    if embedder is None or embedder.embedder_id != manifest.embedder_id:
+        raise EmbedderMismatchError(f"Embedder {manifest.embedder_id!r} used by the index cannot be recreated.")
+    return embedder
+
+
+@dataclass
+class _ActiveCollection:
+    name: str
+    collection: Any
+    manifest: EmbedderManifest
+    embedder: Any
+    pointer_version: Optional[Tuple[int, int]]
+
+
+# 程序內單例：每個 VECTOR_DIR 一個 Chroma client 與目前服務中的 collection
+_CLIENTS: Dict[str, Any] = {}
+_ACTIVE: Dict[str, _ActiveCollection] = {}
+_STATE_LOCK = threading.RLock()
 
 
 class ChromaVectorStore:
@@ -90,73 +261,250 @@ class ChromaVectorStore:
         self.config = config or VSConfig()
         # Ensure telemetry off unless explicitly enabled
         os.environ.setdefault("ANONYMIZED_TELEMETRY", os.getenv("ANONYMIZED_TELEMETRY", "false"))
-        # Lazy import and singleton collection reuse
-        global _CHROMA_COLLECTION
-        if '_CHROMA_COLLECTION' not in globals() or _CHROMA_COLLECTION is None:
-            import chromadb  # type: ignore
-            os.makedirs(self.config.persist_dir, exist_ok=True)
-            _client = chromadb.PersistentClient(path=self.config.persist_dir)
-            
-            # 檢查是否需要重建collection以匹配embedding維度
-            try:
-                existing_collection = _client.get_collection(name="documents")
-                # 測試維度兼容性：使用與當前相同的嵌入器
-                try:
-                    if os.getenv("GOOGLE_API_KEY"):
-                        test_embedder = GoogleEmbedding(self.config.embedding_model)
-                    else:
-                        test_embedder = LocalEmbedding()
-                except RuntimeError:
-                    test_embedder = LocalEmbedding()
-                
-                # 嘗試用當前embedder查詢，看是否有維度衝突
-                test_vec = test_embedder.embed(["test"])[0]
-                existing_collection.query(query_embeddings=[test_vec], n_results=1)
-                _CHROMA_COLLECTION = existing_collection
-            except Exception:
-                # 維度不匹配，刪除並重建collection
-                try:
-                    _client.delete_collection(name="documents")
-                except Exception:
-                    pass
-                _CHROMA_COLLECTION = _client.create_collection(name="documents")
-                
-        self._collection = _CHROMA_COLLECTION
-        # 選擇嵌入器：優先使用 Google Embedding，回退到本地嵌入
-        try:
-            if os.getenv("GOOGLE_API_KEY"):
-                self._embedder = GoogleEmbedding(self.config.embedding_model)
-            else:
-                self._embedder = LocalEmbedding()
-        except RuntimeError:
-            # Google API 不可用時回退到本地嵌入
-            self._embedder = LocalEmbedding()
+        # 設定上的嵌入器；服務中的 collection 若由其他嵌入器建立，查詢仍用原嵌入器直到 reindex 切換
+        self.target_embedder = select_embedder(self.config)
+        # 相容性只看 manifest，不做試嵌入或試查詢
+        self._active()
+        # 內容雜湊嵌入快取：未變動的 chunk 重新 ingest 時不再呼叫嵌入器
+        cache_path = default_cache_path(self.config.persist_dir)
+        self._embedding_cache: Optional[EmbeddingCache] = (
+            get_embedding_cache(cache_path, max_entries=self.config.embedding_cache_max_entries) if cache_path else None
+        )
+        self._lexical: Optional[LexicalIndex] = None
+        if self.config.hybrid_search:
+            self._lexical = get_lexical_index(self.config.persist_dir)
+            self._backfill_lexical_index()
 
-    def upsert(self, ids: List[str], texts: List[str], metadatas: Optional[List[Dict[str, Any]]] = None) -> None:
-        vectors = self._embedder.embed(texts)
-        # de-dup same ids to avoid duplicates (delete then upsert)
+    # ---- collection 管理 ----
+    def client(self) -> Any:
+        persist_dir = self.config.persist_dir
+        client = _CLIENTS.get(persist_dir)
+        if client is None:
+            with _STATE_LOCK:
+                client = _CLIENTS.get(persist_dir)
+                if client is None:
+                    import chromadb  # type: ignore
+                    os.makedirs(persist_dir, exist_ok=True)
+                    client = chromadb.PersistentClient(path=persist_dir)
+                    _CLIENTS[persist_dir] = client
+        return client
+
+    def list_collection_names(self) -> List[str]:
+        # chromadb 0.5 回傳 Collection 物件，0.6 之後回傳名稱
+        return [getattr(c, "name", c) for c in self.client().list_collections()]
+
+    def open_collection(self, name: str) -> Any:
+        return self.client().get_or_create_collection(name=name)
+
+    def _active(self) -> _ActiveCollection:
+        persist_dir = self.config.persist_dir
+        version = active_pointer_version(persist_dir)
+        state = _ACTIVE.get(persist_dir)
+        if state is not None and state.pointer_version == version:
+            return state
+        with _STATE_LOCK:
+            version = active_pointer_version(persist_dir)
+            state = _ACTIVE.get(persist_dir)
+            if state is not None and state.pointer_version == version:
+                return state
+            name = read_active_collection(persist_dir)
+            if name is None:
+                # 首次啟動：沿用舊版未版本化的 collection，否則依目前嵌入器命名
+                name = COLLECTION_NAME if COLLECTION_NAME in self.list_collection_names() else collection_name_for(self.target_embedder.embedder_id)
+                write_active_collection(persist_dir, name)
+                version = active_pointer_version(persist_dir)
+            collection = self.open_collection(name)
+            manifest, embedder = self._load_manifest(name, collection)
+            state = _ActiveCollection(name=name, collection=collection, manifest=manifest, embedder=embedder, pointer_version=version)
+            _ACTIVE[persist_dir] = state
+            return state
+
+    def _load_manifest(self, name: str, collection: Any) -> Tuple[EmbedderManifest, Any]:
+        metric = (collection.metadata or {}).get("hnsw:space", "l2")
+        current = describe_embedder(self.target_embedder, metric=metric)
+        stored = read_manifest(self.config.persist_dir, name)
+        if stored is not None:
+            if stored.embedder_id == current.embedder_id:
+                check_compatible(stored, current, name)
+                return stored, self.target_embedder
+            # 設定已換成其他嵌入器：以原嵌入器繼續服務，等待 reindex 完成後切換
+            embedder = embedder_from_manifest(stored)
+            check_compatible(stored, describe_embedder(embedder, metric=metric), name)
+            logger.warning(
+                "collection %r was built with %s but %s is configured; serving with the original embedder until `manage.py reindex` completes",
+                name, stored.embedder_id, current.embedder_id,
+            )
+            return stored, embedder
+        if collection.count() > 0:
+            # 加入 manifest 之前建立的 collection：從一筆既有向量讀出維度（本機讀取，不需網路）
+            sample = collection.get(limit=1, include=["embeddings"])
+            embeddings = sample.get("embeddings")
+            if embeddings is not None and len(embeddings):
+                dimension = len(embeddings[0])
+                check_dimension(current, dimension, name)
+                current = current.with_dimension(dimension)
+            logger.warning("collection %r has no embedder manifest; adopting it for %s", name, current.embedder_id)
+        write_manifest(self.config.persist_dir, name, current)
+        return current, self.target_embedder
+
+    def _check_vectors(self, state: _ActiveCollection, vectors: Any) -> None:
+        dimension = int(np.asarray(vectors[0]).shape[-1])
+        if state.manifest.dimension is None:
+            state.manifest = state.manifest.with_dimension(dimension)
+            write_manifest(self.config.persist_dir, state.name, state.manifest)
+            return
+        check_dimension(state.manifest, dimension, state.name)
+
+    @property
+    def _collection(self) -> Any:
+        return self._active().collection
+
+    @property
+    def _embedder(self) -> Any:
+        return self._active().embedder
+
+    def active_collection_name(self) -> str:
+        return self._active().name
+
+    def embedder_manifest(self) -> Optional[EmbedderManifest]:
+        return self._active().manifest
+
+    def needs_reindex(self) -> bool:
+        return self._active().manifest.embedder_id != self.target_embedder.embedder_id
+
+    def embed_documents(self, embedder: Any, texts: List[str]) -> Any:
+        if self._embedding_cache is not None:
+            return self._embedding_cache.embed(embedder, texts)
+        return embedder.embed(texts)
+
+    def activate(self, name: str) -> None:
+        """原子地切換服務中的 collection；其他程序在下一次存取時經由指標檔察覺。"""
+        write_active_collection(self.config.persist_dir, name)
+        bump_corpus_generation(self.config.persist_dir)
+        self._active()
+
+    def _shadow_collection(self, state: _ActiveCollection) -> Any:
+        """重新索引進行中時的雙寫目標；只有它確實對應本程序設定的嵌入器時才寫入。"""
+        name = read_shadow_collection(self.config.persist_dir)
+        if name is None or name == state.name:
+            return None
+        if name != collection_name_for(self.target_embedder.embedder_id):
+            logger.warning("reindex target %r does not match the configured embedder %s; skipping dual write", name, self.target_embedder.embedder_id)
+            return None
+        return self.open_collection(name)
+
+    def drop_collection(self, name: str) -> None:
+        if name == self.active_collection_name():
+            raise ValueError(f"Refusing to drop the active collection {name!r}")
         try:
-            self._collection.delete(ids=ids)
-        except Exception:
+            self.client().delete_collection(name=name)
+        except ValueError:
+            # collection 不存在
             pass
-        self._collection.upsert(ids=ids, embeddings=vectors, metadatas=metadatas, documents=texts)
+        remove_manifest(self.config.persist_dir, name)
 
-    def query(self, query_text: str, top_k: int = 5, filter_document_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
-        qvec = self._embedder.embed([query_text])[0]
+    def _backfill_lexical_index(self) -> None:
+        """既有 collection 在加入倒排索引前已 ingest 的資料，首次啟動時補建一次。"""
+        assert self._lexical is not None
+        if not self._lexical.is_empty() or self._collection.count() == 0:
+            return
+        page = 1000
+        offset = 0
+        while True:
+            res = self._collection.get(include=["documents", "metadatas"], limit=page, offset=offset)
+            ids = res.get("ids") or []
+            if not ids:
+                break
+            metadatas = res.get("metadatas") or [None] * len(ids)
+            self._lexical.upsert(ids, res.get("documents") or [""] * len(ids), [(m or {}).get("document_id") for m in metadatas])
+            offset += len(ids)
+        logger.info("lexical index backfilled with %d chunks", offset)
+
+    def upsert(self, ids: List[str], texts: List[str], metadatas: Optional[List[Dict[str, Any]]] = None) -> None:
+        if not ids:
+            # 空批次（例如最後一次 flush 沒有剩餘片段）不嵌入、不寫入，也不改變語料版本
+            return
+        state = self._active()
+        vectors = self.embed_documents(state.embedder, texts)
+        self._check_vectors(state, vectors)
+        # Chroma upsert 會覆寫同 id 的舊資料，不需先刪除
+        state.collection.upsert(ids=ids, embeddings=vectors, metadatas=metadatas, documents=texts)
+        shadow = self._shadow_collection(state)
+        if shadow is not None:
+            shadow.upsert(ids=ids, embeddings=self.embed_documents(self.target_embedder, texts), metadatas=metadatas, documents=texts)
+        if self._lexical is not None:
+            self._lexical.upsert(ids, texts, [(m or {}).get("document_id") for m in (metadatas or [None] * len(ids))])
+        bump_corpus_generation(self.config.persist_dir)
+
+    def get_chunk_metadata(self, document_id: str) -> Dict[str, Dict[str, Any]]:
+        """回傳某文件目前已索引的 {chunk id: metadata}（含 content_hash、start、end）；舊資料可能缺少這些欄位。"""
+        res = self._collection.get(where={"document_id": document_id}, include=["metadatas"])
+        metadatas = res.get("metadatas") or [None] * len(res.get("ids") or [])
+        return {cid: dict(meta or {}) for cid, meta in zip(res.get("ids") or [], metadatas)}
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        """只更新 metadata（例如 chunk 在原文中的位置）；內容與向量不變，因此不寫倒排索引也不改變語料版本。"""
+        if not ids:
+            return
+        state = self._active()
+        state.collection.update(ids=ids, metadatas=metadatas)
+        shadow = self._shadow_collection(state)
+        if shadow is not None:
+            shadow.update(ids=ids, metadatas=metadatas)
+
+    def delete(self, ids: List[str]) -> None:
+        if ids:
+            state = self._active()
+            state.collection.delete(ids=ids)
+            shadow = self._shadow_collection(state)
+            if shadow is not None:
+                shadow.delete(ids=ids)
+            if self._lexical is not None:
+                self._lexical.delete(ids)
+            bump_corpus_generation(self.config.persist_dir)
+
+    def embedding_cache_stats(self) -> Optional[Dict[str, Any]]:
+        return self._embedding_cache.stats() if self._embedding_cache is not None else None
+
+    def lexical_index_stats(self) -> Optional[Dict[str, Any]]:
+        return self._lexical.stats() if self._lexical is not None else None
+
+    def count(self) -> int:
+        return self._collection.count()
+
+    def embed_query(self, query_text: str) -> np.ndarray:
+        with time_stage("embed"):
+            return np.asarray(self._embedder.embed([query_text])[0], dtype=np.float32)
+
+    def query(self, query_text: str, top_k: int = 5, filter_document_ids: Optional[List[str]] = None, *, query_vector: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        search_k = min(top_k * 10, 100)
+        # 倒排索引查詢與向量檢索並行（Chroma 查詢期間會釋放 GIL）
+        lexical_future = None
+        if self._lexical is not None:
+            lexical_future = _get_lexical_executor().submit(self._lexical.search, query_text, search_k, filter_document_ids)
+
+        # 本地嵌入回傳 ndarray，可直接交給 Chroma，不需轉回 list；已有查詢向量（例如回答快取算過）時直接沿用
+        state = self._active()
+        if query_vector is not None:
+            qvecs = [query_vector]
+        else:
+            with time_stage("embed"):
+                qvecs = state.embedder.embed([query_text])
+        self._check_vectors(state, qvecs)
         where: Optional[Dict[str, Any]] = None
         if filter_document_ids:
             # Chroma where-filter on metadatas
             where = {"document_id": {"$in": filter_document_ids}}
         
-        search_k = min(top_k * 10, 100)  
-        res = self._collection.query(query_embeddings=[qvec], n_results=search_k, where=where)
+        with time_stage("chroma_query"):
+            res = state.collection.query(query_embeddings=qvecs, n_results=search_k, where=where)
         
         results: List[Dict[str, Any]] = []
         for i in range(len(res.get("ids", [[]])[0])):
             distance = (res.get("distances") or [[1.0]])[0][i]
 
 
-            if isinstance(self._embedder, LocalEmbedding):
+            if isinstance(state.embedder, LocalEmbedding):
                 # For local embedding: lower distance = higher similarity, scale to 0-1 range
                 similarity = max(0.0, 1.0 / (1.0 + distance))
             else:
@@ -175,10 +523,50 @@ class ChromaVectorStore:
         
         # 根據相似度過濾低品質結果 - 進一步放寬閾值以支援更廣泛的問題
         # 本地嵌入需要更寬鬆的閾值來支援語意相關但字詞不同的查詢
-        min_similarity = 0.1 if isinstance(self._embedder, GoogleEmbedding) else 0.0
+        min_similarity = 0.1 if isinstance(state.embedder, GoogleEmbedding) else 0.0
         filtered_results = [r for r in results if r["similarity"] > min_similarity]
-        
-        # 返回top_k個結果
-        return filtered_results[:top_k]
+
+        if lexical_future is None:
+            # 返回top_k個結果
+            return filtered_results[:top_k]
+        lexical_hits = lexical_future.result()
+        with time_stage("rerank"):
+            return self._fuse(filtered_results, lexical_hits, top_k)
+
+    def _fuse(self, vector_results: List[Dict[str, Any]], lexical_hits: List[Any], top_k: int) -> List[Dict[str, Any]]:
+        """以 RRF 融合向量與 BM25 排名；只出現在 BM25 的 chunk 再向 Chroma 取回內容。"""
+        by_id = {r["id"]: r for r in vector_results}
+        lexical_scores = dict(lexical_hits)
+        fused = reciprocal_rank_fusion(
+            [[r["id"] for r in vector_results], [cid for cid, _ in lexical_hits]], k=self.config.rrf_k
+        )[:top_k]
+        missing = [cid for cid, _ in fused if cid not in by_id]
+        if missing:
+            got = self._collection.get(ids=missing, include=["documents", "metadatas"])
+            metadatas = got.get("metadatas") or [None] * len(got.get("ids") or [])
+            for cid, text, meta in zip(got.get("ids") or [], got.get("documents") or [], metadatas):
+                by_id[cid] = {"id": cid, "text": text, "metadata": meta, "distance": None, "similarity": 0.0}
+        out: List[Dict[str, Any]] = []
+        for cid, score in fused:
+            r = by_id.get(cid)
+            if r is None:
+                continue
+            r["rrf_score"] = score
+            r["lexical_score"] = lexical_scores.get(cid, 0.0)
+            out.append(r)
+        return out
+
+
+_LEXICAL_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_LEXICAL_EXECUTOR_LOCK = threading.Lock()
 
 
+def _get_lexical_executor() -> ThreadPoolExecutor:
+    # 獨立的小執行緒池：查詢本身可能已在 rag-io 池中執行，共用會有互相等待的風險
+    global _LEXICAL_EXECUTOR
+    if _LEXICAL_EXECUTOR is None:
+        with _LEXICAL_EXECUTOR_LOCK:
+            if _LEXICAL_EXECUTOR is None:
+                workers = max(1, int(os.getenv("LEXICAL_SEARCH_THREADS", "4")))
+                _LEXICAL_EXECUTOR = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rag-lexical")
+    return _LEXICAL_EXECUTOR
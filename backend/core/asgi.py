@@ -14,3 +14,13 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 application = get_asgi_application()
+
+# 重啟前尚未完成的 ingest job 繼續執行
+from apps.rag.jobs import resume_pending_jobs  # noqa: E402
+
+resume_pending_jobs()
+
+# 在接收請求前建立並預熱共用的 LLM client，首個請求不需負擔 SDK 匯入與連線建立
+from apps.rag.llm_providers import warm_llm_clients  # noqa: E402
+
+warm_llm_clients()
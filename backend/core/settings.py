@@ -50,9 +50,11 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'apps.common.middleware.MetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'apps.common.middleware.TraceIdMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'apps.common.rate_limit.RateLimitMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -90,7 +92,6 @@ DATABASES = {
     }
 }
 
-# Caches (used by rate limiting)
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
@@ -98,6 +99,44 @@ CACHES = {
     }
 }
 
+# Rate limiting (apps.common.rate_limit.RateLimitMiddleware): sliding window per client IP,
+# counted in a store shared by all worker processes. sqlite | redis | memory (single process only)
+RATE_LIMIT_STORE = os.getenv('RATE_LIMIT_STORE', 'sqlite')
+RATE_LIMIT_SQLITE_PATH = os.getenv('RATE_LIMIT_SQLITE_PATH') or os.path.join(os.getenv('VECTOR_DIR', 'backend/chroma'), 'rate_limit.sqlite3')
+RATE_LIMIT_REDIS_URL = os.getenv('RATE_LIMIT_REDIS_URL', 'redis://127.0.0.1:6379/0')
+
+
+# Server-side chat sessions (apps.rag.conversations): clients send conversation_id plus the new message only.
+# sqlite (shared by worker processes) | memory (single process only)
+CONVERSATION_STORE = os.getenv('CONVERSATION_STORE', 'sqlite')
+CONVERSATION_SQLITE_PATH = os.getenv('CONVERSATION_SQLITE_PATH') or os.path.join(os.getenv('VECTOR_DIR', 'backend/chroma'), 'conversations.sqlite3')
+CONVERSATION_TTL_SECONDS = float(os.getenv('CONVERSATION_TTL_SECONDS', '86400'))
+CONVERSATION_MAX_TURNS = int(os.getenv('CONVERSATION_MAX_TURNS', '30'))
+CONVERSATION_MAX_SESSIONS = int(os.getenv('CONVERSATION_MAX_SESSIONS', '10000'))
+
+
+def _quota(env_name: str, limit: int, window: int) -> dict:
+    # 例如 RATE_LIMIT_CHAT=100/60 表示每 60 秒 100 次
+    raw = os.getenv(env_name, '').strip()
+    if raw:
+        limit_s, _, window_s = raw.partition('/')
+        limit, window = int(limit_s), int(window_s or window)
+    return {'limit': limit, 'window': window}
+
+
+RATE_LIMITS = {
+    'chat': {
+        **_quota('RATE_LIMIT_CHAT', 20, 60),
+        'methods': ['POST'],
+        'paths': ['/api/v1/chat', '/api/v1/chat/stream'],
+    },
+    'ingest': {
+        **_quota('RATE_LIMIT_INGEST', 10, 60),
+        'methods': ['POST'],
+        'paths': ['/api/v1/ingest', '/api/v1/ingest/stream', '/api/v1/ingest-template', '/api/v1/reindex'],
+    },
+}
+
 # Upload limits (Django-level guards)
 DATA_UPLOAD_MAX_MEMORY_SIZE = 1_000_000  # 1MB
 FILE_UPLOAD_MAX_MEMORY_SIZE = 1_000_000  # 1MB
@@ -0,0 +1,154 @@
+"""同步 vs 非同步聊天路徑的併發基準（ASGI、離線、stub LLM 以 sleep 模擬延遲）。
+
+以 in-process ASGI 呼叫 Django 應用：
+- async：正式的 /api/v1/chat（async Ninja view + aanswer_with_rag）
+- sync ：等同舊版的同步 view（answer_with_rag），於 ASGI 下由 Django 以 sync_to_async 執行
+
+用法（於專案根目錄）：
+    python benchmarks/bench_async_chat.py [--clients 50 200] [--rounds 2] [--llm-delay 0.1]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "backend"))
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
+os.environ["VECTOR_DIR"] = tempfile.mkdtemp(prefix="bench-chroma-")
+os.environ.pop("GOOGLE_API_KEY", None)
+# 問題輪流重複，開啟回答快取時量到的多半是快取命中
+os.environ["ANSWER_CACHE"] = "0"
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.core.handlers.asgi import ASGIHandler  # noqa: E402
+from django.http import JsonResponse  # noqa: E402
+from django.urls import path  # noqa: E402
+from django.views.decorators.csrf import csrf_exempt  # noqa: E402
+
+from apps.api.views import api  # noqa: E402
+from apps.rag import llm_providers, service  # noqa: E402
+from apps.rag.ingest import ingest_text  # noqa: E402
+from apps.rag.templates_registry import load_template_text  # noqa: E402
+
+LLM_DELAY = 0.1
+
+
+class SleepyLLM(llm_providers.BaseLLM):
+    """service 經由 complete / acomplete 呼叫 LLM；async 路徑必須以 asyncio.sleep 模擬，不可落入執行緒池。"""
+
+    provider = "sleepy"
+
+    def complete(self, prompt: str) -> str:
+        time.sleep(LLM_DELAY)
+        return "stub answer"
+
+    async def acomplete(self, prompt: str) -> str:
+        await asyncio.sleep(LLM_DELAY)
+        return "stub answer"
+
+
+@csrf_exempt
+def sync_chat(request):
+    payload = json.loads(request.body)
+    result = service.answer_with_rag(payload["message"], None, top_k=5)
+    return JsonResponse({"success": True, "data": result.model_dump()})
+
+
+urlpatterns = [
+    path("bench/chat-sync", sync_chat),
+    path("api/v1/", api.urls),
+]
+
+QUESTIONS = ["加班費怎麼算", "特休有幾天", "資遣費如何計算", "工時上限是多少", "產假幾週"]
+
+
+async def call(app, url: str, body: bytes, client_ip: str) -> Tuple[int, float]:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": url, "raw_path": url.encode(), "query_string": b"", "root_path": "",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                    (b"x-forwarded-for", client_ip.encode()), (b"host", b"localhost")],
+        "client": (client_ip, 0), "server": ("localhost", 80),
+    }
+    sent = False
+    status = 0
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.sleep(3600)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    t0 = time.perf_counter()
+    await app(scope, receive, send)
+    return status, time.perf_counter() - t0
+
+
+async def run_level(app, url: str, clients: int, rounds: int) -> Tuple[float, List[float], int]:
+    latencies: List[float] = []
+    errors = 0
+
+    async def client(i: int) -> None:
+        nonlocal errors
+        for r in range(rounds):
+            body = json.dumps({"message": QUESTIONS[(i + r) % len(QUESTIONS)]}).encode()
+            status, elapsed = await call(app, url, body, f"10.0.{i // 250}.{i % 250}")
+            latencies.append(elapsed)
+            errors += status != 200
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(clients)))
+    return time.perf_counter() - t0, latencies, errors
+
+
+def pct(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def main() -> None:
+    global LLM_DELAY
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, nargs="+", default=[50, 200])
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--llm-delay", type=float, default=0.1)
+    args = parser.parse_args()
+    LLM_DELAY = args.llm_delay
+    logging.disable(logging.WARNING)
+
+    settings.ROOT_URLCONF = __name__
+    service.get_default_llm = lambda: SleepyLLM()
+    ingest_text("labor_standards_act", load_template_text("labor_standards_act"))
+    app = ASGIHandler()
+
+    print(f"llm_delay={LLM_DELAY}s rounds={args.rounds}")
+    for clients in args.clients:
+        for label, url in (("sync ", "/bench/chat-sync"), ("async", "/api/v1/chat")):
+            elapsed, lat, errors = asyncio.run(run_level(app, url, clients, args.rounds))
+            print(f"{label} clients={clients:4d}: {len(lat) / elapsed:8.1f} req/s  "
+                  f"p50={pct(lat, 50) * 1000:8.1f}ms  p99={pct(lat, 99) * 1000:8.1f}ms  errors={errors}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""GoogleEmbedding 批次併發吞吐量（假客戶端，離線）。
+
+用法（於專案根目錄）：
+    python benchmarks/bench_google_embedding.py [--texts 2000] [--batch 20] [--latency 0.05] [--fail-rate 0.05]
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "backend"))
+
+from apps.rag.vectorstore import GoogleEmbedding  # noqa: E402
+
+
+class FakeEmbeddingClient:
+    def __init__(self, latency: float, fail_rate: float, seed: int = 0) -> None:
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.calls = 0
+        self.failures = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def embed_content(self, model, content):
+        with self._lock:
+            self.calls += 1
+            fail = self._rng.random() < self.fail_rate
+            if fail:
+                self.failures += 1
+        time.sleep(self.latency * (0.5 + self._rng.random()))
+        if fail:
+            raise ConnectionError("injected failure")
+        return {"embedding": [[0.0] * 8 for _ in content]}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--texts", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--fail-rate", type=float, default=0.05)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    texts = [f"chunk-{i}" for i in range(args.texts)]
+    print(f"texts={args.texts} batch={args.batch} latency~{args.latency}s fail_rate={args.fail_rate}")
+
+    # 舊版行為：逐筆、序列呼叫
+    client = FakeEmbeddingClient(args.latency, 0.0)
+    emb = GoogleEmbedding("models/fake", client=client, batch_size=1, concurrency=1)
+    sample = texts[:50]
+    t0 = time.perf_counter()
+    emb.embed(sample)
+    elapsed = time.perf_counter() - t0
+    print(f"legacy (1 text/call, serial): {len(sample) / elapsed:10.1f} texts/sec")
+
+    for workers in (1, 4, 16):
+        client = FakeEmbeddingClient(args.latency, args.fail_rate)
+        emb = GoogleEmbedding("models/fake", client=client, batch_size=args.batch, concurrency=workers,
+                              max_retries=5, backoff_base=0.01, backoff_max=0.1)
+        t0 = time.perf_counter()
+        out = emb.embed(texts)
+        elapsed = time.perf_counter() - t0
+        assert len(out) == len(texts)
+        print(f"concurrency={workers:2d}: {len(texts) / elapsed:10.1f} texts/sec  calls={client.calls} injected_failures={client.failures}")
+
+
+if __name__ == "__main__":
+    main()
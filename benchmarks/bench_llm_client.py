@@ -0,0 +1,95 @@
+"""每次請求建立 Gemini client vs 共用預熱 client 的開銷比較（離線，呼叫本地假 LLM 伺服器，延遲 0）。
+
+- legacy：舊版做法，每次呼叫 genai.configure() + 新的 GenerativeModel（configure 會丟棄 SDK 快取的 client 與連線）
+- pooled：LLMRegistry 共用的 GoogleAiStudioLLM（啟動時 warm_llm_clients() 預熱）
+另外單獨量測「只建立 client、不送請求」的 setup 成本，以及預熱本身的耗時。
+
+用法（於專案根目錄）：
+    python benchmarks/bench_llm_client.py [--calls 300]
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "backend"))
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
+
+from apps.rag.fake_llm import FakeLLMConfig, LatencyModel, start_fake_llm_server  # noqa: E402
+
+MODEL = "models/gemini-bench"
+PROMPT = "用戶問題: 加班費怎麼算"
+
+
+def pct(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def measure(label: str, fn: Callable[[], object], calls: int) -> None:
+    samples = []
+    for _ in range(calls):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    mean = sum(samples) / len(samples)
+    print(f"{label:<22} mean={mean * 1e6:9.1f}us  p50={pct(samples, 50) * 1e6:9.1f}us  p99={pct(samples, 99) * 1e6:9.1f}us")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=300)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    server = start_fake_llm_server(FakeLLMConfig(latency=LatencyModel("fixed", 0.0)))
+    os.environ["GOOGLE_API_ENDPOINT"] = server.url
+    os.environ["GOOGLE_API_KEY"] = "fake-key"
+    os.environ["GEMINI_MODEL"] = MODEL
+
+    from apps.rag import llm_providers
+
+    t0 = time.perf_counter()
+    status = llm_providers.warm_llm_clients()
+    print(f"warm-up (import SDK, build client): {(time.perf_counter() - t0) * 1000:.1f}ms  status={status}")
+
+    import google.generativeai as genai
+
+    endpoint = server.url
+
+    def legacy_setup():
+        genai.configure(api_key="fake-key", transport="rest", client_options={"api_endpoint": endpoint})
+        model = genai.GenerativeModel(MODEL)
+        from google.generativeai import client as genai_client
+
+        model._client = genai_client.get_default_generative_client()
+        return model
+
+    def legacy_call():
+        genai.configure(api_key="fake-key", transport="rest", client_options={"api_endpoint": endpoint})
+        return genai.GenerativeModel(MODEL).generate_content(PROMPT).text
+
+    def pooled_call():
+        return llm_providers.get_default_llm().generate(PROMPT)
+
+    print(f"calls={args.calls}")
+    measure("setup legacy", legacy_setup, args.calls)
+    measure("setup pooled", llm_providers.get_default_llm, args.calls)
+    # legacy 會重設 SDK 設定，之後重新讓 pooled client 生效
+    llm_providers._GENAI_CONFIGURED = None
+    llm_providers.get_llm_registry().clear()
+    llm_providers.warm_llm_clients()
+    measure("generate pooled", pooled_call, args.calls)
+    measure("generate legacy", legacy_call, args.calls)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
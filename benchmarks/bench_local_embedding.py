@@ -0,0 +1,68 @@
+"""LocalEmbedding 吞吐量基準：舊版逐筆 sha1 實作 vs NumPy 批次實作。
+
+用法（於專案根目錄）：
+    python benchmarks/bench_local_embedding.py [--docs 2000] [--batch 64]
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import math
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "backend"))
+
+from apps.rag.ingest import split_text  # noqa: E402
+from apps.rag.vectorstore import LocalEmbedding  # noqa: E402
+
+
+def legacy_vectorize(text: str, dimension: int = 256) -> List[float]:
+    """重構前的 LocalEmbedding._vectorize，作為對照組。"""
+    s = ''.join(ch for ch in text.lower() if not ch.isspace())
+    tokens = list(s) + ([s[i:i+2] for i in range(len(s)-1)] if len(s) >= 2 else [])
+    vec = [0.0] * dimension
+    for tok in tokens:
+        vec[int(hashlib.sha1(tok.encode("utf-8")).hexdigest(), 16) % dimension] += 1.0
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+
+def load_corpus(n_docs: int) -> List[str]:
+    text = (ROOT / "backend" / "templates" / "labor_standards_act.txt").read_text(encoding="utf-8")
+    chunks = split_text(text)
+    return [chunks[i % len(chunks)] for i in range(n_docs)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=64)
+    args = parser.parse_args()
+
+    docs = load_corpus(args.docs)
+
+    t0 = time.perf_counter()
+    legacy = [legacy_vectorize(d) for d in docs]
+    legacy_s = time.perf_counter() - t0
+
+    embedder = LocalEmbedding()
+    t0 = time.perf_counter()
+    batches = [embedder.embed(docs[i:i + args.batch]) for i in range(0, len(docs), args.batch)]
+    batched_s = time.perf_counter() - t0
+
+    import numpy as np
+    new = np.concatenate(batches)
+    identical = bool(np.array_equal(new, np.asarray(legacy, dtype=np.float32)))
+
+    print(f"docs={len(docs)} batch={args.batch}")
+    print(f"legacy : {len(docs) / legacy_s:10.1f} docs/sec")
+    print(f"batched: {len(docs) / batched_s:10.1f} docs/sec  (x{legacy_s / batched_s:.1f})")
+    print(f"float32 bit-identical: {identical}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""串流 ingest 基準：以 WSGI 直接送出合成 NDJSON 語料到 /api/v1/ingest/stream，量測 docs/sec 與峰值 RSS。
+
+body 以檔案作為 wsgi.input，不會先整包載入記憶體；峰值 RSS 應與語料大小無關。
+
+用法（於專案根目錄）：
+    python benchmarks/bench_stream_ingest.py [--size-mb 100] [--doc-kb 64] [--line-kb 4]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "backend"))
+
+
+def write_corpus(path: str, size_mb: float, doc_kb: int, line_kb: int) -> int:
+    """以勞基法條文重複組成語料；每份文件切成多行（連續相同 doc_id）。回傳文件數。"""
+    source = (ROOT / "backend" / "templates" / "labor_standards_act.txt").read_text(encoding="utf-8")
+    target = int(size_mb * 1024 * 1024)
+    written = 0
+    docs = 0
+    offset = 0
+    with open(path, "w", encoding="utf-8") as fh:
+        while written < target:
+            doc_id = f"bench-{docs:06d}"
+            doc_bytes = 0
+            while doc_bytes < doc_kb * 1024 and written < target:
+                # 每行約 line_kb，換成帶有文件編號的內容避免所有 chunk 雜湊相同
+                n = line_kb * 1024 // 3
+                piece = (source * 2)[offset:offset + n].replace("勞工", f"勞工{docs}")
+                offset = (offset + n) % len(source)
+                line = json.dumps({"doc_id": doc_id, "text": piece}, ensure_ascii=False) + "\n"
+                fh.write(line)
+                size = len(line.encode("utf-8"))
+                doc_bytes += size
+                written += size
+            docs += 1
+    return docs
+
+
+def peak_rss_mb() -> float:
+    # Linux 以 KB 回報
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=float, default=100)
+    parser.add_argument("--doc-kb", type=int, default=64)
+    parser.add_argument("--line-kb", type=int, default=4)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-stream-")
+    try:
+        run(args, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run(args: argparse.Namespace, workdir: str) -> None:
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
+    os.environ["VECTOR_DIR"] = os.path.join(workdir, "vectors")
+    os.environ.pop("GOOGLE_API_KEY", None)
+
+    corpus = os.path.join(workdir, "corpus.ndjson")
+    n_docs = write_corpus(corpus, args.size_mb, args.doc_kb, args.line_kb)
+    size = os.path.getsize(corpus)
+
+    from django.core.wsgi import get_wsgi_application
+
+    app = get_wsgi_application()
+    rss_before = peak_rss_mb()
+
+    status_holder = []
+    with open(corpus, "rb") as body:
+        environ = {
+            "REQUEST_METHOD": "POST",
+            "PATH_INFO": "/api/v1/ingest/stream",
+            "SERVER_NAME": "localhost",
+            "SERVER_PORT": "80",
+            "REMOTE_ADDR": "127.0.0.1",
+            "CONTENT_TYPE": "application/x-ndjson",
+            "CONTENT_LENGTH": str(size),
+            "wsgi.input": body,
+            "wsgi.url_scheme": "http",
+            "wsgi.errors": sys.stderr,
+            "wsgi.version": (1, 0),
+            "wsgi.multithread": False,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        t0 = time.perf_counter()
+        response = b"".join(app(environ, lambda status, headers: status_holder.append(status)))
+        elapsed = time.perf_counter() - t0
+
+    data = json.loads(response).get("data") or {}
+    print(f"status:      {status_holder[0]}")
+    print(f"corpus:      {size / 1024 / 1024:.1f} MB, {n_docs} docs")
+    print(f"ingested:    {data.get('documents')} docs, {data.get('chunks')} chunks in {elapsed:.1f}s")
+    print(f"throughput:  {n_docs / elapsed:.2f} docs/s, {size / 1024 / 1024 / elapsed:.2f} MB/s")
+    print(f"peak RSS:    {rss_before:.0f} MB before request -> {peak_rss_mb():.0f} MB after")
+
+
+if __name__ == "__main__":
+    main()
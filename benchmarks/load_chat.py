@@ -0,0 +1,326 @@
+"""/api/v1/chat 端到端壓測：以固定到達率重播問題組合，LLM 與嵌入由本地假 LLM 伺服器提供。
+
+開放迴圈（open loop）：請求依排定時間送出，不等待前一個完成；延遲自排定時間起算，
+伺服器塞車時的排隊時間也會計入（避免 coordinated omission）。
+
+預設會自行啟動：
+- 假 LLM 伺服器（manage.py fakellm，Gemini REST 相容；GOOGLE_API_ENDPOINT 指向它）
+- Django 應用：wsgi = manage.py runserver（多執行緒 WSGI），asgi = uvicorn core.asgi:application
+並以 /api/v1/ingest-template 灌入勞基法範本。以 --target 則直接壓測既有部署（不啟動任何行程）。
+
+用法（於專案根目錄；asgi 需另行 pip install uvicorn）：
+    python benchmarks/load_chat.py --deploy wsgi asgi --rate 10 --duration 30 --llm-latency-ms 800
+    python benchmarks/load_chat.py --deploy asgi --rate 40 --llm-error-rate 0.05 --json /tmp/load.json
+    python benchmarks/load_chat.py --target http://127.0.0.1:8000 --rate 5 --duration 60
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+import random
+import secrets
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+BACKEND = ROOT / "backend"
+
+# (權重, 問題)：一般檢索為主，夾雜條號快速路徑與模型詢問
+QUESTION_MIX: List[Tuple[float, str]] = [
+    (4, "加班費怎麼計算？"),
+    (3, "特別休假有幾天？"),
+    (3, "資遣費如何計算？"),
+    (2, "每日正常工作時間上限是多少？"),
+    (2, "產假期間工資怎麼給？"),
+    (2, "雇主可以不給例假日嗎？"),
+    (1, "勞基法第 38 條的內容是什麼？"),
+    (1, "勞基法第 24 條"),
+    (0.5, "你使用什麼模型？"),
+]
+
+
+# 服務端會吞掉 LLM 錯誤改由 EchoLLM 回答（仍回 200），需從 /metrics 看出降級次數
+WATCHED_METRICS = ("rag_llm_requests_total", "rag_llm_errors_total", "rag_llm_fallbacks_total", "rate_limit_rejections_total")
+
+
+@dataclass
+class Sample:
+    status: int
+    # 自排定時間起算（含排隊）
+    latency: float
+    # 自實際送出起算
+    service_time: float
+    error: str = ""
+
+
+def load_questions(path: Optional[str]) -> List[Tuple[float, str]]:
+    """檔案每行一題，可用「權重<TAB>問題」指定權重。"""
+    if not path:
+        return QUESTION_MIX
+    mix = []
+    for line in Path(path).read_text(encoding="utf-8").splitlines():
+        if not line.strip():
+            continue
+        weight, sep, question = line.partition("\t")
+        mix.append((float(weight), question.strip()) if sep else (1.0, line.strip()))
+    return mix
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def http_json(url: str, body: Optional[dict] = None, timeout: float = 10.0, headers: Optional[Dict[str, str]] = None) -> Tuple[int, bytes]:
+    data = json.dumps(body, ensure_ascii=False).encode("utf-8") if body is not None else None
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json", **(headers or {})})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.status, resp.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def wait_until_up(url: str, proc: subprocess.Popen, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"process exited with {proc.returncode} before {url} came up")
+        try:
+            http_json(url, timeout=1.0)
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"timed out waiting for {url}")
+
+
+@contextmanager
+def spawned(cmd: List[str], env: Dict[str, str], log_path: Path, ready_url: str) -> Iterator[subprocess.Popen]:
+    with open(log_path, "wb") as log:
+        proc = subprocess.Popen(cmd, cwd=BACKEND, env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            wait_until_up(ready_url, proc)
+            yield proc
+        except Exception:
+            print(f"--- {' '.join(cmd[:4])} failed, log: {log_path}", file=sys.stderr)
+            raise
+        finally:
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+def server_command(deploy: str, port: int) -> List[str]:
+    if deploy == "wsgi":
+        return [sys.executable, "manage.py", "runserver", f"127.0.0.1:{port}", "--noreload"]
+    return [sys.executable, "-m", "uvicorn", "core.asgi:application", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+
+
+def scrape_metrics(base_url: str) -> Dict[str, float]:
+    """加總 WATCHED_METRICS 各標籤的值；端點不可用時回傳空 dict。"""
+    try:
+        status, body = http_json(base_url.rstrip("/") + "/api/v1/metrics")
+    except OSError:
+        return {}
+    if status != 200:
+        return {}
+    totals: Dict[str, float] = {}
+    for line in body.decode("utf-8").splitlines():
+        name = line.split("{", 1)[0].split(" ", 1)[0]
+        if name in WATCHED_METRICS:
+            totals[name] = totals.get(name, 0.0) + float(line.rsplit(" ", 1)[1])
+    return totals
+
+
+def run_load(base_url: str, args: argparse.Namespace, mix: List[Tuple[float, str]]) -> Tuple[List[Sample], float]:
+    rng = random.Random(args.seed)
+    weights = [w for w, _ in mix]
+    questions = [q for _, q in mix]
+    total = int(args.rate * args.duration)
+    # 以多個 X-Forwarded-For 模擬不同使用者；限流以 IP 計數
+    clients = [f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}" for i in range(args.clients)]
+    url = base_url.rstrip("/") + args.endpoint
+    samples: List[Sample] = []
+    lock = threading.Lock()
+
+    def fire(scheduled: float, question: str, client_ip: str) -> None:
+        sent = time.perf_counter()
+        status, error = 0, ""
+        try:
+            status, _ = http_json(url, {"message": question}, timeout=args.timeout, headers={"X-Forwarded-For": client_ip})
+        except Exception as exc:
+            error = type(exc).__name__
+        done = time.perf_counter()
+        with lock:
+            samples.append(Sample(status, done - scheduled, done - sent, error))
+
+    pool = ThreadPoolExecutor(max_workers=args.max_inflight)
+    started = time.perf_counter()
+    next_at = started
+    for _ in range(total):
+        next_at += rng.expovariate(args.rate) if args.arrival == "poisson" else 1 / args.rate
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        pool.submit(fire, next_at, rng.choices(questions, weights)[0], rng.choice(clients))
+    pool.shutdown(wait=True)
+    return samples, time.perf_counter() - started
+
+
+def run_measured(base_url: str, args: argparse.Namespace, mix: List[Tuple[float, str]]) -> Tuple[List[Sample], float, Dict[str, float]]:
+    """執行壓測，並回傳期間服務端計數器的增量（多 worker 部署時只反映被抓取到的那個行程）。"""
+    before = scrape_metrics(base_url)
+    samples, elapsed = run_load(base_url, args, mix)
+    after = scrape_metrics(base_url)
+    return samples, elapsed, {k: v - before.get(k, 0.0) for k, v in after.items()}
+
+
+def pct(values: List[float], p: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))]
+
+
+def summarize(label: str, samples: List[Sample], elapsed: float, args: argparse.Namespace, llm_stats: Optional[dict],
+              server_metrics: Dict[str, float]) -> dict:
+    statuses = Counter(s.status for s in samples)
+    ok = [s for s in samples if 200 <= s.status < 300]
+    rejected = statuses.get(429, 0)
+    errors = len(samples) - len(ok) - rejected
+    lat = [s.latency for s in ok]
+    return {
+        "deploy": label,
+        "offered_rps": args.rate,
+        "requests": len(samples),
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(pct(lat, 50) * 1000, 1),
+        "p95_ms": round(pct(lat, 95) * 1000, 1),
+        "p99_ms": round(pct(lat, 99) * 1000, 1),
+        "max_ms": round(max(lat) * 1000, 1) if lat else float("nan"),
+        "service_p50_ms": round(pct([s.service_time for s in ok], 50) * 1000, 1),
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+        "rate_limited": rejected,
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+        "transport_errors": dict(Counter(s.error for s in samples if s.error)),
+        "llm": llm_stats,
+        "server": server_metrics,
+    }
+
+
+def print_summary(r: dict) -> None:
+    print(
+        f"[{r['deploy']}] offered {r['offered_rps']:.1f} rps, {r['requests']} requests in {r['elapsed_s']:.1f}s -> "
+        f"{r['throughput_rps']:.2f} ok/s  p50 {r['p50_ms']:.0f}ms  p95 {r['p95_ms']:.0f}ms  p99 {r['p99_ms']:.0f}ms  "
+        f"errors {r['error_rate']:.1%}  429s {r['rate_limited']}  statuses {r['statuses']}"
+    )
+    if r["transport_errors"]:
+        print(f"    transport errors: {r['transport_errors']}")
+    if r["server"]:
+        print(f"    server counters: {r['server']}")
+    if r["llm"] is not None:
+        print(f"    fake LLM calls: {r['llm']}")
+
+
+def run_deploy(deploy: str, args: argparse.Namespace, mix: List[Tuple[float, str]], workdir: Path) -> dict:
+    llm_port, app_port = free_port(), free_port()
+    llm_url = f"http://127.0.0.1:{llm_port}"
+    app_url = f"http://127.0.0.1:{app_port}"
+    vector_dir = workdir / f"chroma-{deploy}"
+    env = {
+        **os.environ,
+        "DJANGO_SETTINGS_MODULE": "core.settings",
+        # 以正式設定（DEBUG=0）執行；本地 HTTP 不做 HTTPS 轉址
+        "DEBUG": "0",
+        "SECRET_KEY": os.environ.get("SECRET_KEY") or secrets.token_urlsafe(50),
+        "SECURE_SSL_REDIRECT": "0",
+        "ALLOWED_HOSTS": "127.0.0.1,localhost",
+        "VECTOR_DIR": str(vector_dir),
+        "GOOGLE_API_KEY": "fake-key",
+        "GOOGLE_API_ENDPOINT": llm_url,
+        "ANSWER_CACHE": "1" if args.answer_cache else "0",
+        "ANONYMIZED_TELEMETRY": "false",
+    }
+    fake_cmd = [
+        sys.executable, "manage.py", "fakellm", "--port", str(llm_port),
+        "--latency-ms", str(args.llm_latency_ms), "--latency-dist", args.llm_latency_dist,
+        "--latency-spread", str(args.llm_latency_spread), "--embed-latency-ms", str(args.embed_latency_ms),
+        "--error-rate", str(args.llm_error_rate), "--throttle-rate", str(args.llm_throttle_rate), "--seed", str(args.seed),
+    ]
+    with spawned(fake_cmd, env, workdir / f"fakellm-{deploy}.log", f"{llm_url}/stats"), \
+            spawned(server_command(deploy, app_port), env, workdir / f"app-{deploy}.log", f"{app_url}/api/v1/health"):
+        status, body = http_json(f"{app_url}/api/v1/ingest-template", {"template_id": "labor_standards_act"}, timeout=300)
+        if status != 200:
+            raise RuntimeError(f"ingest-template failed: {status} {body[:200]!r}")
+        http_json(f"{llm_url}/stats/reset", {})
+        samples, elapsed, server_metrics = run_measured(app_url, args, mix)
+        _, stats = http_json(f"{llm_url}/stats")
+        return summarize(deploy, samples, elapsed, args, json.loads(stats), server_metrics)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--deploy", nargs="+", choices=["wsgi", "asgi"], default=["wsgi", "asgi"])
+    parser.add_argument("--target", default="", help="壓測既有部署的 base URL（不啟動伺服器與假 LLM）")
+    parser.add_argument("--endpoint", default="/api/v1/chat", help="例如 /api/v1/chat/stream")
+    parser.add_argument("--rate", type=float, default=10.0, help="每秒到達的請求數")
+    parser.add_argument("--duration", type=float, default=30.0, help="送出請求的秒數")
+    parser.add_argument("--arrival", choices=["constant", "poisson"], default="poisson")
+    parser.add_argument("--clients", type=int, default=200, help="模擬的不同來源 IP 數（每 IP 限流 20 次/分）")
+    parser.add_argument("--max-inflight", type=int, default=512)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--questions", default="", help="問題檔，每行「權重<TAB>問題」或只有問題")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--answer-cache", action="store_true", help="保留回答快取（預設停用，讓每題都經過 LLM）")
+    parser.add_argument("--llm-latency-ms", type=float, default=800.0)
+    parser.add_argument("--llm-latency-dist", default="lognormal")
+    parser.add_argument("--llm-latency-spread", type=float, default=0.5)
+    parser.add_argument("--embed-latency-ms", type=float, default=30.0)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-throttle-rate", type=float, default=0.0)
+    parser.add_argument("--json", default="", help="將結果寫入 JSON")
+    parser.add_argument("--keep", action="store_true", help="保留暫存目錄（向量庫與伺服器 log）")
+    args = parser.parse_args()
+    mix = load_questions(args.questions)
+
+    results = []
+    if args.target:
+        samples, elapsed, server_metrics = run_measured(args.target, args, mix)
+        results.append(summarize("target", samples, elapsed, args, None, server_metrics))
+        print_summary(results[-1])
+    else:
+        workdir = Path(tempfile.mkdtemp(prefix="load-chat-"))
+        try:
+            for deploy in args.deploy:
+                results.append(run_deploy(deploy, args, mix, workdir))
+                print_summary(results[-1])
+        finally:
+            if args.keep:
+                print(f"work dir kept: {workdir}")
+            else:
+                shutil.rmtree(workdir, ignore_errors=True)
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
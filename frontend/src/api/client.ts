@@ -1,4 +1,4 @@
-import type { ApiResponse, HealthResponse, ChatRequest, ChatResponse, ChatTurn, IngestRequest, IngestResponse, TemplateMeta } from './types';
+import type { ApiResponse, HealthResponse, ChatRequest, ChatResponse, ChatStreamHandlers, ChatTurn, ErrorInfo, IngestJob, IngestRequest, IngestResult, TemplateMeta } from './types';
 
 const API_BASE = import.meta.env.VITE_API_BASE_URL || '/api/v1';
 
@@ -20,29 +20,89 @@ export async function postChat(body: ChatRequest): Promise<ApiResponse<ChatRespo
     return request<ChatResponse>('/chat', { method: 'POST', body: JSON.stringify(body) });
 }
 
-// 工具：裁切最近 N 回合（預設 3）並限制每則內容長度（預設 2000 字元）
+// 串流聊天（SSE over POST）：EventSource 不支援 POST，改以 fetch 讀取 body 並解析事件
+export async function streamChat(body: ChatRequest, handlers: ChatStreamHandlers, signal?: AbortSignal): Promise<void> {
+    const res = await fetch(`${API_BASE}/chat/stream`, {
+        method: 'POST',
+        credentials: 'omit',
+        headers: { 'Content-Type': 'application/json', Accept: 'text/event-stream' },
+        body: JSON.stringify(body),
+        signal,
+    });
+    if (!res.ok || !res.body) {
+        // 限流、驗證錯誤等仍以一般 JSON 錯誤格式回應
+        let error: ErrorInfo = { code: 'http_error', message: `HTTP ${res.status}` };
+        try {
+            const json = (await res.json()) as ApiResponse<unknown>;
+            if (!json.success) error = json.error;
+        } catch {
+            // ignore non-JSON body
+        }
+        handlers.onError?.(error);
+        return;
+    }
+
+    const dispatch = (block: string) => {
+        let event = 'message';
+        const data: string[] = [];
+        for (const line of block.split('\n')) {
+            if (line.startsWith('event:')) event = line.slice(6).trim();
+            else if (line.startsWith('data:')) data.push(line.slice(5).trimStart());
+        }
+        if (!data.length) return;
+        const payload = JSON.parse(data.join('\n'));
+        if (event === 'sources') handlers.onSources?.(payload.sources);
+        else if (event === 'delta') handlers.onDelta?.(payload.text);
+        else if (event === 'done') handlers.onDone?.(payload);
+        else if (event === 'error') handlers.onError?.(payload);
+    };
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    for (;;) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let sep = buffer.indexOf('\n\n');
+        while (sep !== -1) {
+            dispatch(buffer.slice(0, sep));
+            buffer = buffer.slice(sep + 2);
+            sep = buffer.indexOf('\n\n');
+        }
+    }
+    if (buffer.trim()) dispatch(buffer);
+}
+
+// 工具：有 conversationId 時只送新訊息（歷史由伺服器保存）；否則裁切最近 N 回合（預設 30）並限制每則內容長度（預設 4000 字元）
 export function buildChatPayload(
     message: string,
     history: ChatTurn[] = [],
-    options: { maxTurns?: number; maxChars?: number } = {}
+    options: { maxTurns?: number; maxChars?: number; conversationId?: string | null } = {}
 ): ChatRequest {
     const maxTurns = options.maxTurns ?? 30;
     const maxChars = options.maxChars ?? 4000;
     const trim = (s: string) => (s.length > maxChars ? s.slice(-maxChars) : s);
 
+    if (options.conversationId) return { message: trim(message), conversation_id: options.conversationId };
     const trimmedHistory = history.slice(-maxTurns).map((t) => ({ ...t, content: trim(t.content) }));
     return { message: trim(message), history: trimmedHistory };
 }
 
-export async function ingestDocuments(body: IngestRequest): Promise<ApiResponse<IngestResponse>> {
-    return request<IngestResponse>('/ingest', { method: 'POST', body: JSON.stringify(body) });
+// 送出後立即回傳 job（202）；以 getIngestJob 輪詢進度，佇列已滿時回 429（queue_full）
+export async function ingestDocuments(body: IngestRequest): Promise<ApiResponse<IngestJob>> {
+    return request<IngestJob>('/ingest', { method: 'POST', body: JSON.stringify(body) });
+}
+
+export async function getIngestJob(jobId: string): Promise<ApiResponse<IngestJob>> {
+    return request<IngestJob>(`/ingest/jobs/${encodeURIComponent(jobId)}`);
 }
 
 export async function listTemplates(): Promise<ApiResponse<TemplateMeta[]>> {
     return request<TemplateMeta[]>('/templates');
 }
 
-export async function ingestTemplate(template_id: string): Promise<ApiResponse<{ doc_id: string; chunks: number; upserts: number }>> {
+export async function ingestTemplate(template_id: string): Promise<ApiResponse<Omit<IngestResult, 'ok' | 'error'>>> {
     return request('/ingest-template', { method: 'POST', body: JSON.stringify({ template_id }) });
 }
 
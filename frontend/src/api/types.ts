@@ -42,11 +42,17 @@ export type ChatRequest = {
     doc_ids?: number[];
     top_k?: number;
     history?: ChatTurn[];
+    // 伺服器端對話 ID；提供時不可同時送 history
+    conversation_id?: string;
+    include_timings?: boolean;
 };
 
 export type ChatResponse = {
     answer: string;
     sources: ChatSource[];
+    // 各階段耗時（毫秒），僅在 include_timings 時提供
+    timings?: Record<string, number> | null;
+    conversation_id?: string | null;
 };
 
 // Ingest
@@ -64,11 +70,28 @@ export type IngestResult = {
     ok: boolean;
     chunks: number;
     upserts: number;
+    added: number;
+    updated: number;
+    unchanged: number;
+    deleted: number;
     error?: string | null;
 };
 
-export type IngestResponse = {
-    results: IngestResult[];
+export type IngestJobState = 'queued' | 'running' | 'completed' | 'failed';
+
+export type IngestJobDocument = Omit<IngestResult, 'ok'> & {
+    state: 'queued' | 'running' | 'done' | 'failed';
+};
+
+export type IngestJob = {
+    job_id: string;
+    state: IngestJobState;
+    created_at: number;
+    updated_at: number;
+    total: number;
+    completed: number;
+    failed: number;
+    documents: IngestJobDocument[];
 };
 
 export type TemplateMeta = {
@@ -78,3 +101,18 @@ export type TemplateMeta = {
 };
 
 
+
+// Streaming chat (SSE)
+export type ChatStreamTimings = {
+    retrieval_ms: number;
+    first_token_ms: number;
+    total_ms: number;
+    prompt_tokens: number;
+};
+
+export type ChatStreamHandlers = {
+    onSources?: (sources: ChatSource[]) => void;
+    onDelta?: (text: string) => void;
+    onDone?: (info: { timings: ChatStreamTimings; trace_id: string; conversation_id: string }) => void;
+    onError?: (error: ErrorInfo) => void;
+};
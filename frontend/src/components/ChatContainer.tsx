@@ -11,6 +11,8 @@ export default function ChatContainer() {
     const [loading, setLoading] = useState(false)
     const [templates, setTemplates] = useState<TemplateMeta[]>([])
     const [selected, setSelected] = useState<string>('')
+    // 伺服器端對話 ID：有值時只送新訊息
+    const conversationRef = useRef<string | null>(null)
     const scrollEndRef = useRef<HTMLDivElement>(null)
 
     useEffect(() => {
@@ -33,13 +35,16 @@ export default function ChatContainer() {
         if (!text.trim()) return
         setLoading(true)
 
-        const nextHistory: Msg[] = [...messages, { role: 'user', content: text }]
-        setMessages(nextHistory)
+        const history = messages.map((m) => ({ role: m.role, content: m.content }))
+        setMessages([...messages, { role: 'user', content: text }])
         try {
-            const history = nextHistory.map((m) => ({ role: m.role, content: m.content }))
-            const payload = buildChatPayload(text, history)
-            const res = await postChat(payload)
+            let res = await postChat(buildChatPayload(text, history, { conversationId: conversationRef.current }))
+            if (!res.success && res.error?.code === 'conversation_not_found') {
+                // 對話已過期：以本地歷史開新對話
+                res = await postChat(buildChatPayload(text, history))
+            }
             if (res.success) {
+                conversationRef.current = res.data.conversation_id ?? null
                 setMessages((prev) => [...prev, { role: 'assistant', content: res.data.answer, sources: res.data.sources }])
             } else {
                 console.warn('API error', res.error)
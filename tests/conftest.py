@@ -0,0 +1,14 @@
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: RAG 微基準（較慢，以 `pytest -m benchmark` 執行）")
+
+
+def pytest_collection_modifyitems(config, items):
+    import pytest
+
+    # 未以 -m 明確選取時略過基準測試，避免一般測試變慢
+    if "benchmark" in (config.getoption("-m") or ""):
+        return
+    skip = pytest.mark.skip(reason="benchmark: run with `pytest -m benchmark`")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
@@ -0,0 +1,122 @@
+import asyncio
+
+import numpy as np
+
+import backend.apps.rag.answer_cache as answer_cache
+from backend.apps.rag import service
+from backend.apps.rag.answer_cache import AnswerCache, make_cache_key
+from backend.apps.rag.llm_providers import BaseLLM, LLMCallError
+from apps.api.schemas import ChatResponse
+
+
+def _key(msg, **kw):
+    params = dict(doc_ids=None, top_k=5, inline_citations=None, model='Echo:demo')
+    params.update(kw)
+    return make_cache_key(msg, **params)
+
+
+def _vec(*values):
+    return np.asarray(values, dtype=np.float32)
+
+
+def test_exact_tier_normalizes_whitespace_and_case(monkeypatch):
+    monkeypatch.setattr(answer_cache, 'get_corpus_generation', lambda: 'g1')
+    cache = AnswerCache(semantic_threshold=None)
+    cache.put(_key('加班費 怎麼算'), ChatResponse(answer='A'))
+    hit, _ = cache.get(_key('  加班費   怎麼算 '))
+    assert hit.answer == 'A'
+    miss, _ = cache.get(_key('加班費 怎麼算', top_k=6))
+    assert miss is None
+    assert cache.stats()['exact_hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_semantic_tier_reuses_close_queries_only(monkeypatch):
+    monkeypatch.setattr(answer_cache, 'get_corpus_generation', lambda: 'g1')
+    cache = AnswerCache(semantic_threshold=0.9)
+    cache.put(_key('特休幾天'), ChatResponse(answer='特休'), _vec(1, 0, 0))
+
+    hit, vec = cache.get(_key('特休有幾天'), lambda: _vec(0.95, 0.1, 0))
+    assert hit.answer == '特休' and vec is not None
+    far, _ = cache.get(_key('資遣費'), lambda: _vec(0, 1, 0))
+    assert far is None
+    assert cache.stats()['semantic_hits'] == 1
+
+
+def test_semantic_tier_never_crosses_numbers(monkeypatch):
+    monkeypatch.setattr(answer_cache, 'get_corpus_generation', lambda: 'g1')
+    cache = AnswerCache(semantic_threshold=0.5)
+    cache.put(_key('第38條'), ChatResponse(answer='38'), _vec(1, 0))
+    hit, _ = cache.get(_key('第39條'), lambda: _vec(1, 0))
+    assert hit is None
+
+
+def test_exact_hit_skips_query_embedding(monkeypatch):
+    monkeypatch.setattr(answer_cache, 'get_corpus_generation', lambda: 'g1')
+    cache = AnswerCache()
+    cache.put(_key('hi'), ChatResponse(answer='A'), _vec(1, 0))
+
+    def _boom():
+        raise AssertionError('should not embed on exact hit')
+
+    hit, _ = cache.get(_key('hi'), _boom)
+    assert hit.answer == 'A'
+
+
+def test_corpus_change_invalidates_everything(monkeypatch):
+    generation = {'value': 'g1'}
+    monkeypatch.setattr(answer_cache, 'get_corpus_generation', lambda: generation['value'])
+    cache = AnswerCache()
+    cache.put(_key('hi'), ChatResponse(answer='A'), _vec(1, 0))
+    generation['value'] = 'g2'
+    hit, _ = cache.get(_key('hi'), lambda: _vec(1, 0))
+    assert hit is None
+    assert cache.stats()['entries'] == 0 and cache.stats()['invalidations'] == 1
+
+    # 計算期間語料變更：舊版本的回答不寫入
+    cache.put(_key('hi'), ChatResponse(answer='stale'), generation='g1')
+    assert cache.stats()['entries'] == 0
+
+
+def test_ttl_and_size_bound(monkeypatch):
+    monkeypatch.setattr(answer_cache, 'get_corpus_generation', lambda: 'g1')
+    cache = AnswerCache(max_entries=2, ttl_seconds=0)
+    cache.put(_key('a'), ChatResponse(answer='A'))
+    assert cache.get(_key('a'))[0] is None
+
+    cache = AnswerCache(max_entries=2)
+    for msg in ('a', 'b', 'c'):
+        cache.put(_key(msg), ChatResponse(answer=msg))
+    assert cache.stats()['entries'] == 2
+    assert cache.get(_key('a'))[0] is None
+
+
+class FlakyLLM(BaseLLM):
+    provider = 'google'
+    model = 'models/test'
+
+    def __init__(self):
+        self.calls = 0
+        self.fail = True
+
+    def complete(self, prompt):
+        self.calls += 1
+        if self.fail:
+            raise LLMCallError('error')
+        return '加班費依第24條計算'
+
+
+def test_fallback_answers_are_not_cached(monkeypatch):
+    cache = AnswerCache(semantic_threshold=None)
+    llm = FlakyLLM()
+    monkeypatch.setattr(service, 'get_answer_cache', lambda: cache)
+    monkeypatch.setattr(service, 'get_default_llm', lambda: llm)
+
+    service.answer_with_rag('加班費怎麼算', None)
+    asyncio.run(service.aanswer_with_rag('加班費怎麼算', None))
+    assert llm.calls == 2 and cache.stats()['entries'] == 0
+
+    # 供應商恢復後的回答才寫入
+    llm.fail = False
+    assert service.answer_with_rag('加班費怎麼算', None).answer == '加班費依第24條計算'
+    assert service.answer_with_rag('加班費怎麼算', None).answer == '加班費依第24條計算'
+    assert llm.calls == 3 and cache.stats()['entries'] == 1
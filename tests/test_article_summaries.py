@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+from backend.apps.rag import article_summaries, service
+from backend.apps.rag.article_summaries import (
+    PROMPT_VERSION,
+    ArticleSummaryStore,
+    SummaryKey,
+    summary_key,
+    warm_article_summaries,
+)
+from backend.apps.rag.llm_providers import BaseLLM, EchoLLM, LLMCallError
+from backend.apps.rag.llm_router import LLMRouter, RouterConfig
+
+TEMPLATE = 'labor_standards_act'
+
+
+class CountingLLM(BaseLLM):
+    provider = 'google'
+    model = 'models/test'
+
+    def __init__(self, fail=False, provider='google'):
+        self.calls = 0
+        self.fail = fail
+        self.provider = provider
+
+    def complete(self, prompt):
+        self.calls += 1
+        if self.fail:
+            raise LLMCallError('error')
+        article = prompt.split('--- 條文開始 ---\n')[1].split('\n')[0]
+        return f'摘要：{article}'
+
+
+@pytest.fixture
+def summaries(monkeypatch, tmp_path):
+    monkeypatch.setenv('ARTICLE_SUMMARY_PATH', str(tmp_path / 'summaries.sqlite3'))
+    monkeypatch.setenv('ANSWER_CACHE', '0')
+    llm = CountingLLM()
+    monkeypatch.setattr(service, 'get_default_llm', lambda: llm)
+    return llm
+
+
+def _key(template_hash='h1', article='38'):
+    return SummaryKey(TEMPLATE, article, 'google:models/test', PROMPT_VERSION, template_hash)
+
+
+def test_store_only_hits_matching_template_hash(tmp_path):
+    store = ArticleSummaryStore(str(tmp_path / 's.sqlite3'))
+    store.put(_key('h1'), '  特休規定摘要 ')
+    assert store.get(_key('h1')) == '特休規定摘要'
+    # 模板內容改變後舊摘要不再命中，並可清除
+    assert store.get(_key('h2')) is None
+    assert store.purge_stale(TEMPLATE, 'h2') == 1
+    assert store.stats()['entries'] == 0
+
+
+def test_echo_answers_are_never_keyed():
+    assert summary_key(TEMPLATE, '38', EchoLLM()) is None
+    assert summary_key('missing_template', '38', CountingLLM()) is None
+
+
+def test_article_question_is_served_from_store_after_first_answer(summaries):
+    first = service.answer_with_rag('勞基法第38條是什麼', None)
+    assert summaries.calls == 1 and first.answer.startswith('摘要：第')
+    again = asyncio.run(service.aanswer_with_rag('第三十八條特休怎麼算', None))
+    events = list(service.stream_answer_with_rag('請說明第 38 條', None))
+    assert summaries.calls == 1
+    assert again.answer == first.answer
+    assert ''.join(data['text'] for name, data in events if name == 'delta') == first.answer
+    assert again.sources[0].article_reference == '勞基法第38條'
+
+
+def test_streamed_summary_is_stored(summaries):
+    events = list(service.stream_answer_with_rag('第39條', None))
+    streamed = ''.join(data['text'] for name, data in events if name == 'delta')
+    assert service.answer_with_rag('第39條', None).answer == streamed
+    assert summaries.calls == 1
+
+
+def test_failed_generation_falls_back_without_storing(summaries):
+    summaries.fail = True
+    assert '示範模式' in service.answer_with_rag('第38條', None).answer
+    summaries.fail = False
+    service.answer_with_rag('第38條', None)
+    assert summaries.calls == 2
+
+
+def test_warmup_generates_missing_articles_once(summaries):
+    stats = warm_article_summaries(TEMPLATE, summaries, articles=['38', '39', '９-１'])
+    assert (stats.articles, stats.generated, stats.cached, stats.failed) == (3, 3, 0, 0)
+    again = warm_article_summaries(TEMPLATE, summaries)
+    assert again.cached == 3 and again.generated == again.articles - 3
+    assert summaries.calls == again.articles
+
+
+def test_template_change_invalidates(monkeypatch, summaries):
+    service.answer_with_rag('第38條', None)
+    monkeypatch.setattr(article_summaries, 'template_content_hash', lambda tid: 'edited')
+    service.answer_with_rag('第38條', None)
+    assert summaries.calls == 2
+
+
+def test_router_summaries_are_keyed_by_the_answering_provider(monkeypatch, summaries):
+    failing, fast = CountingLLM(fail=True, provider='openai'), CountingLLM()
+    router = LLMRouter([failing, fast], RouterConfig(hedge=False))
+    monkeypatch.setattr(service, 'get_default_llm', lambda: router)
+    answer = service.answer_with_rag('第38條', None).answer
+    # 失敗轉送後由 google 回答，摘要存在 google 的鍵下，不是路由器的組合名稱
+    store = article_summaries.get_article_summary_store()
+    assert store.existing(TEMPLATE, 'google:models/test', article_summaries.template_content_hash(TEMPLATE)) == {'38'}
+    # 改變路由中的供應商組合後仍命中
+    monkeypatch.setattr(service, 'get_default_llm', lambda: LLMRouter([CountingLLM(provider='openai'), fast], RouterConfig(hedge=False)))
+    assert service.answer_with_rag('第38條', None).answer == answer
+    monkeypatch.setattr(service, 'get_default_llm', lambda: fast)
+    assert service.answer_with_rag('第38條', None).answer == answer
+    assert fast.calls == 1
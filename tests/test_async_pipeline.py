@@ -0,0 +1,26 @@
+import asyncio
+
+from asgiref.sync import iscoroutinefunction
+
+from backend.apps.common.rate_limit import RateLimitMiddleware
+from backend.apps.rag.llm_providers import BaseLLM, EchoLLM
+
+
+def test_rate_limit_middleware_keeps_async_chain_async():
+    async def get_response(request):
+        return 'ok'
+
+    assert iscoroutinefunction(RateLimitMiddleware(get_response))
+
+
+def test_base_agenerate_offloads_sync_generate():
+    class SyncOnly(BaseLLM):
+        def generate(self, prompt):
+            return prompt.upper()
+
+    assert asyncio.run(SyncOnly().agenerate('abc')) == 'ABC'
+
+
+def test_echo_agenerate_matches_generate():
+    prompt = '用戶問題: 加班費'
+    assert asyncio.run(EchoLLM().agenerate(prompt)) == EchoLLM().generate(prompt)
@@ -0,0 +1,52 @@
+from pathlib import Path
+
+from backend.apps.rag.ingest import iter_chunks
+
+TEMPLATE = Path(__file__).resolve().parent.parent / 'backend' / 'templates' / 'labor_standards_act.txt'
+
+
+def test_chunks_are_exact_source_spans_with_original_punctuation():
+    text = '第 1 條\n勞工請假！可以嗎？\n可以；但須申請。\n'
+    chunks = list(iter_chunks([text]))
+    assert len(chunks) == 1
+    c = chunks[0]
+    assert text[c.start:c.end] == c.text == text.strip()
+    assert '！' in c.text and '？' in c.text and '；' in c.text
+
+
+def test_short_articles_are_packed_without_splitting_an_article():
+    articles = [f'第 {i} 條\n' + f'第{i}條的內容，說明權利義務。' * 8 + '\n' for i in range(1, 9)]
+    text = ''.join(articles)
+    chunks = list(iter_chunks([text], chunk_size=300))
+    assert len(chunks) < len(articles)
+    for c in chunks:
+        assert c.text.startswith('第 ') and c.text.endswith('。')
+    assert [a for c in chunks for a in c.articles] == [str(i) for i in range(1, 9)]
+
+
+def test_chapter_heading_starts_the_chunk_of_its_first_article():
+    text = '第 1 條\n' + '甲' * 250 + '。\n第 二 章 勞動契約\n第 9 條\n' + '乙' * 250 + '。\n'
+    chunks = list(iter_chunks([text], chunk_size=300))
+    assert [c.articles for c in chunks] == [('1',), ('9',)]
+    assert chunks[1].text.startswith('第 二 章')
+
+
+def test_long_article_is_split_at_sentences_with_overlap():
+    body = ''.join(f'第{i}句說明工資計算方式。' for i in range(100))
+    text = '第 24 條\n' + body
+    chunks = list(iter_chunks([text], chunk_size=200, overlap=50))
+    assert len(chunks) > 1
+    assert all(c.article == '24' and len(c.text) <= 200 for c in chunks)
+    for prev, nxt in zip(chunks, chunks[1:]):
+        assert 0 < prev.end - nxt.start <= 50
+        assert nxt.text.startswith('第') and nxt.text.endswith('。')
+
+
+def test_labor_standards_act_has_fewer_chunks_without_duplicated_text():
+    text = TEMPLATE.read_text(encoding='utf-8')
+    chunks = list(iter_chunks(text.splitlines(keepends=True)))
+    assert all(text[c.start:c.end] == c.text for c in chunks)
+    assert all(c.article for c in chunks)
+    # 舊版 600/150 重疊窗切出 36 塊、共約 21000 字
+    assert len(chunks) < 36
+    assert sum(len(c.text) for c in chunks) < len(text) * 1.05
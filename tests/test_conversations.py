@@ -0,0 +1,47 @@
+import pytest
+
+from backend.apps.rag.conversations import MemoryConversationStore, SQLiteConversationStore
+
+LIMITS = {'ttl_seconds': 100, 'max_turns': 4, 'max_sessions': 2}
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryConversationStore(**LIMITS)
+    return SQLiteConversationStore(str(tmp_path / 'conversations.sqlite3'), **LIMITS)
+
+
+def _exchange(i):
+    return [('user', f'q{i}'), ('assistant', f'a{i}')]
+
+
+def test_keeps_only_the_latest_turns(store):
+    for i in range(3):
+        store.append('c1', _exchange(i), now=10 + i)
+    assert store.get('c1', now=20) == _exchange(1) + _exchange(2)
+    assert store.get('missing', now=20) is None
+
+
+def test_conversation_expires_after_ttl_since_last_write(store):
+    store.append('c1', _exchange(0), now=0)
+    store.append('c1', _exchange(1), now=90)
+    assert store.get('c1', now=150) == _exchange(0) + _exchange(1)
+    assert store.get('c1', now=191) is None
+    # 過期後再寫入視為新對話
+    store.append('c1', _exchange(2), now=200)
+    assert store.get('c1', now=200) == _exchange(2)
+
+
+def test_purge_evicts_expired_and_least_recent_sessions(store):
+    store.append('old', _exchange(0), now=0)
+    for i, cid in enumerate(['a', 'b', 'c']):
+        store.append(cid, _exchange(i), now=50 + i)
+    store.purge(now=120)
+    assert [store.get(cid, now=120) is not None for cid in ['old', 'a', 'b', 'c']] == [False, False, True, True]
+
+
+def test_delete(store):
+    store.append('c1', _exchange(0), now=0)
+    store.delete('c1')
+    assert store.get('c1', now=0) is None
@@ -0,0 +1,61 @@
+import numpy as np
+
+from backend.apps.rag.embedding_cache import EmbeddingCache
+from backend.apps.rag.vectorstore import LocalEmbedding
+
+
+class CountingEmbedder:
+    embedder_id = 'counting-v1'
+
+    def __init__(self):
+        self.inner = LocalEmbedding(dimension=32)
+        self.calls = 0
+        self.texts = 0
+
+    def embed(self, texts):
+        self.calls += 1
+        self.texts += len(texts)
+        return self.inner.embed(texts)
+
+
+def test_reingest_unchanged_texts_does_zero_embedding_calls(tmp_path):
+    path = str(tmp_path / 'cache.sqlite3')
+    texts = ['第1條 目的', '第2條 定義', '第1條 目的']
+    embedder = CountingEmbedder()
+
+    first = EmbeddingCache(path).embed(embedder, texts)
+    assert embedder.calls == 1 and embedder.texts == 2  # duplicate text embedded once
+
+    # 模擬重新啟動：新的快取實例讀同一個檔案
+    cache = EmbeddingCache(path)
+    second = cache.embed(embedder, texts)
+    assert embedder.calls == 1
+    assert np.array_equal(first, second)
+    assert cache.stats()['hits'] == 3
+    assert cache.stats()['misses'] == 0
+
+
+def test_partial_hits_preserve_order(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / 'cache.sqlite3'))
+    embedder = CountingEmbedder()
+    cache.embed(embedder, ['a', 'c'])
+    out = cache.embed(embedder, ['a', 'b', 'c'])
+    assert embedder.texts == 3
+    assert np.array_equal(out, embedder.inner.embed(['a', 'b', 'c']))
+    assert cache.stats()['hits'] == 2 and cache.stats()['misses'] == 3
+
+
+def test_eviction_bounds_entries(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / 'cache.sqlite3'), max_entries=10)
+    embedder = CountingEmbedder()
+    for i in range(5):
+        cache.embed(embedder, [f'text-{i}-{j}' for j in range(4)])
+    assert cache.stats()['entries'] <= 10
+
+
+def test_empty_batch_returns_empty_matrix_without_embedding(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / 'cache.sqlite3'))
+    embedder = CountingEmbedder()
+    out = cache.embed(embedder, [])
+    assert out.shape[0] == 0 and out.dtype == np.float32
+    assert embedder.calls == 0
@@ -0,0 +1,70 @@
+import asyncio
+import random
+
+import pytest
+
+from backend.apps.rag.fake_llm import DEFAULT_ANSWER, FakeLLMConfig, LatencyModel, start_fake_llm_server
+from backend.apps.rag.llm_providers import GoogleAiStudioLLM
+from backend.apps.rag.vectorstore import GoogleEmbedding
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    servers = []
+
+    def start(**kwargs):
+        server = start_fake_llm_server(FakeLLMConfig(seed=1, **kwargs))
+        servers.append(server)
+        monkeypatch.setenv('GOOGLE_API_ENDPOINT', server.url)
+        monkeypatch.setenv('GOOGLE_API_KEY', 'fake-key')
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.mark.parametrize('dist', ['fixed', 'uniform', 'normal', 'exponential', 'lognormal'])
+def test_latency_model_mean(dist):
+    model = LatencyModel(dist, mean_ms=100, spread=0.5)
+    rng = random.Random(7)
+    samples = [model.sample(rng) for _ in range(20000)]
+    assert min(samples) >= 0
+    assert sum(samples) / len(samples) == pytest.approx(0.1, rel=0.05)
+
+
+def test_unknown_distribution_is_rejected():
+    with pytest.raises(ValueError):
+        LatencyModel('pareto', 10)
+
+
+def test_google_provider_generates_and_streams_through_fake_server(fake_llm):
+    server = fake_llm(stream_chunks=4)
+    llm = GoogleAiStudioLLM(api_key='fake-key', model='gemini-test')
+    assert llm.generate('用戶問題: 加班費') == DEFAULT_ANSWER
+    assert asyncio.run(llm.agenerate('用戶問題: 加班費')) == DEFAULT_ANSWER
+    pieces = list(llm.stream('用戶問題: 加班費'))
+    assert len(pieces) == 4 and ''.join(pieces) == DEFAULT_ANSWER
+    assert server.stats() == {'generateContent': 2, 'streamGenerateContent': 1}
+
+
+def test_injected_errors_fall_back_to_echo(fake_llm):
+    server = fake_llm(error_rate=1.0)
+    answer = GoogleAiStudioLLM(api_key='fake-key', model='gemini-test').generate('用戶問題: 特休')
+    assert '示範模式' in answer
+    assert server.stats()['generateContent.error'] >= 1
+
+
+def test_google_embedding_uses_fake_server(fake_llm):
+    server = fake_llm()
+    embedder = GoogleEmbedding('models/text-embedding-004', batch_size=2, concurrency=1)
+    vectors = embedder.embed(['工資', '工時', '特休'])
+    assert len(vectors) == 3 and all(len(v) == 768 for v in vectors)
+    assert server.stats() == {'batchEmbedContents': 2}
+
+
+def test_readiness_check_hits_model_endpoint(fake_llm):
+    server = fake_llm()
+    GoogleAiStudioLLM(api_key='fake-key', model='gemini-test').warm(check=True)
+    assert server.stats() == {'getModel': 1}
@@ -0,0 +1,70 @@
+import threading
+import time
+
+import pytest
+
+from backend.apps.rag.vectorstore import GoogleEmbedding
+
+
+class FakeEmbeddingClient:
+    """模擬 genai.embed_content：可注入延遲與前 N 次失敗。"""
+
+    def __init__(self, latency=0.0, fail_first=0):
+        self.latency = latency
+        self.fail_first = fail_first
+        self.calls = 0
+        self.batch_sizes = []
+        self._lock = threading.Lock()
+
+    def embed_content(self, model, content):
+        with self._lock:
+            self.calls += 1
+            call_no = self.calls
+            self.batch_sizes.append(len(content))
+        if self.latency:
+            time.sleep(self.latency)
+        if call_no <= self.fail_first:
+            raise ConnectionError('transient')
+        return {'embedding': [[float(len(t)), float(ord(t[-1]))] for t in content]}
+
+
+def _make(client, **kwargs):
+    emb = GoogleEmbedding('models/fake', client=client, **kwargs)
+    emb._sleep = lambda s: None
+    return emb
+
+
+def test_batches_preserve_input_order():
+    texts = [f'text-{i:03d}' + chr(0x4e00 + i) for i in range(95)]
+    client = FakeEmbeddingClient(latency=0.001)
+    vectors = _make(client, batch_size=10, concurrency=4).embed(texts)
+    assert client.batch_sizes.count(10) == 9 and 5 in client.batch_sizes
+    assert vectors == [[float(len(t)), float(ord(t[-1]))] for t in texts]
+
+
+def test_transient_failure_is_retried_per_batch():
+    client = FakeEmbeddingClient(fail_first=2)
+    vectors = _make(client, batch_size=4, concurrency=1, max_retries=3).embed(['a', 'b', 'c'])
+    assert len(vectors) == 3
+    assert client.calls == 3
+
+
+def test_gives_up_after_max_retries():
+    client = FakeEmbeddingClient(fail_first=10)
+    with pytest.raises(ConnectionError):
+        _make(client, max_retries=2).embed(['a'])
+    assert client.calls == 3
+
+
+def test_concurrency_speeds_up_many_batches():
+    texts = [str(i) for i in range(16)]
+    serial_client = FakeEmbeddingClient(latency=0.02)
+    t0 = time.perf_counter()
+    _make(serial_client, batch_size=1, concurrency=1).embed(texts)
+    serial = time.perf_counter() - t0
+
+    parallel_client = FakeEmbeddingClient(latency=0.02)
+    t0 = time.perf_counter()
+    _make(parallel_client, batch_size=1, concurrency=8).embed(texts)
+    parallel = time.perf_counter() - t0
+    assert parallel < serial / 2
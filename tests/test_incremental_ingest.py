@@ -0,0 +1,113 @@
+from backend.apps.rag.ingest import ingest_text, split_text
+from backend.apps.rag.templates_registry import load_template_text
+
+
+class FakeStore:
+    """記錄 upsert/delete 呼叫的記憶體向量庫。"""
+
+    def __init__(self):
+        self.rows = {}
+        self.upserted = []
+        self.moved = []
+        self.deleted = []
+
+    def get_chunk_metadata(self, document_id):
+        return {cid: dict(meta) for cid, (meta, _) in self.rows.items() if meta['document_id'] == document_id}
+
+    def update_metadata(self, ids, metadatas):
+        self.moved.extend(ids)
+        for cid, meta in zip(ids, metadatas):
+            self.rows[cid] = (meta, self.rows[cid][1])
+
+    def upsert(self, ids, texts, metadatas=None):
+        self.upserted.extend(ids)
+        for cid, text, meta in zip(ids, texts, metadatas):
+            self.rows[cid] = (meta, text)
+
+    def delete(self, ids):
+        self.deleted.extend(ids)
+        for cid in ids:
+            self.rows.pop(cid, None)
+
+
+def _doc(n, edit=None):
+    lines = [f'第{i}條 勞工每日正常工作時間不得超過八小時，此為第{i}段的測試內容。' for i in range(n)]
+    if edit is not None:
+        lines[edit] = lines[edit].replace('八小時', '十小時')
+    return '\n'.join(lines)
+
+
+def test_reingest_unchanged_document_touches_nothing():
+    store = FakeStore()
+    first = ingest_text('doc', _doc(80), store=store)
+    assert first.added == first.chunks and first.upserts == first.chunks
+    store.upserted.clear()
+
+    again = ingest_text('doc', _doc(80), store=store)
+    assert again.unchanged == again.chunks
+    assert again.added == again.updated == again.deleted == 0
+    assert store.upserted == []
+
+
+def test_edit_only_upserts_changed_chunks():
+    store = FakeStore()
+    ingest_text('doc', _doc(80), store=store)
+    store.upserted.clear()
+
+    stats = ingest_text('doc', _doc(80, edit=79), store=store)
+    assert stats.updated >= 1
+    assert stats.updated + stats.added <= 2
+    assert len(store.upserted) == stats.upserts
+
+
+def test_shrunk_document_deletes_stale_tail():
+    store = FakeStore()
+    ingest_text('doc', _doc(80), store=store)
+    ingest_text('other', _doc(5), store=store)
+    n_small = len(split_text(_doc(20)))
+
+    stats = ingest_text('doc', _doc(20), store=store)
+    assert stats.deleted > 0
+    assert sorted(k for k in store.rows if k.startswith('doc:')) == sorted(f'doc:{i}' for i in range(n_small))
+    assert any(k.startswith('other:') for k in store.rows)
+
+
+def test_insert_near_top_only_moves_later_chunks():
+    store = FakeStore()
+    text = load_template_text('labor_standards_act')
+    ingest_text('law', text, store=store)
+    store.upserted.clear()
+
+    edited = text[:100] + '一' + text[100:]
+    stats = ingest_text('law', edited, store=store)
+    assert stats.upserts == 1 and len(store.upserted) == 1
+    assert stats.moved == stats.chunks - 1 == len(store.moved)
+    # 位置已更新為新原文中的位置
+    for meta, chunk_text in store.rows.values():
+        assert edited[meta['start']:meta['end']] == chunk_text
+
+
+def test_inserted_or_removed_article_keeps_ids_of_shifted_chunks():
+    store = FakeStore()
+    text = load_template_text('labor_standards_act')
+    ingest_text('law', text, store=store)
+    before = {meta['content_hash']: cid for cid, (meta, _) in store.rows.items()}
+    store.upserted.clear()
+
+    # 在開頭附近插入一整條長條文：後面每個 chunk 的位置序號都改變，但內容相同的 chunk 沿用原 id
+    head = text.index('第 2 條')
+    inserted = text[:head] + '第 1-1 條\n' + '本條為測試插入的新條文。' * 80 + '\n' + text[head:]
+    stats = ingest_text('law', inserted, store=store)
+    assert stats.chunks > len(before)
+    assert stats.upserts == len(store.upserted) <= 3
+    assert stats.moved >= stats.chunks - 3
+    after = {meta['content_hash']: cid for cid, (meta, _) in store.rows.items()}
+    assert all(after[h] == cid for h, cid in before.items() if h in after)
+    for meta, chunk_text in store.rows.values():
+        assert inserted[meta['start']:meta['end']] == chunk_text
+    assert sorted(meta['chunk'] for meta, _ in store.rows.values()) == list(range(stats.chunks))
+
+    store.upserted.clear()
+    removed = ingest_text('law', text, store=store)
+    assert removed.upserts == len(store.upserted) <= 1
+    assert len(store.rows) == removed.chunks == len(before)
@@ -0,0 +1,125 @@
+import sqlite3
+import threading
+
+import pytest
+
+from backend.apps.rag import vectorstore
+from backend.apps.rag.ingest import ingest_text
+from backend.apps.rag.jobs import IngestJobQueue, QueueFull
+from backend.apps.rag.vectorstore import ChromaVectorStore, VSConfig
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    monkeypatch.delenv('GOOGLE_API_KEY', raising=False)
+    monkeypatch.setattr(vectorstore, '_ACTIVE', {})
+    return ChromaVectorStore(VSConfig(persist_dir=str(tmp_path / 'vectors')))
+
+
+def test_job_runs_in_background_with_local_embedder(store, tmp_path):
+    queue = IngestJobQueue(str(tmp_path / 'jobs.sqlite3'), ingest_fn=lambda doc_id, text: ingest_text(doc_id, text, store=store))
+    job_id = queue.submit([('a', '第1條 勞工特別休假。'), ('b', '第2條 延長工時工資。')])
+    assert queue.get(job_id)['state'] in ('queued', 'running')
+
+    job = queue.wait(job_id)
+    assert job['state'] == 'completed'
+    assert [d['state'] for d in job['documents']] == ['done', 'done']
+    assert job['documents'][0]['added'] == job['documents'][0]['chunks'] >= 1
+    assert store.query('延長工時', top_k=1)[0]['metadata']['document_id'] == 'b'
+    queue.stop()
+
+
+def test_failed_document_is_reported_per_document(tmp_path):
+    def ingest(doc_id, text):
+        if doc_id == 'bad':
+            raise ValueError('boom')
+        return ingest_text(doc_id, text, store=_NullStore())
+
+    queue = IngestJobQueue(str(tmp_path / 'jobs.sqlite3'), ingest_fn=ingest)
+    job = queue.wait(queue.submit([('ok', '內容'), ('bad', '內容')]))
+    assert job['state'] == 'failed'
+    assert job['completed'] == 1 and job['failed'] == 1
+    assert job['documents'][1]['error'] == 'boom'
+    queue.stop()
+
+
+def test_backpressure_when_queue_is_full(tmp_path):
+    release = threading.Event()
+
+    def slow(doc_id, text):
+        release.wait(5)
+        return ingest_text(doc_id, text, store=_NullStore())
+
+    queue = IngestJobQueue(str(tmp_path / 'jobs.sqlite3'), workers=1, max_depth=2, ingest_fn=slow)
+    first = queue.submit([('a', 'x')])
+    queue.submit([('b', 'y')])
+    with pytest.raises(QueueFull):
+        queue.submit([('c', 'z')])
+    release.set()
+    assert queue.wait(first)['state'] == 'completed'
+    queue.submit([('c', 'z')])
+    queue.stop()
+
+
+def test_interrupted_job_resumes_after_restart(tmp_path):
+    path = str(tmp_path / 'jobs.sqlite3')
+    seen = []
+    release = threading.Event()
+
+    def stuck(doc_id, text):
+        release.wait(5)
+        raise RuntimeError('worker died')
+
+    crashed = IngestJobQueue(path, workers=1, ingest_fn=stuck)
+    job_id = crashed.submit([('a', 'x'), ('b', 'y')])
+    while crashed.get(job_id)['state'] != 'running':
+        pass
+    crashed._stopping = True
+    crashed._stopped.set()
+    # 模擬 worker 程序已結束：不再續約，租約到期；PID 被其他存活的程序重複使用也不影響判斷
+    with sqlite3.connect(path) as conn:
+        conn.execute('UPDATE jobs SET lease_until = 0 WHERE job_id = ?', (job_id,))
+
+    def ok(doc_id, text):
+        seen.append(doc_id)
+        return ingest_text(doc_id, text, store=_NullStore())
+
+    restarted = IngestJobQueue(path, ingest_fn=ok)
+    job = restarted.wait(job_id)
+    assert job['state'] == 'completed'
+    assert seen == ['a', 'b']
+    release.set()
+    restarted.stop()
+
+
+def test_live_lease_is_not_taken_over(tmp_path):
+    path = str(tmp_path / 'jobs.sqlite3')
+    release = threading.Event()
+
+    def slow(doc_id, text):
+        release.wait(5)
+        return ingest_text(doc_id, text, store=_NullStore())
+
+    owner = IngestJobQueue(path, workers=1, ingest_fn=slow, lease_seconds=3)
+    job_id = owner.submit([('a', 'x')])
+    while owner.get(job_id)['state'] != 'running':
+        pass
+    # 另一個 worker 程序啟動並輪詢：租約仍有效，不得重新排隊
+    other = IngestJobQueue(path, workers=1, ingest_fn=slow, poll_interval=0.05)
+    assert other._claim() is None
+    assert owner.get(job_id)['state'] == 'running'
+    release.set()
+    assert owner.wait(job_id)['state'] == 'completed'
+    owner.stop()
+    other.stop()
+
+
+class _NullStore:
+    def get_chunk_metadata(self, document_id):
+        return {}
+
+    def upsert(self, ids, texts, metadatas=None):
+        pass
+
+    def delete(self, ids):
+        pass
@@ -0,0 +1,72 @@
+from backend.apps.rag.corpus import bump_corpus_generation
+from backend.apps.rag.lexical_index import LexicalIndex, reciprocal_rank_fusion, tokenize
+from backend.apps.rag.service import RetrievedChunk, _filter_and_rank_contexts
+
+
+def test_tokenize_cjk_bigrams_and_latin_tokens():
+    assert tokenize('特別休假 API v2') == ['特別', '別休', '休假', 'api', 'v2']
+    assert tokenize('第38條') == ['第', '38', '條']
+
+
+def test_bm25_ranks_exact_terms_and_filters_documents(tmp_path):
+    index = LexicalIndex(str(tmp_path / 'lexical.sqlite3'))
+    index.upsert(
+        ['a:0', 'a:1', 'b:0'],
+        ['勞工特別休假之日數', '工資應全額直接給付勞工', '特別休假 特別休假 未休完應發給工資'],
+        ['a', 'a', 'b'],
+    )
+    hits = index.search('特別休假', limit=10)
+    assert [cid for cid, _ in hits][:2] == ['b:0', 'a:0']
+    assert 'a:1' not in dict(hits)
+
+    assert [cid for cid, _ in index.search('特別休假', document_ids=['a'])] == ['a:0']
+
+    index.delete(['b:0'])
+    assert [cid for cid, _ in index.search('特別休假')] == ['a:0']
+
+
+def test_index_reloads_when_another_process_writes(tmp_path):
+    path = str(tmp_path / 'lexical.sqlite3')
+    reader = LexicalIndex(path)
+    assert reader.search('延長工時') == []
+
+    LexicalIndex(path).upsert(['c:0'], ['延長工時之工資'], ['c'])
+    bump_corpus_generation(str(tmp_path))
+    assert [cid for cid, _ in reader.search('延長工時')] == ['c:0']
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([['x', 'y', 'z'], ['y', 'w']], k=60)
+    assert fused[0][0] == 'y'
+    assert {cid for cid, _ in fused} == {'x', 'y', 'z', 'w'}
+
+
+def test_ranked_contexts_skip_regex_rerank():
+    contexts = [
+        RetrievedChunk(id='1', document_id=None, text='無關內容', score=0.03),
+        RetrievedChunk(id='2', document_id=None, text='特別休假', score=0.02),
+    ]
+    assert [c.id for c in _filter_and_rank_contexts('特別休假', contexts)] == ['1', '2']
+
+
+def test_local_writes_update_memory_without_full_reload(tmp_path):
+    index = LexicalIndex(str(tmp_path / 'lexical.sqlite3'))
+    index.upsert(['a:0', 'a:1'], ['勞工特別休假之日數', '延長工時之工資'], ['a', 'a'])
+    bump_corpus_generation(str(tmp_path))
+    assert [cid for cid, _ in index.search('特別休假')] == ['a:0']
+    assert index.reloads == 1
+
+    # 同一程序寫入後 bump（與 ChromaVectorStore.upsert 相同）：差異直接套用，不重新載入
+    index.upsert(['a:0', 'b:0'], ['工資應全額給付', '特別休假未休完應發給工資'], ['a', 'b'])
+    bump_corpus_generation(str(tmp_path))
+    assert [cid for cid, _ in index.search('特別休假')] == ['b:0']
+    index.delete(['a:1'])
+    bump_corpus_generation(str(tmp_path))
+    assert [cid for cid, _ in index.search('工資')] in (['a:0', 'b:0'], ['b:0', 'a:0'])
+    assert index.reloads == 1
+
+    # 記憶體內容與重新載入的結果一致
+    fresh = LexicalIndex(index.path)
+    assert fresh.search('工資') == index.search('工資')
+    assert fresh.stats()['chunks'] == index.stats()['chunks'] == 2
+    assert fresh.stats()['terms'] == index.stats()['terms']
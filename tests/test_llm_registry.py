@@ -0,0 +1,120 @@
+import asyncio
+import threading
+
+from backend.apps.rag import llm_providers
+from backend.apps.rag.llm_providers import (
+    EchoLLM,
+    GoogleAiStudioLLM,
+    LLMRegistry,
+    ProviderLimits,
+    configure_genai,
+)
+
+
+class _BlockingModel:
+    """generate_content 會卡住直到 release 被設定，用來佔住呼叫名額。"""
+
+    def __init__(self):
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def generate_content(self, prompt, request_options=None, stream=False):
+        self.entered.set()
+        self.release.wait(5)
+        return type('Resp', (), {'text': 'pooled answer'})()
+
+
+def _fallbacks(reason):
+    # llm_providers 以 apps.common.metrics 匯入，需用同一個 counter 物件
+    return llm_providers.LLM_FALLBACKS.value('google', reason)
+
+
+def test_limits_read_provider_then_global_env(monkeypatch):
+    monkeypatch.setenv('LLM_TIMEOUT_SECONDS', '12')
+    monkeypatch.setenv('LLM_MAX_CONCURRENCY', '3')
+    monkeypatch.setenv('LLM_GOOGLE_MAX_CONCURRENCY', '7')
+    assert ProviderLimits.from_env('google') == ProviderLimits(timeout_seconds=12.0, max_concurrency=7)
+
+
+def test_configure_genai_only_once_per_config(monkeypatch):
+    import google.generativeai as genai
+
+    calls = []
+    monkeypatch.setattr(genai, 'configure', lambda **kwargs: calls.append(kwargs))
+    monkeypatch.setattr(llm_providers, '_GENAI_CONFIGURED', None)
+    monkeypatch.delenv('GOOGLE_API_ENDPOINT', raising=False)
+    for _ in range(3):
+        configure_genai('key-a')
+    configure_genai('key-b')
+    assert [c['api_key'] for c in calls] == ['key-a', 'key-b']
+
+
+def test_registry_reuses_client_per_configuration(monkeypatch):
+    registry = LLMRegistry()
+    monkeypatch.delenv('GOOGLE_API_KEY', raising=False)
+    assert isinstance(registry.default(), EchoLLM)
+    monkeypatch.setenv('GOOGLE_API_KEY', 'key-a')
+    first = registry.default()
+    assert isinstance(first, GoogleAiStudioLLM) and registry.default() is first
+    monkeypatch.setenv('GEMINI_MODEL', 'gemini-other')
+    assert registry.default() is not first
+
+
+def test_concurrency_limit_falls_back_when_saturated(monkeypatch):
+    monkeypatch.delenv('GOOGLE_API_ENDPOINT', raising=False)
+    llm = GoogleAiStudioLLM(api_key='k', model='m', limits=ProviderLimits(timeout_seconds=0.05, max_concurrency=1))
+    llm._model = model = _BlockingModel()
+    before = _fallbacks('overloaded')
+    holder = threading.Thread(target=llm.generate, args=('first',))
+    holder.start()
+    assert model.entered.wait(5)
+    assert '示範模式' in llm.generate('second')
+    assert '示範模式' in asyncio.run(llm.agenerate('third'))
+    model.release.set()
+    holder.join(5)
+    assert _fallbacks('overloaded') == before + 2
+    # 名額釋放後恢復正常
+    assert llm.generate('fourth') == 'pooled answer'
+
+
+def test_warm_failure_is_reported_not_raised(monkeypatch):
+    registry = LLMRegistry()
+    monkeypatch.setenv('GOOGLE_API_KEY', 'key-a')
+
+    def boom(check=False):
+        raise RuntimeError('endpoint unreachable')
+
+    monkeypatch.setattr(registry.default(), 'warm', boom)
+    status = registry.warm(check=True)
+    assert status['provider'] == 'google' and status['ready'] is False
+    assert 'unreachable' in status['error']
+    assert registry.status() == status
+
+
+def test_google_async_client_is_created_per_event_loop(monkeypatch):
+    from google.ai import generativelanguage as glm
+
+    monkeypatch.delenv('GOOGLE_API_ENDPOINT', raising=False)
+    created = []
+
+    class FakeAsyncClient:
+        def __init__(self, client_options=None):
+            self.loop = asyncio.get_running_loop()
+            created.append(self)
+
+        async def generate_content(self, request=None, timeout=None):
+            # grpc.aio channel 只能在建立它的 loop 上使用
+            assert asyncio.get_running_loop() is self.loop
+            text = request.contents[0].parts[0].text
+            return glm.GenerateContentResponse(candidates=[{'content': {'parts': [{'text': f'答：{text}'}]}}])
+
+    monkeypatch.setattr(glm, 'GenerativeServiceAsyncClient', FakeAsyncClient)
+    llm = GoogleAiStudioLLM(api_key='k', model='m')
+
+    async def twice(prompt):
+        return [await llm.acomplete(prompt), await llm.acomplete(prompt)]
+
+    # WSGI 下每個 async_to_sync 呼叫都是新的 event loop
+    assert asyncio.run(twice('一')) == ['答：一', '答：一']
+    assert asyncio.run(llm.acomplete('二')) == '答：二'
+    assert len(created) == 2
@@ -0,0 +1,158 @@
+import asyncio
+import time
+
+from backend.apps.rag import llm_providers, llm_router
+from backend.apps.rag.llm_providers import BaseLLM, LLMCallError, LLMRegistry
+from backend.apps.rag.llm_router import LLMRouter, ProviderStats, RouterConfig
+
+
+class ScriptedLLM(BaseLLM):
+    """依腳本回應的假供應商：每次呼叫取下一個延遲（秒），或拋出腳本中的 LLMCallError；腳本用完後重複最後一項。"""
+
+    def __init__(self, name, script):
+        self.provider = name
+        self.script = list(script)
+        self.calls = 0
+
+    def _next(self):
+        step = self.script[min(self.calls, len(self.script) - 1)]
+        self.calls += 1
+        return step
+
+    def complete(self, prompt):
+        step = self._next()
+        if isinstance(step, Exception):
+            raise step
+        time.sleep(step)
+        return f'{self.provider}: {prompt}'
+
+    async def acomplete(self, prompt):
+        step = self._next()
+        if isinstance(step, Exception):
+            raise step
+        await asyncio.sleep(step)
+        return f'{self.provider}: {prompt}'
+
+    def stream_raw(self, prompt):
+        step = self._next()
+        if isinstance(step, Exception):
+            raise step
+        yield f'{self.provider}: '
+        yield prompt
+
+
+def _router(*providers, **config):
+    config.setdefault('min_samples', 2)
+    config.setdefault('hedge', False)
+    return LLMRouter(providers, RouterConfig(**config))
+
+
+def test_routes_to_fastest_provider_after_sampling():
+    slow, fast = ScriptedLLM('slow', [0.03]), ScriptedLLM('fast', [0.001])
+    router = _router(slow, fast)
+    answers = [router.generate('q') for _ in range(6)]
+    # 未取樣的供應商先各試一次，之後都走較快者
+    assert answers[0] == 'slow: q' and answers[1:] == ['fast: q'] * 5
+    assert router.rank() == [1, 0]
+
+
+def test_hedges_to_runner_up_after_primary_p95():
+    counter = llm_router.LLM_HEDGES
+    primary, backup = ScriptedLLM('primary', [0.5]), ScriptedLLM('backup', [0.01])
+    router = _router(primary, backup, hedge=True, hedge_after_ms=50)
+    before = counter.value('backup')
+    started = time.perf_counter()
+    assert router.generate('q') == 'backup: q'
+    assert time.perf_counter() - started < 0.3
+    assert asyncio.run(router.agenerate('q')) == 'backup: q'
+    assert counter.value('backup') == before + 2
+
+
+def test_hedge_delay_tracks_primary_p95():
+    stats_primary = ScriptedLLM('primary', [0.0])
+    router = _router(stats_primary, ScriptedLLM('backup', [0.0]), hedge=True, hedge_after_ms=5000, min_samples=5)
+    assert router.hedge_delay(0) == 5.0
+    for latency in [0.01] * 18 + [0.2, 0.3]:
+        router._stats[0].record(latency)
+    assert router.hedge_delay(0) == 0.2
+
+
+def test_fails_over_and_demotes_unhealthy_provider():
+    broken, healthy = ScriptedLLM('broken', [LLMCallError('error')]), ScriptedLLM('healthy', [0.0])
+    router = _router(broken, healthy)
+    # 延遲相同時依設定順序，broken 先被嘗試，失敗立即改送 healthy
+    assert router.generate('q') == 'healthy: q'
+    assert asyncio.run(router.agenerate('q')) == 'healthy: q'
+    assert router.health()[0].error_rate == 1.0
+    assert router.rank() == [1, 0]
+    calls = broken.calls
+    router.generate('q')
+    assert broken.calls == calls
+
+
+def test_all_providers_failing_falls_back_to_echo():
+    router = _router(ScriptedLLM('a', [LLMCallError('error')]), ScriptedLLM('b', [LLMCallError('empty')]))
+    fallbacks = llm_providers.LLM_FALLBACKS
+    before = fallbacks.value('router', 'empty')
+    assert '示範模式' in router.generate('用戶問題: 加班費')
+    assert '示範模式' in asyncio.run(router.agenerate('用戶問題: 加班費'))
+    # 回報最後一個失敗原因
+    assert fallbacks.value('router', 'empty') == before + 2
+
+
+def test_stream_fails_over_before_first_chunk():
+    router = _router(ScriptedLLM('down', [LLMCallError('error')]), ScriptedLLM('up', [0.0]))
+    assert ''.join(router.stream('q')) == 'up: q'
+    assert router.health()[0].errors == 1 and router.health()[1].successes == 1
+
+
+def test_errors_expire_with_the_window():
+    now = [0.0]
+    stats = ProviderStats('p', window_seconds=10, window_size=100, clock=lambda: now[0])
+    stats.record(None)
+    stats.record(0.2)
+    assert stats.health().error_rate == 0.5
+    now[0] = 10.5
+    stats.record(0.1)
+    health = stats.health()
+    assert (health.calls, health.errors, health.p50) == (1, 0, 0.1)
+
+
+def test_registry_routes_when_several_providers_are_configured(monkeypatch):
+    monkeypatch.setenv('OPENAI_API_KEY', 'sk-test')
+    monkeypatch.setenv('GOOGLE_API_KEY', 'g-test')
+    monkeypatch.delenv('LLM_PROVIDER', raising=False)
+    llm = LLMRegistry().default()
+    assert isinstance(llm, LLMRouter)
+    assert [p.provider for p in llm.providers] == ['openai', 'google']
+    monkeypatch.setenv('LLM_PROVIDER', 'gemini')
+    assert LLMRegistry().default().provider == 'google'
+
+
+def test_async_losers_are_cancelled():
+    slow, fast = ScriptedLLM('slow', [0.5]), ScriptedLLM('fast', [0.001])
+    router = _router(slow, fast, hedge=True, hedge_after_ms=20)
+
+    async def run():
+        answer = await router.agenerate('q')
+        others = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        return answer, others
+
+    answer, others = asyncio.run(run())
+    assert answer == 'fast: q' and others and all(t.cancelled() for t in others)
+    # 被取消的呼叫不留下延遲樣本，慢的供應商不會因此看起來健康
+    assert router.health()[0].calls == 0
+
+
+def test_routed_requests_are_counted_once_per_provider_call(monkeypatch):
+    from backend.apps.rag import service
+
+    broken, healthy = ScriptedLLM('broken', [LLMCallError('error')]), ScriptedLLM('healthy', [0.0])
+    router = _router(broken, healthy)
+    monkeypatch.setenv('ANSWER_CACHE', '0')
+    monkeypatch.setattr(service, 'get_default_llm', lambda: router)
+    counter = service.LLM_REQUESTS
+    before = {name: counter.value(name) for name in ('router', 'broken', 'healthy')}
+    service.answer_with_rag('加班費怎麼算', None)
+    after = {name: counter.value(name) for name in before}
+    assert {name: after[name] - before[name] for name in before} == {'router': 0, 'broken': 1, 'healthy': 1}
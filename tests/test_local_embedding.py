@@ -0,0 +1,36 @@
+import hashlib
+import math
+
+import numpy as np
+
+from backend.apps.rag.vectorstore import LocalEmbedding
+
+
+def _legacy_vectorize(text, dimension=256):
+    s = ''.join(ch for ch in text.lower() if not ch.isspace())
+    tokens = list(s) + [s[i:i+2] for i in range(len(s) - 1)]
+    vec = [0.0] * dimension
+    for tok in tokens:
+        vec[int(hashlib.sha1(tok.encode('utf-8')).hexdigest(), 16) % dimension] += 1.0
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+
+def test_batch_embed_matches_legacy_vectors():
+    texts = ['第38條 特別休假', 'Overtime pay 加班費', '', '   ', '勞工']
+    out = LocalEmbedding().embed(texts)
+    assert out.dtype == np.float32
+    assert out.shape == (len(texts), 256)
+    expected = np.asarray([_legacy_vectorize(t) for t in texts], dtype=np.float32)
+    assert np.array_equal(out, expected)
+
+
+def test_rows_are_unit_norm_and_empty_is_zero():
+    out = LocalEmbedding().embed(['工資', ''])
+    assert abs(float(np.linalg.norm(out[0])) - 1.0) < 1e-6
+    assert not out[1].any()
+
+
+def test_embedder_id_is_versioned():
+    assert LocalEmbedding().embedder_id == 'local-hash-v1-d256'
+    assert LocalEmbedding(dimension=64).embedder_id == 'local-hash-v1-d64'
@@ -0,0 +1,67 @@
+import asyncio
+import threading
+
+import pytest
+
+from backend.apps.common.metrics import MetricsRegistry
+
+
+def test_counter_is_exact_across_threads_and_folds_finished_threads():
+    registry = MetricsRegistry()
+    counter = registry.counter('jobs_total', 'Jobs.', ('kind',))
+
+    def work():
+        for _ in range(10000):
+            counter.inc('a')
+
+    for _ in range(3):
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        # 已結束執行緒的分片在輸出時併入保留值
+        counter.value('a')
+    assert counter.value('a') == 240000
+    assert len(counter._shards) <= 1
+
+
+def test_histogram_under_asyncio_tasks_and_exposition_format():
+    registry = MetricsRegistry()
+    hist = registry.histogram('stage_seconds', 'Stage latency.', ('stage',), buckets=(0.1, 1.0))
+
+    async def main():
+        async def observe(v):
+            await asyncio.sleep(0)
+            hist.observe(v, 'embed')
+
+        await asyncio.gather(*(observe(v) for v in [0.05, 0.5, 0.5, 3.0] * 50))
+
+    asyncio.run(main())
+    text = registry.render()
+    assert '# TYPE stage_seconds histogram' in text
+    assert 'stage_seconds_bucket{stage="embed",le="0.1"} 50' in text
+    assert 'stage_seconds_bucket{stage="embed",le="1"} 150' in text
+    assert 'stage_seconds_bucket{stage="embed",le="+Inf"} 200' in text
+    assert 'stage_seconds_count{stage="embed"} 200' in text
+    assert 'stage_seconds_sum{stage="embed"} 202.5' in text
+
+
+def test_gauge_function_labels_are_escaped_and_errors_are_skipped():
+    registry = MetricsRegistry()
+    gauge = registry.gauge('collection_chunks', 'Chunks.', ('collection',))
+    gauge.set_function(lambda: [(('a"b',), 3)])
+    assert 'collection_chunks{collection="a\\"b"} 3' in registry.render()
+
+    gauge.set_function(lambda: 1 / 0)
+    assert '# TYPE collection_chunks gauge' in registry.render()
+
+
+def test_registry_rejects_conflicting_definitions_and_label_mismatch():
+    registry = MetricsRegistry()
+    counter = registry.counter('x_total', 'X.', ('a',))
+    assert registry.counter('x_total', 'X.', ('a',)) is counter
+    with pytest.raises(ValueError):
+        registry.histogram('x_total', 'X.', ('a',))
+    with pytest.raises(ValueError):
+        counter.inc()
@@ -0,0 +1,67 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from backend.apps.rag.microbench import (
+    BenchResult,
+    SuiteResults,
+    compare,
+    load_results,
+    measure,
+    parse_size,
+    run_suite,
+    synthetic_chunks,
+    write_results,
+)
+
+
+def _result(name, ops_per_sec, corpus=None):
+    return BenchResult(name, corpus, 10, ops_per_sec, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0)
+
+
+def test_parse_size():
+    assert [parse_size(s) for s in ('1k', '10K', '100k', '2m', '500')] == [1_000, 10_000, 100_000, 2_000_000, 500]
+    with pytest.raises(ValueError):
+        parse_size('0')
+
+
+def test_synthetic_chunks_are_deterministic():
+    a, b = synthetic_chunks(120), synthetic_chunks(120)
+    assert a == b
+    assert len({c['id'] for c in a}) == 120
+    assert all(c['text'].startswith('第 ') for c in a)
+
+
+def test_measure_reports_percentiles():
+    result = measure('noop', lambda: None, min_time=0.01, warmup=1)
+    assert result.ops >= 5
+    assert result.min_us <= result.p50_us <= result.p95_us <= result.p99_us <= result.max_us
+    assert result.ops_per_sec > 0
+
+
+def test_compare_flags_regression_beyond_threshold():
+    baseline = SuiteResults({'a': _result('a', 100.0), 'q[1k]': _result('q', 50.0, '1k')})
+    current = SuiteResults({'a': _result('a', 85.0), 'q[1k]': _result('q', 30.0, '1k'), 'new': _result('new', 1.0)})
+    by_key = {c.key: c for c in compare(current, baseline, threshold=0.2)}
+    assert set(by_key) == {'a', 'q[1k]'}
+    assert not by_key['a'].regressed
+    assert by_key['q[1k]'].regressed and by_key['q[1k]'].change == -0.4
+
+
+def test_results_round_trip(tmp_path):
+    suite = SuiteResults({'q[1k]': _result('q', 50.0, '1k')}, {'python': '3'})
+    write_results(suite, tmp_path / 'out.json')
+    loaded = load_results(tmp_path / 'out.json')
+    assert loaded.results['q[1k]'] == suite.results['q[1k]'] and loaded.meta == suite.meta
+
+
+@pytest.mark.benchmark
+def test_suite_on_1k_corpus(tmp_path):
+    suite = run_suite([1_000], min_time=float(os.getenv('RAG_BENCH_MIN_TIME', '0.2')), root=tmp_path)
+    assert {'embed.vectorize', 'service.build_prompt', 'vectorstore.query[1k]', 'service.answer_with_rag[1k]'} <= set(suite.results)
+    baseline = os.getenv('RAG_BENCH_BASELINE')
+    if baseline:
+        threshold = float(os.getenv('RAG_BENCH_THRESHOLD', '0.2'))
+        regressed = [c for c in compare(suite, load_results(Path(baseline)), threshold) if c.regressed]
+        assert not regressed, regressed
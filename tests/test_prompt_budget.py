@@ -0,0 +1,130 @@
+from backend.apps.common.timing import RequestTimings
+from backend.apps.rag import service
+from backend.apps.rag.llm_providers import LLMCallError
+from backend.apps.rag.prompt_budget import (
+    ExtractiveSummarizer,
+    HeuristicTokenEstimator,
+    HistorySummaryCache,
+    PromptBudget,
+    assemble_prompt,
+    cap_history_chars,
+    summarize_history,
+)
+
+EST = HeuristicTokenEstimator(4)
+
+
+class RecordingSummarizer(ExtractiveSummarizer):
+    name = 'recording'
+
+    def __init__(self, fail=False):
+        super().__init__()
+        self.batches = []
+        self.fail = fail
+
+    def extend(self, previous, turns, max_tokens, estimator):
+        self.batches.append(len(turns))
+        if self.fail:
+            raise LLMCallError('error')
+        return super().extend(previous, turns, max_tokens, estimator)
+
+
+def _history(n, chars=200):
+    return [('user' if i % 2 == 0 else 'assistant', f'第{i}則。' + '加班費計算' * (chars // 5)) for i in range(n)]
+
+
+def _assemble(history, budget=PromptBudget(), summarizer=None, sources=('- 來源一', '- 來源二')):
+    return assemble_prompt(
+        system_prompt='',
+        source_lines=list(sources),
+        no_sources_text='無相關資料',
+        history=history,
+        message='加班費怎麼算',
+        instructions='使用繁體中文回答。',
+        budget=budget,
+        estimator=EST,
+        summarizer=summarizer or RecordingSummarizer(),
+    )
+
+
+def test_heuristic_estimator_counts_cjk_per_character():
+    assert EST.count('加班費') == 3
+    assert EST.count('overtime') == 2
+    assert EST.count('第 38 條，') == 3 + 1
+    assert EST.count('a加b班cd費') == 3 + 1
+
+
+def test_short_conversation_is_kept_verbatim():
+    prompt = _assemble([('user', '你好'), ('assistant', '您好')])
+    assert prompt.text == '相關資料來源:\n- 來源一\n- 來源二\n對話記錄:\nuser: 你好\nassistant: 您好\n用戶問題: 加班費怎麼算\n回答指引: 使用繁體中文回答。'
+    assert prompt.turns_summarized == 0 and prompt.tokens == sum(prompt.sections.values()) >= EST.count(prompt.text)
+
+
+def test_long_history_is_summarized_within_budget():
+    budget = PromptBudget(max_tokens=1200, context_tokens=200, history_tokens=600, summary_tokens=150)
+    prompt = _assemble(_history(20), budget)
+    assert prompt.tokens <= budget.max_tokens
+    assert prompt.turns_summarized > 0
+    # 最新的回合原文保留，較早的只剩第一句
+    history = _history(20)
+    assert history[-1][1] in prompt.text and history[0][1] not in prompt.text
+    assert '對話摘要（較早的對話）:\nuser: 第0則' in prompt.text
+    assert prompt.sections['history'] <= budget.history_tokens + budget.context_tokens
+
+
+def test_contexts_are_cut_in_rank_order():
+    budget = PromptBudget(max_tokens=2000, context_tokens=12)
+    prompt = _assemble([], budget, sources=['- 第一名來源', '- 第二名來源', '- 第三名來源'])
+    assert '- 第一名來源' in prompt.text and '- 第三名來源' not in prompt.text
+    assert prompt.contexts_dropped == 2
+
+
+def test_rolling_summary_only_summarizes_new_turns():
+    cache, summarizer = HistorySummaryCache(), RecordingSummarizer()
+    turns = _history(10)
+    first = summarize_history(turns[:6], 200, EST, summarizer=summarizer, cache=cache)
+    assert summarize_history(turns[:6], 200, EST, summarizer=summarizer, cache=cache) == first
+    summarize_history(turns[:8], 200, EST, summarizer=summarizer, cache=cache)
+    assert summarizer.batches == [6, 2]
+    assert cache.stats()['hits'] == 1
+
+
+def test_summary_cache_ignores_the_room_left_by_contexts():
+    cache, summarizer = HistorySummaryCache(), RecordingSummarizer()
+    turns = _history(10)
+    full = summarize_history(turns, 200, EST, summarizer=summarizer, cache=cache, cache_tokens=200)
+    # 檢索內容較多、摘要空間變小時仍命中同一份摘要，只截掉最舊的行
+    short = summarize_history(turns, 30, EST, summarizer=summarizer, cache=cache, cache_tokens=200)
+    assert summarizer.batches == [10]
+    assert cache.stats() == {'entries': 1, 'hits': 1, 'misses': 1}
+    assert EST.count(short) <= 30 < EST.count(full) and full.endswith(short)
+
+
+def test_failed_llm_summary_falls_back_without_caching():
+    cache, summarizer = HistorySummaryCache(), RecordingSummarizer(fail=True)
+    summary = summarize_history(_history(4), 200, EST, summarizer=summarizer, cache=cache)
+    assert summary.startswith('user: 第0則')
+    assert cache.stats()['entries'] == 0
+
+
+def test_total_history_chars_drops_oldest_turns():
+    turns = _history(8, chars=100)
+    kept = cap_history_chars(turns, max_chars=350)
+    assert kept == turns[-3:]
+    long = _history(24, chars=1000)
+    assert _assemble(long).turns_dropped == len(long) - len(cap_history_chars(long)) > 0
+
+
+def test_prompt_tokens_reported_but_not_in_server_timing():
+    timings = RequestTimings(trace_id='t')
+    timings.record('retrieval', 0.01)
+    timings.set_value('prompt_tokens', 812)
+    assert timings.summary()['prompt_tokens'] == 812
+    assert 'prompt_tokens' not in timings.server_timing()
+
+
+def test_stream_done_event_carries_prompt_tokens(monkeypatch):
+    monkeypatch.setenv('ANSWER_CACHE', '0')
+    events = list(service.stream_answer_with_rag('加班費怎麼算', [service.ChatTurn(role='user', content='你好')]))
+    done = dict(events)['done']
+    assert done['timings']['prompt_tokens'] > 0
@@ -0,0 +1,43 @@
+import dataclasses
+
+import pytest
+
+from backend.apps.rag.query_analysis import analyze_query, normalize_article_mentions, parse_chinese_num
+from backend.apps.rag.service import _calculate_text_similarity
+
+
+@pytest.mark.parametrize('raw, expected', [
+    ('一百零五', 105),
+    ('一百二', 120),
+    ('兩百', 200),
+    ('一千零一', 1001),
+    ('３８', 38),
+    ('二 十 三', 23),
+    ('零', 0),
+])
+def test_parse_chinese_num(raw, expected):
+    assert parse_chinese_num(raw) == expected
+
+
+def test_articles_are_normalized_in_one_pass():
+    q = analyze_query('請比較第一百零五條、第 9-1 條與第九條之一，還有第３８條')
+    assert q.normalized == '請比較第105條、第9-1條與第9-1條，還有第38條'
+    assert q.articles == ('105', '9-1', '38')
+    assert q.article == '105'
+    # 無法解析的條號保留原文
+    assert normalize_article_mentions('第零條') == '第零條'
+
+
+def test_model_inquiry_and_law_mentions():
+    assert analyze_query('請問你使用什麼模型？').model_inquiry
+    assert analyze_query('Which MODEL is this').model_inquiry
+    q = analyze_query('民法第184條')
+    assert not q.model_inquiry and q.unknown_law and q.law_mentions == ()
+
+
+def test_analysis_is_frozen_and_reused_by_similarity():
+    q = analyze_query('加班費如何計算')
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        q.normalized = ''
+    text = '加班費如何計算？依第24條，按平日每小時工資額加給。'
+    assert _calculate_text_similarity(q, text) == _calculate_text_similarity('加班費如何計算', text) > 0
@@ -0,0 +1,84 @@
+import multiprocessing
+
+import pytest
+
+from backend.apps.common.rate_limit import (
+    MemoryRateLimitStore,
+    RedisRateLimitStore,
+    SQLiteRateLimitStore,
+    load_quotas,
+)
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryRateLimitStore()
+    return SQLiteRateLimitStore(str(tmp_path / 'rl.sqlite3'))
+
+
+def test_sliding_window_allows_exactly_limit(store):
+    assert [store.hit('k', 3, 10, now=100.0).allowed for _ in range(4)] == [True, True, True, False]
+    assert store.hit('other', 3, 10, now=100.0).remaining == 2
+
+
+def test_window_slides_instead_of_resetting_at_edges(store):
+    store.hit('k', 2, 10, now=100.0)
+    store.hit('k', 2, 10, now=109.0)
+    # 固定視窗在 110 會歸零而放行 2 次；滑動視窗只在 100 那筆過期後才放行 1 次
+    rejected = store.hit('k', 2, 10, now=109.5)
+    assert not rejected.allowed and rejected.retry_after == pytest.approx(0.5)
+    assert store.hit('k', 2, 10, now=110.0).allowed
+    assert not store.hit('k', 2, 10, now=110.5).allowed
+
+
+def test_rejected_hits_are_not_counted(store):
+    for _ in range(5):
+        store.hit('k', 1, 10, now=100.0)
+    assert store.hit('k', 1, 10, now=110.0).allowed
+
+
+def test_load_quotas_maps_routes():
+    routes = load_quotas({'chat': {'limit': 5, 'window': 30, 'paths': ['/api/v1/chat/', '/api/v1/chat/stream']}})
+    assert routes[('POST', '/api/v1/chat')].limit == 5
+    assert routes[('POST', '/api/v1/chat/stream')].window_seconds == 30
+
+
+def _hammer(path, attempts, start, results):
+    store = SQLiteRateLimitStore(path)
+    start.wait()
+    results.put(sum(store.hit('chat:10.0.0.1', 100, 60).allowed for _ in range(attempts)))
+
+
+def test_exact_limit_holds_across_processes(tmp_path):
+    path = str(tmp_path / 'shared.sqlite3')
+    SQLiteRateLimitStore(path).close()
+    ctx = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn')
+    start, results = ctx.Event(), ctx.Queue()
+    procs = [ctx.Process(target=_hammer, args=(path, 60, start, results)) for _ in range(6)]
+    for p in procs:
+        p.start()
+    start.set()
+    allowed = [results.get(timeout=60) for _ in procs]
+    for p in procs:
+        p.join(timeout=10)
+    # 6 個行程共送出 360 次，恰好放行 100 次
+    assert sum(allowed) == 100
+
+
+class _FakeRedis:
+    def __init__(self, reply):
+        self.reply = reply
+        self.calls = []
+
+    def eval(self, script, numkeys, *args):
+        self.calls.append((numkeys, args))
+        return self.reply
+
+
+def test_redis_store_runs_one_script_per_hit():
+    client = _FakeRedis([0, 0, b'12.5'])
+    decision = RedisRateLimitStore(client).hit('chat:1.2.3.4', 20, 60)
+    assert not decision.allowed and decision.retry_after == 12.5
+    [(numkeys, args)] = client.calls
+    assert numkeys == 1 and args[:3] == ('rl:chat:1.2.3.4', 60, 20)
@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+from backend.apps.rag import vectorstore
+from backend.apps.rag.reindex import ReindexInProgress, ReindexProgress, _reindex_lock, _write_status, read_reindex_status, reindex
+from backend.apps.rag.vectorstore import ChromaVectorStore, LocalEmbedding, VSConfig, collection_name_for
+
+
+@pytest.fixture
+def stores(monkeypatch, tmp_path):
+    monkeypatch.delenv('GOOGLE_API_KEY', raising=False)
+    monkeypatch.setattr(vectorstore, '_ACTIVE', {})
+    config = VSConfig(persist_dir=str(tmp_path / 'vectors'), hybrid_search=False)
+
+    def open_store(dimension):
+        monkeypatch.setattr(vectorstore, 'select_embedder', lambda _config: LocalEmbedding(dimension=dimension))
+        return ChromaVectorStore(config)
+
+    return open_store
+
+
+def test_reindex_serves_old_collection_until_flip(stores):
+    old = stores(256)
+    old.upsert(
+        ['d:0', 'd:1'],
+        ['第38條 特別休假', '第24條 延長工時工資'],
+        [{'document_id': 'd'}, {'document_id': 'd'}],
+    )
+
+    store = stores(64)
+    assert store.needs_reindex()
+    assert store.active_collection_name() == collection_name_for('local-hash-v1-d256')
+
+    seen = []
+
+    def on_progress(progress):
+        if progress.phase == 'copy' and not seen:
+            # 切換前查詢仍走舊 collection；期間的 ingest 會雙寫到新 collection
+            seen.append(store.active_collection_name())
+            assert store.query('特別休假', top_k=1)[0]['id'] == 'd:0'
+            store.upsert(['d:2'], ['第59條 職業災害補償'], [{'document_id': 'd'}])
+
+    result = reindex(store, batch_size=1, grace_seconds=0, on_progress=on_progress)
+
+    assert seen == [collection_name_for('local-hash-v1-d256')]
+    assert result.state == 'completed' and result.total == 2
+    assert result.dropped == [collection_name_for('local-hash-v1-d256')]
+    assert store.active_collection_name() == collection_name_for('local-hash-v1-d64')
+    assert not store.needs_reindex()
+    assert store._collection.count() == 3
+    assert store.query('職業災害', top_k=1)[0]['id'] == 'd:2'
+    assert read_reindex_status(store.config.persist_dir).state == 'completed'
+
+
+def test_reindex_is_noop_when_up_to_date(stores):
+    store = stores(256)
+    store.upsert(['d:0'], ['第1條 目的'], [{'document_id': 'd'}])
+    result = reindex(store, grace_seconds=0)
+    assert result.state == 'completed' and result.dropped == []
+    assert store.active_collection_name() == collection_name_for(store.target_embedder.embedder_id)
+
+
+def test_stale_lock_file_does_not_block_reindex(stores):
+    store = stores(256)
+    persist_dir = store.config.persist_dir
+    # 容器重啟前留下的鎖檔與執行中狀態：PID 1 在新容器裡一定存在，但沒有人持有檔案鎖
+    with open(os.path.join(persist_dir, 'reindex.lock'), 'w') as fh:
+        fh.write('1')
+    _write_status(persist_dir, ReindexProgress(state='running', pid=1))
+    assert read_reindex_status(persist_dir).state == 'interrupted'
+    assert reindex(store, grace_seconds=0).state == 'completed'
+
+
+def test_held_lock_reports_running(stores):
+    store = stores(256)
+    persist_dir = store.config.persist_dir
+    with _reindex_lock(persist_dir):
+        _write_status(persist_dir, ReindexProgress(state='running'))
+        assert read_reindex_status(persist_dir).state == 'running'
+        with pytest.raises(ReindexInProgress):
+            reindex(store, grace_seconds=0)
@@ -1,7 +1,6 @@
-import re
-
-# 直接從 service 匯入要測的函式與正則（不需啟動 Django）
-from backend.apps.rag.service import normalize_chinese_numbers, CHINESE_ARTICLE_PATTERN, parse_chinese_num
+# 直接從 service 匯入要測的函式（不需啟動 Django）；條號比對只有 query_analysis.ARTICLE_MENTION_PATTERN 一份
+from backend.apps.rag.query_analysis import ARTICLE_MENTION_PATTERN
+from backend.apps.rag.service import normalize_chinese_numbers, parse_chinese_num
 
 
 def test_parse_chinese_num_basic():
@@ -31,7 +30,7 @@ def test_normalize_chinese_numbers_chinese_to_arabic():
 
 def test_article_regex():
     s = '第7條與第  25 條'
-    m = CHINESE_ARTICLE_PATTERN.findall(s)
+    m = [match.group(1) for match in ARTICLE_MENTION_PATTERN.finditer(s)]
     assert m == ['7', '25']
 
 
@@ -0,0 +1,18 @@
+from backend.apps.rag.service import _CitationStripper
+
+
+def _run(pieces):
+    stripper = _CitationStripper()
+    return ''.join(stripper.feed(p) for p in pieces) + stripper.flush()
+
+
+def test_strips_citation_split_across_chunks():
+    assert _run(['依第38條[', '1', ', 2]規定', '應給特休[3]。']) == '依第38條規定應給特休。'
+
+
+def test_keeps_non_citation_brackets():
+    assert _run(['見[附', '件]說明 [a]']) == '見[附件]說明 [a]'
+
+
+def test_unclosed_bracket_is_flushed():
+    assert _run(['結論[', '12']) == '結論[12'
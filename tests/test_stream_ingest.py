@@ -0,0 +1,85 @@
+import json
+import random
+
+import pytest
+
+from backend.apps.rag.ingest import (
+    NdjsonFormatError,
+    ingest_stream,
+    ingest_text,
+    iter_chunks,
+    iter_ndjson_documents,
+    split_text,
+)
+
+
+class FakeStore:
+    """記錄每批 upsert 筆數的記憶體向量庫。"""
+
+    def __init__(self):
+        self.rows = {}
+        self.batches = []
+
+    def get_chunk_metadata(self, document_id):
+        return {cid: dict(meta) for cid, meta in self.rows.items() if meta['document_id'] == document_id}
+
+    def update_metadata(self, ids, metadatas):
+        self.rows.update(zip(ids, metadatas))
+
+    def upsert(self, ids, texts, metadatas=None):
+        self.batches.append(len(ids))
+        self.rows.update(zip(ids, metadatas))
+
+    def delete(self, ids):
+        for cid in ids:
+            self.rows.pop(cid, None)
+
+
+def _doc(n):
+    return '\n'.join(f'第{i}條 勞工每日正常工作時間不得超過八小時，此為第{i}段的測試內容。' for i in range(n))
+
+
+def test_iter_chunks_matches_split_text_for_any_piece_boundaries():
+    rng = random.Random(7)
+    text = _doc(60) + '。尾段沒有換行！？；最後'
+    for _ in range(20):
+        cuts = sorted(rng.sample(range(1, len(text)), 15))
+        pieces = [text[a:b] for a, b in zip([0] + cuts, cuts + [len(text)])]
+        assert [c.text for c in iter_chunks(pieces)] == split_text(text)
+
+
+def test_ingest_stream_flushes_in_batches_and_matches_ingest_text():
+    text = _doc(120)
+    streamed = FakeStore()
+    stats = ingest_stream('doc', (text[i:i + 97] for i in range(0, len(text), 97)), store=streamed, batch_size=4)
+    assert max(streamed.batches) <= 4 and sum(streamed.batches) == stats.chunks
+
+    whole = FakeStore()
+    ingest_text('doc', text, store=whole)
+    assert streamed.rows == whole.rows
+
+
+def test_ingest_stream_deletes_stale_tail():
+    store = FakeStore()
+    ingest_text('doc', _doc(80), store=store)
+    stats = ingest_stream('doc', [_doc(20)], store=store)
+    assert stats.deleted > 0
+    assert sorted(int(cid.split(':')[1]) for cid in store.rows) == list(range(stats.chunks))
+
+
+def test_ndjson_groups_consecutive_lines_per_document():
+    lines = [
+        json.dumps({'doc_id': 'a', 'text': '第一段'}).encode(),
+        b'\n',
+        json.dumps({'doc_id': 'a', 'text': '第二段'}).encode(),
+        json.dumps({'doc_id': 'b', 'text': '另一份'}).encode(),
+    ]
+    docs = [(doc_id, ''.join(pieces)) for doc_id, pieces in iter_ndjson_documents(lines)]
+    assert docs == [('a', '第一段第二段'), ('b', '另一份')]
+
+
+@pytest.mark.parametrize('line', [b'not json', b'{"doc_id": "", "text": "x"}', b'["a"]', b'{"doc_id": "a"}'])
+def test_ndjson_rejects_malformed_lines_with_line_number(line):
+    with pytest.raises(NdjsonFormatError, match='line 2'):
+        for _, pieces in iter_ndjson_documents([b'{"doc_id": "ok", "text": "x"}', line]):
+            list(pieces)
@@ -0,0 +1,61 @@
+import os
+
+import backend.apps.rag.templates_registry as reg
+from backend.apps.rag.templates_registry import TemplateMeta, extract_article_text, find_article_any, normalize_article_no
+
+
+def test_article_spans_stop_at_next_article_and_chapter():
+    art9 = extract_article_text('labor_standards_act', '9')
+    assert art9.startswith('第 9 條')
+    assert '第 9-1 條' not in art9
+    assert extract_article_text('labor_standards_act', '9-1').startswith('第 9-1 條')
+    art8 = extract_article_text('labor_standards_act', '8')
+    assert '章' not in art8.splitlines()[-1]
+
+
+def test_normalize_article_no():
+    assert normalize_article_no('０７') == '7'
+    assert normalize_article_no(' 9 - 1 ') == '9-1'
+
+
+def test_unknown_lookups_do_not_grow_index():
+    find_article_any('38')
+    before = len(reg._ARTICLE_TEMPLATES)
+    for i in range(1000, 1200):
+        assert find_article_any(str(i)) is None
+    assert len(reg._ARTICLE_TEMPLATES) == before
+
+
+def test_law_name_in_query_selects_template(tmp_path, monkeypatch):
+    (tmp_path / 'civil.txt').write_text('第 38 條\n民法測試條文。\n', encoding='utf-8')
+    (tmp_path / 'labor.txt').write_text('第 38 條\n勞工特別休假。\n', encoding='utf-8')
+    monkeypatch.setattr(reg, 'TEMPLATES_DIR', tmp_path)
+    monkeypatch.setattr(reg, 'REGISTRY', {
+        'labor': TemplateMeta('labor', 'labor.txt', '勞基法', aliases=('勞動基準法',)),
+        'civil': TemplateMeta('civil', 'civil.txt', '民法'),
+    })
+    monkeypatch.setattr(reg, '_INDEX', {})
+    monkeypatch.setattr(reg, '_ARTICLE_TEMPLATES', {})
+    monkeypatch.setattr(reg, '_ALL_CHECKED_AT', 0.0)
+
+    assert find_article_any('38')[0] == 'labor'
+    assert find_article_any('38', '民法第38條是什麼')[0] == 'civil'
+    assert find_article_any('38', '勞動基準法第38條')[0] == 'labor'
+    assert find_article_any('38', '刑法第38條') is None
+
+
+def test_template_edit_is_picked_up_via_mtime(tmp_path, monkeypatch):
+    path = tmp_path / 'law.txt'
+    path.write_text('第 1 條\n舊內容\n', encoding='utf-8')
+    monkeypatch.setattr(reg, 'TEMPLATES_DIR', tmp_path)
+    monkeypatch.setattr(reg, 'REGISTRY', {'law': TemplateMeta('law', 'law.txt', '測試法')})
+    monkeypatch.setattr(reg, '_INDEX', {})
+    monkeypatch.setattr(reg, '_ARTICLE_TEMPLATES', {})
+    monkeypatch.setattr(reg, '_STAT_INTERVAL', 0.0)
+    assert '舊內容' in extract_article_text('law', '1')
+
+    path.write_text('第 1 條\n新內容\n第 2 條\n第二條\n', encoding='utf-8')
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    assert '新內容' in extract_article_text('law', '1')
+    assert extract_article_text('law', '2') is not None
@@ -0,0 +1,78 @@
+import os
+import time
+
+import pytest
+
+from backend.apps.rag import vectorstore
+from backend.apps.rag.corpus import get_corpus_generation
+from backend.apps.rag.manifest import EmbedderManifest, EmbedderMismatchError, manifest_path, read_manifest, write_manifest
+from backend.apps.rag.vectorstore import ChromaVectorStore, LocalEmbedding, VSConfig, collection_name_for
+
+NAME = collection_name_for(LocalEmbedding().embedder_id)
+
+
+@pytest.fixture
+def fresh_store(monkeypatch, tmp_path):
+    monkeypatch.delenv('GOOGLE_API_KEY', raising=False)
+    config = VSConfig(persist_dir=str(tmp_path / 'vectors'))
+
+    def open_store():
+        # 模擬新程序啟動：清掉程序內的 collection 單例
+        monkeypatch.setattr(vectorstore, '_ACTIVE', {})
+        return ChromaVectorStore(config)
+
+    return config, open_store
+
+
+def test_cold_start_reads_manifest_without_embedding(fresh_store, monkeypatch):
+    config, open_store = fresh_store
+    store = open_store()
+    store.upsert(['d:0', 'd:1'], ['第1條 目的', '第2條 定義'], [{'document_id': 'd'}, {'document_id': 'd'}])
+    manifest = read_manifest(config.persist_dir, NAME)
+    assert manifest.embedder_id == LocalEmbedding().embedder_id
+    assert manifest.dimension == 256 and manifest.metric == 'l2'
+
+    def no_embedding(self, texts):
+        raise AssertionError('startup must not embed')
+
+    monkeypatch.setattr(LocalEmbedding, 'embed', no_embedding)
+    started = time.perf_counter()
+    store = open_store()
+    cold_start = time.perf_counter() - started
+    print(f'cold start: {cold_start * 1000:.1f} ms')
+    assert cold_start < 5.0
+    assert store._collection.count() == 2
+
+
+def test_mismatch_raises_and_keeps_data(fresh_store):
+    config, open_store = fresh_store
+    open_store().upsert(['d:0'], ['第1條 目的'], [{'document_id': 'd'}])
+    original = read_manifest(config.persist_dir, NAME)
+    write_manifest(config.persist_dir, NAME, EmbedderManifest(
+        embedder_id='google:models/text-embedding-004', embedder_type='GoogleEmbedding', model='models/text-embedding-004', dimension=768,
+    ))
+
+    with pytest.raises(EmbedderMismatchError):
+        open_store()
+
+    write_manifest(config.persist_dir, NAME, original)
+    assert open_store()._collection.count() == 1
+
+
+def test_legacy_collection_without_manifest_is_adopted(fresh_store):
+    config, open_store = fresh_store
+    open_store().upsert(['d:0'], ['第1條 目的'], [{'document_id': 'd'}])
+    os.remove(manifest_path(config.persist_dir, NAME))
+
+    store = open_store()
+    assert store._collection.count() == 1
+    assert read_manifest(config.persist_dir, NAME).dimension == 256
+
+
+def test_empty_upsert_is_a_no_op(fresh_store):
+    config, open_store = fresh_store
+    store = open_store()
+    generation = get_corpus_generation(config.persist_dir)
+    store.upsert([], [], [])
+    assert store._collection.count() == 0
+    assert get_corpus_generation(config.persist_dir) == generation